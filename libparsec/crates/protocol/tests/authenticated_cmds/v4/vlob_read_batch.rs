@@ -0,0 +1,200 @@
+// Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+
+// `allow-unwrap-in-test` don't behave as expected, see:
+// https://github.com/rust-lang/rust-clippy/issues/11119
+#![allow(clippy::unwrap_used)]
+
+use libparsec_tests_lite::prelude::*;
+use libparsec_types::prelude::*;
+
+use super::authenticated_cmds;
+
+// Request
+
+pub fn req() {
+    // Generated from Rust implementation (Parsec v2.16.0+dev)
+    // Content:
+    //   cmd: "vlob_read_batch"
+    //   encryption_revision: 8
+    //   items: [
+    //     {
+    //       timestamp: None
+    //       version: 8
+    //       vlob_id: ext(2, hex!("2b5f314728134a12863da1ce49c112f6"))
+    //     }
+    //     {
+    //       timestamp: ext(1, 946774800.0)
+    //       version: None
+    //       vlob_id: ext(2, hex!("d0f2a0ed4c0a47e4b4f2c9b0e2b3a1c5"))
+    //     }
+    //   ]
+    let raw = hex!(
+        "83a3636d64af766c6f625f726561645f6261746368b3656e6372797074696f6e5f72657669"
+        "73696f6e08a56974656d739283a974696d657374616d70c0a776657273696f6e08a7766c6f"
+        "625f6964d8022b5f314728134a12863da1ce49c112f683a974696d657374616d70d70141cc"
+        "375188000000a776657273696f6ec0a7766c6f625f6964d802d0f2a0ed4c0a47e4b4f2c9b0"
+        "e2b3a1c5"
+    );
+
+    let req = authenticated_cmds::vlob_read_batch::Req {
+        encryption_revision: 8,
+        items: vec![
+            authenticated_cmds::vlob_read_batch::ReadBatchItem {
+                vlob_id: VlobID::from_hex("2b5f314728134a12863da1ce49c112f6").unwrap(),
+                version: Some(8),
+                timestamp: None,
+            },
+            authenticated_cmds::vlob_read_batch::ReadBatchItem {
+                vlob_id: VlobID::from_hex("d0f2a0ed4c0a47e4b4f2c9b0e2b3a1c5").unwrap(),
+                version: None,
+                timestamp: Some("2000-1-2T01:00:00Z".parse().unwrap()),
+            },
+        ],
+    };
+
+    let expected = authenticated_cmds::AnyCmdReq::VlobReadBatch(req);
+
+    let data = authenticated_cmds::AnyCmdReq::load(&raw).unwrap();
+
+    p_assert_eq!(data, expected);
+
+    // Also test serialization round trip
+    let authenticated_cmds::AnyCmdReq::VlobReadBatch(req2) = data else {
+        unreachable!()
+    };
+
+    let raw2 = req2.dump().unwrap();
+
+    let data2 = authenticated_cmds::AnyCmdReq::load(&raw2).unwrap();
+
+    p_assert_eq!(data2, expected);
+}
+
+// Responses
+
+pub fn rep_ok() {
+    // Generated from Rust implementation (Parsec v2.16.0+dev)
+    // Content:
+    //   status: "ok"
+    //   items: [
+    //     {
+    //       author: "alice@dev1"
+    //       blob: hex!("666f6f626172")
+    //       certificate_index: 0
+    //       timestamp: ext(1, 946774800.0)
+    //       version: 8
+    //       vlob_id: ext(2, hex!("2b5f314728134a12863da1ce49c112f6"))
+    //     }
+    //   ]
+    //   not_found: [ext(2, hex!("d0f2a0ed4c0a47e4b4f2c9b0e2b3a1c5"))]
+    let raw = hex!(
+        "83a6737461747573a26f6ba56974656d739186a6617574686f72aa616c6963654064657631"
+        "a4626c6f62c406666f6f626172b163657274696669636174655f696e64657800a974696d65"
+        "7374616d70d70141cc375188000000a776657273696f6e08a7766c6f625f6964d8022b5f31"
+        "4728134a12863da1ce49c112f6a96e6f745f666f756e6491d802d0f2a0ed4c0a47e4b4f2c9"
+        "b0e2b3a1c5"
+    );
+
+    let expected = authenticated_cmds::vlob_read_batch::Rep::Ok {
+        items: vec![authenticated_cmds::vlob_read_batch::ReadBatchResultItem {
+            vlob_id: VlobID::from_hex("2b5f314728134a12863da1ce49c112f6").unwrap(),
+            version: 8,
+            blob: b"foobar".as_ref().into(),
+            author: "alice@dev1".parse().unwrap(),
+            timestamp: "2000-1-2T01:00:00Z".parse().unwrap(),
+            certificate_index: 0,
+        }],
+        not_found: vec![VlobID::from_hex("d0f2a0ed4c0a47e4b4f2c9b0e2b3a1c5").unwrap()],
+    };
+
+    let data = authenticated_cmds::vlob_read_batch::Rep::load(&raw).unwrap();
+
+    p_assert_eq!(data, expected);
+
+    // Also test serialization round trip
+    let raw2 = data.dump().unwrap();
+
+    let data2 = authenticated_cmds::vlob_read_batch::Rep::load(&raw2).unwrap();
+
+    p_assert_eq!(data2, expected);
+}
+
+pub fn rep_not_allowed() {
+    // Generated from Rust implementation (Parsec v2.16.0+dev)
+    // Content:
+    //   status: "not_allowed"
+    let raw = hex!("81a6737461747573ab6e6f745f616c6c6f776564");
+
+    let expected = authenticated_cmds::vlob_read_batch::Rep::NotAllowed;
+
+    let data = authenticated_cmds::vlob_read_batch::Rep::load(&raw).unwrap();
+
+    p_assert_eq!(data, expected);
+
+    // Also test serialization round trip
+    let raw2 = data.dump().unwrap();
+
+    let data2 = authenticated_cmds::vlob_read_batch::Rep::load(&raw2).unwrap();
+
+    p_assert_eq!(data2, expected);
+}
+
+pub fn rep_bad_encryption_revision() {
+    // Generated from Rust implementation (Parsec v2.16.0+dev)
+    // Content:
+    //   status: "bad_encryption_revision"
+    let raw = hex!("81a6737461747573b76261645f656e6372797074696f6e5f7265766973696f6e");
+
+    let expected = authenticated_cmds::vlob_read_batch::Rep::BadEncryptionRevision;
+
+    let data = authenticated_cmds::vlob_read_batch::Rep::load(&raw).unwrap();
+
+    p_assert_eq!(data, expected);
+
+    // Also test serialization round trip
+    let raw2 = data.dump().unwrap();
+
+    let data2 = authenticated_cmds::vlob_read_batch::Rep::load(&raw2).unwrap();
+
+    p_assert_eq!(data2, expected);
+}
+
+pub fn rep_in_maintenance() {
+    // Generated from Rust implementation (Parsec v2.16.0+dev)
+    // Content:
+    //   status: "in_maintenance"
+    let raw = hex!("81a6737461747573ae696e5f6d61696e74656e616e6365");
+
+    let expected = authenticated_cmds::vlob_read_batch::Rep::InMaintenance;
+
+    let data = authenticated_cmds::vlob_read_batch::Rep::load(&raw).unwrap();
+
+    p_assert_eq!(data, expected);
+
+    // Also test serialization round trip
+    let raw2 = data.dump().unwrap();
+
+    let data2 = authenticated_cmds::vlob_read_batch::Rep::load(&raw2).unwrap();
+
+    p_assert_eq!(data2, expected);
+}
+
+pub fn rep_not_available() {
+    // Generated from Rust implementation (Parsec v2.16.0+dev)
+    // Content:
+    //   status: "not_available"
+    let raw = hex!("81a6737461747573ad6e6f745f617661696c61626c65");
+
+    let expected = authenticated_cmds::vlob_read_batch::Rep::NotAvailable;
+
+    let data = authenticated_cmds::vlob_read_batch::Rep::load(&raw).unwrap();
+
+    p_assert_eq!(data, expected);
+
+    // Also test serialization round trip
+    let raw2 = data.dump().unwrap();
+
+    let data2 = authenticated_cmds::vlob_read_batch::Rep::load(&raw2).unwrap();
+
+    p_assert_eq!(data2, expected);
+}
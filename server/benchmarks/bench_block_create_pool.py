@@ -0,0 +1,304 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure concurrent PostgreSQL block creations with a slow blockstore, depending on the pool size.
+
+The blockstore upload is simulated with a fixed latency (typically S3/Swift).
+Compare the legacy implementation (upload done while holding a connection and
+its transaction) with the two-phase one (no connection held during the upload).
+While the uploads are in progress, an unrelated query is sent periodically to
+measure how long the other commands wait for a connection.
+
+Migrations are applied and a new organization is populated, so use a throwaway database.
+
+Usage: python benchmarks/bench_block_create_pool.py --db postgresql://... [--uploads 500] [--json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+from uuid import uuid4
+
+import trio
+import triopg
+
+from parsec._parsec import BlockID, DateTime, DeviceID, OrganizationID, VlobID
+from parsec.backend.memory import MemoryBlockStoreComponent
+from parsec.backend.postgresql.block import (
+    PGBlockComponent,
+    _check_block_create,
+    _q_insert_block,
+)
+from parsec.backend.postgresql.handler import (
+    PGHandler,
+    _apply_migrations,
+    handle_datetime,
+    handle_integer,
+    handle_uuid,
+    retrieve_migrations,
+)
+from parsec.backend.postgresql.utils import q_increment_organization_stats
+from parsec.event_bus import EventBus
+from parsec.utils import trio_run
+
+
+class SlowBlockStoreComponent(MemoryBlockStoreComponent):
+    def __init__(self, upload_latency: float):
+        super().__init__()
+        self._upload_latency = upload_latency
+
+    async def create(
+        self, organization_id: OrganizationID, block_id: BlockID, block: bytes
+    ) -> None:
+        await trio.sleep(self._upload_latency)
+        await super().create(organization_id, block_id, block)
+
+
+class LegacyPGBlockComponent(PGBlockComponent):
+    """
+    Block creation used before the blockstore upload was done outside of the transaction
+    """
+
+    async def create(
+        self,
+        organization_id: OrganizationID,
+        author: DeviceID,
+        block_id: BlockID,
+        realm_id: VlobID,
+        block: bytes,
+        created_on: DateTime | None = None,
+    ) -> None:
+        created_on = created_on or DateTime.now()
+        async with self.dbh.pool.acquire() as conn, conn.transaction():
+            await _check_block_create(conn, organization_id, author, block_id, realm_id)
+            await self._blockstore_component.create(organization_id, block_id, block)
+            await conn.execute(
+                *_q_insert_block(
+                    organization_id=organization_id.str,
+                    block_id=block_id,
+                    realm_id=realm_id,
+                    author=author.str,
+                    size=len(block),
+                    created_on=created_on,
+                )
+            )
+            await q_increment_organization_stats(
+                conn, organization_id, created_on, data_size=len(block)
+            )
+
+
+async def _init_connection(conn: triopg._triopg.TrioConnectionProxy) -> None:
+    await handle_datetime(conn)
+    await handle_uuid(conn)
+    await handle_integer(conn)
+
+
+async def _populate(
+    conn: triopg._triopg.TrioConnectionProxy, organization_id: OrganizationID
+) -> VlobID:
+    """
+    Create an organization with a single user owning a realm
+    """
+    granted_on = DateTime.now().subtract(days=1)
+    org_internal_id = await conn.fetchval(
+        """
+INSERT INTO organization (
+    organization_id, bootstrap_token, user_profile_outsider_allowed, is_expired, _created_on
+)
+VALUES ($1, '', TRUE, FALSE, $2)
+RETURNING _id
+""",
+        organization_id.str,
+        granted_on,
+    )
+    user_internal_id = await conn.fetchval(
+        """
+INSERT INTO user_ (
+    organization, user_id, user_certificate, redacted_user_certificate, created_on, profile
+)
+VALUES ($1, 'alice', '', '', $2, 'ADMIN')
+RETURNING _id
+""",
+        org_internal_id,
+        granted_on,
+    )
+    device_internal_id = await conn.fetchval(
+        """
+INSERT INTO device (
+    organization, user_, device_id, device_certificate, redacted_device_certificate, created_on
+)
+VALUES ($1, $2, 'alice@dev1', '', '', $3)
+RETURNING _id
+""",
+        org_internal_id,
+        user_internal_id,
+        granted_on,
+    )
+    realm_id = VlobID.new()
+    realm_internal_id = await conn.fetchval(
+        """
+INSERT INTO realm (organization, realm_id, encryption_revision)
+VALUES ($1, $2, 1)
+RETURNING _id
+""",
+        org_internal_id,
+        realm_id,
+    )
+    await conn.execute(
+        "INSERT INTO vlob_encryption_revision (realm, encryption_revision) VALUES ($1, 1)",
+        realm_internal_id,
+    )
+    await conn.execute(
+        """
+INSERT INTO realm_user_role (realm, user_, role, certificate, certified_by, certified_on)
+VALUES ($1, $2, 'OWNER', '', $3, $4)
+""",
+        realm_internal_id,
+        user_internal_id,
+        device_internal_id,
+        granted_on,
+    )
+    return realm_id
+
+
+def _percentiles(timings: List[float]) -> Dict[str, float]:
+    timings = sorted(timings)
+    return {
+        "median_ms": statistics.median(timings) * 1e3,
+        "p95_ms": timings[int(len(timings) * 0.95)] * 1e3,
+    }
+
+
+async def _run_uploads(
+    args: argparse.Namespace,
+    organization_id: OrganizationID,
+    realm_id: VlobID,
+    pool_size: int,
+    legacy: bool,
+) -> Dict[str, float]:
+    author = DeviceID("alice@dev1")
+    block = os.urandom(args.block_size)
+    create_timings: List[float] = []
+    probe_timings: List[float] = []
+    uploads = iter(range(args.uploads))
+
+    dbh = PGHandler(args.db, pool_size, pool_size, EventBus())
+    blockstore = SlowBlockStoreComponent(args.upload_latency)
+    component_cls = LegacyPGBlockComponent if legacy else PGBlockComponent
+    component = component_cls(dbh=dbh, blockstore_component=blockstore)
+
+    async def _uploader() -> None:
+        for _ in uploads:
+            start = time.perf_counter()
+            await component.create(organization_id, author, BlockID.new(), realm_id, block)
+            create_timings.append(time.perf_counter() - start)
+
+    async def _prober() -> None:
+        while True:
+            start = time.perf_counter()
+            async with dbh.pool.acquire() as conn:
+                await conn.fetchval("SELECT 1")
+            probe_timings.append(time.perf_counter() - start)
+            await trio.sleep(args.probe_interval)
+
+    async with trio.open_nursery() as nursery:
+        await dbh.init(nursery, None)
+        try:
+            nursery.start_soon(_prober)
+            started_on = time.perf_counter()
+            async with trio.open_nursery() as uploaders_nursery:
+                for _ in range(args.uploaders):
+                    uploaders_nursery.start_soon(_uploader)
+            total = time.perf_counter() - started_on
+        finally:
+            await dbh.teardown()
+            nursery.cancel_scope.cancel()
+
+    create_stats = _percentiles(create_timings)
+    probe_stats = _percentiles(probe_timings)
+    return {
+        "blocks_per_s": args.uploads / total,
+        "create_median_ms": create_stats["median_ms"],
+        "create_p95_ms": create_stats["p95_ms"],
+        "other_query_median_ms": probe_stats["median_ms"],
+        "other_query_p95_ms": probe_stats["p95_ms"],
+    }
+
+
+async def _bench(args: argparse.Namespace) -> Dict[str, Any]:
+    async with triopg.connect(args.db) as conn:
+        await _init_connection(conn)
+        result = await _apply_migrations(conn, retrieve_migrations(), dry_run=False)
+        if result.error:
+            migration, msg = result.error
+            raise SystemExit(f"Cannot apply migration {migration.file_name}: {msg}")
+
+        organization_id = OrganizationID(f"Bench{uuid4().hex[:8]}")
+        realm_id = await _populate(conn, organization_id)
+
+    results = {}
+    for pool_size in args.pool_sizes:
+        results[f"legacy_pool_{pool_size}"] = await _run_uploads(
+            args, organization_id, realm_id, pool_size, legacy=True
+        )
+        results[f"two_phase_pool_{pool_size}"] = await _run_uploads(
+            args, organization_id, realm_id, pool_size, legacy=False
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("PG_URL"),
+        help="URL of an empty PostgreSQL database (default: `PG_URL` env var)",
+    )
+    parser.add_argument(
+        "--pool-sizes",
+        type=int,
+        nargs="+",
+        default=[2, 5, 10],
+        help="Database connection pool sizes (default: 2 5 10)",
+    )
+    parser.add_argument("--uploads", type=int, default=500)
+    parser.add_argument("--uploaders", type=int, default=50, help="Concurrent uploads")
+    parser.add_argument(
+        "--upload-latency",
+        type=float,
+        default=0.2,
+        help="Simulated blockstore upload latency in seconds (default: 0.2)",
+    )
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument(
+        "--probe-interval",
+        type=float,
+        default=0.01,
+        help="Interval in seconds between the unrelated queries (default: 0.01)",
+    )
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("a PostgreSQL database is required (use `--db` or `PG_URL` env var)")
+
+    results = trio_run(_bench, args, use_asyncio=True)
+
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k != "db"}
+        print(json.dumps({"params": params, "results": results}, indent=2))
+    else:
+        for name, stats in results.items():
+            print(
+                f"{name:<20} {stats['blocks_per_s']:8.1f} blocks/s"
+                f"  create median {stats['create_median_ms']:8.2f}ms"
+                f" p95 {stats['create_p95_ms']:8.2f}ms"
+                f"  other query median {stats['other_query_median_ms']:8.2f}ms"
+                f" p95 {stats['other_query_p95_ms']:8.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure the cost of the PostgreSQL event log: on each event sent, and on SSE reconnection.
+
+Events are sent with and without the event log enabled to get the overhead of
+persisting them, then an organization's event log is populated with `--events`
+events and the events missed by a reconnecting client are replayed for an
+increasing number of missed events.
+
+Migrations are applied and a new organization is populated, so use a throwaway database.
+
+Usage: python benchmarks/bench_event_log_replay.py --db postgresql://... [--events 100000] [--json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import time
+from hashlib import md5
+from typing import Any, Dict, List
+from uuid import uuid4
+
+import triopg
+
+from parsec._parsec import BackendEventPinged, DateTime, DeviceID, OrganizationID
+from parsec.backend.postgresql.handler import (
+    EVENT_LOG_SETTING,
+    PGConnection,
+    _apply_migrations,
+    get_logged_events,
+    handle_datetime,
+    handle_integer,
+    handle_uuid,
+    retrieve_migrations,
+    send_signal,
+)
+from parsec.utils import trio_run
+
+
+async def _init_connection(conn: triopg._triopg.TrioConnectionProxy) -> None:
+    await handle_datetime(conn)
+    await handle_uuid(conn)
+    await handle_integer(conn)
+
+
+def _event_id(prefix: str, index: int) -> str:
+    # Must be kept consistent with the ids generated by `_populate`
+    return md5(f"{prefix}{index}".encode()).hexdigest()
+
+
+async def _populate(
+    conn: triopg._triopg.TrioConnectionProxy,
+    organization_id: OrganizationID,
+    prefix: str,
+    events: int,
+    event: bytes,
+) -> None:
+    """
+    Create an organization with `events` events in the event log
+    """
+    org_internal_id = await conn.fetchval(
+        """
+INSERT INTO organization (
+    organization_id, bootstrap_token, user_profile_outsider_allowed, is_expired, _created_on
+)
+VALUES ($1, '', TRUE, FALSE, $2)
+RETURNING _id
+""",
+        organization_id.str,
+        DateTime.now(),
+    )
+    await conn.execute(
+        """
+INSERT INTO event_log (organization, event_id, event, created_on, xact_id, xact_xmin)
+SELECT $1, md5($2 || i::TEXT), $3, NOW(), txid_current(), txid_current()
+FROM generate_series(1, $4) AS i
+ORDER BY i
+""",
+        org_internal_id,
+        prefix,
+        event,
+        events,
+    )
+    await conn.execute("ANALYZE event_log")
+
+
+def _stats(timings: List[float], events: int) -> Dict[str, float]:
+    timings = sorted(timings)
+    return {
+        "median_ms": statistics.median(timings) * 1e3,
+        "p95_ms": timings[int(len(timings) * 0.95)] * 1e3,
+        "events_per_s": events * len(timings) / sum(timings),
+    }
+
+
+async def _bench_send(
+    db: str, organization_id: OrganizationID, event_log: bool, signals: int
+) -> Dict[str, float]:
+    server_settings = {EVENT_LOG_SETTING: "on"} if event_log else {}
+    async with triopg.connect(
+        db, connection_class=PGConnection, server_settings=server_settings
+    ) as conn:
+        await _init_connection(conn)
+        timings = []
+        for i in range(signals):
+            event = BackendEventPinged(organization_id, DeviceID("alice@dev1"), f"ping {i}")
+            start = time.perf_counter()
+            await send_signal(conn, event)
+            timings.append(time.perf_counter() - start)
+    return _stats(timings, 1)
+
+
+async def _bench(args: argparse.Namespace) -> Dict[str, Any]:
+    async with triopg.connect(args.db) as conn:
+        await _init_connection(conn)
+        result = await _apply_migrations(conn, retrieve_migrations(), dry_run=False)
+        if result.error:
+            migration, msg = result.error
+            raise SystemExit(f"Cannot apply migration {migration.file_name}: {msg}")
+
+        organization_id = OrganizationID(f"Bench{uuid4().hex[:8]}")
+        prefix = uuid4().hex
+        event = BackendEventPinged(organization_id, DeviceID("alice@dev1"), "ping").dump()
+        await _populate(conn, organization_id, prefix, args.events, event)
+
+    results: Dict[str, Any] = {
+        "send_without_event_log": await _bench_send(
+            args.db, organization_id, event_log=False, signals=args.signals
+        ),
+        "send_with_event_log": await _bench_send(
+            args.db, organization_id, event_log=True, signals=args.signals
+        ),
+    }
+
+    async with triopg.connect(args.db, connection_class=PGConnection) as conn:
+        await _init_connection(conn)
+        for missed in args.missed:
+            if missed >= args.events:
+                continue
+            last_event_id = _event_id(prefix, args.events - missed)
+            timings = []
+            for _ in range(args.repetitions):
+                start = time.perf_counter()
+                events = await get_logged_events(
+                    conn, organization_id, last_event_id, max_events=missed
+                )
+                timings.append(time.perf_counter() - start)
+                assert events is not None and len(events) == missed
+            results[f"replay_{missed}_missed"] = _stats(timings, missed)
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("PG_URL"),
+        help="URL of an empty PostgreSQL database (default: `PG_URL` env var)",
+    )
+    parser.add_argument("--events", type=int, default=100_000, help="Events in the event log")
+    parser.add_argument(
+        "--missed",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100, 1000, 10000],
+        help="Number of events missed by the reconnecting client (default: 1 10 100 1000 10000)",
+    )
+    parser.add_argument("--signals", type=int, default=1000, help="Events sent per mode")
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("a PostgreSQL database is required (use `--db` or `PG_URL` env var)")
+
+    results = trio_run(_bench, args, use_asyncio=True)
+
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k != "db"}
+        print(json.dumps({"params": params, "results": results}, indent=2))
+    else:
+        for name, stats in results.items():
+            print(
+                f"{name:<24} median {stats['median_ms']:8.2f}ms  p95 {stats['p95_ms']:8.2f}ms"
+                f"  {stats['events_per_s']:10.1f} events/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure the cost of dispatching backend events to the connected clients.
+
+Compare the legacy routing (each client registers its own callbacks on the
+event bus and filters every single event) with the `EventsDispatcher` index.
+
+Usage: python benchmarks/bench_events_fanout.py [--clients 10000] [--orgs 1000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import time
+from typing import Any, Callable, Dict, List
+
+import trio
+
+from parsec._parsec import (
+    ApiVersion,
+    BackendEvent,
+    BackendEventCertificatesUpdated,
+    BackendEventInviteStatusChanged,
+    BackendEventMessageReceived,
+    BackendEventPinged,
+    BackendEventPkiEnrollmentUpdated,
+    BackendEventRealmMaintenanceFinished,
+    BackendEventRealmMaintenanceStarted,
+    BackendEventRealmRolesUpdated,
+    BackendEventRealmVlobsUpdated,
+    DeviceID,
+    OrganizationID,
+    PrivateKey,
+    SigningKey,
+    VlobID,
+)
+from parsec.api.protocol.types import UserProfile
+from parsec.backend.client_context import AuthenticatedClientContext
+from parsec.backend.events import EventsDispatcher, _is_event_for_our_client
+from parsec.event_bus import EventBus
+
+EVENT_TYPES = (
+    BackendEventCertificatesUpdated,
+    BackendEventPinged,
+    BackendEventRealmVlobsUpdated,
+    BackendEventRealmMaintenanceStarted,
+    BackendEventRealmMaintenanceFinished,
+    BackendEventMessageReceived,
+    BackendEventInviteStatusChanged,
+    BackendEventPkiEnrollmentUpdated,
+    BackendEventRealmRolesUpdated,
+)
+
+
+def _make_clients(
+    clients_count: int, orgs_count: int, realms_per_org: int
+) -> tuple[List[AuthenticatedClientContext], Dict[OrganizationID, List[VlobID]]]:
+    verify_key = SigningKey.generate().verify_key
+    public_key = PrivateKey.generate().public_key
+    orgs = [OrganizationID(f"Org{i}") for i in range(orgs_count)]
+    realms = {org: [VlobID.new() for _ in range(realms_per_org)] for org in orgs}
+    clients = []
+    for i in range(clients_count):
+        org = orgs[i % orgs_count]
+        client_ctx = AuthenticatedClientContext(
+            api_version=ApiVersion.API_LATEST_VERSION,
+            client_api_version=ApiVersion.API_LATEST_VERSION,
+            organization_id=org,
+            device_id=DeviceID(f"user{i}@dev1"),
+            human_handle=None,
+            device_label=None,
+            profile=UserProfile.STANDARD,
+            public_key=public_key,
+            verify_key=verify_key,
+        )
+        # Each client is part of one realm of its organization
+        client_ctx.realms = {realms[org][i % realms_per_org]}
+        clients.append(client_ctx)
+    return clients, realms
+
+
+def _drain(clients: List[AuthenticatedClientContext]) -> None:
+    for client_ctx in clients:
+        while True:
+            try:
+                client_ctx.receive_events_channel.receive_nowait()
+            except trio.WouldBlock:
+                break
+
+
+def _setup_legacy(clients: List[AuthenticatedClientContext]) -> Callable[[str, BackendEvent], None]:
+    event_bus = EventBus()
+    for client_ctx in clients:
+
+        def _on_event(
+            event: Any, event_id: str, payload: BackendEvent, client_ctx: Any = client_ctx
+        ) -> None:
+            if _is_event_for_our_client(client_ctx, payload):
+                try:
+                    client_ctx.send_events_channel.send_nowait((event_id, payload))
+                except trio.WouldBlock:
+                    client_ctx.close_connection_asap()
+
+        for event_type in EVENT_TYPES:
+            event_bus.connect(event_type, _on_event)  # type: ignore
+
+    def _send(event_id: str, event: BackendEvent) -> None:
+        event_bus.send(type(event), event_id=event_id, payload=event)
+
+    return _send
+
+
+def _setup_dispatcher(
+    clients: List[AuthenticatedClientContext],
+) -> Callable[[str, BackendEvent], None]:
+    dispatcher = EventsDispatcher()
+    for client_ctx in clients:
+        dispatcher.subscribe(client_ctx)
+    return dispatcher.dispatch
+
+
+def _bench(
+    send: Callable[[str, BackendEvent], None],
+    clients: List[AuthenticatedClientContext],
+    events: List[BackendEvent],
+    rounds: int,
+) -> float:
+    # Events are sent by small batches so that clients' channels never get full
+    batch_size = 50
+    elapsed = 0.0
+    for _ in range(rounds):
+        for batch_start in range(0, len(events), batch_size):
+            batch = events[batch_start : batch_start + batch_size]
+            start = time.perf_counter()
+            for event in batch:
+                send("event_id", event)
+            elapsed += time.perf_counter() - start
+            _drain(clients)
+    return elapsed / (rounds * len(events))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--orgs", type=int, default=1_000)
+    parser.add_argument("--realms-per-org", type=int, default=5)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+
+    clients, realms = _make_clients(args.clients, args.orgs, args.realms_per_org)
+    orgs = list(realms.keys())
+    author = DeviceID("author@dev1")
+    events_kinds: Dict[str, List[BackendEvent]] = {
+        "pinged": [
+            BackendEventPinged(orgs[i % len(orgs)], author, "ping") for i in range(args.events)
+        ],
+        "realm_vlobs_updated": [
+            BackendEventRealmVlobsUpdated(
+                orgs[i % len(orgs)],
+                author,
+                realms[orgs[i % len(orgs)]][i % args.realms_per_org],
+                i,
+                VlobID.new(),
+                1,
+            )
+            for i in range(args.events)
+        ],
+    }
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name, setup in (("legacy", _setup_legacy), ("dispatcher", _setup_dispatcher)):
+        send = setup(clients)
+        for kind, events in events_kinds.items():
+            per_event = _bench(send, clients, events, args.rounds)
+            results.setdefault(kind, {})[name] = per_event
+        # Make sure no event is left over for the next implementation
+        _drain(clients)
+
+    if args.json:
+        print(json.dumps({"params": vars(args), "results_s_per_event": results}, indent=2))
+        return
+
+    print(
+        f"{args.clients} clients over {args.orgs} organizations"
+        f" ({math.ceil(args.clients / args.orgs)} clients/org, {args.realms_per_org} realms/org)"
+    )
+    for kind, by_impl in results.items():
+        legacy = by_impl["legacy"]
+        dispatcher = by_impl["dispatcher"]
+        print(
+            f"{kind:<22} legacy: {legacy * 1e6:10.1f}us/event"
+            f"  dispatcher: {dispatcher * 1e6:8.1f}us/event"
+            f"  speedup: x{legacy / dispatcher:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure the filesystem blockstore throughput, compared with the PostgreSQL blockstore.
+
+Blocks are created then read by concurrent clients. The filesystem blockstore
+is measured with a fsync per block, with batched fsync (group commit) and
+without fsync. The PostgreSQL blockstore is only measured if a database is
+provided.
+
+Migrations are applied and blocks are inserted, so use a throwaway database.
+
+Usage: python benchmarks/bench_fs_blockstore.py [--path /mnt/vol] [--db postgresql://...] [--json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+from uuid import uuid4
+
+import trio
+import triopg
+
+from parsec._parsec import BlockID, OrganizationID
+from parsec.backend.blockstore import BaseBlockStoreComponent
+from parsec.backend.fs_blockstore import FileSystemBlockStoreComponent
+from parsec.backend.postgresql.block import PGBlockStoreComponent
+from parsec.backend.postgresql.handler import (
+    PGHandler,
+    _apply_migrations,
+    handle_datetime,
+    handle_integer,
+    handle_uuid,
+    retrieve_migrations,
+)
+from parsec.event_bus import EventBus
+from parsec.utils import trio_run
+
+
+async def _run_concurrently(
+    concurrency: int, block_ids: List[BlockID], fn: Callable[[BlockID], Awaitable[None]]
+) -> Dict[str, float]:
+    timings: List[float] = []
+    remaining = iter(block_ids)
+
+    async def _client() -> None:
+        for block_id in remaining:
+            start = time.perf_counter()
+            await fn(block_id)
+            timings.append(time.perf_counter() - start)
+
+    started_on = time.perf_counter()
+    async with trio.open_nursery() as nursery:
+        for _ in range(concurrency):
+            nursery.start_soon(_client)
+    total = time.perf_counter() - started_on
+
+    timings.sort()
+    return {
+        "blocks_per_s": len(block_ids) / total,
+        "median_ms": statistics.median(timings) * 1e3,
+        "p95_ms": timings[int(len(timings) * 0.95)] * 1e3,
+    }
+
+
+async def _bench_blockstore(
+    args: argparse.Namespace, blockstore: BaseBlockStoreComponent
+) -> Dict[str, Dict[str, float]]:
+    organization_id = OrganizationID(f"Bench{uuid4().hex[:8]}")
+    block = os.urandom(args.block_size)
+    block_ids = [BlockID.new() for _ in range(args.blocks)]
+
+    async def _create(block_id: BlockID) -> None:
+        await blockstore.create(organization_id, block_id, block)
+
+    async def _read(block_id: BlockID) -> None:
+        await blockstore.read(organization_id, block_id)
+
+    create_stats = await _run_concurrently(args.concurrency, block_ids, _create)
+    read_stats = await _run_concurrently(args.concurrency, block_ids, _read)
+    for stats in (create_stats, read_stats):
+        stats["mb_per_s"] = stats["blocks_per_s"] * args.block_size / 1e6
+    return {"create": create_stats, "read": read_stats}
+
+
+async def _bench_postgresql(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    async with triopg.connect(args.db) as conn:
+        await handle_datetime(conn)
+        await handle_uuid(conn)
+        await handle_integer(conn)
+        result = await _apply_migrations(conn, retrieve_migrations(), dry_run=False)
+        if result.error:
+            migration, msg = result.error
+            raise SystemExit(f"Cannot apply migration {migration.file_name}: {msg}")
+
+    dbh = PGHandler(args.db, args.concurrency, args.concurrency, EventBus())
+    async with trio.open_nursery() as nursery:
+        await dbh.init(nursery, None)
+        try:
+            return await _bench_blockstore(args, PGBlockStoreComponent(dbh))
+        finally:
+            await dbh.teardown()
+            nursery.cancel_scope.cancel()
+
+
+async def _bench(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(dir=args.path) as tmp_dir:
+        root = Path(tmp_dir)
+        results: Dict[str, Any] = {
+            "fs_fsync": await _bench_blockstore(
+                args, FileSystemBlockStoreComponent(root / "fsync")
+            ),
+            "fs_fsync_batch": await _bench_blockstore(
+                args,
+                FileSystemBlockStoreComponent(
+                    root / "fsync_batch", fsync_batch_delay=args.fsync_batch_delay
+                ),
+            ),
+            "fs_nofsync": await _bench_blockstore(
+                args, FileSystemBlockStoreComponent(root / "nofsync", fsync=False)
+            ),
+        }
+    if args.db:
+        results["postgresql"] = await _bench_postgresql(args)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--path",
+        type=Path,
+        default=None,
+        help="Volume to store the blocks on (default: system's temporary directory)",
+    )
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("PG_URL"),
+        help="URL of an empty PostgreSQL database (default: `PG_URL` env var, skipped if not set)",
+    )
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--block-size", type=int, default=64 * 1024)
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument(
+        "--fsync-batch-delay",
+        type=float,
+        default=0.002,
+        help="Delay in seconds of the fsync batches (default: 0.002)",
+    )
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+
+    results = trio_run(_bench, args, use_asyncio=bool(args.db))
+
+    if args.json:
+        params = {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()}
+        del params["db"]
+        print(json.dumps({"params": params, "results": results}, indent=2))
+    else:
+        for name, operations in results.items():
+            for operation, stats in operations.items():
+                print(
+                    f"{name + ' ' + operation:<24} {stats['blocks_per_s']:8.1f} blocks/s"
+                    f"  {stats['mb_per_s']:8.1f} MB/s"
+                    f"  median {stats['median_ms']:7.2f}ms  p95 {stats['p95_ms']:7.2f}ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Compare the RAID1 read modes (all mirrors at once vs hedged reads).
+
+Mirrors are simulated with a log-normal latency, occasional latency spikes and
+a limited number of concurrent requests (so extra requests come at a cost).
+Time is virtual (trio's mock clock), so the benchmark is fast and reproducible.
+
+Usage: python benchmarks/bench_raid1_hedged_reads.py [--mirrors 2] [--reads 5000] [--clients 8]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+from typing import Dict, List
+
+import trio
+from trio.testing import MockClock
+
+from parsec._parsec import BlockID, OrganizationID
+from parsec.backend.memory import MemoryBlockStoreComponent
+from parsec.backend.raid1_blockstore import RAID1BlockStoreComponent
+
+ORGANIZATION_ID = OrganizationID("BenchOrg")
+
+
+class SimulatedMirror(MemoryBlockStoreComponent):
+    def __init__(
+        self,
+        server_nursery: trio.Nursery,
+        rng: random.Random,
+        median_latency: float,
+        spike_probability: float,
+        spike_latency: float,
+        concurrency: int,
+    ):
+        super().__init__()
+        self._server_nursery = server_nursery
+        self._rng = rng
+        self._median_latency = median_latency
+        self._spike_probability = spike_probability
+        self._spike_latency = spike_latency
+        self._slots = trio.Semaphore(concurrency)
+        self.requests = 0
+
+    async def _serve(self, done: trio.Event) -> None:
+        async with self._slots:
+            latency = self._median_latency * self._rng.lognormvariate(0, 0.3)
+            if self._rng.random() < self._spike_probability:
+                latency += self._spike_latency
+            await trio.sleep(latency)
+        done.set()
+
+    async def read(self, organization_id: OrganizationID, block_id: BlockID) -> bytes:
+        self.requests += 1
+        # Like a real server, the mirror keeps processing the request even if
+        # the client gave up on it
+        done = trio.Event()
+        self._server_nursery.start_soon(self._serve, done)
+        await done.wait()
+        return await super().read(organization_id, block_id)
+
+
+async def _bench(args: argparse.Namespace, hedged_reads: bool) -> Dict[str, float]:
+    rng = random.Random(args.seed)
+    async with trio.open_nursery() as server_nursery:
+        result = await _bench_with_mirrors(args, hedged_reads, server_nursery, rng)
+        server_nursery.cancel_scope.cancel()
+    return result
+
+
+async def _bench_with_mirrors(
+    args: argparse.Namespace, hedged_reads: bool, server_nursery: trio.Nursery, rng: random.Random
+) -> Dict[str, float]:
+    mirrors = [
+        SimulatedMirror(
+            server_nursery,
+            rng,
+            # Mirrors are not equally fast
+            median_latency=args.median_latency * (1 + i * 0.5),
+            spike_probability=args.spike_probability,
+            spike_latency=args.spike_latency,
+            concurrency=args.mirror_concurrency,
+        )
+        for i in range(args.mirrors)
+    ]
+    blockstore = RAID1BlockStoreComponent(
+        mirrors, hedged_reads=hedged_reads  # type: ignore[arg-type]
+    )
+    block_ids = [BlockID.new() for _ in range(100)]
+    for block_id in block_ids:
+        await blockstore.create(ORGANIZATION_ID, block_id, b"x")
+
+    timings: List[float] = []
+
+    async def _client(reads: int) -> None:
+        for i in range(reads):
+            started_on = trio.current_time()
+            await blockstore.read(ORGANIZATION_ID, block_ids[i % len(block_ids)])
+            timings.append(trio.current_time() - started_on)
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(args.clients):
+            nursery.start_soon(_client, args.reads // args.clients)
+
+    timings.sort()
+    return {
+        "requests_per_read": sum(mirror.requests for mirror in mirrors) / len(timings),
+        "p50_ms": timings[len(timings) // 2] * 1e3,
+        "p99_ms": timings[int(len(timings) * 0.99)] * 1e3,
+        "p999_ms": timings[int(len(timings) * 0.999)] * 1e3,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mirrors", type=int, default=2)
+    parser.add_argument("--reads", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent readers")
+    parser.add_argument("--median-latency", type=float, default=0.010, help="In seconds")
+    parser.add_argument("--spike-probability", type=float, default=0.02)
+    parser.add_argument("--spike-latency", type=float, default=0.200, help="In seconds")
+    parser.add_argument(
+        "--mirror-concurrency", type=int, default=4, help="Concurrent requests served by a mirror"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for name, hedged_reads in (("read_all", False), ("hedged", True)):
+        clock = MockClock(autojump_threshold=0)
+        results[name] = trio.run(_bench, args, hedged_reads, clock=clock)
+
+    if args.json:
+        print(json.dumps({"params": vars(args), "results": results}, indent=2))
+    else:
+        for name, stats in results.items():
+            print(
+                f"{name:<10} requests/read {stats['requests_per_read']:5.2f}"
+                f"  p50 {stats['p50_ms']:7.1f}ms  p99 {stats['p99_ms']:7.1f}ms"
+                f"  p99.9 {stats['p999_ms']:7.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
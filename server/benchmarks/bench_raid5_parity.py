@@ -0,0 +1,152 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure the cost of the RAID5 chunking and parity computation.
+
+Compare the legacy implementation (padded payload copy, big integers XOR and
+full payload copy on rebuild) with the current one, using NumPy if available
+and the pure Python fallback.
+
+Usage: python benchmarks/bench_raid5_parity.py [--sizes 4096,65536,524288] [--nodes 3,5,9]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+import time
+from sys import byteorder
+from types import ModuleType
+from typing import Callable, Dict, List
+
+from parsec.backend import raid5_blockstore
+from parsec.backend.raid5_blockstore import (
+    generate_checksum_chunk,
+    rebuild_block_from_chunks,
+    split_block_in_chunks,
+)
+
+
+def _legacy_xor_buffers(*buffers: bytes) -> bytes:
+    buff_len = len(buffers[0])
+    xored = int.from_bytes(buffers[0], byteorder)
+    for buff in buffers[1:]:
+        xored ^= int.from_bytes(buff, byteorder)
+    return xored.to_bytes(buff_len, byteorder)
+
+
+def _legacy_split_block_in_chunks(block: bytes, nb_chunks: int) -> List[bytes]:
+    payload_size = len(block) + 4
+    chunk_len = payload_size // nb_chunks
+    if nb_chunks * chunk_len < payload_size:
+        chunk_len += 1
+    padding_len = chunk_len * nb_chunks - payload_size
+    payload = struct.pack("!I", len(block)) + block + b"\x00" * padding_len
+    return [payload[chunk_len * i : chunk_len * (i + 1)] for i in range(nb_chunks)]
+
+
+def _legacy_rebuild_block_from_chunks(chunks: List[bytes | None], checksum_chunk: bytes) -> bytes:
+    valid_chunks = [chunk for chunk in chunks if chunk is not None]
+    missing_chunk_id = next(index for index, chunk in enumerate(chunks) if chunk is None)
+    chunks[missing_chunk_id] = _legacy_xor_buffers(*valid_chunks, checksum_chunk)
+    payload = b"".join(chunks)  # type: ignore[arg-type]
+    (block_len,) = struct.unpack("!I", payload[:4])
+    return payload[4 : 4 + block_len]
+
+
+def _timeit(fn: Callable[[], object], min_duration: float) -> float:
+    # Repeat until the measurement is long enough to be meaningful
+    iterations = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        iterations += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_duration:
+            return elapsed / iterations
+
+
+def _bench_implementation(
+    block: bytes,
+    nb_chunks: int,
+    split: Callable[[bytes, int], List[bytes]],
+    checksum: Callable[[List[bytes]], bytes],
+    rebuild: Callable[[List[bytes | None], bytes], bytes],
+    min_duration: float,
+) -> Dict[str, float]:
+    chunks = split(block, nb_chunks)
+    checksum_chunk = checksum(chunks)
+
+    def _create() -> None:
+        checksum(split(block, nb_chunks))
+
+    def _degraded_read() -> None:
+        # Worst case read: a chunk is missing and must be rebuilt from the parity
+        rebuild([None, *chunks[1:]], checksum_chunk)
+
+    return {
+        "create_us": _timeit(_create, min_duration) * 1e6,
+        "degraded_read_us": _timeit(_degraded_read, min_duration) * 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="4096,65536,524288", help="Block sizes in bytes")
+    parser.add_argument("--nodes", default="3,5,9", help="RAID5 node counts (parity included)")
+    parser.add_argument(
+        "--min-duration", type=float, default=0.2, help="Minimal duration of each measure (s)"
+    )
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+
+    numpy = raid5_blockstore.numpy
+    # Current implementation is measured with and without NumPy
+    implementations: Dict[str, ModuleType | None] = {"legacy": None, "python": None}
+    if numpy is not None:
+        implementations["numpy"] = numpy
+
+    results = []
+    for size in [int(x) for x in args.sizes.split(",")]:
+        block = os.urandom(size)
+        for nodes in [int(x) for x in args.nodes.split(",")]:
+            for name, numpy_module in implementations.items():
+                raid5_blockstore.numpy = numpy_module  # type: ignore[assignment]
+                if name == "legacy":
+                    result = _bench_implementation(
+                        block,
+                        nodes - 1,
+                        _legacy_split_block_in_chunks,
+                        lambda chunks: _legacy_xor_buffers(*chunks),
+                        _legacy_rebuild_block_from_chunks,
+                        args.min_duration,
+                    )
+                else:
+                    result = _bench_implementation(
+                        block,
+                        nodes - 1,
+                        split_block_in_chunks,
+                        generate_checksum_chunk,
+                        rebuild_block_from_chunks,  # type: ignore[arg-type]
+                        args.min_duration,
+                    )
+                results.append(
+                    {"implementation": name, "block_size": size, "nodes": nodes, **result}
+                )
+
+    if args.json:
+        print(json.dumps({"params": vars(args), "results": results}, indent=2))
+    else:
+        print(
+            f"{'implementation':<15}{'block size':>12}{'nodes':>7}"
+            f"{'create':>14}{'degraded read':>16}"
+        )
+        for r in results:
+            print(
+                f"{r['implementation']:<15}{r['block_size']:>12}{r['nodes']:>7}"
+                f"{r['create_us']:>12.1f}us{r['degraded_read_us']:>14.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
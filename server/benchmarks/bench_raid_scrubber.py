@@ -0,0 +1,161 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure the impact of the RAID scrubber on the foreground reads, depending on its I/O budget.
+
+The RAID5 nodes are simulated in memory with a limited bandwidth shared by all
+their requests (typically a disk or a network link), so a scrubber reading too
+much slows down the foreground reads. Foreground clients read random blocks
+while the scrubber goes through all the blocks (one node having lost a third of
+its chunks), the scrubber is then measured with increasing I/O budgets.
+
+Usage: python benchmarks/bench_raid_scrubber.py [--blocks 500] [--node-bandwidth 50] [--json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from typing import Any, Dict, List
+
+import trio
+
+from parsec._parsec import BlockID, OrganizationID
+from parsec.backend.memory import MemoryBlockStoreComponent
+from parsec.backend.postgresql.raid_scrubber import PGRAIDScrubber
+from parsec.backend.raid5_blockstore import RAID5BlockStoreComponent
+from parsec.utils import trio_run
+
+
+class BandwidthLimitedBlockStoreComponent(MemoryBlockStoreComponent):
+    def __init__(self, bandwidth: float):
+        super().__init__()
+        self._bandwidth = bandwidth
+        # Requests are served one at a time, each taking the time to transfer its data
+        self._lock = trio.Lock()
+
+    async def _transfer(self, size: int) -> None:
+        async with self._lock:
+            await trio.sleep(size / self._bandwidth)
+
+    async def read(self, organization_id: OrganizationID, block_id: BlockID) -> bytes:
+        block = await super().read(organization_id, block_id)
+        await self._transfer(len(block))
+        return block
+
+    async def create(
+        self, organization_id: OrganizationID, block_id: BlockID, block: bytes
+    ) -> None:
+        await self._transfer(len(block))
+        await super().create(organization_id, block_id, block)
+
+
+async def _run(args: argparse.Namespace, io_budget: int | None) -> Dict[str, float]:
+    organization_id = OrganizationID("Bench")
+    nodes = [BandwidthLimitedBlockStoreComponent(args.node_bandwidth * 1e6) for _ in range(3)]
+    blockstore = RAID5BlockStoreComponent(nodes)
+    block_ids = [BlockID.new() for _ in range(args.blocks)]
+    block = os.urandom(args.block_size)
+    # Populate the nodes without paying the transfer time, then lose some chunks
+    populate = RAID5BlockStoreComponent([MemoryBlockStoreComponent() for _ in range(3)])
+    for block_id in block_ids:
+        await populate.create(organization_id, block_id, block)
+    for node, populated_node in zip(nodes, populate.blockstores):
+        node._blocks = populated_node._blocks  # type: ignore[attr-defined]
+    for block_id in block_ids[::3]:
+        del nodes[0]._blocks[(organization_id, block_id)]
+
+    read_timings: List[float] = []
+    scrub_duration = 0.0
+
+    async def _client() -> None:
+        while True:
+            start = time.perf_counter()
+            await blockstore.read(organization_id, random.choice(block_ids))
+            read_timings.append(time.perf_counter() - start)
+            await trio.sleep(args.think_time)
+
+    async def _scrub() -> None:
+        nonlocal scrub_duration
+        assert io_budget is not None
+        # Blocks are provided directly, so no database is needed
+        scrubber = PGRAIDScrubber(
+            dbh=None, blockstore=blockstore, io_budget=io_budget  # type: ignore[arg-type]
+        )
+        start = time.perf_counter()
+        for block_id in block_ids:
+            await scrubber.scrub_block(organization_id, block_id, len(block))
+        scrub_duration = time.perf_counter() - start
+        assert scrubber.repaired_nodes == len(block_ids[::3])
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(args.clients):
+            nursery.start_soon(_client)
+        if io_budget is None:
+            await trio.sleep(args.duration)
+        else:
+            await _scrub()
+        nursery.cancel_scope.cancel()
+
+    read_timings.sort()
+    return {
+        "read_median_ms": statistics.median(read_timings) * 1e3,
+        "read_p95_ms": read_timings[int(len(read_timings) * 0.95)] * 1e3,
+        "scrub_blocks_per_s": args.blocks / scrub_duration if scrub_duration else 0.0,
+    }
+
+
+async def _bench(args: argparse.Namespace) -> Dict[str, Any]:
+    results = {"no_scrub": await _run(args, None)}
+    for io_budget in args.io_budgets:
+        results[f"scrub_{io_budget}MBps"] = await _run(args, int(io_budget * 1e6))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--blocks", type=int, default=500)
+    parser.add_argument("--block-size", type=int, default=512 * 1024)
+    parser.add_argument(
+        "--node-bandwidth", type=float, default=50, help="Bandwidth of each node in MB/s"
+    )
+    parser.add_argument(
+        "--io-budgets",
+        type=float,
+        nargs="+",
+        default=[1, 5, 20, 1000],
+        help="Scrubber I/O budgets in MB/s (default: 1 5 20 1000)",
+    )
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent foreground clients")
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=0.05,
+        help="Delay in seconds between two reads of a client (default: 0.05)",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=5.0,
+        help="Duration in seconds of the measure without scrubber (default: 5)",
+    )
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+
+    results = trio_run(_bench, args)
+
+    if args.json:
+        print(json.dumps({"params": vars(args), "results": results}, indent=2))
+    else:
+        for name, stats in results.items():
+            print(
+                f"{name:<20} read median {stats['read_median_ms']:8.2f}ms"
+                f" p95 {stats['read_p95_ms']:8.2f}ms"
+                f"  scrub {stats['scrub_blocks_per_s']:8.1f} blocks/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure the PostgreSQL reencryption maintenance throughput on a big realm.
+
+A realm containing `--atoms` vlob atoms is put in reencryption maintenance, then
+batches are fetched and saved back (reencryption as identity) until the
+maintenance can be finished.
+
+The first `--legacy-batches` batches are saved with the legacy implementation
+(one `INSERT` per atom, then progress re-counted over the whole realm) to
+compare with the single statement batch insert and its incremental progress.
+
+Migrations are applied and a new organization is populated, so use a throwaway database.
+
+Usage: python benchmarks/bench_reencryption.py --db postgresql://... [--atoms 1000000] [--json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from uuid import uuid4
+
+import triopg
+
+from parsec._parsec import DateTime, DeviceID, OrganizationID, UserID, VlobID
+from parsec.backend.postgresql.handler import (
+    _apply_migrations,
+    handle_datetime,
+    handle_integer,
+    handle_uuid,
+    retrieve_migrations,
+)
+from parsec.backend.postgresql.realm_queries import (
+    query_finish_reencryption_maintenance,
+    query_start_reencryption_maintenance,
+)
+from parsec.backend.postgresql.utils import (
+    Q,
+    q_organization_internal_id,
+    q_vlob_encryption_revision_internal_id,
+)
+from parsec.backend.postgresql.vlob_queries import (
+    query_maintenance_get_reencryption_batch,
+    query_maintenance_save_reencryption_batch,
+)
+from parsec.utils import trio_run
+
+# Queries used before the batch was saved with a single statement
+
+_q_legacy_save_reencryption_batch = Q(
+    f"""
+INSERT INTO vlob_atom(
+    organization,
+    vlob_encryption_revision,
+    vlob_id,
+    version,
+    blob,
+    size,
+    author,
+    created_on,
+    deleted_on
+)
+SELECT
+    organization,
+    {
+        q_vlob_encryption_revision_internal_id(
+            organization_id="$organization_id",
+            realm_id="$realm_id",
+            encryption_revision="$encryption_revision",
+        )
+    },
+    $vlob_id,
+    $version,
+    $blob,
+    $blob_len,
+    author,
+    created_on,
+    deleted_on
+FROM vlob_atom
+WHERE
+    organization = { q_organization_internal_id("$organization_id") }
+    AND vlob_id = $vlob_id
+    AND version = $version
+ON CONFLICT DO NOTHING
+"""
+)
+
+
+_q_legacy_save_reencryption_batch_get_stat = Q(
+    f"""
+SELECT (
+    SELECT COUNT(*)
+    FROM vlob_atom
+    WHERE vlob_encryption_revision = {
+        q_vlob_encryption_revision_internal_id(
+            organization_id="$organization_id",
+            realm_id="$realm_id",
+            encryption_revision="$encryption_revision - 1",
+        )
+    }
+),
+(
+    SELECT COUNT(*)
+    FROM vlob_atom
+    WHERE vlob_encryption_revision = {
+        q_vlob_encryption_revision_internal_id(
+            organization_id="$organization_id",
+            realm_id="$realm_id",
+            encryption_revision="$encryption_revision",
+        )
+    }
+)
+"""
+)
+
+
+_q_bump_reencryption_done = Q(
+    f"""
+UPDATE vlob_encryption_revision
+SET reencryption_done = reencryption_done + $atoms
+WHERE _id = {
+    q_vlob_encryption_revision_internal_id(
+        organization_id="$organization_id", realm_id="$realm_id", encryption_revision="2"
+    )
+}
+"""
+)
+
+
+async def _legacy_save_reencryption_batch(
+    conn: triopg._triopg.TrioConnectionProxy,
+    organization_id: OrganizationID,
+    realm_id: VlobID,
+    encryption_revision: int,
+    batch: List[Tuple[VlobID, int, bytes]],
+) -> Tuple[int, int]:
+    async with conn.transaction():
+        for vlob_id, version, blob in batch:
+            await conn.execute(
+                *_q_legacy_save_reencryption_batch(
+                    organization_id=organization_id.str,
+                    realm_id=realm_id,
+                    vlob_id=vlob_id,
+                    version=version,
+                    encryption_revision=encryption_revision,
+                    blob=blob,
+                    blob_len=len(blob),
+                )
+            )
+        rep = await conn.fetchrow(
+            *_q_legacy_save_reencryption_batch_get_stat(
+                organization_id=organization_id.str,
+                realm_id=realm_id,
+                encryption_revision=encryption_revision,
+            )
+        )
+    return rep[0], rep[1]
+
+
+async def _init_connection(conn: triopg._triopg.TrioConnectionProxy) -> None:
+    await handle_datetime(conn)
+    await handle_uuid(conn)
+    await handle_integer(conn)
+
+
+async def _populate(
+    conn: triopg._triopg.TrioConnectionProxy,
+    organization_id: OrganizationID,
+    atoms: int,
+    versions_per_vlob: int,
+    blob_size: int,
+) -> VlobID:
+    """
+    Create an organization with a single user owning a realm of `atoms` vlob atoms
+    """
+    now = DateTime.now().subtract(days=1)
+    org_internal_id = await conn.fetchval(
+        """
+INSERT INTO organization (
+    organization_id, bootstrap_token, user_profile_outsider_allowed, is_expired, _created_on
+)
+VALUES ($1, '', TRUE, FALSE, $2)
+RETURNING _id
+""",
+        organization_id.str,
+        now,
+    )
+    user_internal_id = await conn.fetchval(
+        """
+INSERT INTO user_ (
+    organization, user_id, user_certificate, redacted_user_certificate, created_on, profile
+)
+VALUES ($1, 'alice', '', '', $2, 'ADMIN')
+RETURNING _id
+""",
+        org_internal_id,
+        now,
+    )
+    device_internal_id = await conn.fetchval(
+        """
+INSERT INTO device (
+    organization, user_, device_id, device_certificate, redacted_device_certificate, created_on
+)
+VALUES ($1, $2, 'alice@dev1', '', '', $3)
+RETURNING _id
+""",
+        org_internal_id,
+        user_internal_id,
+        now,
+    )
+    realm_id = VlobID.new()
+    realm_internal_id = await conn.fetchval(
+        """
+INSERT INTO realm (organization, realm_id, encryption_revision)
+VALUES ($1, $2, 1)
+RETURNING _id
+""",
+        org_internal_id,
+        realm_id,
+    )
+    ver_internal_id = await conn.fetchval(
+        """
+INSERT INTO vlob_encryption_revision (realm, encryption_revision)
+VALUES ($1, 1)
+RETURNING _id
+""",
+        realm_internal_id,
+    )
+    await conn.execute(
+        """
+INSERT INTO realm_user_role (realm, user_, role, certificate, certified_by, certified_on)
+VALUES ($1, $2, 'OWNER', '', $3, $4)
+""",
+        realm_internal_id,
+        user_internal_id,
+        device_internal_id,
+        now,
+    )
+    # Vlob ids are derived from the atom index so that consecutive atoms are
+    # the versions of the same vlob
+    await conn.execute(
+        """
+INSERT INTO vlob_atom (
+    organization, vlob_encryption_revision, vlob_id, version, blob, size, author, created_on
+)
+SELECT
+    $1,
+    $2,
+    md5($3::TEXT || ((i - 1) / $4)::TEXT)::UUID,
+    (i - 1) % $4 + 1,
+    $5,
+    OCTET_LENGTH($5),
+    $6,
+    $7
+FROM generate_series(1, $8) AS i
+""",
+        org_internal_id,
+        ver_internal_id,
+        realm_id.hex,
+        versions_per_vlob,
+        os.urandom(blob_size),
+        device_internal_id,
+        now,
+        atoms,
+    )
+    await conn.execute("ANALYZE vlob_atom")
+    return realm_id
+
+
+def _stats(timings: List[float], atoms: int) -> Dict[str, float]:
+    timings = sorted(timings)
+    return {
+        "batches": float(len(timings)),
+        "median_ms": statistics.median(timings) * 1e3,
+        "p95_ms": timings[int(len(timings) * 0.95)] * 1e3,
+        "atoms_per_s": atoms / sum(timings),
+    }
+
+
+async def _bench(args: argparse.Namespace) -> Dict[str, Any]:
+    async with triopg.connect(args.db) as conn:
+        await _init_connection(conn)
+        result = await _apply_migrations(conn, retrieve_migrations(), dry_run=False)
+        if result.error:
+            migration, msg = result.error
+            raise SystemExit(f"Cannot apply migration {migration.file_name}: {msg}")
+
+        organization_id = OrganizationID(f"Bench{uuid4().hex[:8]}")
+        author = DeviceID("alice@dev1")
+        realm_id = await _populate(
+            conn, organization_id, args.atoms, args.versions_per_vlob, args.blob_size
+        )
+
+        async def _timed(fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, float]:
+            start = time.perf_counter()
+            ret = await fn()
+            return ret, time.perf_counter() - start
+
+        _, start_maintenance_time = await _timed(
+            lambda: query_start_reencryption_maintenance(
+                conn, organization_id, author, realm_id, 2, {UserID("alice"): b""}, DateTime.now()
+            )
+        )
+
+        get_timings: List[float] = []
+        legacy_save_timings: List[float] = []
+        save_timings: List[float] = []
+        legacy_atoms = atoms = 0
+        started_on = time.perf_counter()
+        while True:
+            batch, elapsed = await _timed(
+                lambda: query_maintenance_get_reencryption_batch(
+                    conn, organization_id, author, realm_id, 2, args.batch_size
+                )
+            )
+            get_timings.append(elapsed)
+            if not batch:
+                break
+
+            if len(legacy_save_timings) < args.legacy_batches:
+                _, elapsed = await _timed(
+                    lambda: _legacy_save_reencryption_batch(
+                        conn, organization_id, realm_id, 2, batch
+                    )
+                )
+                legacy_save_timings.append(elapsed)
+                legacy_atoms += len(batch)
+            else:
+                _, elapsed = await _timed(
+                    lambda: query_maintenance_save_reencryption_batch(
+                        conn, organization_id, author, realm_id, 2, batch
+                    )
+                )
+                save_timings.append(elapsed)
+                atoms += len(batch)
+
+        total = time.perf_counter() - started_on
+
+        # Legacy saves don't maintain the progress counter
+        await conn.execute(
+            *_q_bump_reencryption_done(
+                organization_id=organization_id.str, realm_id=realm_id, atoms=legacy_atoms
+            )
+        )
+        _, finish_maintenance_time = await _timed(
+            lambda: query_finish_reencryption_maintenance(
+                conn, organization_id, author, realm_id, 2
+            )
+        )
+
+    results: Dict[str, Any] = {
+        "start_maintenance_ms": start_maintenance_time * 1e3,
+        "get_batch": _stats(get_timings, legacy_atoms + atoms),
+        "finish_maintenance_ms": finish_maintenance_time * 1e3,
+        # Including the batches saved with the legacy implementation
+        "reencryption_atoms_per_s": (legacy_atoms + atoms) / total,
+    }
+    if legacy_save_timings:
+        results["legacy_save_batch"] = _stats(legacy_save_timings, legacy_atoms)
+    if save_timings:
+        results["save_batch"] = _stats(save_timings, atoms)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("PG_URL"),
+        help="URL of an empty PostgreSQL database (default: `PG_URL` env var)",
+    )
+    parser.add_argument("--atoms", type=int, default=1_000_000)
+    parser.add_argument("--versions-per-vlob", type=int, default=2)
+    parser.add_argument("--blob-size", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--legacy-batches",
+        type=int,
+        default=10,
+        help="Number of batches saved with the legacy implementation (default: 10)",
+    )
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("a PostgreSQL database is required (use `--db` or `PG_URL` env var)")
+
+    results = trio_run(_bench, args, use_asyncio=True)
+
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k != "db"}
+        print(json.dumps({"params": params, "results": results}, indent=2))
+    else:
+        for name, value in results.items():
+            if isinstance(value, dict):
+                print(
+                    f"{name:<18} {value['batches']:6.0f} batches"
+                    f"  median {value['median_ms']:8.2f}ms  p95 {value['p95_ms']:8.2f}ms"
+                    f"  {value['atoms_per_s']:10.1f} atoms/s"
+                )
+            else:
+                print(f"{name:<26} {value:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
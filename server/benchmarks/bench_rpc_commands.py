@@ -0,0 +1,453 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure the latency of the authenticated RPC commands hot paths.
+
+Requests go through the whole ASGI application (`app_factory`): HTTP handshake
+(signature check, organization and device lookup), command deserialization and
+backend components. The HTTP server itself is not involved (Quart's test client
+is used to call the application).
+
+The MOCKED backend is used by default. Pass `--db` (or set the `PG_URL` env var)
+to use PostgreSQL instead: migrations are applied and a new organization is
+created, so use a throwaway database.
+
+Use `--json` to get results that can be compared across commits with
+`benchmarks/compare_results.py`.
+
+Usage: python benchmarks/bench_rpc_commands.py [--db postgresql://...] [--iterations 500] [--json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from base64 import b64encode
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List
+from uuid import uuid4
+
+import trio
+import triopg
+from quart.typing import TestClientProtocol
+
+from parsec._parsec import (
+    ApiVersion,
+    BlockID,
+    DateTime,
+    DeviceID,
+    OrganizationID,
+    PrivateKey,
+    SigningKey,
+    UserProfile,
+    VlobID,
+)
+from parsec.api.data import DeviceCertificate, RealmRoleCertificate, UserCertificate
+from parsec.api.protocol import authenticated_cmds
+from parsec.backend import backend_app_factory
+from parsec.backend.app import BackendApp
+from parsec.backend.asgi import app_factory
+from parsec.backend.config import BackendConfig, MockedBlockStoreConfig, MockedEmailConfig
+from parsec.backend.postgresql.handler import _apply_migrations, retrieve_migrations
+from parsec.backend.user import Device, User
+from parsec.utils import trio_run
+
+cmds = authenticated_cmds.latest
+
+
+@dataclass
+class BenchDevice:
+    organization_id: OrganizationID
+    device_id: DeviceID
+    signing_key: SigningKey
+
+
+class RpcClient:
+    def __init__(self, client: TestClientProtocol, device: BenchDevice):
+        self.client = client
+        self.device = device
+        self.path = f"/authenticated/{device.organization_id.str}"
+        self.base_headers = {
+            "Content-Type": "application/msgpack",
+            "Api-Version": str(ApiVersion.API_LATEST_VERSION),
+            "Authorization": "PARSEC-SIGN-ED25519",
+            "Author": b64encode(device.device_id.str.encode("utf8")).decode("ascii"),
+        }
+
+    def sse_headers(self) -> Dict[str, str]:
+        signature = self.device.signing_key.sign_only_signature(b"")
+        return {
+            **self.base_headers,
+            "Signature": b64encode(signature).decode("ascii"),
+            "Accept": "text/event-stream",
+        }
+
+    async def call(self, cmd: Any, **kwargs: Any) -> Any:
+        body = cmd.Req(**kwargs).dump()
+        signature = self.device.signing_key.sign_only_signature(body)
+        rep = await self.client.post(
+            self.path,
+            headers={**self.base_headers, "Signature": b64encode(signature).decode("ascii")},
+            data=body,
+        )
+        if rep.status_code != 200:
+            raise RuntimeError(f"Bad HTTP status for `{cmd.__name__}`: {rep.status_code}")
+        cooked_rep = cmd.Rep.load(await rep.get_data())
+        if type(cooked_rep).__name__ != "RepOk":
+            raise RuntimeError(f"Bad reply for `{cmd.__name__}`: {cooked_rep!r}")
+        return cooked_rep
+
+
+async def _bootstrap_organization(
+    backend: BackendApp, organization_id: OrganizationID, devices_count: int
+) -> List[BenchDevice]:
+    """
+    Create an organization with a single user owning `devices_count` devices
+    """
+    root_signing_key = SigningKey.generate()
+    now = DateTime.now()
+    devices = [
+        BenchDevice(organization_id, DeviceID(f"alice@dev{i + 1}"), SigningKey.generate())
+        for i in range(devices_count)
+    ]
+    first_device = devices[0]
+
+    def _backend_device(device: BenchDevice, certifier: BenchDevice | None) -> Device:
+        certif = DeviceCertificate(
+            author=certifier.device_id if certifier else None,
+            timestamp=now,
+            device_id=device.device_id,
+            device_label=None,
+            verify_key=device.signing_key.verify_key,
+        ).dump_and_sign(certifier.signing_key if certifier else root_signing_key)
+        return Device(
+            device_id=device.device_id,
+            device_label=None,
+            device_certificate=certif,
+            redacted_device_certificate=certif,
+            device_certifier=certifier.device_id if certifier else None,
+            created_on=now,
+        )
+
+    user_certif = UserCertificate(
+        author=None,
+        timestamp=now,
+        user_id=first_device.device_id.user_id,
+        # Private key is never used given the benchmark doesn't involve messages
+        public_key=PrivateKey.generate().public_key,
+        profile=UserProfile.ADMIN,
+        human_handle=None,
+    ).dump_and_sign(root_signing_key)
+    user = User(
+        user_id=first_device.device_id.user_id,
+        human_handle=None,
+        initial_profile=UserProfile.ADMIN,
+        user_certificate=user_certif,
+        redacted_user_certificate=user_certif,
+        user_certifier=None,
+        created_on=now,
+    )
+
+    bootstrap_token = uuid4().hex
+    await backend.organization.create(id=organization_id, bootstrap_token=bootstrap_token)
+    await backend.organization.bootstrap(
+        id=organization_id,
+        user=user,
+        first_device=_backend_device(first_device, None),
+        bootstrap_token=bootstrap_token,
+        root_verify_key=root_signing_key.verify_key,
+    )
+    for device in devices[1:]:
+        await backend.user.create_device(organization_id, _backend_device(device, first_device))
+    return devices
+
+
+async def _measure(iterations: int, fn: Callable[[int], Awaitable[None]]) -> Dict[str, float]:
+    # Warmup
+    for i in range(min(iterations // 10, 50)):
+        await fn(-i - 1)
+    timings = []
+    started_on = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        await fn(i)
+        timings.append(time.perf_counter() - start)
+    total = time.perf_counter() - started_on
+    timings.sort()
+    return {
+        "median_us": statistics.median(timings) * 1e6,
+        "p95_us": timings[int(len(timings) * 0.95)] * 1e6,
+        "mean_us": statistics.fmean(timings) * 1e6,
+        "ops_per_s": iterations / total,
+    }
+
+
+async def _bench_events_fanout(
+    rpc: RpcClient, pinger: RpcClient, listeners_count: int, iterations: int
+) -> Dict[str, float]:
+    """
+    Connect `listeners_count` SSE clients, then measure how long it takes for
+    an event (triggered by a `ping` command) to be received by all of them.
+    """
+    listeners_done = 0
+    all_received = trio.Event()
+
+    async def _listen(task_status: trio.TaskStatus[None]) -> None:
+        nonlocal listeners_done
+        # Similar to `tests.common.rpc_api.AuthenticatedRpcApiClient.connect_sse_events`
+        connection = rpc.client.request(
+            method="GET", path=f"{rpc.path}/events", headers=rpc.sse_headers()
+        )
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(
+                connection.app, connection.scope, connection._asgi_receive, connection._asgi_send
+            )
+            await connection.send_complete()
+            first_data = await connection.receive()
+            if connection.status_code != 200 or first_data != b":keepalive\n\n":
+                raise RuntimeError(f"Cannot connect to SSE events: {connection.status_code}")
+            task_status.started()
+
+            buffer = b""
+            while True:
+                buffer += await connection.receive()
+                *messages, buffer = buffer.split(b"\n\n")
+                for message in messages:
+                    if message.startswith(b":"):
+                        continue  # Keepalive
+                    listeners_done += 1
+                    if listeners_done == listeners_count:
+                        all_received.set()
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(listeners_count):
+            await nursery.start(_listen)
+
+        async def _fanout(i: int) -> None:
+            nonlocal listeners_done, all_received
+            listeners_done = 0
+            all_received = trio.Event()
+            await pinger.call(cmds.ping, ping=str(i))
+            await all_received.wait()
+
+        result = await _measure(iterations, _fanout)
+        nursery.cancel_scope.cancel()
+
+    return result
+
+
+async def _run_benchmarks(args: argparse.Namespace, backend: BackendApp) -> Dict[str, Any]:
+    organization_id = OrganizationID(f"Bench{uuid4().hex[:8]}")
+    device, other_device = await _bootstrap_organization(backend, organization_id, 2)
+    asgi_app = app_factory(backend)
+    rpc = RpcClient(asgi_app.test_client(), device)
+    other_rpc = RpcClient(asgi_app.test_client(), other_device)
+    iterations = args.iterations
+    results: Dict[str, Any] = {}
+
+    async def _run(name: str, fn: Callable[[int], Awaitable[None]]) -> None:
+        if args.only and name not in args.only:
+            return
+        try:
+            results[name] = await _measure(iterations, fn)
+        except (RuntimeError, NotImplementedError) as exc:
+            # e.g. a command not implemented by the backend type
+            results[name] = {"error": repr(exc)}
+
+    # Handshake
+
+    async def ping(i: int) -> None:
+        await rpc.call(cmds.ping, ping="")
+
+    async def ping_without_auth_cache(i: int) -> None:
+        backend.auth_cache.invalidate_organization(organization_id)
+        await rpc.call(cmds.ping, ping="")
+
+    await _run("handshake_ping", ping)
+    await _run("handshake_ping_without_auth_cache", ping_without_auth_cache)
+
+    # Realm used by the following benchmarks
+
+    realm_id = VlobID.new()
+    await rpc.call(
+        cmds.realm_create,
+        role_certificate=RealmRoleCertificate.build_realm_root_certif(
+            author=device.device_id, timestamp=DateTime.now(), realm_id=realm_id
+        ).dump_and_sign(device.signing_key),
+    )
+
+    # Blocks
+
+    block_data = os.urandom(args.block_size)
+    block_ids: List[BlockID] = []
+
+    async def block_create(i: int) -> None:
+        block_id = BlockID.new()
+        await rpc.call(cmds.block_create, block_id=block_id, realm_id=realm_id, block=block_data)
+        block_ids.append(block_id)
+
+    async def block_read(i: int) -> None:
+        await rpc.call(cmds.block_read, block_id=block_ids[i % len(block_ids)])
+
+    await _run("block_create", block_create)
+    if block_ids:
+        await _run("block_read", block_read)
+
+    # Vlobs
+
+    blob = os.urandom(args.blob_size)
+    vlobs_versions: Dict[VlobID, int] = {}
+
+    async def vlob_create(i: int) -> None:
+        vlob_id = VlobID.new()
+        await rpc.call(
+            cmds.vlob_create,
+            realm_id=realm_id,
+            encryption_revision=1,
+            vlob_id=vlob_id,
+            timestamp=DateTime.now(),
+            blob=blob,
+            sequester_blob=None,
+        )
+        vlobs_versions[vlob_id] = 1
+
+    vlob_ids: List[VlobID] = []
+
+    async def vlob_update(i: int) -> None:
+        vlob_id = vlob_ids[i % len(vlob_ids)]
+        vlobs_versions[vlob_id] += 1
+        await rpc.call(
+            cmds.vlob_update,
+            encryption_revision=1,
+            vlob_id=vlob_id,
+            version=vlobs_versions[vlob_id],
+            timestamp=DateTime.now(),
+            blob=blob,
+            sequester_blob=None,
+        )
+
+    async def vlob_read(i: int) -> None:
+        await rpc.call(
+            cmds.vlob_read,
+            encryption_revision=1,
+            vlob_id=vlob_ids[i % len(vlob_ids)],
+            version=None,
+            timestamp=None,
+        )
+
+    async def vlob_poll_changes_full(i: int) -> None:
+        await rpc.call(cmds.vlob_poll_changes, realm_id=realm_id, last_checkpoint=0)
+
+    async def vlob_poll_changes_up_to_date(i: int) -> None:
+        await rpc.call(cmds.vlob_poll_changes, realm_id=realm_id, last_checkpoint=last_checkpoint)
+
+    await _run("vlob_create", vlob_create)
+    vlob_ids += vlobs_versions.keys()
+    if vlob_ids:
+        await _run("vlob_update", vlob_update)
+        await _run("vlob_read", vlob_read)
+    rep = await rpc.call(cmds.vlob_poll_changes, realm_id=realm_id, last_checkpoint=0)
+    last_checkpoint = rep.current_checkpoint
+    await _run("vlob_poll_changes_full", vlob_poll_changes_full)
+    await _run("vlob_poll_changes_up_to_date", vlob_poll_changes_up_to_date)
+
+    # Events
+
+    if not args.only or "events_fanout" in args.only:
+        try:
+            results["events_fanout"] = await _bench_events_fanout(
+                rpc, other_rpc, args.sse_clients, args.fanout_iterations
+            )
+        except RuntimeError as exc:
+            results["events_fanout"] = {"error": repr(exc)}
+
+    return results
+
+
+async def _bench(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.db != "MOCKED":
+        async with triopg.connect(args.db) as conn:
+            result = await _apply_migrations(conn, retrieve_migrations(), dry_run=False)
+            if result.error:
+                migration, msg = result.error
+                raise SystemExit(f"Cannot apply migration {migration.file_name}: {msg}")
+
+    config = BackendConfig(
+        administration_token="s3cr3t",
+        db_url=args.db,
+        db_min_connections=args.db_connections,
+        db_max_connections=args.db_connections,
+        sse_keepalive=30,
+        blockstore_config=MockedBlockStoreConfig(),
+        email_config=MockedEmailConfig(
+            sender="no-reply@parsec.com", tmpdir=tempfile.mkdtemp(prefix="tmp-email-folder-")
+        ),
+        forward_proto_enforce_https=None,
+        backend_addr=None,
+        debug=False,
+    )
+    async with backend_app_factory(config) as backend:
+        return await _run_benchmarks(args, backend)
+
+
+def _environment(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "db": "MOCKED" if args.db == "MOCKED" else "POSTGRESQL",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("PG_URL", "MOCKED"),
+        help="PostgreSQL database URL or MOCKED (default: `PG_URL` env var, or MOCKED)",
+    )
+    parser.add_argument("--db-connections", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--block-size", type=int, default=512 * 1024, help="In bytes")
+    parser.add_argument("--blob-size", type=int, default=1024, help="Vlob blob size in bytes")
+    parser.add_argument("--sse-clients", type=int, default=100, help="Listeners for the fan-out")
+    parser.add_argument("--fanout-iterations", type=int, default=100)
+    parser.add_argument(
+        "--only", nargs="*", metavar="BENCHMARK", help="Only run the given benchmarks"
+    )
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+
+    results = trio_run(_bench, args, use_asyncio=args.db != "MOCKED", monitor_tasks=False)
+
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k != "db"}
+        print(
+            json.dumps(
+                {"params": params, "environment": _environment(args), "results": results},
+                indent=2,
+            )
+        )
+    else:
+        for name, stats in results.items():
+            if "error" in stats:
+                print(f"{name:<36} {stats['error']}")
+            else:
+                print(
+                    f"{name:<36} median {stats['median_us']:9.1f}us"
+                    f"  p95 {stats['p95_us']:9.1f}us  {stats['ops_per_s']:8.1f} ops/s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure the latency of the PostgreSQL vlob authorization step.
+
+Compare the legacy sequence of queries (realm lookup from the vlob, realm
+status, then caller's role) with the single "authorize vlob operation" query.
+
+Migrations are applied and a new organization is populated, so use a throwaway database.
+
+Usage: python benchmarks/bench_vlob_authorization.py --db postgresql://... [--iterations 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List
+from uuid import uuid4
+
+import trio
+import triopg
+
+from parsec._parsec import DateTime, DeviceID, OrganizationID, VlobID
+from parsec.backend.postgresql.handler import (
+    PGConnection,
+    _apply_migrations,
+    handle_datetime,
+    handle_integer,
+    handle_uuid,
+    retrieve_migrations,
+)
+from parsec.backend.postgresql.realm_queries.maintenance import get_realm_status
+from parsec.backend.postgresql.utils import (
+    Q,
+    q_organization_internal_id,
+    q_realm_internal_id,
+    q_user_internal_id,
+)
+from parsec.backend.postgresql.vlob_queries.utils import _authorize_vlob_operation
+from parsec.backend.utils import OperationKind
+
+# Queries used before the authorization was merged into a single round-trip
+
+_q_legacy_get_realm_id_from_vlob_id = Q(
+    f"""
+SELECT
+    realm.realm_id
+FROM vlob_atom
+INNER JOIN vlob_encryption_revision
+ON  vlob_atom.vlob_encryption_revision = vlob_encryption_revision._id
+INNER JOIN realm
+ON vlob_encryption_revision.realm = realm._id
+WHERE vlob_atom._id = (
+    SELECT _id
+    FROM vlob_atom
+    WHERE
+        organization = { q_organization_internal_id("$organization_id") }
+        AND vlob_id = $vlob_id
+    LIMIT 1
+)
+LIMIT 1
+"""
+)
+
+_q_legacy_check_realm_access = Q(
+    f"""
+WITH cte_current_realm_roles AS (
+    SELECT DISTINCT ON(user_) user_, role, certified_on
+    FROM  realm_user_role
+    WHERE realm = { q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id") }
+    ORDER BY user_, certified_on DESC
+)
+SELECT role, certified_on
+FROM user_
+LEFT JOIN cte_current_realm_roles
+ON user_._id = cte_current_realm_roles.user_
+WHERE user_._id = { q_user_internal_id(organization_id="$organization_id", user_id="$user_id") }
+"""
+)
+
+
+async def _init_connection(conn: triopg._triopg.TrioConnectionProxy) -> None:
+    await handle_datetime(conn)
+    await handle_uuid(conn)
+    await handle_integer(conn)
+
+
+async def _populate(
+    conn: triopg._triopg.TrioConnectionProxy,
+    organization_id: OrganizationID,
+    users: int,
+    realms: int,
+    vlobs_per_realm: int,
+    roles_per_user: int,
+) -> List[VlobID]:
+    """
+    Create an organization where each user has been granted (and re-granted)
+    a role on every realm, each realm containing some vlobs.
+    """
+    now = DateTime.now()
+    org_internal_id = await conn.fetchval(
+        """
+INSERT INTO organization (
+    organization_id, bootstrap_token, user_profile_outsider_allowed, is_expired, _created_on
+)
+VALUES ($1, '', TRUE, FALSE, $2)
+RETURNING _id
+""",
+        organization_id.str,
+        now,
+    )
+    devices_internal_ids = []
+    for i in range(users):
+        user_internal_id = await conn.fetchval(
+            """
+INSERT INTO user_ (
+    organization, user_id, user_certificate, redacted_user_certificate, created_on, profile
+)
+VALUES ($1, $2, '', '', $3, 'STANDARD')
+RETURNING _id
+""",
+            org_internal_id,
+            f"user{i}",
+            now,
+        )
+        device_internal_id = await conn.fetchval(
+            """
+INSERT INTO device (
+    organization, user_, device_id, device_certificate, redacted_device_certificate, created_on
+)
+VALUES ($1, $2, $3, '', '', $4)
+RETURNING _id
+""",
+            org_internal_id,
+            user_internal_id,
+            f"user{i}@dev1",
+            now,
+        )
+        devices_internal_ids.append((user_internal_id, device_internal_id))
+
+    vlob_ids = []
+    for _ in range(realms):
+        realm_internal_id = await conn.fetchval(
+            """
+INSERT INTO realm (organization, realm_id, encryption_revision)
+VALUES ($1, $2, 1)
+RETURNING _id
+""",
+            org_internal_id,
+            VlobID.new(),
+        )
+        ver_internal_id = await conn.fetchval(
+            """
+INSERT INTO vlob_encryption_revision (realm, encryption_revision)
+VALUES ($1, 1)
+RETURNING _id
+""",
+            realm_internal_id,
+        )
+        await conn.executemany(
+            """
+INSERT INTO realm_user_role (realm, user_, role, certificate, certified_by, certified_on)
+VALUES ($1, $2, 'CONTRIBUTOR', '', $3, $4)
+""",
+            [
+                (realm_internal_id, user_internal_id, device_internal_id, now.subtract(seconds=j))
+                for user_internal_id, device_internal_id in devices_internal_ids
+                for j in range(roles_per_user)
+            ],
+        )
+        realm_vlob_ids = [VlobID.new() for _ in range(vlobs_per_realm)]
+        await conn.executemany(
+            """
+INSERT INTO vlob_atom (
+    organization, vlob_encryption_revision, vlob_id, version, blob, size, author, created_on
+)
+VALUES ($1, $2, $3, 1, '', 0, $4, $5)
+""",
+            [
+                (org_internal_id, ver_internal_id, vlob_id, devices_internal_ids[0][1], now)
+                for vlob_id in realm_vlob_ids
+            ],
+        )
+        vlob_ids += realm_vlob_ids
+
+    await conn.execute("ANALYZE")
+    return vlob_ids
+
+
+async def _measure(iterations: int, fn: Callable[[int], Awaitable[None]]) -> Dict[str, float]:
+    # Warmup
+    for i in range(min(iterations, 100)):
+        await fn(i)
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await fn(i)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "median_us": statistics.median(timings) * 1e6,
+        "p95_us": timings[int(len(timings) * 0.95)] * 1e6,
+        "mean_us": statistics.fmean(timings) * 1e6,
+    }
+
+
+async def _bench(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    # Same connection class as the backend pool (e.g. for the organization ID cache)
+    async with triopg.connect(args.db, connection_class=PGConnection) as conn:
+        await _init_connection(conn)
+        result = await _apply_migrations(conn, retrieve_migrations(), dry_run=False)
+        if result.error:
+            migration, msg = result.error
+            raise SystemExit(f"Cannot apply migration {migration.file_name}: {msg}")
+
+        organization_id = OrganizationID(f"Bench{uuid4().hex[:8]}")
+        vlob_ids = await _populate(
+            conn,
+            organization_id,
+            users=args.users,
+            realms=args.realms,
+            vlobs_per_realm=args.vlobs_per_realm,
+            roles_per_user=args.roles_per_user,
+        )
+        realm_ids = [
+            VlobID.from_hex(row["realm_id"])
+            for row in await conn.fetch(
+                "SELECT realm_id FROM realm WHERE organization = "
+                "(SELECT _id FROM organization WHERE organization_id = $1)",
+                organization_id.str,
+            )
+        ]
+        author = DeviceID("user0@dev1")
+
+        async def _legacy_from_realm_id(realm_id: VlobID) -> None:
+            await get_realm_status(conn, organization_id, realm_id)
+            await conn.fetchrow(
+                *_q_legacy_check_realm_access(
+                    organization_id=organization_id.str,
+                    realm_id=realm_id,
+                    user_id=author.user_id.str,
+                )
+            )
+
+        async def legacy_by_vlob(i: int) -> None:
+            realm_id = await conn.fetchval(
+                *_q_legacy_get_realm_id_from_vlob_id(
+                    organization_id=organization_id.str, vlob_id=vlob_ids[i % len(vlob_ids)]
+                )
+            )
+            await _legacy_from_realm_id(VlobID.from_hex(realm_id))
+
+        async def legacy_by_realm(i: int) -> None:
+            await _legacy_from_realm_id(realm_ids[i % len(realm_ids)])
+
+        async def combined_by_vlob(i: int) -> None:
+            await _authorize_vlob_operation(
+                conn,
+                organization_id,
+                author,
+                OperationKind.DATA_READ,
+                1,
+                vlob_id=vlob_ids[i % len(vlob_ids)],
+            )
+
+        async def combined_by_realm(i: int) -> None:
+            await _authorize_vlob_operation(
+                conn,
+                organization_id,
+                author,
+                OperationKind.DATA_READ,
+                1,
+                realm_id=realm_ids[i % len(realm_ids)],
+            )
+
+        results = {}
+        # Read/update/list_versions identify the realm through the vlob,
+        # create/poll_changes provide the realm id
+        for name, fn in (
+            ("legacy_by_vlob_id", legacy_by_vlob),
+            ("combined_by_vlob_id", combined_by_vlob),
+            ("legacy_by_realm_id", legacy_by_realm),
+            ("combined_by_realm_id", combined_by_realm),
+        ):
+            results[name] = await _measure(args.iterations, fn)
+        return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("PG_URL"),
+        help="URL of an empty PostgreSQL database (default: `PG_URL` env var)",
+    )
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--realms", type=int, default=20)
+    parser.add_argument("--vlobs-per-realm", type=int, default=100)
+    parser.add_argument(
+        "--roles-per-user", type=int, default=3, help="Role certificates per user and realm"
+    )
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("a PostgreSQL database is required (use `--db` or `PG_URL` env var)")
+
+    results = trio.run(_bench, args)
+
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k != "db"}
+        print(json.dumps({"params": params, "results": results}, indent=2))
+    else:
+        for name, stats in results.items():
+            print(
+                f"{name:<22} median {stats['median_us']:8.1f}us"
+                f"  p95 {stats['p95_us']:8.1f}us  mean {stats['mean_us']:8.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
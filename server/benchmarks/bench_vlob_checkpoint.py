@@ -0,0 +1,257 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure the PostgreSQL vlob creation throughput with concurrent writers on a single realm.
+
+Each vlob creation allocates a new checkpoint in the realm. Compare the legacy
+allocation (`MAX(index) + 1` on `realm_vlob_update`, where concurrent writers
+collide on the `UNIQUE(realm, index)` constraint and replay their whole
+transaction) with the per-realm counter stored in the `realm` row.
+
+Migrations are applied and a new organization is populated, so use a throwaway database.
+
+Usage: python benchmarks/bench_vlob_checkpoint.py --db postgresql://... [--writers 50] [--json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+from unittest.mock import patch
+from uuid import uuid4
+
+import trio
+import triopg
+from triopg import UniqueViolationError
+
+from parsec._parsec import DateTime, DeviceID, OrganizationID, VlobID
+from parsec.backend.postgresql.handler import (
+    PGConnection,
+    _apply_migrations,
+    handle_datetime,
+    handle_integer,
+    handle_uuid,
+    retrieve_migrations,
+)
+from parsec.backend.postgresql.utils import Q
+from parsec.backend.postgresql.vlob_queries import query_create
+from parsec.backend.postgresql.vlob_queries import write as write_module
+from parsec.utils import trio_run
+
+# Query used before the checkpoint was stored in the realm row
+
+_q_legacy_vlob_updated = Q(
+    """
+INSERT INTO realm_vlob_update (
+realm, index, vlob_atom
+)
+SELECT
+$realm,
+(
+    SELECT COALESCE(MAX(index) + 1, 1)
+    FROM realm_vlob_update
+    WHERE realm = $realm
+),
+$vlob_atom_internal_id
+RETURNING index
+"""
+)
+
+
+async def _init_connection(conn: triopg._triopg.TrioConnectionProxy) -> None:
+    await handle_datetime(conn)
+    await handle_uuid(conn)
+    await handle_integer(conn)
+
+
+async def _populate(
+    conn: triopg._triopg.TrioConnectionProxy, organization_id: OrganizationID, realms: int
+) -> List[VlobID]:
+    """
+    Create an organization with a single user owning `realms` realms
+    """
+    granted_on = DateTime.now().subtract(days=1)
+    org_internal_id = await conn.fetchval(
+        """
+INSERT INTO organization (
+    organization_id, bootstrap_token, user_profile_outsider_allowed, is_expired, _created_on
+)
+VALUES ($1, '', TRUE, FALSE, $2)
+RETURNING _id
+""",
+        organization_id.str,
+        granted_on,
+    )
+    user_internal_id = await conn.fetchval(
+        """
+INSERT INTO user_ (
+    organization, user_id, user_certificate, redacted_user_certificate, created_on, profile
+)
+VALUES ($1, 'alice', '', '', $2, 'ADMIN')
+RETURNING _id
+""",
+        org_internal_id,
+        granted_on,
+    )
+    device_internal_id = await conn.fetchval(
+        """
+INSERT INTO device (
+    organization, user_, device_id, device_certificate, redacted_device_certificate, created_on
+)
+VALUES ($1, $2, 'alice@dev1', '', '', $3)
+RETURNING _id
+""",
+        org_internal_id,
+        user_internal_id,
+        granted_on,
+    )
+
+    realm_ids = []
+    for _ in range(realms):
+        realm_id = VlobID.new()
+        realm_internal_id = await conn.fetchval(
+            """
+INSERT INTO realm (organization, realm_id, encryption_revision)
+VALUES ($1, $2, 1)
+RETURNING _id
+""",
+            org_internal_id,
+            realm_id,
+        )
+        await conn.execute(
+            "INSERT INTO vlob_encryption_revision (realm, encryption_revision) VALUES ($1, 1)",
+            realm_internal_id,
+        )
+        await conn.execute(
+            """
+INSERT INTO realm_user_role (realm, user_, role, certificate, certified_by, certified_on)
+VALUES ($1, $2, 'OWNER', '', $3, $4)
+""",
+            realm_internal_id,
+            user_internal_id,
+            device_internal_id,
+            granted_on,
+        )
+        realm_ids.append(realm_id)
+
+    return realm_ids
+
+
+async def _run_writers(
+    db: str,
+    organization_id: OrganizationID,
+    realm_id: VlobID,
+    writers: int,
+    vlobs_per_writer: int,
+    blob: bytes,
+) -> Dict[str, float]:
+    author = DeviceID("alice@dev1")
+    timings: List[float] = []
+    retries = 0
+    go = trio.Event()
+
+    async def _writer(task_status: trio.TaskStatus[None]) -> None:
+        nonlocal retries
+        # Same connection class as the backend pool (e.g. for the organization ID cache)
+        async with triopg.connect(db, connection_class=PGConnection) as conn:
+            await _init_connection(conn)
+            task_status.started()
+            await go.wait()
+            for _ in range(vlobs_per_writer):
+                vlob_id = VlobID.new()
+                start = time.perf_counter()
+                # Same as the `retry_on_unique_violation` decorator previously
+                # used by `PGVlobComponent.create`
+                while True:
+                    try:
+                        await query_create(
+                            conn,
+                            organization_id,
+                            author,
+                            realm_id,
+                            1,
+                            vlob_id,
+                            DateTime.now(),
+                            blob,
+                        )
+                        break
+                    except UniqueViolationError:
+                        retries += 1
+                timings.append(time.perf_counter() - start)
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(writers):
+            await nursery.start(_writer)
+        started_on = time.perf_counter()
+        go.set()
+    total = time.perf_counter() - started_on
+
+    timings.sort()
+    vlobs = writers * vlobs_per_writer
+    return {
+        "vlobs_per_s": vlobs / total,
+        "median_ms": statistics.median(timings) * 1e3,
+        "p95_ms": timings[int(len(timings) * 0.95)] * 1e3,
+        "retries": float(retries),
+        "retries_per_vlob": retries / vlobs,
+    }
+
+
+async def _bench(args: argparse.Namespace) -> Dict[str, Any]:
+    async with triopg.connect(args.db) as conn:
+        await _init_connection(conn)
+        result = await _apply_migrations(conn, retrieve_migrations(), dry_run=False)
+        if result.error:
+            migration, msg = result.error
+            raise SystemExit(f"Cannot apply migration {migration.file_name}: {msg}")
+
+        organization_id = OrganizationID(f"Bench{uuid4().hex[:8]}")
+        legacy_realm_id, counter_realm_id = await _populate(conn, organization_id, realms=2)
+
+    blob = os.urandom(args.blob_size)
+    results = {}
+    with patch.object(write_module, "_q_vlob_updated", _q_legacy_vlob_updated):
+        results["legacy_max_index"] = await _run_writers(
+            args.db, organization_id, legacy_realm_id, args.writers, args.vlobs_per_writer, blob
+        )
+    results["realm_counter"] = await _run_writers(
+        args.db, organization_id, counter_realm_id, args.writers, args.vlobs_per_writer, blob
+    )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("PG_URL"),
+        help="URL of an empty PostgreSQL database (default: `PG_URL` env var)",
+    )
+    parser.add_argument(
+        "--writers", type=int, default=50, help="Concurrent writers (one connection each)"
+    )
+    parser.add_argument("--vlobs-per-writer", type=int, default=20)
+    parser.add_argument("--blob-size", type=int, default=1024)
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("a PostgreSQL database is required (use `--db` or `PG_URL` env var)")
+
+    results = trio_run(_bench, args, use_asyncio=True)
+
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k != "db"}
+        print(json.dumps({"params": params, "results": results}, indent=2))
+    else:
+        for name, stats in results.items():
+            print(
+                f"{name:<18} {stats['vlobs_per_s']:8.1f} vlobs/s"
+                f"  median {stats['median_ms']:7.2f}ms  p95 {stats['p95_ms']:7.2f}ms"
+                f"  retries {stats['retries']:6.0f} ({stats['retries_per_vlob']:.2f}/vlob)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,565 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Measure the PostgreSQL vlob create/update latency and the planner cost of their statements.
+
+Compare the legacy statements (where the organization, realm and user internal
+IDs are looked up again by subqueries in each statement) with the current ones
+(organization internal ID cached by the connection, realm and user internal IDs
+returned by the authorization query).
+
+Migrations are applied and a new organization is populated, so use a throwaway database.
+
+Usage: python benchmarks/bench_vlob_write.py --db postgresql://... [--iterations 1000] [--json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from uuid import uuid4
+
+import triopg
+
+from parsec._parsec import BackendEventRealmVlobsUpdated, DateTime, DeviceID, OrganizationID, VlobID
+from parsec.backend.postgresql.handler import (
+    PGConnection,
+    _apply_migrations,
+    handle_datetime,
+    handle_integer,
+    handle_uuid,
+    retrieve_migrations,
+    send_signal,
+)
+from parsec.backend.postgresql.utils import (
+    Q,
+    _q_increment_organization_stats_factory,
+    get_organization_internal_id,
+    q_day,
+    q_device_internal_id,
+    q_increment_organization_stats_ctes,
+    q_organization_internal_id,
+    q_realm_internal_id,
+    q_user_internal_id,
+    q_vlob_encryption_revision_internal_id,
+)
+from parsec.backend.postgresql.vlob_queries import query_create, query_update
+from parsec.backend.postgresql.vlob_queries.utils import (
+    _q_authorize_vlob_operation_from_realm_id,
+    _q_authorize_vlob_operation_from_vlob_id,
+)
+from parsec.backend.postgresql.vlob_queries.write import (
+    _q_create,
+    _q_get_vlob_version,
+    _q_insert_vlob_atom,
+    _q_set_last_vlob_update,
+    _q_vlob_updated,
+)
+from parsec.utils import trio_run
+
+# Queries used before the internal IDs were resolved once per operation
+
+
+def _q_legacy_authorize_factory(realm_internal_id: str) -> Q:
+    return Q(
+        f"""
+SELECT
+    realm.realm_id,
+    realm.encryption_revision,
+    realm.maintenance_type,
+    caller_role.role,
+    caller_role.certified_on
+FROM realm
+LEFT JOIN LATERAL (
+    SELECT role, certified_on
+    FROM realm_user_role
+    WHERE
+        realm_user_role.realm = realm._id
+        AND realm_user_role.user_ = {
+            q_user_internal_id(organization_id="$organization_id", user_id="$user_id")
+        }
+    ORDER BY certified_on DESC
+    LIMIT 1
+) AS caller_role ON TRUE
+WHERE realm._id = { realm_internal_id }
+"""
+    )
+
+
+_q_legacy_authorize_from_realm_id = _q_legacy_authorize_factory(
+    q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id")
+)
+
+
+_q_legacy_authorize_from_vlob_id = _q_legacy_authorize_factory(
+    f"""(
+    SELECT vlob_encryption_revision.realm
+    FROM vlob_atom
+    INNER JOIN vlob_encryption_revision
+    ON vlob_atom.vlob_encryption_revision = vlob_encryption_revision._id
+    WHERE
+        vlob_atom.organization = { q_organization_internal_id("$organization_id") }
+        AND vlob_atom.vlob_id = $vlob_id
+    LIMIT 1
+)"""
+)
+
+
+_q_legacy_get_vlob_version = Q(
+    f"""
+SELECT
+    version,
+    created_on
+FROM vlob_atom
+WHERE
+    organization = { q_organization_internal_id("$organization_id") }
+    AND vlob_id = $vlob_id
+ORDER BY version DESC LIMIT 1
+"""
+)
+
+
+_q_legacy_insert_vlob_atom = Q(
+    f"""
+INSERT INTO vlob_atom (
+    organization,
+    vlob_encryption_revision,
+    vlob_id,
+    version,
+    blob,
+    size,
+    author,
+    created_on
+)
+SELECT
+    { q_organization_internal_id(organization_id="$organization_id") },
+    {
+        q_vlob_encryption_revision_internal_id(
+            organization_id="$organization_id",
+            realm_id="$realm_id",
+            encryption_revision="$encryption_revision"
+        )
+    },
+    $vlob_id,
+    $version,
+    $blob,
+    $blob_len,
+    { q_device_internal_id(organization_id="$organization_id", device_id="$author") },
+    $timestamp
+RETURNING _id
+"""
+)
+
+
+_q_legacy_vlob_updated = Q(
+    f"""
+WITH realm_checkpoint AS (
+    UPDATE realm
+    SET checkpoint = checkpoint + 1
+    WHERE
+        organization = { q_organization_internal_id("$organization_id") }
+        AND realm_id = $realm_id
+    RETURNING _id, checkpoint
+)
+INSERT INTO realm_vlob_update (
+realm, index, vlob_atom
+)
+SELECT _id, checkpoint, $vlob_atom_internal_id
+FROM realm_checkpoint
+RETURNING index
+"""
+)
+
+
+_q_legacy_set_last_vlob_update = Q(
+    f"""
+INSERT INTO realm_user_change(realm, user_, last_role_change, last_vlob_update)
+VALUES (
+    { q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id") },
+    { q_user_internal_id(organization_id="$organization_id", user_id="$user_id") },
+    NULL,
+    $timestamp
+)
+ON CONFLICT (realm, user_)
+DO UPDATE SET last_vlob_update = (
+    SELECT GREATEST($timestamp, last_vlob_update)
+    FROM realm_user_change
+    WHERE realm={ q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id") }
+    AND user_={ q_user_internal_id(organization_id="$organization_id", user_id="$user_id") }
+    LIMIT 1
+)
+"""
+)
+
+
+_q_legacy_increment_metadata_size = Q(
+    f"""
+WITH cte_increments AS (
+    SELECT
+        { q_organization_internal_id("$organization_id") } AS organization,
+        { q_day("$on") } AS day,
+        $metadata_size::BIGINT AS metadata_size
+),
+{ q_increment_organization_stats_ctes("cte_increments", ["metadata_size"]) }
+SELECT TRUE
+"""
+)
+
+
+async def _legacy_write(
+    conn: triopg._triopg.TrioConnectionProxy,
+    organization_id: OrganizationID,
+    author: DeviceID,
+    realm_id: VlobID,
+    vlob_id: VlobID,
+    version: int,
+    timestamp: DateTime,
+    blob: bytes,
+) -> None:
+    """
+    Same statements as the legacy `query_create` (`version == 1`) or
+    `query_update`, without the checks done in Python
+    """
+    ids = {"organization_id": organization_id.str, "realm_id": realm_id}
+    async with conn.transaction():
+        if version == 1:
+            await conn.fetchrow(
+                *_q_legacy_authorize_from_realm_id(**ids, user_id=author.user_id.str)
+            )
+        else:
+            await conn.fetchrow(
+                *_q_legacy_authorize_from_vlob_id(
+                    organization_id=organization_id.str,
+                    user_id=author.user_id.str,
+                    vlob_id=vlob_id,
+                )
+            )
+            await conn.fetchrow(
+                *_q_legacy_get_vlob_version(organization_id=organization_id.str, vlob_id=vlob_id)
+            )
+        vlob_atom_internal_id = await conn.fetchval(
+            *_q_legacy_insert_vlob_atom(
+                **ids,
+                author=author.str,
+                encryption_revision=1,
+                vlob_id=vlob_id,
+                version=version,
+                blob=blob,
+                blob_len=len(blob),
+                timestamp=timestamp,
+            )
+        )
+        index = await conn.fetchval(
+            *_q_legacy_vlob_updated(**ids, vlob_atom_internal_id=vlob_atom_internal_id)
+        )
+        await conn.execute(
+            *_q_legacy_set_last_vlob_update(**ids, user_id=author.user_id.str, timestamp=timestamp)
+        )
+        await send_signal(
+            conn,
+            BackendEventRealmVlobsUpdated(
+                organization_id=organization_id,
+                author=author,
+                realm_id=realm_id,
+                checkpoint=index,
+                src_id=vlob_id,
+                src_version=version,
+            ),
+        )
+        await conn.execute(
+            *_q_legacy_increment_metadata_size(
+                organization_id=organization_id.str, on=timestamp, metadata_size=len(blob)
+            )
+        )
+
+
+async def _init_connection(conn: triopg._triopg.TrioConnectionProxy) -> None:
+    await handle_datetime(conn)
+    await handle_uuid(conn)
+    await handle_integer(conn)
+
+
+async def _populate(
+    conn: triopg._triopg.TrioConnectionProxy, organization_id: OrganizationID, realms: int
+) -> List[VlobID]:
+    """
+    Create an organization with a single user owning `realms` realms
+    """
+    granted_on = DateTime.now().subtract(days=1)
+    org_internal_id = await conn.fetchval(
+        """
+INSERT INTO organization (
+    organization_id, bootstrap_token, user_profile_outsider_allowed, is_expired, _created_on
+)
+VALUES ($1, '', TRUE, FALSE, $2)
+RETURNING _id
+""",
+        organization_id.str,
+        granted_on,
+    )
+    user_internal_id = await conn.fetchval(
+        """
+INSERT INTO user_ (
+    organization, user_id, user_certificate, redacted_user_certificate, created_on, profile
+)
+VALUES ($1, 'alice', '', '', $2, 'ADMIN')
+RETURNING _id
+""",
+        org_internal_id,
+        granted_on,
+    )
+    device_internal_id = await conn.fetchval(
+        """
+INSERT INTO device (
+    organization, user_, device_id, device_certificate, redacted_device_certificate, created_on
+)
+VALUES ($1, $2, 'alice@dev1', '', '', $3)
+RETURNING _id
+""",
+        org_internal_id,
+        user_internal_id,
+        granted_on,
+    )
+
+    realm_ids = []
+    for _ in range(realms):
+        realm_id = VlobID.new()
+        realm_internal_id = await conn.fetchval(
+            """
+INSERT INTO realm (organization, realm_id, encryption_revision)
+VALUES ($1, $2, 1)
+RETURNING _id
+""",
+            org_internal_id,
+            realm_id,
+        )
+        await conn.execute(
+            "INSERT INTO vlob_encryption_revision (realm, encryption_revision) VALUES ($1, 1)",
+            realm_internal_id,
+        )
+        await conn.execute(
+            """
+INSERT INTO realm_user_role (realm, user_, role, certificate, certified_by, certified_on)
+VALUES ($1, $2, 'OWNER', '', $3, $4)
+""",
+            realm_internal_id,
+            user_internal_id,
+            device_internal_id,
+            granted_on,
+        )
+        realm_ids.append(realm_id)
+
+    return realm_ids
+
+
+async def _plan_cost(conn: triopg._triopg.TrioConnectionProxy, query: List[Any]) -> float:
+    sql, *args = query
+    raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+    (explain,) = json.loads(raw)
+    return explain["Plan"]["Total Cost"]
+
+
+async def _plan_costs(
+    conn: triopg._triopg.TrioConnectionProxy,
+    organization_id: OrganizationID,
+    author: DeviceID,
+    realm_id: VlobID,
+    vlob_id: VlobID,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Sum of the planner's total cost of the statements of a vlob create/update
+    """
+    ids = {"organization_id": organization_id.str, "realm_id": realm_id}
+    organization = await get_organization_internal_id(conn, organization_id)
+    authorization = await conn.fetchrow(
+        *_q_authorize_vlob_operation_from_realm_id(
+            organization=organization, user_id=author.user_id.str, realm_id=realm_id
+        )
+    )
+    realm, user = authorization["_id"], authorization["user_"]
+    vlob_atom_internal_id = await conn.fetchval("SELECT MAX(_id) FROM vlob_atom")
+    now = DateTime.now()
+    write = {
+        "author": author.str,
+        "encryption_revision": 1,
+        "vlob_id": vlob_id,
+        "blob": b"",
+        "blob_len": 0,
+        "timestamp": now,
+    }
+
+    legacy_common = [
+        _q_legacy_vlob_updated(**ids, vlob_atom_internal_id=vlob_atom_internal_id),
+        _q_legacy_set_last_vlob_update(**ids, user_id=author.user_id.str, timestamp=now),
+        _q_legacy_increment_metadata_size(
+            organization_id=organization_id.str, on=now, metadata_size=0
+        ),
+    ]
+    common = [
+        _q_vlob_updated(realm=realm, vlob_atom_internal_id=vlob_atom_internal_id),
+        _q_set_last_vlob_update(realm=realm, user=user, timestamp=now),
+        _q_increment_organization_stats_factory(("metadata_size",))(
+            organization=organization, on=now, metadata_size=0
+        ),
+    ]
+    statements = {
+        "legacy_create": [
+            _q_legacy_authorize_from_realm_id(**ids, user_id=author.user_id.str),
+            _q_legacy_insert_vlob_atom(**ids, **write, version=1),
+            *legacy_common,
+        ],
+        "create": [
+            _q_authorize_vlob_operation_from_realm_id(
+                organization=organization, user_id=author.user_id.str, realm_id=realm_id
+            ),
+            _q_create(organization=organization, realm=realm, **write),
+            *common,
+        ],
+        "legacy_update": [
+            _q_legacy_authorize_from_vlob_id(
+                organization_id=organization_id.str, user_id=author.user_id.str, vlob_id=vlob_id
+            ),
+            _q_legacy_get_vlob_version(organization_id=organization_id.str, vlob_id=vlob_id),
+            _q_legacy_insert_vlob_atom(**ids, **write, version=2),
+            *legacy_common,
+        ],
+        "update": [
+            _q_authorize_vlob_operation_from_vlob_id(
+                organization=organization, user_id=author.user_id.str, vlob_id=vlob_id
+            ),
+            _q_get_vlob_version(organization=organization, vlob_id=vlob_id),
+            _q_insert_vlob_atom(organization=organization, realm=realm, **write, version=2),
+            *common,
+        ],
+    }
+    costs = {}
+    for name, queries in statements.items():
+        costs[name] = {
+            "statements": float(len(queries)),
+            "plan_cost": sum([await _plan_cost(conn, query) for query in queries]),
+        }
+    return costs
+
+
+async def _measure(iterations: int, fn: Callable[[int], Awaitable[None]]) -> Dict[str, float]:
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await fn(i)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "median_us": statistics.median(timings) * 1e6,
+        "p95_us": timings[int(len(timings) * 0.95)] * 1e6,
+        "writes_per_s": len(timings) / sum(timings),
+    }
+
+
+async def _bench(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    # Same connection class as the backend pool (e.g. for the organization ID cache)
+    async with triopg.connect(args.db, connection_class=PGConnection) as conn:
+        await _init_connection(conn)
+        result = await _apply_migrations(conn, retrieve_migrations(), dry_run=False)
+        if result.error:
+            migration, msg = result.error
+            raise SystemExit(f"Cannot apply migration {migration.file_name}: {msg}")
+
+        organization_id = OrganizationID(f"Bench{uuid4().hex[:8]}")
+        author = DeviceID("alice@dev1")
+        realm_ids = await _populate(conn, organization_id, args.realms)
+        blob = os.urandom(args.blob_size)
+
+        # Vlobs created by the "create" runs are then updated by the "update" runs
+        vlob_ids: Dict[str, List[Tuple[VlobID, int]]] = {"legacy": [], "current": []}
+
+        def _create(kind: str) -> Callable[[int], Awaitable[None]]:
+            async def _run(i: int) -> None:
+                realm_id = realm_ids[i % len(realm_ids)]
+                vlob_id = VlobID.new()
+                if kind == "legacy":
+                    await _legacy_write(
+                        conn, organization_id, author, realm_id, vlob_id, 1, DateTime.now(), blob
+                    )
+                else:
+                    await query_create(
+                        conn, organization_id, author, realm_id, 1, vlob_id, DateTime.now(), blob
+                    )
+                vlob_ids[kind].append((vlob_id, i))
+
+            return _run
+
+        def _update(kind: str) -> Callable[[int], Awaitable[None]]:
+            async def _run(i: int) -> None:
+                vlob_id, created = vlob_ids[kind][i % len(vlob_ids[kind])]
+                version = i // len(vlob_ids[kind]) + 2
+                if kind == "legacy":
+                    realm_id = realm_ids[created % len(realm_ids)]
+                    await _legacy_write(
+                        conn,
+                        organization_id,
+                        author,
+                        realm_id,
+                        vlob_id,
+                        version,
+                        DateTime.now(),
+                        blob,
+                    )
+                else:
+                    await query_update(
+                        conn, organization_id, author, 1, vlob_id, version, DateTime.now(), blob
+                    )
+
+            return _run
+
+        results = {}
+        for name, fn in (
+            ("legacy_create", _create("legacy")),
+            ("create", _create("current")),
+            ("legacy_update", _update("legacy")),
+            ("update", _update("current")),
+        ):
+            results[name] = await _measure(args.iterations, fn)
+
+        await conn.execute("ANALYZE")
+        vlob_id, created = vlob_ids["current"][0]
+        costs = await _plan_costs(
+            conn, organization_id, author, realm_ids[created % len(realm_ids)], vlob_id
+        )
+        for name, cost in costs.items():
+            results[name].update(cost)
+        return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("PG_URL"),
+        help="URL of an empty PostgreSQL database (default: `PG_URL` env var)",
+    )
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--realms", type=int, default=20)
+    parser.add_argument("--blob-size", type=int, default=1024)
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("a PostgreSQL database is required (use `--db` or `PG_URL` env var)")
+
+    results = trio_run(_bench, args, use_asyncio=True)
+
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k != "db"}
+        print(json.dumps({"params": params, "results": results}, indent=2))
+    else:
+        for name, stats in results.items():
+            print(
+                f"{name:<14} median {stats['median_us']:8.1f}us  p95 {stats['p95_us']:8.1f}us"
+                f"  {stats['writes_per_s']:8.1f} writes/s"
+                f"  {stats['statements']:3.0f} statements, plan cost {stats['plan_cost']:8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+"""
+Compare two JSON results of the same benchmark (e.g. produced on two commits).
+
+Any of the `benchmarks/bench_*.py` scripts can be used, as long as `--json`
+was passed:
+
+    git checkout master && python benchmarks/bench_rpc_commands.py --json > before.json
+    git checkout my-branch && python benchmarks/bench_rpc_commands.py --json > after.json
+    python benchmarks/compare_results.py before.json after.json
+
+Usage: python benchmarks/compare_results.py BEFORE.json AFTER.json [--threshold 0.1]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+# Metrics where a higher value is better, all the other ones are durations
+HIGHER_IS_BETTER_SUFFIXES = ("_per_s", "ratio")
+
+
+def _flatten(results: Any, prefix: str = "") -> Dict[str, float]:
+    """
+    Benchmarks output either a `{name: {metric: value}}` mapping or a list of
+    `{param: value, ..., metric: value}` items, in the latter case the non-float
+    fields are used to identify the item.
+    """
+    flattened: Dict[str, float] = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            name = f"{prefix}.{key}" if prefix else str(key)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                flattened[name] = float(value)
+            else:
+                flattened.update(_flatten(value, name))
+
+    elif isinstance(results, list):
+        for item in results:
+            if not isinstance(item, dict):
+                continue
+            identifier = ",".join(
+                f"{key}={value}" for key, value in item.items() if not isinstance(value, float)
+            )
+            metrics = {key: value for key, value in item.items() if isinstance(value, float)}
+            name = f"{prefix}[{identifier}]" if prefix else f"[{identifier}]"
+            flattened.update(_flatten(metrics, name))
+
+    return flattened
+
+
+def compare(
+    before: Dict[str, float], after: Dict[str, float], threshold: float
+) -> Tuple[List[Tuple[str, float, float, float, str]], int]:
+    rows = []
+    regressions = 0
+    for name in sorted(before.keys() & after.keys()):
+        old, new = before[name], after[name]
+        ratio = new / old if old else float("inf") if new else 1.0
+        higher_is_better = name.endswith(HIGHER_IS_BETTER_SUFFIXES)
+        change = ratio - 1 if not higher_is_better else (1 / ratio if ratio else float("inf")) - 1
+        if change > threshold:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif change < -threshold:
+            verdict = "improvement"
+        else:
+            verdict = ""
+        rows.append((name, old, new, ratio, verdict))
+    return rows, regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("before", type=argparse.FileType("r"))
+    parser.add_argument("after", type=argparse.FileType("r"))
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative change considered significant (default: 0.1, i.e. 10%%)",
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="Exit with an error status if a regression is detected",
+    )
+    args = parser.parse_args()
+
+    before = json.load(args.before)
+    after = json.load(args.after)
+    if before.get("params") != after.get("params"):
+        print("Warning: results have been produced with different parameters", file=sys.stderr)
+
+    rows, regressions = compare(
+        _flatten(before["results"]), _flatten(after["results"]), args.threshold
+    )
+    width = max((len(row[0]) for row in rows), default=0)
+    for name, old, new, ratio, verdict in rows:
+        print(f"{name:<{width}}  {old:>14.2f}  {new:>14.2f}  x{ratio:<6.2f} {verdict}")
+
+    if regressions and args.fail_on_regression:
+        raise SystemExit(f"{regressions} regression(s) detected")
+
+
+if __name__ == "__main__":
+    main()
@@ -39,6 +39,7 @@ from . import (
     vlob_maintenance_save_reencryption_batch,
     vlob_poll_changes,
     vlob_read,
+    vlob_read_batch,
     vlob_update,
 )
 
@@ -83,6 +84,7 @@ class AnyCmdReq:
         | vlob_maintenance_save_reencryption_batch.Req
         | vlob_poll_changes.Req
         | vlob_read.Req
+        | vlob_read_batch.Req
         | vlob_update.Req
     ): ...
 
@@ -124,5 +126,6 @@ __all__ = [
     "vlob_maintenance_save_reencryption_batch",
     "vlob_poll_changes",
     "vlob_read",
+    "vlob_read_batch",
     "vlob_update",
 ]
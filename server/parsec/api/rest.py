@@ -112,6 +112,7 @@ class ServerStatsRepSchema(BaseSchema):
 
 
 server_stats_rep_serializer = JSONSerializer(ServerStatsRepSchema)
+server_stats_item_serializer = JSONSerializer(ServerStatsItem)
 
 # PATCH /administration/organizations/<organization_id>
 
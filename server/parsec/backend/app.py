@@ -8,6 +8,7 @@ from typing import Any, AsyncGenerator, Callable, Dict, Type
 import attr
 
 from parsec._parsec import OrganizationID, RealmRole, UserProfile
+from parsec.backend.auth_cache import AuthenticationCache
 from parsec.backend.block import BaseBlockComponent
 from parsec.backend.blockstore import BaseBlockStoreComponent
 from parsec.backend.client_context import BaseClientContext
@@ -20,6 +21,7 @@ from parsec.backend.organization import BaseOrganizationComponent, SequesterAuth
 from parsec.backend.ping import BasePingComponent
 from parsec.backend.pki import BasePkiEnrollmentComponent
 from parsec.backend.postgresql import components_factory as postgresql_components_factory
+from parsec.backend.postgresql.raid_scrubber import PGRAIDScrubber
 from parsec.backend.realm import BaseRealmComponent, RealmGrantedRole
 from parsec.backend.sequester import BaseSequesterComponent, StorageSequesterService
 from parsec.backend.user import BaseUserComponent, Device, User
@@ -57,6 +59,8 @@ async def backend_app_factory(
             pki=components["pki"],
             sequester=components["sequester"],
             events=components["events"],
+            auth_cache=components["auth_cache"],
+            raid_scrubber=components.get("raid_scrubber"),
         )
 
 
@@ -77,6 +81,9 @@ class BackendApp:
     pki: BasePkiEnrollmentComponent
     sequester: BaseSequesterComponent
     events: EventsComponent
+    auth_cache: AuthenticationCache
+    # Only with PostgreSQL, if enabled
+    raid_scrubber: PGRAIDScrubber | None = None
 
     apis: Dict[Type[Any], Callable[[BaseClientContext, Any], Any]] = attr.field(init=False)
 
@@ -109,6 +116,7 @@ class BackendApp:
         self.block.test_duplicate_organization(id, new_id)  # type: ignore[attr-defined]
         self.pki.test_duplicate_organization(id, new_id)  # type: ignore[attr-defined]
         self.sequester.test_duplicate_organization(id, new_id)  # type: ignore[attr-defined]
+        self.auth_cache.test_duplicate_organization(id, new_id)
 
     def test_drop_organization(self, id: OrganizationID) -> None:
         self.user.test_drop_organization(id)  # type: ignore[attr-defined]
@@ -122,6 +130,7 @@ class BackendApp:
         self.block.test_drop_organization(id)  # type: ignore[attr-defined]
         self.pki.test_drop_organization(id)  # type: ignore[attr-defined]
         self.sequester.test_drop_organization(id)  # type: ignore[attr-defined]
+        self.auth_cache.test_drop_organization(id)
 
     async def test_load_template(self, template: Any) -> OrganizationID:
         from parsec._parsec import testbed
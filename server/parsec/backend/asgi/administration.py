@@ -4,9 +4,19 @@ from __future__ import annotations
 import csv
 from functools import wraps
 from io import StringIO
-from typing import TYPE_CHECKING, Any, Awaitable, Callable, NoReturn, TypeVar
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    NoReturn,
+    TypeVar,
+)
 
 from quart import Blueprint, Response, current_app, g, jsonify, make_response, request
+from quart.wrappers.response import IterableBody
 from typing_extensions import ParamSpec
 
 from parsec._parsec import (
@@ -22,13 +32,15 @@ from parsec.api.rest import (
     organization_create_req_serializer,
     organization_stats_rep_serializer,
     organization_update_req_serializer,
-    server_stats_rep_serializer,
+    server_stats_item_serializer,
 )
+from parsec.backend.cached_blockstore import CachedBlockStoreComponent
 from parsec.backend.organization import (
     OrganizationAlreadyExistsError,
     OrganizationNotFoundError,
     generate_bootstrap_token,
 )
+from parsec.backend.raid1_blockstore import RAID1BlockStoreComponent
 from parsec.serde import SerdePackingError, SerdeValidationError
 from parsec.serde.serializer import JSONSerializer
 
@@ -44,33 +56,41 @@ CONTENT_TYPE_JSON = "application/json"
 administration_bp = Blueprint("administration_api", __name__)
 
 
-def _convert_server_stats_results_as_csv(stats: dict[OrganizationID, OrganizationStats]) -> str:
+SERVER_STATS_CSV_HEADER = [
+    "organization_id",
+    "data_size",
+    "metadata_size",
+    "realms",
+    "active_users",
+    "admin_users_active",
+    "admin_users_revoked",
+    "standard_users_active",
+    "standard_users_revoked",
+    "outsider_users_active",
+    "outsider_users_revoked",
+]
+
+
+def _csv_row(row: list[Any]) -> bytes:
     # Use `newline=""` to let the CSV writer handles the newlines
     with StringIO(newline="") as memory_file:
-        writer = csv.writer(memory_file)
-        # Header
-        writer.writerow(
-            [
-                "organization_id",
-                "data_size",
-                "metadata_size",
-                "realms",
-                "active_users",
-                "admin_users_active",
-                "admin_users_revoked",
-                "standard_users_active",
-                "standard_users_revoked",
-                "outsider_users_active",
-                "outsider_users_revoked",
-            ]
-        )
+        csv.writer(memory_file).writerow(row)
+        return memory_file.getvalue().encode("utf-8")
+
+
+async def _stream_server_stats_as_csv(
+    stats: AsyncIterator[tuple[OrganizationID, OrganizationStats]]
+) -> AsyncGenerator[bytes, None]:
+    yield _csv_row(SERVER_STATS_CSV_HEADER)
+
+    async for organization_id, org_stats in stats:
 
         def _find_profile_counts(profile: UserProfile) -> tuple[int, int]:
             detail = next(x for x in org_stats.users_per_profile_detail if x.profile == profile)
             return (detail.active, detail.revoked)
 
-        for organization_id, org_stats in stats.items():
-            csv_row = [
+        yield _csv_row(
+            [
                 organization_id.str,
                 org_stats.data_size,
                 org_stats.metadata_size,
@@ -80,9 +100,28 @@ def _convert_server_stats_results_as_csv(stats: dict[OrganizationID, Organizatio
                 *_find_profile_counts(UserProfile.STANDARD),
                 *_find_profile_counts(UserProfile.OUTSIDER),
             ]
-            writer.writerow(csv_row)
+        )
 
-        return memory_file.getvalue()
+
+async def _stream_server_stats_as_json(
+    stats: AsyncIterator[tuple[OrganizationID, OrganizationStats]]
+) -> AsyncGenerator[bytes, None]:
+    # Same output than `server_stats_rep_serializer`, one item at a time
+    yield b'{"stats": ['
+    separator = b""
+    async for organization_id, org_stats in stats:
+        yield separator + server_stats_item_serializer.dumps(
+            {
+                "organization_id": organization_id.str,
+                "data_size": org_stats.data_size,
+                "metadata_size": org_stats.metadata_size,
+                "realms": org_stats.realms,
+                "active_users": org_stats.active_users,
+                "users_per_profile_detail": org_stats.users_per_profile_detail,
+            }
+        )
+        separator = b", "
+    yield b"]}"
 
 
 def administration_authenticated(fn: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
@@ -257,35 +296,49 @@ async def administration_server_stats() -> Response:
     try:
         raw_at = request.args.get("at")
         at = DateTime.from_rfc3339(raw_at) if raw_at else None
-        server_stats = await backend.organization.server_stats(at=at)
     except ValueError:
         return await bad_data_abort(
             reason="Invalid `at` query argument (expected RFC3339 datetime)",
         )
 
+    # Stats are streamed as they are retrieved, so neither the server nor the
+    # response have to hold the stats of all the organizations at once
+    server_stats = backend.organization.server_stats(at=at)
     if request.args["format"] == "csv":
-        csv_data = _convert_server_stats_results_as_csv(server_stats)
-        return current_app.response_class(
-            csv_data,
+        response = current_app.response_class(
+            IterableBody(_stream_server_stats_as_csv(server_stats)),
             content_type="text/csv",
             status=200,
         )
 
     else:
-        return make_rep_response(
-            server_stats_rep_serializer,
-            data={
-                "stats": [
-                    {
-                        "organization_id": organization_id.str,
-                        "data_size": org_stats.data_size,
-                        "metadata_size": org_stats.metadata_size,
-                        "realms": org_stats.realms,
-                        "active_users": org_stats.active_users,
-                        "users_per_profile_detail": org_stats.users_per_profile_detail,
-                    }
-                    for organization_id, org_stats in server_stats.items()
-                ]
-            },
+        response = current_app.response_class(
+            IterableBody(_stream_server_stats_as_json(server_stats)),
+            content_type=CONTENT_TYPE_JSON,
             status=200,
         )
+
+    # Big servers can take longer than the default response timeout
+    response.timeout = None
+    return response
+
+
+@administration_bp.route("/administration/metrics", methods=["GET"])
+@administration_authenticated
+async def administration_metrics() -> Response:
+    backend: "BackendApp" = g.backend
+
+    metrics: dict[str, Any] = {"auth_cache": backend.auth_cache.stats()}
+    blockstore = backend.blockstore
+    if isinstance(blockstore, CachedBlockStoreComponent):
+        metrics["blockstore_cache"] = blockstore.stats()
+        blockstore = blockstore.blockstore
+    if isinstance(blockstore, RAID1BlockStoreComponent):
+        metrics["blockstore_raid1"] = blockstore.stats()
+    if backend.raid_scrubber:
+        metrics["blockstore_raid_scrub"] = backend.raid_scrubber.stats()
+    if backend.config.db_type == "POSTGRESQL":
+        from parsec.backend.postgresql.utils import queries_stats
+
+        metrics["postgresql_queries"] = queries_stats()
+    return jsonify(metrics)
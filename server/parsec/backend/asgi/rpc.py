@@ -195,7 +195,7 @@ async def _do_handshake(
         )
     organization: Organization | None
     try:
-        organization = await backend.organization.get(organization_id)
+        organization = await backend.auth_cache.get_organization(organization_id)
     except OrganizationNotFoundError:
         if not allow_missing_organization:
             _handshake_abort(
@@ -242,7 +242,7 @@ async def _do_handshake(
 
         body: bytes = await request.get_data()
         try:
-            user, device = await backend.user.get_user_with_device(organization_id, device_id)
+            user, device = await backend.auth_cache.get_user_with_device(organization_id, device_id)
         except UserNotFoundError:
             _handshake_abort(CustomHttpStatus.BadAuthenticationInfo.value, api_version=api_version)
         else:
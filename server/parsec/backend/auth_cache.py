@@ -0,0 +1,163 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Dict, Tuple, Type
+
+import trio
+
+from parsec._parsec import (
+    BackendEvent,
+    BackendEventOrganizationExpired,
+    BackendEventUserUpdatedOrRevoked,
+    DeviceID,
+    OrganizationID,
+    UserID,
+)
+from parsec.event_bus import EventBus
+
+if TYPE_CHECKING:
+    from parsec.backend.organization import BaseOrganizationComponent, Organization
+    from parsec.backend.user import BaseUserComponent
+    from parsec.backend.user_type import Device, User
+
+
+class AuthenticationCache:
+    """
+    Short-lived in-process cache for the organization and user/device lookups
+    done by the HTTP RPC handshake (unlike with Websocket, the handshake is
+    done for each request).
+
+    Invalidation is done in two ways:
+    - Components modifying an organization or a user synchronously invalidate
+      the corresponding entries, so the change is visible right away on the
+      node that did it.
+    - `organization.expired` and `user.updated_or_revoked` events are listened
+      to, so changes done on other server nodes are taken into account as soon
+      as the event is dispatched.
+
+    The TTL is only a safety net in case an event got lost.
+    """
+
+    def __init__(self, event_bus: EventBus, ttl: float):
+        self._ttl = ttl
+        self._organization_component: BaseOrganizationComponent | None = None
+        self._user_component: BaseUserComponent | None = None
+        self._organizations: Dict[OrganizationID, Tuple[float, Organization]] = {}
+        self._devices: Dict[OrganizationID, Dict[DeviceID, Tuple[float, User, Device]]] = {}
+        # Incremented on each invalidation: a lookup that started before an
+        # invalidation may have fetched outdated data, so it must not populate
+        # the cache
+        self._generation = 0
+        self.organization_hits = 0
+        self.organization_misses = 0
+        self.device_hits = 0
+        self.device_misses = 0
+
+        def _on_expired(
+            event: Type[BackendEvent], event_id: str, payload: BackendEventOrganizationExpired
+        ) -> None:
+            self.invalidate_organization(payload.organization_id)
+
+        def _on_updated_or_revoked(
+            event: Type[BackendEvent], event_id: str, payload: BackendEventUserUpdatedOrRevoked
+        ) -> None:
+            self.invalidate_user(payload.organization_id, payload.user_id)
+
+        event_bus.connect(
+            BackendEventOrganizationExpired,
+            _on_expired,  # type: ignore[arg-type]
+        )
+        event_bus.connect(
+            BackendEventUserUpdatedOrRevoked,
+            _on_updated_or_revoked,  # type: ignore[arg-type]
+        )
+
+    def register_components(
+        self,
+        organization: BaseOrganizationComponent,
+        user: BaseUserComponent,
+        **other_components: Any,
+    ) -> None:
+        self._organization_component = organization
+        self._user_component = user
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "organization_hits": self.organization_hits,
+            "organization_misses": self.organization_misses,
+            "device_hits": self.device_hits,
+            "device_misses": self.device_misses,
+            "cached_organizations": len(self._organizations),
+            "cached_devices": sum(len(devices) for devices in self._devices.values()),
+        }
+
+    async def get_organization(self, id: OrganizationID) -> Organization:
+        """
+        Raises:
+            OrganizationNotFoundError
+        """
+        assert self._organization_component is not None
+
+        try:
+            expires_on, organization = self._organizations[id]
+            if expires_on > trio.current_time():
+                self.organization_hits += 1
+                return organization
+        except KeyError:
+            pass
+
+        self.organization_misses += 1
+        generation = self._generation
+        organization = await self._organization_component.get(id)
+        # Expired organizations are not cached: requests to them are rejected anyway,
+        # and turning an organization back to non-expired doesn't send any event
+        if self._ttl > 0 and not organization.is_expired and generation == self._generation:
+            self._organizations[id] = (trio.current_time() + self._ttl, organization)
+        return organization
+
+    async def get_user_with_device(
+        self, organization_id: OrganizationID, device_id: DeviceID
+    ) -> Tuple[User, Device]:
+        """
+        Raises:
+            UserNotFoundError
+        """
+        assert self._user_component is not None
+
+        try:
+            expires_on, user, device = self._devices[organization_id][device_id]
+            if expires_on > trio.current_time():
+                self.device_hits += 1
+                return user, device
+        except KeyError:
+            pass
+
+        self.device_misses += 1
+        generation = self._generation
+        user, device = await self._user_component.get_user_with_device(organization_id, device_id)
+        # Revoked users are not cached: their requests are rejected anyway
+        if self._ttl > 0 and not user.revoked_on and generation == self._generation:
+            self._devices.setdefault(organization_id, {})[device_id] = (
+                trio.current_time() + self._ttl,
+                user,
+                device,
+            )
+        return user, device
+
+    def invalidate_organization(self, organization_id: OrganizationID) -> None:
+        self._generation += 1
+        self._organizations.pop(organization_id, None)
+        self._devices.pop(organization_id, None)
+
+    def invalidate_user(self, organization_id: OrganizationID, user_id: UserID) -> None:
+        self._generation += 1
+        devices = self._devices.get(organization_id)
+        if devices:
+            for device_id in [d for d in devices if d.user_id == user_id]:
+                del devices[device_id]
+
+    def test_duplicate_organization(self, id: OrganizationID, new_id: OrganizationID) -> None:
+        pass
+
+    def test_drop_organization(self, id: OrganizationID) -> None:
+        self.invalidate_organization(id)
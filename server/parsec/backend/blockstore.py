@@ -1,19 +1,27 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, List, Tuple
+
+import attr
+import trio
 
 from parsec._parsec import BlockID, OrganizationID
+from parsec.backend.block import BlockStoreError
 from parsec.backend.config import (
     BaseBlockStoreConfig,
+    CachedBlockStoreConfig,
+    FileSystemBlockStoreConfig,
     MockedBlockStoreConfig,
     PostgreSQLBlockStoreConfig,
     RAID0BlockStoreConfig,
     RAID1BlockStoreConfig,
     RAID5BlockStoreConfig,
+    RAIDECBlockStoreConfig,
     S3BlockStoreConfig,
     SWIFTBlockStoreConfig,
 )
+from parsec.utils import open_service_nursery
 
 if TYPE_CHECKING:
     from parsec.backend.postgresql.handler import PGHandler
@@ -63,6 +71,80 @@ class BaseBlockStoreComponent:
         raise NotImplementedError()
 
 
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class BlockScrubResult:
+    block_size: int
+    # Bytes read from and written to the nodes
+    read_bytes: int
+    written_bytes: int
+    # Index of the nodes the block was missing from, among them those which could
+    # not be repaired, and the nodes whose data doesn't match the rebuilt block
+    missing_nodes: List[int]
+    repair_failed_nodes: List[int]
+    inconsistent_nodes: List[int]
+
+
+async def scrub_nodes(
+    blockstores: List[BaseBlockStoreComponent],
+    organization_id: OrganizationID,
+    block_id: BlockID,
+    rebuild: Callable[[List[bytes | None]], Tuple[bytes, List[bytes]]],
+    rebuild_in_thread: bool = False,
+) -> BlockScrubResult:
+    """
+    Read a block from all the nodes of a RAID blockstore, then create it again on
+    the nodes it is missing from.
+
+    `rebuild` is provided with the data read from each node (`None` if the read
+    has failed), and returns the block and the data each node should contain.
+
+    Raises:
+        BlockStoreError: if the block cannot be rebuilt
+    """
+    nodes_data: List[bytes | None] = [None] * len(blockstores)
+
+    async def _node_read(index: int) -> None:
+        try:
+            nodes_data[index] = await blockstores[index].read(organization_id, block_id)
+        except BlockStoreError:
+            pass
+
+    async with open_service_nursery() as nursery:
+        for index in range(len(blockstores)):
+            nursery.start_soon(_node_read, index)
+
+    if rebuild_in_thread:
+        block, expected_nodes_data = await trio.to_thread.run_sync(rebuild, nodes_data)
+    else:
+        block, expected_nodes_data = rebuild(nodes_data)
+
+    missing_nodes = [index for index, data in enumerate(nodes_data) if data is None]
+    repair_failed_nodes: List[int] = []
+
+    async def _node_repair(index: int) -> None:
+        try:
+            await blockstores[index].create(organization_id, block_id, expected_nodes_data[index])
+        except BlockStoreError:
+            repair_failed_nodes.append(index)
+
+    async with open_service_nursery() as nursery:
+        for index in missing_nodes:
+            nursery.start_soon(_node_repair, index)
+
+    return BlockScrubResult(
+        block_size=len(block),
+        read_bytes=sum(len(data) for data in nodes_data if data is not None),
+        written_bytes=sum(len(expected_nodes_data[index]) for index in missing_nodes),
+        missing_nodes=missing_nodes,
+        repair_failed_nodes=sorted(repair_failed_nodes),
+        inconsistent_nodes=[
+            index
+            for index, data in enumerate(nodes_data)
+            if data is not None and data != expected_nodes_data[index]
+        ],
+    )
+
+
 def blockstore_factory(
     config: BaseBlockStoreConfig, postgresql_dbh: PGHandler | None = None
 ) -> BaseBlockStoreComponent:
@@ -88,6 +170,8 @@ def blockstore_factory(
                 config.s3_key,
                 config.s3_secret,
                 config.s3_endpoint_url,
+                max_connections=config.s3_max_connections,
+                timeout=config.s3_timeout,
             )
         except ImportError as exc:
             raise ValueError("S3 block store is not available") from exc
@@ -102,16 +186,26 @@ def blockstore_factory(
                 config.swift_container,
                 config.swift_user,
                 config.swift_password,
+                max_connections=config.swift_max_connections,
             )
         except ImportError as exc:
             raise ValueError("Swift block store is not available") from exc
 
+    elif isinstance(config, FileSystemBlockStoreConfig):
+        from parsec.backend.fs_blockstore import FileSystemBlockStoreComponent
+
+        return FileSystemBlockStoreComponent(
+            config.path, fsync=config.fsync, fsync_batch_delay=config.fsync_batch_delay
+        )
+
     elif isinstance(config, RAID1BlockStoreConfig):
         from parsec.backend.raid1_blockstore import RAID1BlockStoreComponent
 
         blocks = [blockstore_factory(sub_conf, postgresql_dbh) for sub_conf in config.blockstores]
 
-        return RAID1BlockStoreComponent(blocks, partial_create_ok=config.partial_create_ok)
+        return RAID1BlockStoreComponent(
+            blocks, partial_create_ok=config.partial_create_ok, hedged_reads=config.hedged_reads
+        )
 
     elif isinstance(config, RAID0BlockStoreConfig):
         from parsec.backend.raid0_blockstore import RAID0BlockStoreComponent
@@ -130,5 +224,33 @@ def blockstore_factory(
 
         return RAID5BlockStoreComponent(blocks, partial_create_ok=config.partial_create_ok)
 
+    elif isinstance(config, RAIDECBlockStoreConfig):
+        from parsec.backend.raidec_blockstore import RAIDEC_MAX_SHARDS, RAIDECBlockStoreComponent
+
+        if config.parity_shards < 1:
+            raise ValueError("RAIDEC block store needs at least 1 parity shard")
+        if len(config.blockstores) <= config.parity_shards:
+            raise ValueError("RAIDEC block store needs more nodes than parity shards")
+        if len(config.blockstores) > RAIDEC_MAX_SHARDS:
+            raise ValueError(f"RAIDEC block store supports at most {RAIDEC_MAX_SHARDS} nodes")
+
+        blocks = [blockstore_factory(sub_conf, postgresql_dbh) for sub_conf in config.blockstores]
+
+        return RAIDECBlockStoreComponent(
+            blocks,
+            parity_shards=config.parity_shards,
+            partial_create_ok=config.partial_create_ok,
+        )
+
+    elif isinstance(config, CachedBlockStoreConfig):
+        from parsec.backend.cached_blockstore import CachedBlockStoreComponent
+
+        return CachedBlockStoreComponent(
+            blockstore_factory(config.blockstore, postgresql_dbh),
+            memory_cache_size=config.memory_cache_size,
+            disk_cache_dir=config.disk_cache_dir,
+            disk_cache_size=config.disk_cache_size,
+        )
+
     else:
         raise ValueError(f"Unknown block store configuration `{config}`")
@@ -0,0 +1,238 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import os
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Tuple, Union
+from uuid import uuid4
+
+import attr
+import trio
+from structlog import get_logger
+
+from parsec._parsec import BlockID, OrganizationID
+from parsec.backend.block import BlockStoreError
+from parsec.backend.blockstore import BaseBlockStoreComponent
+
+logger = get_logger()
+
+CacheKey = Tuple[OrganizationID, BlockID]
+
+
+@attr.s(slots=True, auto_attribs=True)
+class _PendingRead:
+    done: trio.Event = attr.ib(factory=trio.Event)
+    # Set once the read is done, left to `None` if the read has been cancelled
+    outcome: Union[bytes, BlockStoreError, None] = None
+
+
+class _DiskBlockCache:
+    """
+    Blocks are stored as `<dir>/parsec-block-cache/<organization_id>/<block_id[:2]>/<block_id>`.
+
+    The index of the cached blocks only lives in memory, so the cache directory
+    is cleared on startup (it is a cache after all).
+    """
+
+    def __init__(self, dir: Path, max_size: int):
+        path = dir / "parsec-block-cache"
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self._index: OrderedDict[CacheKey, int] = OrderedDict()
+        shutil.rmtree(path, ignore_errors=True)
+        path.mkdir(parents=True, exist_ok=True)
+
+    def _block_path(self, key: CacheKey) -> Path:
+        organization_id, block_id = key
+        return self.path / organization_id.str / block_id.hex[:2] / block_id.hex
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    async def get(self, key: CacheKey) -> bytes | None:
+        if key not in self._index:
+            return None
+        try:
+            block = await trio.to_thread.run_sync(self._block_path(key).read_bytes)
+        except OSError as exc:
+            logger.warning("Block cache disk read error", key=key, exc_info=exc)
+            self._forget(key)
+            return None
+        # The block may have been evicted by a concurrent `put` while reading it
+        if key in self._index:
+            self._index.move_to_end(key)
+        return block
+
+    async def put(self, key: CacheKey, block: bytes) -> None:
+        if key in self._index or len(block) > self.max_size:
+            return
+
+        def _write() -> None:
+            # Write then rename so a block file is never partially written
+            block_path = self._block_path(key)
+            block_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = block_path.with_name(f"{block_path.name}.{uuid4().hex}.tmp")
+            tmp_path.write_bytes(block)
+            os.replace(tmp_path, block_path)
+
+        try:
+            await trio.to_thread.run_sync(_write)
+        except OSError as exc:
+            logger.warning("Block cache disk write error", key=key, exc_info=exc)
+            return
+        # A concurrent `put` of the same block may have been done while writing it
+        if key in self._index:
+            return
+        self._index[key] = len(block)
+        self.size += len(block)
+        while self.size > self.max_size:
+            self._forget(next(iter(self._index)))
+
+    def _forget(self, key: CacheKey) -> None:
+        size = self._index.pop(key, None)
+        if size is None:
+            # Already forgotten while the caller was waiting on a disk operation
+            return
+        self.size -= size
+        # Removal is cheap compared to the read/write, no need to use a thread
+        try:
+            self._block_path(key).unlink()
+        except OSError:
+            pass
+
+    def drop_organization(self, organization_id: OrganizationID) -> None:
+        for key in [key for key in self._index if key[0] == organization_id]:
+            self._forget(key)
+
+
+class CachedBlockStoreComponent(BaseBlockStoreComponent):
+    """
+    Read-through cache in front of another blockstore.
+
+    This is possible given blocks are immutable: a block is never modified
+    once created, so a cached block is always valid.
+
+    Concurrent reads of a block missing from the cache are coalesced into a
+    single read on the underlying blockstore.
+    """
+
+    def __init__(
+        self,
+        blockstore: BaseBlockStoreComponent,
+        memory_cache_size: int,
+        disk_cache_dir: Path | None = None,
+        disk_cache_size: int = 0,
+    ):
+        self.blockstore = blockstore
+        self._memory_cache_max_size = memory_cache_size
+        self._memory_cache_size = 0
+        self._memory_cache: OrderedDict[CacheKey, bytes] = OrderedDict()
+        self._disk_cache = (
+            _DiskBlockCache(disk_cache_dir, disk_cache_size) if disk_cache_dir else None
+        )
+        self._pending_reads: Dict[CacheKey, _PendingRead] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.coalesced_reads = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.bytes_fetched = 0
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        reads = self.memory_hits + self.disk_hits + self.coalesced_reads + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "coalesced_reads": self.coalesced_reads,
+            "misses": self.misses,
+            "hit_ratio": (reads - self.misses) / reads if reads else 0.0,
+            "bytes_served": self.bytes_served,
+            "bytes_fetched": self.bytes_fetched,
+            "memory_cached_blocks": len(self._memory_cache),
+            "memory_cached_bytes": self._memory_cache_size,
+            "disk_cached_blocks": len(self._disk_cache) if self._disk_cache else 0,
+            "disk_cached_bytes": self._disk_cache.size if self._disk_cache else 0,
+        }
+
+    def _memory_cache_put(self, key: CacheKey, block: bytes) -> None:
+        if key in self._memory_cache or len(block) > self._memory_cache_max_size:
+            return
+        self._memory_cache[key] = block
+        self._memory_cache_size += len(block)
+        while self._memory_cache_size > self._memory_cache_max_size:
+            _, evicted_block = self._memory_cache.popitem(last=False)
+            self._memory_cache_size -= len(evicted_block)
+
+    async def _fetch(self, key: CacheKey) -> bytes:
+        if self._disk_cache:
+            block = await self._disk_cache.get(key)
+            if block is not None:
+                self.disk_hits += 1
+                self._memory_cache_put(key, block)
+                return block
+
+        self.misses += 1
+        block = await self.blockstore.read(*key)
+        self.bytes_fetched += len(block)
+        self._memory_cache_put(key, block)
+        if self._disk_cache:
+            await self._disk_cache.put(key, block)
+        return block
+
+    async def _read(self, key: CacheKey) -> bytes:
+        while True:
+            try:
+                block = self._memory_cache[key]
+                self._memory_cache.move_to_end(key)
+                self.memory_hits += 1
+                return block
+            except KeyError:
+                pass
+
+            pending = self._pending_reads.get(key)
+            if pending is None:
+                break
+
+            # Another read of this block is in progress, wait for its outcome
+            await pending.done.wait()
+            if isinstance(pending.outcome, bytes):
+                self.coalesced_reads += 1
+                return pending.outcome
+            elif isinstance(pending.outcome, BlockStoreError):
+                raise BlockStoreError(*pending.outcome.args) from pending.outcome
+            # Otherwise the other read has been cancelled, so try again
+
+        pending = _PendingRead()
+        self._pending_reads[key] = pending
+        try:
+            pending.outcome = await self._fetch(key)
+            return pending.outcome
+        except BlockStoreError as exc:
+            pending.outcome = exc
+            raise
+        finally:
+            del self._pending_reads[key]
+            pending.done.set()
+
+    async def read(self, organization_id: OrganizationID, block_id: BlockID) -> bytes:
+        block = await self._read((organization_id, block_id))
+        self.bytes_served += len(block)
+        return block
+
+    async def create(
+        self, organization_id: OrganizationID, block_id: BlockID, block: bytes
+    ) -> None:
+        await self.blockstore.create(organization_id, block_id, block)
+
+    def test_duplicate_organization(self, id: OrganizationID, new_id: OrganizationID) -> None:
+        self.blockstore.test_duplicate_organization(id, new_id)  # type: ignore[attr-defined]
+
+    def test_drop_organization(self, id: OrganizationID) -> None:
+        self.blockstore.test_drop_organization(id)  # type: ignore[attr-defined]
+        for key in [key for key in self._memory_cache if key[0] == id]:
+            self._memory_cache_size -= len(self._memory_cache.pop(key))
+        if self._disk_cache:
+            self._disk_cache.drop_organization(id)
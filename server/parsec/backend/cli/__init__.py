@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import click
 
+from parsec.backend.cli.blockstore import migrate_blockstore
 from parsec.backend.cli.migration import migrate
 from parsec.backend.cli.run import run_cmd
 from parsec.backend.cli.sequester import (
@@ -35,6 +36,15 @@ backend_sequester_cmd.add_command(generate_service_certificate, "generate_servic
 backend_sequester_cmd.add_command(import_service_certificate, "import_service_certificate")
 
 
+@click.group(short_help="Handle blockstore")
+@version_option
+def backend_blockstore_cmd() -> None:
+    pass
+
+
+backend_blockstore_cmd.add_command(migrate_blockstore, "migrate")
+
+
 @click.group()
 @version_option
 def backend_cmd_group() -> None:
@@ -45,3 +55,4 @@ backend_cmd_group.add_command(run_cmd, "run")
 backend_cmd_group.add_command(migrate, "migrate")
 backend_cmd_group.add_command(human_accesses, "human_accesses")
 backend_cmd_group.add_command(backend_sequester_cmd, "sequester")
+backend_cmd_group.add_command(backend_blockstore_cmd, "blockstore")
@@ -0,0 +1,231 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import click
+import trio
+
+from parsec._parsec import BlockID, OrganizationID
+from parsec.backend.blockstore import blockstore_factory
+from parsec.backend.cli.migration import _validate_postgres_db_url
+from parsec.backend.cli.sequester import BackendDbConfig, run_pg_db_handler
+from parsec.backend.cli.utils import _parse_blockstore_params
+from parsec.backend.config import BaseBlockStoreConfig
+from parsec.backend.postgresql.blockstore_migration import BlockStoreMigration
+from parsec.cli_utils import cli_exception_handler, debug_config_options, logging_config_options
+from parsec.utils import trio_run
+
+
+class BlockStoreMigrationCliError(Exception):
+    pass
+
+
+UnmigratedBlocks = Dict[int, Tuple[OrganizationID, BlockID]]
+
+
+def load_checkpoint(path: Path) -> Tuple[int, UnmigratedBlocks]:
+    """
+    Return the `_id` of the last processed block (0 if the migration hasn't started yet)
+    and the blocks that couldn't be migrated so far
+    """
+    try:
+        checkpoint = json.loads(path.read_text())
+        last_id = int(checkpoint["last_id"])
+        unmigrated_blocks = {
+            int(block["id"]): (
+                OrganizationID(block["organization_id"]),
+                BlockID.from_hex(block["block_id"]),
+            )
+            for block in checkpoint.get("unmigrated_blocks", [])
+        }
+    except FileNotFoundError:
+        return 0, {}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as exc:
+        raise BlockStoreMigrationCliError(f"Invalid checkpoint file `{path}`: {exc!r}") from exc
+    return last_id, unmigrated_blocks
+
+
+def save_checkpoint(path: Path, last_id: int, unmigrated_blocks: UnmigratedBlocks) -> None:
+    checkpoint = {
+        "last_id": last_id,
+        # Also useful for the operator to know which blocks are missing
+        "unmigrated_blocks": [
+            {"id": row_id, "organization_id": organization_id.str, "block_id": block_id.hex}
+            for row_id, (organization_id, block_id) in sorted(unmigrated_blocks.items())
+        ],
+    }
+    # Write then rename so the checkpoint is never partially written
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_text(json.dumps(checkpoint, indent=2))
+    os.replace(tmp_path, path)
+
+
+def _display_progress(migration: BlockStoreMigration, last_block_id: int, elapsed: float) -> None:
+    elapsed = max(elapsed, 1e-6)
+    click.echo(
+        f"Block {migration.last_id}/{last_block_id}:"
+        f" {migration.copied_blocks} blocks copied ({migration.copied_bytes / 1e6:.1f} MB)"
+        f", {migration.failed_blocks} failed"
+        f" - {migration.copied_blocks / elapsed:.1f} blocks/s"
+        f", {migration.copied_bytes / 1e6 / elapsed:.1f} MB/s"
+    )
+
+
+async def _migrate_blockstore(
+    db_config: BackendDbConfig,
+    source_config: BaseBlockStoreConfig,
+    destination_config: BaseBlockStoreConfig,
+    checkpoint: Path,
+    concurrency: int,
+    batch_size: int,
+    progress_interval: float,
+) -> None:
+    last_id, unmigrated_blocks = load_checkpoint(checkpoint)
+    if last_id:
+        click.echo(f"Resuming migration after block {last_id}")
+    if unmigrated_blocks:
+        click.echo(f"Retrying {len(unmigrated_blocks)} blocks that previously failed")
+
+    def _on_block_error(
+        row_id: int, organization_id: OrganizationID, block_id: BlockID, reason: str
+    ) -> None:
+        click.secho(
+            f"Block {row_id} (organization `{organization_id.str}`, block `{block_id.hex}`)"
+            f" not migrated: {reason}",
+            fg="red",
+        )
+
+    async with run_pg_db_handler(db_config) as dbh:
+        migration = BlockStoreMigration(
+            dbh=dbh,
+            source=blockstore_factory(source_config, postgresql_dbh=dbh),
+            destination=blockstore_factory(destination_config, postgresql_dbh=dbh),
+            last_id=last_id,
+            concurrency=concurrency,
+            batch_size=batch_size,
+            on_block_error=_on_block_error,
+            unmigrated_blocks=unmigrated_blocks,
+        )
+        last_block_id = await migration.get_last_block_id()
+        started_on = time.monotonic()
+
+        async def _report_progress() -> None:
+            while True:
+                await trio.sleep(progress_interval)
+                save_checkpoint(checkpoint, migration.last_id, migration.unmigrated_blocks)
+                _display_progress(migration, last_block_id, time.monotonic() - started_on)
+
+        try:
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(_report_progress)
+                await migration.run()
+                nursery.cancel_scope.cancel()
+        finally:
+            # Also done on error or interruption, so the migration can be resumed
+            save_checkpoint(checkpoint, migration.last_id, migration.unmigrated_blocks)
+
+        _display_progress(migration, last_block_id, time.monotonic() - started_on)
+
+    if migration.unmigrated_blocks:
+        raise BlockStoreMigrationCliError(
+            f"{len(migration.unmigrated_blocks)} blocks could not be migrated"
+            f" (listed in `{checkpoint}`, run the same command again to retry them)"
+        )
+    click.secho("Migration done", fg="green")
+
+
+@click.command(short_help="Copy the blocks from a blockstore to another")
+@click.option(
+    "--db",
+    required=True,
+    callback=_validate_postgres_db_url,
+    envvar="PARSEC_DB",
+    help="PostgreSQL database url",
+)
+@click.option(
+    "--source",
+    required=True,
+    multiple=True,
+    callback=lambda ctx, param, value: _parse_blockstore_params(value),
+    metavar="CONFIG",
+    help="Blockstore to copy the blocks from (same format as `parsec backend run --blockstore`)",
+)
+@click.option(
+    "--destination",
+    required=True,
+    multiple=True,
+    callback=lambda ctx, param, value: _parse_blockstore_params(value),
+    metavar="CONFIG",
+    help="Blockstore to copy the blocks to (same format as `parsec backend run --blockstore`)",
+)
+@click.option(
+    "--checkpoint",
+    type=Path,
+    required=True,
+    help="File where the migration progress is saved, the migration resumes from it if it exists",
+)
+@click.option(
+    "--concurrency", default=16, show_default=True, help="Number of blocks copied concurrently"
+)
+@click.option(
+    "--batch-size",
+    default=1000,
+    show_default=True,
+    help="Number of blocks retrieved from the database at once",
+)
+@click.option(
+    "--progress-interval",
+    default=10.0,
+    show_default=True,
+    help="Interval in seconds between progress reports (and checkpoint saves)",
+)
+# Avoid polluting CLI command output with INFO logs
+@logging_config_options(default_log_level="WARNING")
+# Add --debug
+@debug_config_options
+def migrate_blockstore(
+    db: str,
+    source: BaseBlockStoreConfig,
+    destination: BaseBlockStoreConfig,
+    checkpoint: Path,
+    concurrency: int,
+    batch_size: int,
+    progress_interval: float,
+    debug: bool,
+    **kwargs: Any,
+) -> None:
+    """
+    Copy the blocks referenced in the database from a blockstore to another
+
+    Blocks are copied in the order they have been created, and their size is
+    checked against the one stored in the database. The progress is saved in
+    the checkpoint file, so an interrupted migration can be resumed by running
+    the same command again. Blocks that couldn't be copied are also listed in
+    the checkpoint file, and retried when running the same command again.
+
+    Blocks created once the migration is over are not copied: after switching
+    the server to the destination blockstore, run the same command again to copy
+    the blocks created in the meantime.
+    """
+    with cli_exception_handler(debug):
+        # Connections are used to retrieve the blocks, and by the workers if
+        # the PostgreSQL blockstore is involved
+        db_config = BackendDbConfig(
+            db_url=db, db_min_connections=1, db_max_connections=concurrency + 1
+        )
+        trio_run(
+            _migrate_blockstore,
+            db_config,
+            source,
+            destination,
+            checkpoint,
+            concurrency,
+            batch_size,
+            progress_interval,
+            use_asyncio=True,
+        )
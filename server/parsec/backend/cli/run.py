@@ -7,6 +7,7 @@ from functools import partial
 from pathlib import Path
 from typing import Any, Tuple
 
+import attr
 import click
 import trio
 from structlog import get_logger
@@ -14,12 +15,18 @@ from structlog import get_logger
 from parsec._parsec import ActiveUsersLimit, BackendAddr
 from parsec.backend import backend_app_factory
 from parsec.backend.asgi import serve_backend_with_asgi
-from parsec.backend.cli.utils import blockstore_backend_options, db_backend_options
+from parsec.backend.cli.utils import (
+    blockstore_backend_options,
+    configure_blockstore_connections,
+    db_backend_options,
+)
 from parsec.backend.config import (
     BackendConfig,
     BaseBlockStoreConfig,
+    CachedBlockStoreConfig,
     EmailConfig,
     MockedEmailConfig,
+    RAID1BlockStoreConfig,
     SmtpEmailConfig,
 )
 from parsec.cli_utils import (
@@ -122,6 +129,67 @@ For instance:
     help="Number of seconds before a new attempt at connecting to the database",
 )
 @blockstore_backend_options
+@click.option(
+    "--blockstore-cache-size",
+    default=0,
+    show_default=True,
+    type=int,
+    envvar="PARSEC_BLOCKSTORE_CACHE_SIZE",
+    help=(
+        "Size (in bytes) of the in-memory cache of the blocks read from the blockstore"
+        " (pass 0 to disable)"
+    ),
+)
+@click.option(
+    "--blockstore-disk-cache-dir",
+    default=None,
+    type=click.Path(file_okay=False, path_type=Path),
+    envvar="PARSEC_BLOCKSTORE_DISK_CACHE_DIR",
+    help="Directory used as a second tier of cache for the blocks (cleared on startup)",
+)
+@click.option(
+    "--blockstore-disk-cache-size",
+    default=1024**3,
+    show_default=True,
+    type=int,
+    envvar="PARSEC_BLOCKSTORE_DISK_CACHE_SIZE",
+    help="Size (in bytes) of the blocks disk cache",
+)
+@click.option(
+    "--blockstore-max-connections",
+    default=None,
+    type=click.IntRange(min=1),
+    envvar="PARSEC_BLOCKSTORE_MAX_CONNECTIONS",
+    help="Number of concurrent requests allowed against each S3/SWIFT blockstore (default: 10)",
+)
+@click.option(
+    "--blockstore-s3-timeout",
+    default=None,
+    type=click.FloatRange(min=0, min_open=True),
+    envvar="PARSEC_BLOCKSTORE_S3_TIMEOUT",
+    help="Timeout (in seconds) of a single S3 blockstore read/create (default: 30)",
+)
+@click.option(
+    "--blockstore-raid1-read-all",
+    is_flag=True,
+    envvar="PARSEC_BLOCKSTORE_RAID1_READ_ALL",
+    help=(
+        "Send RAID1 reads to all the mirrors at once instead of querying the fastest one"
+        " and only hedging with another mirror when it is slow to answer"
+    ),
+)
+@click.option(
+    "--blockstore-raid-scrub-io-budget",
+    default=0,
+    show_default=True,
+    type=int,
+    envvar="PARSEC_BLOCKSTORE_RAID_SCRUB_IO_BUDGET",
+    help=(
+        "Bytes per second read and written by the background task going through all the"
+        " blocks to repair the ones missing from some RAID nodes (only with PostgreSQL,"
+        " pass <= 0 to disable). Should only be enabled on a single server"
+    ),
+)
 @click.option(
     "--administration-token",
     required=True,
@@ -282,6 +350,49 @@ organization_id, device_id, device_label (can be null), human_email (can be null
     envvar="PARSEC_SSE_KEEPALIVE",
     help="Keep SSE connection open by sending keepalive messages to client (pass <= 0 to disable)",
 )
+@click.option(
+    "--auth-cache-ttl",
+    default=5,
+    show_default=True,
+    type=float,
+    envvar="PARSEC_AUTH_CACHE_TTL",
+    help=(
+        "Number of seconds the organization and user lookups done to authenticate HTTP"
+        " requests are cached (pass <= 0 to disable)"
+    ),
+)
+@click.option(
+    "--events-cache-size",
+    default=1024,
+    show_default=True,
+    type=int,
+    envvar="PARSEC_EVENTS_CACHE_SIZE",
+    help=(
+        "Number of last events kept to send to the SSE clients the events they missed"
+        " while reconnecting (pass 0 to disable)"
+    ),
+)
+@click.option(
+    "--events-cache-max-age",
+    default=3600,
+    show_default=True,
+    type=float,
+    callback=lambda ctx, param, value: math.inf if value is None or value <= 0 else value,
+    envvar="PARSEC_EVENTS_CACHE_MAX_AGE",
+    help="Number of seconds events are kept in the events cache (pass <= 0 to disable)",
+)
+@click.option(
+    "--event-log-retention",
+    default=0,
+    show_default=True,
+    type=float,
+    envvar="PARSEC_EVENT_LOG_RETENTION",
+    help=(
+        "Number of seconds events are persisted in the database to send to the SSE clients"
+        " the events they missed while reconnecting to any server, even after a restart"
+        " (only with PostgreSQL, pass <= 0 to disable)"
+    ),
+)
 # Add --debug
 @debug_config_options
 def run_cmd(
@@ -291,9 +402,20 @@ def run_cmd(
     db_min_connections: int,
     db_max_connections: int,
     sse_keepalive: float,
+    auth_cache_ttl: float,
+    events_cache_size: int,
+    events_cache_max_age: float,
+    event_log_retention: float,
     maximum_database_connection_attempts: int,
     pause_before_retry_database_connection: float,
     blockstore: BaseBlockStoreConfig,
+    blockstore_cache_size: int,
+    blockstore_disk_cache_dir: Path | None,
+    blockstore_disk_cache_size: int,
+    blockstore_max_connections: int | None,
+    blockstore_s3_timeout: float | None,
+    blockstore_raid1_read_all: bool,
+    blockstore_raid_scrub_io_budget: int,
     administration_token: str,
     spontaneous_organization_bootstrap: bool,
     organization_bootstrap_webhook: str,
@@ -341,6 +463,20 @@ def run_cmd(
                 sender=email_sender,
             )
 
+        blockstore = configure_blockstore_connections(
+            blockstore, blockstore_max_connections, blockstore_s3_timeout
+        )
+        if blockstore_raid1_read_all and isinstance(blockstore, RAID1BlockStoreConfig):
+            blockstore = attr.evolve(blockstore, hedged_reads=False)
+
+        if blockstore_cache_size > 0 or blockstore_disk_cache_dir:
+            blockstore = CachedBlockStoreConfig(
+                blockstore=blockstore,
+                memory_cache_size=blockstore_cache_size,
+                disk_cache_dir=blockstore_disk_cache_dir,
+                disk_cache_size=blockstore_disk_cache_size,
+            )
+
         app_config = BackendConfig(
             administration_token=administration_token,
             db_url=db,
@@ -360,6 +496,11 @@ def run_cmd(
             if organization_initial_active_users_limit is not None
             else ActiveUsersLimit.NO_LIMIT,
             organization_initial_user_profile_outsider_allowed=organization_initial_user_profile_outsider_allowed,
+            auth_cache_ttl=auth_cache_ttl,
+            events_cache_size=events_cache_size,
+            events_cache_max_age=events_cache_max_age,
+            event_log_retention=event_log_retention,
+            blockstore_raid_scrub_io_budget=blockstore_raid_scrub_io_budget,
         )
 
         click.echo(
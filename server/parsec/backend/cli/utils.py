@@ -1,20 +1,25 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
+import re
 from collections import defaultdict
 from itertools import count
+from pathlib import Path
 from typing import Callable, List, TypeVar
 
+import attr
 import click
 from typing_extensions import ParamSpec
 
 from parsec.backend.config import (
     BaseBlockStoreConfig,
+    FileSystemBlockStoreConfig,
     MockedBlockStoreConfig,
     PostgreSQLBlockStoreConfig,
     RAID0BlockStoreConfig,
     RAID1BlockStoreConfig,
     RAID5BlockStoreConfig,
+    RAIDECBlockStoreConfig,
     S3BlockStoreConfig,
     SWIFTBlockStoreConfig,
 )
@@ -142,17 +147,44 @@ def _parse_blockstore_param(value: str) -> BaseBlockStoreConfig:
                 swift_user=user,
                 swift_password=password,
             )
+        elif parts[0].upper() == "FS":
+            if len(parts) not in (2, 3) or not parts[1]:
+                raise click.BadParameter(
+                    "Invalid FS config, must be `fs:<path>[:<fsync_batch_delay>|nofsync]`"
+                )
+            if len(parts) == 2:
+                return FileSystemBlockStoreConfig(path=Path(parts[1]))
+            elif parts[2].lower() == "nofsync":
+                return FileSystemBlockStoreConfig(path=Path(parts[1]), fsync=False)
+            try:
+                fsync_batch_delay = float(parts[2])
+            except ValueError:
+                raise click.BadParameter(
+                    f"Invalid FS config, fsync batch delay `{parts[2]}` must be a number of seconds"
+                )
+            return FileSystemBlockStoreConfig(
+                path=Path(parts[1]), fsync_batch_delay=fsync_batch_delay
+            )
+
         else:
             raise click.BadParameter(f"Invalid blockstore type `{parts[0]}`")
 
 
+# Erasure coding mode specifies its number of parity shards (e.g. `RAIDEC2`)
+RAIDEC_MODE_PATTERN = re.compile(r"^RAIDEC(?P<parity_shards>[0-9]+)$", re.IGNORECASE)
+
+
+def _is_raid_mode(value: str) -> bool:
+    return value.upper() in ("RAID0", "RAID1", "RAID5") or bool(RAIDEC_MODE_PATTERN.match(value))
+
+
 def _parse_blockstore_params(raw_params: str) -> BaseBlockStoreConfig:
     raid_configs = defaultdict(list)
     for raw_param in raw_params:
         raid_mode: str | None
         raid_node: int | None
         raw_param_parts = raw_param.split(":", 2)
-        if raw_param_parts[0].upper() in ("RAID0", "RAID1", "RAID5") and len(raw_param_parts) == 3:
+        if _is_raid_mode(raw_param_parts[0]) and len(raw_param_parts) == 3:
             raid_mode, raw_raid_node, node_param = raw_param_parts
             try:
                 raid_node = int(raw_raid_node)
@@ -188,16 +220,58 @@ def _parse_blockstore_params(raw_params: str) -> BaseBlockStoreConfig:
             raise click.BadParameter(f"Multiple configuration for node index `{x}` in RAID config")
         blockstores.append(_parse_blockstore_param(x_node_params[0]))
 
+    raidec_match = RAIDEC_MODE_PATTERN.match(raid_mode)
     if raid_mode.upper() == "RAID0":
         return RAID0BlockStoreConfig(blockstores=blockstores)
     elif raid_mode.upper() == "RAID1":
         return RAID1BlockStoreConfig(blockstores=blockstores)
     elif raid_mode.upper() == "RAID5":
         return RAID5BlockStoreConfig(blockstores=blockstores)
+    elif raidec_match:
+        parity_shards = int(raidec_match.group("parity_shards"))
+        if not 0 < parity_shards < len(blockstores):
+            raise click.BadParameter(
+                f"Invalid RAIDEC config, parity shards count must be between 1 and {len(blockstores) - 1}"
+            )
+        return RAIDECBlockStoreConfig(blockstores=blockstores, parity_shards=parity_shards)
     else:
         raise click.BadParameter(f"Invalid multi blockstore mode `{raid_mode}`")
 
 
+def configure_blockstore_connections(
+    config: BaseBlockStoreConfig, max_connections: int | None, s3_timeout: float | None
+) -> BaseBlockStoreConfig:
+    """
+    Apply the connections settings to the S3/SWIFT blockstores (including the
+    ones that are nodes of a RAID cluster), `None` keeping the default value.
+    """
+    if isinstance(
+        config,
+        (
+            RAID0BlockStoreConfig,
+            RAID1BlockStoreConfig,
+            RAID5BlockStoreConfig,
+            RAIDECBlockStoreConfig,
+        ),
+    ):
+        return attr.evolve(
+            config,
+            blockstores=[
+                configure_blockstore_connections(node, max_connections, s3_timeout)
+                for node in config.blockstores
+            ],
+        )
+    elif isinstance(config, S3BlockStoreConfig):
+        if max_connections is not None:
+            config = attr.evolve(config, s3_max_connections=max_connections)
+        if s3_timeout is not None:
+            config = attr.evolve(config, s3_timeout=s3_timeout)
+    elif isinstance(config, SWIFTBlockStoreConfig):
+        if max_connections is not None:
+            config = attr.evolve(config, swift_max_connections=max_connections)
+    return config
+
+
 def blockstore_backend_options(fn: Callable[P, T]) -> Callable[P, T]:
     decorators = [
         click.option(
@@ -216,17 +290,25 @@ Allowed values:
 -`POSTGRESQL`: Use the database specified in the `--db` param
 -`s3:[<endpoint_url>]:<region>:<bucket>:<key>:<secret>`: Use S3 storage
 -`swift:<auth_url>:<tenant>:<container>:<user>:<password>`: Use SWIFT storage
+-`fs:<path>[:<fsync_batch_delay>|nofsync]`: Use local (or NFS) filesystem storage
 
 Note endpoint_url/auth_url are considered as https by default (e.g.
 `s3:foo.com:[...]` -> https://foo.com).
 Escaping must be used to provide a custom scheme (e.g. `s3:http\\://foo.com:[...]`).
 
+Filesystem blocks are synced to the disk before the block creation is
+acknowledged. With a `fsync_batch_delay` (in seconds), the blocks created within
+this delay are synced together, `nofsync` disables syncing altogether (not
+crash-safe).
+
 On top of that, multiple blockstore configurations can be provided to form a
-RAID0/1/5 cluster.
+RAID0/1/5 cluster, or an erasure coded cluster (RAIDEC<m>, with <m> the number of
+Reed-Solomon parity shards, the block being readable as long as no more than <m>
+nodes have failed).
 
 Each configuration must be provided with the form
-`<raid_type>:<node>:<config>` with `<raid_type>` RAID0/RAID1/RAID5, `<node>` a
-integer and `<config>` the MOCKED/POSTGRESQL/S3/SWIFT config.
+`<raid_type>:<node>:<config>` with `<raid_type>` RAID0/RAID1/RAID5/RAIDEC<m>, `<node>` a
+integer and `<config>` the MOCKED/POSTGRESQL/S3/SWIFT/FS config.
 
 \b
 """,
@@ -1,6 +1,7 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
+from pathlib import Path
 from typing import List, Tuple, Union
 
 import attr
@@ -28,6 +29,9 @@ class RAID1BlockStoreConfig(BaseBlockStoreConfig):
 
     blockstores: List[BaseBlockStoreConfig]
     partial_create_ok: bool = False
+    # Query the fastest mirror first and only hedge with another mirror when it
+    # is slow to answer, otherwise all the mirrors are queried at once
+    hedged_reads: bool = True
 
 
 @attr.s(frozen=True, auto_attribs=True)
@@ -38,6 +42,29 @@ class RAID5BlockStoreConfig(BaseBlockStoreConfig):
     partial_create_ok: bool = False
 
 
+@attr.s(frozen=True, auto_attribs=True)
+class RAIDECBlockStoreConfig(BaseBlockStoreConfig):
+    type = "RAIDEC"
+
+    # The last `parity_shards` blockstores store the Reed-Solomon parity shards,
+    # the others store the data shards
+    blockstores: List[BaseBlockStoreConfig]
+    parity_shards: int
+    partial_create_ok: bool = False
+
+
+@attr.s(frozen=True, auto_attribs=True)
+class CachedBlockStoreConfig(BaseBlockStoreConfig):
+    type = "CACHED"
+
+    blockstore: BaseBlockStoreConfig
+    # Maximum size (in bytes) of the blocks kept in memory
+    memory_cache_size: int
+    # Optional second cache tier on the local disk
+    disk_cache_dir: Path | None = None
+    disk_cache_size: int = 0
+
+
 @attr.s(frozen=True, auto_attribs=True)
 class S3BlockStoreConfig(BaseBlockStoreConfig):
     type = "S3"
@@ -47,6 +74,11 @@ class S3BlockStoreConfig(BaseBlockStoreConfig):
     s3_bucket: str
     s3_key: str
     s3_secret: str
+    # Number of concurrent requests (hence of pooled HTTP connections and
+    # worker threads) allowed against the S3 service
+    s3_max_connections: int = 10
+    # Timeout (in seconds) of a single read/create operation
+    s3_timeout: float = 30.0
 
 
 @attr.s(frozen=True, auto_attribs=True)
@@ -58,6 +90,20 @@ class SWIFTBlockStoreConfig(BaseBlockStoreConfig):
     swift_container: str
     swift_user: str
     swift_password: str
+    # Number of concurrent requests (hence of pooled connections and worker
+    # threads) allowed against the Swift service
+    swift_max_connections: int = 10
+
+
+@attr.s(frozen=True, auto_attribs=True)
+class FileSystemBlockStoreConfig(BaseBlockStoreConfig):
+    type = "FS"
+
+    path: Path
+    fsync: bool = True
+    # Blocks created within this delay (in seconds) are synced to the disk
+    # together, if <= 0 each block is synced on its own
+    fsync_batch_delay: float = 0.0
 
 
 @attr.s(frozen=True, auto_attribs=True)
@@ -121,6 +167,19 @@ class BackendConfig:
     organization_spontaneous_bootstrap: bool = False
     organization_initial_active_users_limit: ActiveUsersLimit = ActiveUsersLimit.NO_LIMIT
     organization_initial_user_profile_outsider_allowed: bool = True
+    # Time (in seconds) organization and user/device lookups done by the HTTP RPC
+    # handshake are cached (pass <= 0 to disable the cache)
+    auth_cache_ttl: float = 5.0
+    # Number of last dispatched events (and for how long in seconds) kept to replay
+    # the ones missed by the SSE clients reconnecting with `Last-Event-Id`
+    events_cache_size: int = 1024
+    events_cache_max_age: float = 3600.0  # Set to `math.inf` if disabled
+    # Time (in seconds) events are persisted in the PostgreSQL event log, used to
+    # replay the events missed by SSE clients when not in the cache (<= 0 to disable)
+    event_log_retention: float = 0
+    # I/O budget (in bytes per second) of the background task repairing the blocks
+    # missing from some nodes of a RAID1/RAID5/RAIDEC blockstore (<= 0 to disable)
+    blockstore_raid_scrub_io_budget: int = 0
 
     @property
     def db_type(self) -> str:
@@ -1,8 +1,9 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
+import time
 from collections import deque
-from typing import Awaitable, Callable, Type
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Set, Tuple, Type
 
 import trio
 
@@ -17,15 +18,19 @@ from parsec._parsec import (
     BackendEventRealmMaintenanceStarted,
     BackendEventRealmRolesUpdated,
     BackendEventRealmVlobsUpdated,
+    OrganizationID,
+    UserID,
+    VlobID,
     authenticated_cmds,
 )
 from parsec.api.protocol.types import UserProfile
 from parsec.backend.client_context import AuthenticatedClientContext
 from parsec.backend.realm import BaseRealmComponent
 from parsec.backend.utils import api, api_ws_cancel_on_client_sending_new_cmd
+from parsec.event_bus import EventBus
 
-# TODO: make this configurable ?
-BACKEND_EVENTS_LOCAL_CACHE_SIZE = 1024
+DEFAULT_EVENTS_CACHE_SIZE = 1024
+DEFAULT_EVENTS_CACHE_MAX_AGE = 3600.0
 
 
 def internal_to_api_v2_v3_events(
@@ -155,31 +160,260 @@ def _is_event_for_our_client(
         return client_ctx.profile == UserProfile.ADMIN
 
 
+class _OrganizationSubscribers:
+    __slots__ = ("clients", "by_user", "by_realm", "admins")
+
+    def __init__(self) -> None:
+        self.clients: Set[AuthenticatedClientContext] = set()
+        self.by_user: Dict[UserID, Set[AuthenticatedClientContext]] = {}
+        self.by_realm: Dict[VlobID, Set[AuthenticatedClientContext]] = {}
+        self.admins: Set[AuthenticatedClientContext] = set()
+
+
+def _discard_from_index(
+    index: Dict[Any, Set[AuthenticatedClientContext]],
+    key: Any,
+    client_ctx: AuthenticatedClientContext,
+) -> None:
+    clients = index.get(key)
+    if clients is not None:
+        clients.discard(client_ctx)
+        if not clients:
+            del index[key]
+
+
+class EventsDispatcher:
+    """
+    Route the backend events to the subscribed clients.
+
+    Subscribers are indexed by organization, then by user and realm so that
+    an event only touches the clients that can receive it (instead of having
+    each client filter every single event dispatched on the server).
+    """
+
+    def __init__(self) -> None:
+        self._organizations: Dict[OrganizationID, _OrganizationSubscribers] = {}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "organizations": len(self._organizations),
+            "clients": sum(len(org.clients) for org in self._organizations.values()),
+        }
+
+    def subscribe(self, client_ctx: AuthenticatedClientContext) -> None:
+        org = self._organizations.get(client_ctx.organization_id)
+        if org is None:
+            org = _OrganizationSubscribers()
+            self._organizations[client_ctx.organization_id] = org
+        org.clients.add(client_ctx)
+        org.by_user.setdefault(client_ctx.user_id, set()).add(client_ctx)
+        if client_ctx.profile == UserProfile.ADMIN:
+            org.admins.add(client_ctx)
+        for realm_id in client_ctx.realms:
+            org.by_realm.setdefault(realm_id, set()).add(client_ctx)
+
+    def unsubscribe(self, client_ctx: AuthenticatedClientContext) -> None:
+        org = self._organizations.get(client_ctx.organization_id)
+        if org is None or client_ctx not in org.clients:
+            return
+        org.clients.discard(client_ctx)
+        org.admins.discard(client_ctx)
+        _discard_from_index(org.by_user, client_ctx.user_id, client_ctx)
+        for realm_id in client_ctx.realms:
+            _discard_from_index(org.by_realm, realm_id, client_ctx)
+        if not org.clients:
+            del self._organizations[client_ctx.organization_id]
+
+    def set_client_realms(
+        self, client_ctx: AuthenticatedClientContext, realms: Iterable[VlobID]
+    ) -> None:
+        org = self._organizations.get(client_ctx.organization_id)
+        if org is None or client_ctx not in org.clients:
+            # Client got disconnected in the meantime
+            client_ctx.realms = set(realms)
+            return
+        for realm_id in client_ctx.realms:
+            _discard_from_index(org.by_realm, realm_id, client_ctx)
+        client_ctx.realms = set(realms)
+        for realm_id in client_ctx.realms:
+            org.by_realm.setdefault(realm_id, set()).add(client_ctx)
+
+    def _get_recipients(
+        self, org: _OrganizationSubscribers, event: BackendEvent
+    ) -> Iterable[AuthenticatedClientContext]:
+        # Must be kept consistent with `_is_event_for_our_client`
+        if isinstance(event, BackendEventCertificatesUpdated):
+            return org.clients
+
+        elif isinstance(event, BackendEventRealmRolesUpdated):
+            return org.by_user.get(event.user, ())
+
+        elif isinstance(event, BackendEventPinged):
+            return (c for c in org.clients if c.device_id != event.author)
+
+        elif isinstance(
+            event,
+            (
+                BackendEventRealmVlobsUpdated,
+                BackendEventRealmMaintenanceFinished,
+                BackendEventRealmMaintenanceStarted,
+            ),
+        ):
+            return (c for c in org.by_realm.get(event.realm_id, ()) if c.device_id != event.author)
+
+        elif isinstance(event, BackendEventMessageReceived):
+            return org.by_user.get(event.recipient, ())
+
+        elif isinstance(event, BackendEventInviteStatusChanged):
+            return org.by_user.get(event.greeter, ())
+
+        else:
+            assert isinstance(event, BackendEventPkiEnrollmentUpdated)
+            return org.admins
+
+    def dispatch(self, event_id: str, event: BackendEvent) -> None:
+        org = self._organizations.get(event.organization_id)
+        if org is None:
+            return
+
+        # Recipients are computed first given realm roles update modifies the index
+        recipients = list(self._get_recipients(org, event))
+
+        for client_ctx in recipients:
+            # Keep up to date the list of realms the user should be notified of
+            if isinstance(event, BackendEventRealmRolesUpdated):
+                if event.role is None:
+                    if event.realm_id in client_ctx.realms:
+                        client_ctx.realms.discard(event.realm_id)
+                        _discard_from_index(org.by_realm, event.realm_id, client_ctx)
+                elif event.realm_id not in client_ctx.realms:
+                    client_ctx.realms.add(event.realm_id)
+                    org.by_realm.setdefault(event.realm_id, set()).add(client_ctx)
+
+            try:
+                client_ctx.send_events_channel.send_nowait((event_id, event))
+            except trio.WouldBlock:
+                client_ctx.close_connection_asap()
+
+
+class EventsCache:
+    """
+    Keep the last dispatched events so that we can handle SSE reconnection with
+    the `Last-Event-Id` header.
+
+    Events are bounded in number and in age. They are also stored by organization
+    and indexed by ID, so that a reconnection only walks through the events of its
+    organization dispatched after its last event (instead of the whole cache).
+    """
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_EVENTS_CACHE_SIZE,
+        max_age: float = DEFAULT_EVENTS_CACHE_MAX_AGE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.max_age = max_age  # Set to `math.inf` if disabled
+        self._clock = clock
+        self._next_index = 0
+        # All the events in dispatch order, used to evict the oldest ones
+        self._ring: deque[Tuple[int, float, OrganizationID, str]] = deque()
+        self._by_organization: Dict[OrganizationID, deque[Tuple[int, str, BackendEvent]]] = {}
+        self._indexes: Dict[str, Tuple[OrganizationID, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+    def add(self, event_id: str, event: BackendEvent) -> None:
+        if self.max_size <= 0:
+            return
+        index = self._next_index
+        self._next_index += 1
+        self._ring.append((index, self._clock(), event.organization_id, event_id))
+        self._by_organization.setdefault(event.organization_id, deque()).append(
+            (index, event_id, event)
+        )
+        self._indexes[event_id] = (event.organization_id, index)
+        self._evict()
+
+    def _evict(self) -> None:
+        expired_before = self._clock() - self.max_age
+        while self._ring and (len(self._ring) > self.max_size or self._ring[0][1] < expired_before):
+            _, _, organization_id, event_id = self._ring.popleft()
+            del self._indexes[event_id]
+            # Organization events are in dispatch order too
+            organization_events = self._by_organization[organization_id]
+            organization_events.popleft()
+            if not organization_events:
+                del self._by_organization[organization_id]
+
+    def get_events_since(
+        self, organization_id: OrganizationID, last_event_id: str
+    ) -> List[Tuple[str, BackendEvent]] | None:
+        """
+        Returns: the organization's events dispatched after `last_event_id` (oldest
+        first), or `None` if this event is not in the cache
+        """
+        self._evict()
+        try:
+            last_event_organization_id, last_index = self._indexes[last_event_id]
+        except KeyError:
+            return None
+        if last_event_organization_id != organization_id:
+            return None
+
+        events = []
+        for index, event_id, event in reversed(self._by_organization[organization_id]):
+            if index <= last_index:
+                break
+            events.append((event_id, event))
+        events.reverse()
+        return events
+
+
 class EventsComponent:
     def __init__(
-        self, realm_component: BaseRealmComponent, send_event: Callable[..., Awaitable[None]]
+        self,
+        realm_component: BaseRealmComponent,
+        send_event: Callable[..., Awaitable[None]],
+        event_bus: EventBus,
+        cache_size: int = DEFAULT_EVENTS_CACHE_SIZE,
+        cache_max_age: float = DEFAULT_EVENTS_CACHE_MAX_AGE,
+        event_log: Callable[[OrganizationID, str], Awaitable[List[Tuple[str, BackendEvent]] | None]]
+        | None = None,
     ):
         self._realm_component = realm_component
-        # Keep in cache the last dispatched events so that we can handle SSE reconnection
-        # with the `Last-Event-Id` header
-        self._events_cache: deque[tuple[str, BackendEvent]] = deque(
-            maxlen=BACKEND_EVENTS_LOCAL_CACHE_SIZE
-        )
+        # Persisted events (if enabled), used when the client's last event is not in the cache
+        self._event_log = event_log
+        self._events_cache = EventsCache(max_size=cache_size, max_age=cache_max_age)
         self.send = send_event
+        self.dispatcher = EventsDispatcher()
+
+        def _on_event(event: Type[BackendEvent], event_id: str, payload: BackendEvent) -> None:
+            self.dispatcher.dispatch(event_id, payload)
+
+        # A single callback for all the clients, the dispatcher takes care of the routing
+        for event_type in (
+            BackendEventCertificatesUpdated,
+            BackendEventPinged,
+            BackendEventRealmVlobsUpdated,
+            BackendEventRealmMaintenanceStarted,
+            BackendEventRealmMaintenanceFinished,
+            BackendEventMessageReceived,
+            BackendEventInviteStatusChanged,
+            BackendEventPkiEnrollmentUpdated,
+            BackendEventRealmRolesUpdated,
+        ):
+            event_bus.connect(event_type, _on_event)  # type: ignore
 
     def add_event_to_cache(self, event_id: str, event: BackendEvent) -> None:
-        self._events_cache.append((event_id, event))
+        self._events_cache.add(event_id, event)
 
     def _get_client_missed_events_since(
         self, client_ctx: AuthenticatedClientContext, last_event_id: str
     ) -> deque[tuple[str, BackendEvent] | None]:
-        # We use a VlobID purely for convenience given we need a serializable UUID type
-        events = iter(self._events_cache)
-        for candidate_event_id, _ in events:
-            if candidate_event_id == last_event_id:
-                break
-
-        else:
+        events = self._events_cache.get_events_since(client_ctx.organization_id, last_event_id)
+        if events is None:
             return deque((None,))
 
         return deque(event for event in events if _is_event_for_our_client(client_ctx, event[1]))
@@ -198,73 +432,19 @@ class EventsComponent:
     async def connect_events(
         self, client_ctx: AuthenticatedClientContext, last_event_id: str | None = None
     ) -> deque[tuple[str, BackendEvent] | None]:
-        def _on_event(
-            event: Type[BackendEvent],
-            event_id: str,
-            payload: BackendEvent,
-        ) -> None:
-            if _is_event_for_our_client(client_ctx, payload):
-                # Keep up to date the list of realms the user should be notified of
-                if isinstance(payload, BackendEventRealmRolesUpdated):
-                    if payload.role is None:
-                        client_ctx.realms.discard(payload.realm_id)
-                    else:
-                        client_ctx.realms.add(payload.realm_id)
-
-                try:
-                    client_ctx.send_events_channel.send_nowait((event_id, payload))
-                except trio.WouldBlock:
-                    client_ctx.close_connection_asap()
-
         # Command should be idempotent
         if client_ctx.events_subscribed:
             return deque()
 
-        # Connect the new callbacks
-        client_ctx.event_bus_ctx.connect(
-            BackendEventCertificatesUpdated,
-            _on_event,  # type: ignore
-        )
-        client_ctx.event_bus_ctx.connect(
-            BackendEventPinged,
-            _on_event,  # type: ignore
-        )
-        client_ctx.event_bus_ctx.connect(
-            BackendEventRealmVlobsUpdated,
-            _on_event,  # type: ignore
-        )
-        client_ctx.event_bus_ctx.connect(
-            BackendEventRealmMaintenanceStarted,
-            _on_event,  # type: ignore
-        )
-        client_ctx.event_bus_ctx.connect(
-            BackendEventRealmMaintenanceFinished,
-            _on_event,  # type: ignore
-        )
-        client_ctx.event_bus_ctx.connect(
-            BackendEventMessageReceived,
-            _on_event,  # type: ignore
-        )
-        client_ctx.event_bus_ctx.connect(
-            BackendEventInviteStatusChanged,
-            _on_event,  # type: ignore
-        )
-
-        client_ctx.event_bus_ctx.connect(
-            BackendEventPkiEnrollmentUpdated,
-            _on_event,  # type: ignore
-        )
-
-        # Final event to keep up to date the list of realm we should listen on
-        client_ctx.event_bus_ctx.connect(
-            BackendEventRealmRolesUpdated,
-            _on_event,  # type: ignore
-        )
+        # Register the client in the dispatcher, it will be unregistered as soon
+        # as the connection's event bus context is closed
+        self.dispatcher.subscribe(client_ctx)
+        client_ctx.event_bus_ctx.on_clear(lambda: self.dispatcher.unsubscribe(client_ctx))
 
         # We must do that here to be right after even bus connection, but before any
-        # async operation, otherwise a concurrent event may be handled by the registered
-        # callbacks and also appear in the cache (and in the end we will send to the
-        # client this event twice !)
+        # async operation, otherwise a concurrent event may be handled by the dispatcher
+        # and also appear in the cache (and in the end we will send to the client this
+        # event twice !)
         if last_event_id is not None:
             new_events = self._get_client_missed_events_since(client_ctx, last_event_id)
         else:
@@ -277,9 +457,21 @@ class EventsComponent:
         realms_for_user = await self._realm_component.get_realms_for_user(
             client_ctx.organization_id, client_ctx.user_id
         )
-        client_ctx.realms = set(realms_for_user.keys())
+        self.dispatcher.set_client_realms(client_ctx, realms_for_user.keys())
         client_ctx.events_subscribed = True
 
+        if last_event_id is not None and new_events == deque((None,)) and self._event_log:
+            # Last event is too old for the cache (or has been dispatched before
+            # a restart, or by another server), so fallback on the event log.
+            # Note events dispatched meanwhile may also be replayed from the log.
+            logged_events = await self._event_log(client_ctx.organization_id, last_event_id)
+            if logged_events is not None:
+                new_events = deque(
+                    event
+                    for event in logged_events
+                    if _is_event_for_our_client(client_ctx, event[1])
+                )
+
         return new_events
 
     @api_ws_cancel_on_client_sending_new_cmd
@@ -321,6 +513,9 @@ class EventsComponent:
         missed_events = await self.connect_events(client_ctx, last_event_id)
         if missed_events is None:
             missed_events = deque((None,))
+        # Events replayed from the event log may also have been dispatched while
+        # retrieving them, so they must not be sent twice
+        replayed_event_ids = {event[0] for event in missed_events if event is not None}
 
         async def _next_event_cb() -> tuple[
             str, authenticated_cmds.latest.events_listen.Rep
@@ -347,6 +542,9 @@ class EventsComponent:
                 # Then switch back to the current events
 
                 (event_id, event) = await client_ctx.receive_events_channel.receive()
+                if replayed_event_ids and event_id in replayed_event_ids:
+                    replayed_event_ids.discard(event_id)
+                    continue
 
                 unit = internal_to_api_events(event)
                 if not unit:
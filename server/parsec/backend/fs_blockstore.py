@@ -0,0 +1,173 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import os
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable, List, Set, Tuple, TypeVar
+from uuid import uuid4
+
+import attr
+import trio
+from structlog import get_logger
+
+from parsec._parsec import BlockID, OrganizationID
+from parsec.backend.block import BlockStoreError
+from parsec.backend.blockstore import BaseBlockStoreComponent
+
+logger = get_logger()
+
+T = TypeVar("T")
+
+# Blocking filesystem operations are done in worker threads, this limits how
+# many of them can run concurrently (on top of trio's default thread limiter)
+FS_BLOCKSTORE_MAX_THREADS = 16
+
+
+def build_fs_block_path(root: Path, organization_id: OrganizationID, block_id: BlockID) -> Path:
+    # Blocks are spread over 2 levels of 256 sub-directories, so that directories
+    # stay small even with millions of blocks. The sharding uses a hash given the
+    # block ID is chosen by the client, hence cannot be trusted to be random.
+    digest = sha256(f"{organization_id.str}/{block_id.hex}".encode()).hexdigest()
+    return root / organization_id.str / digest[:2] / digest[2:4] / block_id.hex
+
+
+def _fsync_dir(path: Path) -> None:
+    # Required for a rename to be durable, but not supported on Windows
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_tmp_block(block_path: Path, block: bytes, fsync: bool) -> Path:
+    block_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = block_path.with_name(f"{block_path.name}.{uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, "wb") as fd:
+            fd.write(block)
+            if fsync:
+                fd.flush()
+                os.fsync(fd.fileno())
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return tmp_path
+
+
+def _write_block(block_path: Path, block: bytes, fsync: bool) -> None:
+    # Write then rename so a block file is never partially written
+    tmp_path = _write_tmp_block(block_path, block, fsync)
+    os.replace(tmp_path, block_path)
+    if fsync:
+        _fsync_dir(block_path.parent)
+
+
+def _commit_blocks(blocks: List[Tuple[Path, Path]]) -> None:
+    directories: Set[Path] = set()
+    try:
+        for tmp_path, block_path in blocks:
+            fd = os.open(tmp_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, block_path)
+            directories.add(block_path.parent)
+    except OSError:
+        for tmp_path, _ in blocks:
+            tmp_path.unlink(missing_ok=True)
+        raise
+    # Blocks sharing a directory only need a single directory sync
+    for directory in directories:
+        _fsync_dir(directory)
+
+
+@attr.s(slots=True, auto_attribs=True)
+class _FsyncBatch:
+    blocks: List[Tuple[Path, Path]] = attr.ib(factory=list)
+    done: trio.Event = attr.ib(factory=trio.Event)
+    # Set if the batch commit failed
+    error: OSError | None = None
+
+
+class FileSystemBlockStoreComponent(BaseBlockStoreComponent):
+    """
+    Blocks are stored as `<path>/<organization_id>/<xx>/<yy>/<block_id>`
+    (see `build_fs_block_path`), the path can be a local or a NFS volume.
+
+    With `fsync_batch_delay > 0`, the blocks created within this delay are
+    synced to the disk together (group commit): each create still returns once
+    its block is durable, but the syncs are done by a single worker thread and
+    the blocks sharing a directory only sync it once.
+    """
+
+    def __init__(self, path: Path, fsync: bool = True, fsync_batch_delay: float = 0.0):
+        self.path = path
+        self._fsync = fsync
+        self._fsync_batch_delay = fsync_batch_delay
+        self._fsync_batch: _FsyncBatch | None = None
+        self._limiter = trio.CapacityLimiter(FS_BLOCKSTORE_MAX_THREADS)
+        self._logger = logger.bind(blockstore_type="FS", path=str(path))
+        path.mkdir(parents=True, exist_ok=True)
+
+    async def _run_in_thread(self, fn: Callable[..., T], *args: object) -> T:
+        return await trio.to_thread.run_sync(fn, *args, limiter=self._limiter)
+
+    async def read(self, organization_id: OrganizationID, block_id: BlockID) -> bytes:
+        block_path = build_fs_block_path(self.path, organization_id, block_id)
+        try:
+            return await self._run_in_thread(block_path.read_bytes)
+        except OSError as exc:
+            self._logger.warning(
+                "Block read error",
+                organization_id=organization_id.str,
+                block_id=block_id.hex,
+                exc_info=exc,
+            )
+            raise BlockStoreError(exc) from exc
+
+    async def _commit_in_batch(self, tmp_path: Path, block_path: Path) -> None:
+        batch = self._fsync_batch
+        if batch is not None:
+            batch.blocks.append((tmp_path, block_path))
+            await batch.done.wait()
+            if batch.error:
+                raise OSError(*batch.error.args) from batch.error
+            return
+
+        # No pending batch, we are in charge of the new one. This must not be
+        # cancelled, otherwise the other blocks of the batch are never committed.
+        batch = self._fsync_batch = _FsyncBatch(blocks=[(tmp_path, block_path)])
+        with trio.CancelScope(shield=True):
+            await trio.sleep(self._fsync_batch_delay)
+            self._fsync_batch = None
+            try:
+                await self._run_in_thread(_commit_blocks, batch.blocks)
+            except OSError as exc:
+                batch.error = exc
+                raise
+            finally:
+                batch.done.set()
+
+    async def create(
+        self, organization_id: OrganizationID, block_id: BlockID, block: bytes
+    ) -> None:
+        block_path = build_fs_block_path(self.path, organization_id, block_id)
+        try:
+            if self._fsync and self._fsync_batch_delay > 0:
+                tmp_path = await self._run_in_thread(_write_tmp_block, block_path, block, False)
+                await self._commit_in_batch(tmp_path, block_path)
+            else:
+                await self._run_in_thread(_write_block, block_path, block, self._fsync)
+        except OSError as exc:
+            self._logger.warning(
+                "Block create error",
+                organization_id=organization_id.str,
+                block_id=block_id.hex,
+                exc_info=exc,
+            )
+            raise BlockStoreError(exc) from exc
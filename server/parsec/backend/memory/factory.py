@@ -8,6 +8,7 @@ from uuid import uuid4
 
 import trio
 
+from parsec.backend.auth_cache import AuthenticationCache
 from parsec.backend.blockstore import blockstore_factory
 from parsec.backend.config import BackendConfig
 from parsec.backend.events import BackendEvent, EventsComponent
@@ -50,10 +51,19 @@ async def components_factory(  # type: ignore[misc]
     sequester = MemorySequesterComponent()
     block = MemoryBlockComponent()
     blockstore = blockstore_factory(config.blockstore_config)
-    events = EventsComponent(realm, send_event=_send_event)
+    events = EventsComponent(
+        realm,
+        send_event=_send_event,
+        event_bus=event_bus,
+        cache_size=config.events_cache_size,
+        cache_max_age=config.events_cache_max_age,
+    )
+
+    auth_cache = AuthenticationCache(event_bus, ttl=config.auth_cache_ttl)
 
     components = {
         "events": events,
+        "auth_cache": auth_cache,
         "webhooks": webhooks,
         "organization": organization,
         "user": user,
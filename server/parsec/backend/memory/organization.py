@@ -3,7 +3,7 @@ from __future__ import annotations
 
 from collections import defaultdict
 from copy import deepcopy
-from typing import TYPE_CHECKING, Any, Callable, Coroutine, Union
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Coroutine, Tuple, Union
 
 import trio
 
@@ -31,6 +31,7 @@ from parsec.backend.user import Device, User, UserError
 from parsec.backend.utils import Unset, UnsetType
 
 if TYPE_CHECKING:
+    from parsec.backend.auth_cache import AuthenticationCache
     from parsec.backend.memory.block import MemoryBlockComponent
     from parsec.backend.memory.realm import MemoryRealmComponent
     from parsec.backend.memory.user import MemoryUserComponent
@@ -56,12 +57,14 @@ class MemoryOrganizationComponent(BaseOrganizationComponent):
         vlob: MemoryVlobComponent,
         block: MemoryBlockComponent,
         realm: MemoryRealmComponent,
+        auth_cache: AuthenticationCache,
         **other_components: Any,
     ) -> None:
         self._user_component = user
         self._vlob_component = vlob
         self._block_component = block
         self._realm_component = realm
+        self._auth_cache = auth_cache
 
     async def create(
         self,
@@ -202,17 +205,16 @@ class MemoryOrganizationComponent(BaseOrganizationComponent):
 
     async def server_stats(
         self, at: DateTime | None = None
-    ) -> dict[OrganizationID, OrganizationStats]:
+    ) -> AsyncIterator[Tuple[OrganizationID, OrganizationStats]]:
         at = at or DateTime.now()
-        result = {}
-        for org_id in self._organizations.keys():
+        # Organizations can be created while the caller consumes the stats
+        for org_id in sorted(self._organizations.keys(), key=lambda org_id: org_id.str):
             try:
-                result[org_id] = await self.stats(org_id, at)
+                org_stats = await self.stats(org_id, at)
             except OrganizationNotFoundError:
                 # Organization didn't not exist at the considered time, just ignore it
-                pass
-
-        return result
+                continue
+            yield org_id, org_stats
 
     async def update(
         self,
@@ -241,6 +243,7 @@ class MemoryOrganizationComponent(BaseOrganizationComponent):
 
         assert isinstance(organization.active_users_limit, ActiveUsersLimit)
         self._organizations[id] = organization
+        self._auth_cache.invalidate_organization(id)
 
         if self._organizations[id].is_expired:
             await self._send_event(BackendEventOrganizationExpired(organization_id=id))
@@ -33,6 +33,7 @@ from parsec.backend.user import (
 from parsec.backend.user_type import User, UserUpdate
 
 if TYPE_CHECKING:
+    from parsec.backend.auth_cache import AuthenticationCache
     from parsec.backend.memory.organization import MemoryOrganizationComponent
     from parsec.backend.memory.realm import MemoryRealmComponent
     from parsec.backend.memory.sequester import MemorySequesterComponent
@@ -60,11 +61,13 @@ class MemoryUserComponent(BaseUserComponent):
         organization: MemoryOrganizationComponent,
         realm: MemoryRealmComponent,
         sequester: MemorySequesterComponent,
+        auth_cache: AuthenticationCache,
         **other_components: Any,
     ) -> None:
         self._organization_component = organization
         self._realm_component = realm
         self._sequester_component = sequester
+        self._auth_cache = auth_cache
 
     def get_current_certificate_index(self, organization_id: OrganizationID) -> int:
         org = self._organizations[organization_id]
@@ -376,6 +379,7 @@ class MemoryUserComponent(BaseUserComponent):
         )
         if user.human_handle:
             del org.human_handle_to_user_id[user.human_handle]
+        self._auth_cache.invalidate_user(organization_id, user_id)
 
         await self.notify_certificates_update(
             organization_id=organization_id,
@@ -444,6 +448,7 @@ class MemoryUserComponent(BaseUserComponent):
         )
         if user.human_handle:
             del org.human_handle_to_user_id[user.human_handle]
+        self._auth_cache.invalidate_user(organization_id, user_id)
 
         await self.notify_certificates_update(
             organization_id=organization_id,
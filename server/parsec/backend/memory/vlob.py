@@ -1,10 +1,11 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from copy import deepcopy
 from dataclasses import dataclass
 from dataclasses import field as dataclass_field
+from itertools import islice
 from typing import TYPE_CHECKING, AbstractSet, Any, Callable, Coroutine, Dict, List, Tuple
 
 from parsec._parsec import (
@@ -63,7 +64,10 @@ class Reencryption:
     def __init__(self, realm_id: VlobID, vlobs: Dict[VlobID, Vlob]):
         self.realm_id = realm_id
         self._original_vlobs = vlobs
-        self._todo: Dict[Tuple[VlobID, int], bytes] = {}
+        # Unlike `dict` (which keeps the removed entries' slots until it gets resized),
+        # iterating over an `OrderedDict` doesn't go through the items already
+        # saved, so getting a batch only costs its size
+        self._todo: OrderedDict[Tuple[VlobID, int], bytes] = OrderedDict()
         self._done: Dict[Tuple[VlobID, int], bytes] = {}
         for vlob_id, vlob in vlobs.items():
             for index, (data, _, _, _) in enumerate(vlob.data):
@@ -98,12 +102,11 @@ class Reencryption:
         return not self._todo
 
     def get_batch(self, size: int) -> List[Tuple[VlobID, int, bytes]]:
-        batch = []
-        for (vlob_id, version), data in self._todo.items():
-            if (vlob_id, version) in self._done:
-                continue
-            batch.append((vlob_id, version, data))
-        return batch[:size]
+        # Saved items are removed from `_todo`, so the batch resumes after them
+        return [
+            (vlob_id, version, data)
+            for (vlob_id, version), data in islice(self._todo.items(), size)
+        ]
 
     def save_batch(self, batch: List[Tuple[VlobID, int, bytes]]) -> Tuple[int, int]:
         for vlob_id, version, data in batch:
@@ -465,6 +468,24 @@ class MemoryVlobComponent(BaseVlobComponent):
 
         await self._update_changes(organization_id, author, realm_id, vlob_id, timestamp)
 
+    def _get_vlob_version(
+        self, vlob: Vlob, version: int | None, timestamp: DateTime | None
+    ) -> Tuple[int, bytes, DeviceID, DateTime, int]:
+        if version is None:
+            if timestamp is None:
+                version = vlob.current_version
+            else:
+                for i in range(vlob.current_version, 0, -1):
+                    if vlob.data[i - 1][2] <= timestamp:
+                        version = i
+                        break
+                else:
+                    raise VlobVersionError()
+        if not 1 <= version <= vlob.current_version:
+            raise VlobVersionError()
+        vlob_data, vlob_device_id, vlob_timestamp, certificate_index = vlob.data[version - 1]
+        return version, vlob_data, vlob_device_id, vlob_timestamp, certificate_index
+
     async def read(
         self,
         organization_id: OrganizationID,
@@ -480,32 +501,54 @@ class MemoryVlobComponent(BaseVlobComponent):
             organization_id, vlob.realm_id, author.user_id, encryption_revision, timestamp
         )
 
-        if version is None:
-            if timestamp is None:
-                version = vlob.current_version
-            else:
-                for i in range(vlob.current_version, 0, -1):
-                    if vlob.data[i - 1][2] <= timestamp:
-                        version = i
-                        break
-                else:
-                    raise VlobVersionError()
-        try:
-            vlob_data, vlob_device_id, vlob_timestamp, certificate_index = vlob.data[version - 1]
-            last_role = realm.get_last_role(vlob_device_id.user_id)
-            # Given the vlob exists, the author must have had a role
-            assert last_role is not None
-            return (
-                version,
-                vlob_data,
-                vlob_device_id,
-                vlob_timestamp,
-                last_role.granted_on,
-                certificate_index,
+        (
+            version,
+            vlob_data,
+            vlob_device_id,
+            vlob_timestamp,
+            certificate_index,
+        ) = self._get_vlob_version(vlob, version, timestamp)
+        last_role = realm.get_last_role(vlob_device_id.user_id)
+        # Given the vlob exists, the author must have had a role
+        assert last_role is not None
+        return (
+            version,
+            vlob_data,
+            vlob_device_id,
+            vlob_timestamp,
+            last_role.granted_on,
+            certificate_index,
+        )
+
+    async def read_batch(
+        self,
+        organization_id: OrganizationID,
+        author: DeviceID,
+        encryption_revision: int,
+        items: List[Tuple[VlobID, int | None, DateTime | None]],
+    ) -> Tuple[List[Tuple[VlobID, int, bytes, DeviceID, DateTime, int]], List[VlobID]]:
+        vlobs = {
+            vlob_id: vlob
+            for vlob_id, _, _ in items
+            if (vlob := self._vlobs.get((organization_id, vlob_id))) is not None
+        }
+
+        # Check each realm only once
+        for realm_id in {vlob.realm_id for vlob in vlobs.values()}:
+            self._check_realm_read_access(
+                organization_id, realm_id, author.user_id, encryption_revision, None
             )
 
-        except IndexError:
-            raise VlobVersionError()
+        found = []
+        not_found = []
+        for vlob_id, version, timestamp in items:
+            try:
+                vlob = vlobs[vlob_id]
+                found.append((vlob_id, *self._get_vlob_version(vlob, version, timestamp)))
+            except (KeyError, VlobVersionError):
+                not_found.append(vlob_id)
+
+        return found, not_found
 
     async def update(
         self,
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from secrets import token_hex
-from typing import Any, Union
+from typing import Any, AsyncIterator, Tuple, Union
 
 import attr
 
@@ -366,10 +366,13 @@ class BaseOrganizationComponent:
         """
         raise NotImplementedError()
 
-    async def server_stats(
+    def server_stats(
         self, at: DateTime | None = None
-    ) -> dict[OrganizationID, OrganizationStats]:
+    ) -> AsyncIterator[Tuple[OrganizationID, OrganizationStats]]:
         """
+        Async generator over the organizations (ordered by ID) and their stats,
+        so the caller doesn't have to keep the stats of the whole server in memory.
+
         Raises: Nothing !
         """
         raise NotImplementedError()
@@ -1,6 +1,8 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
+from typing import Any, List
+
 import triopg
 from triopg.exceptions import UniqueViolationError
 
@@ -21,6 +23,7 @@ from parsec.backend.postgresql.utils import (
     Q,
     q_block,
     q_device_internal_id,
+    q_increment_organization_stats,
     q_organization_internal_id,
     q_realm,
     q_realm_internal_id,
@@ -98,6 +101,33 @@ VALUES (
 )
 
 
+_q_get_blocks_batch = Q(
+    """
+SELECT
+    block._id,
+    organization.organization_id,
+    block.block_id,
+    block.size
+FROM block
+INNER JOIN organization ON organization._id = block.organization
+WHERE
+    block._id > $last_id
+ORDER BY block._id
+LIMIT $batch_size
+"""
+)
+
+
+async def get_blocks_batch(
+    conn: triopg._triopg.TrioConnectionProxy, last_id: int, batch_size: int
+) -> List[Any]:
+    """
+    Blocks of all the organizations following the `last_id` one (in `_id` order),
+    as rows with the `_id`, `organization_id`, `block_id` and `size` fields.
+    """
+    return await conn.fetch(*_q_get_blocks_batch(last_id=last_id, batch_size=batch_size))
+
+
 async def _check_realm(
     conn: triopg._triopg.TrioConnectionProxy,
     organization_id: OrganizationID,
@@ -119,6 +149,31 @@ async def _check_realm(
         raise BlockInMaintenanceError("Data realm is currently under maintenance")
 
 
+async def _check_block_create(
+    conn: triopg._triopg.TrioConnectionProxy,
+    organization_id: OrganizationID,
+    author: DeviceID,
+    block_id: BlockID,
+    realm_id: VlobID,
+) -> None:
+    await _check_realm(conn, organization_id, realm_id, OperationKind.DATA_WRITE)
+
+    ret = await conn.fetchrow(
+        *_q_get_block_write_right_and_unicity(
+            organization_id=organization_id.str,
+            user_id=author.user_id.str,
+            realm_id=realm_id,
+            block_id=block_id,
+        )
+    )
+
+    if not ret["has_access"]:
+        raise BlockAccessError()
+
+    elif ret["exists"]:
+        raise BlockAlreadyExistsError()
+
+
 class PGBlockComponent(BaseBlockComponent):
     def __init__(self, dbh: PGHandler, blockstore_component: BaseBlockStoreComponent):
         self.dbh = dbh
@@ -164,41 +219,35 @@ class PGBlockComponent(BaseBlockComponent):
         created_on: DateTime | None = None,
     ) -> None:
         created_on = created_on or DateTime.now()
-        async with self.dbh.pool.acquire() as conn, conn.transaction():
-            await _check_realm(conn, organization_id, realm_id, OperationKind.DATA_WRITE)
 
-            # 1) Check access rights and block unicity
-            # Note it's important to check unicity here because blockstore create
-            # overwrite existing data !
-            ret = await conn.fetchrow(
-                *_q_get_block_write_right_and_unicity(
-                    organization_id=organization_id.str,
-                    user_id=author.user_id.str,
-                    realm_id=realm_id,
-                    block_id=block_id,
-                )
-            )
+        # Uploading to the blockstore can take a long time, so the operation is
+        # split in two transactions to avoid holding a connection from the pool
+        # meanwhile (otherwise a burst of uploads would starve the other commands)
 
-            if not ret["has_access"]:
-                raise BlockAccessError()
+        # 1) Check access rights and block unicity
+        # Note it's important to check unicity here because blockstore create
+        # overwrite existing data !
+        async with self.dbh.pool.acquire() as conn, conn.transaction():
+            await _check_block_create(conn, organization_id, author, block_id, realm_id)
+
+        # 2) Upload block data in blockstore under an arbitrary id
+        # Given block metadata and block data are stored on different storages,
+        # being atomic is not easy here :(
+        # For instance step 2) can be successful (or can be successful on *some*
+        # blockstores in case of a RAID blockstores configuration) but step 3) fails.
+        # This is solved by the fact blockstores are considered idempotent and two
+        # create operations with the same orgID/ID couple are expected to have the
+        # same block data.
+        # Hence any blockstore create failure result in the operation cancellation,
+        # and blockstore create success can be overwritten by another create in case
+        # the postgres transaction failed in step 3)
+        await self._blockstore_component.create(organization_id, block_id, block)
+
+        # 3) Insert the block metadata into the database
+        async with self.dbh.pool.acquire() as conn, conn.transaction():
+            # Realm maintenance or access rights may have changed during the upload
+            await _check_block_create(conn, organization_id, author, block_id, realm_id)
 
-            elif ret["exists"]:
-                raise BlockAlreadyExistsError()
-
-            # 2) Upload block data in blockstore under an arbitrary id
-            # Given block metadata and block data are stored on different storages,
-            # being atomic is not easy here :(
-            # For instance step 2) can be successful (or can be successful on *some*
-            # blockstores in case of a RAID blockstores configuration) but step 4) fails.
-            # This is solved by the fact blockstores are considered idempotent and two
-            # create operations with the same orgID/ID couple are expected to have the
-            # same block data.
-            # Hence any blockstore create failure result in postgres transaction
-            # cancellation, and blockstore create success can be overwritten by another
-            # create in case the postgres transaction was cancelled in step 3)
-            await self._blockstore_component.create(organization_id, block_id, block)
-
-            # 3) Insert the block metadata into the database
             try:
                 ret = await conn.execute(
                     *_q_insert_block(
@@ -218,6 +267,10 @@ class PGBlockComponent(BaseBlockComponent):
             if ret != "INSERT 0 1":
                 raise BlockError(f"Insertion error: {ret}")
 
+            await q_increment_organization_stats(
+                conn, organization_id, created_on, data_size=len(block)
+            )
+
 
 _q_get_block_data = Q(
     """
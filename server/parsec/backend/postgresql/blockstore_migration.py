@@ -0,0 +1,206 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Set, Tuple
+
+import trio
+
+from parsec._parsec import BlockID, OrganizationID
+from parsec.backend.block import BlockStoreError
+from parsec.backend.blockstore import BaseBlockStoreComponent
+from parsec.backend.postgresql.block import get_blocks_batch
+from parsec.backend.postgresql.handler import PGHandler
+from parsec.backend.postgresql.utils import Q
+
+# Blocks completed after a block that is still in progress cannot be checkpointed
+# yet, this limits how many of them are kept track of (i.e. how far the migration
+# can go ahead of a block that is stuck retrying)
+MAX_IN_PROGRESS_BLOCKS = 100_000
+
+# Called with the block's `_id`, organization, block ID and the reason of the failure
+BlockMigrationErrorCallback = Callable[[int, OrganizationID, BlockID, str], None]
+
+# Block's `_id`, organization, block ID and size
+_BlockRow = Tuple[int, OrganizationID, BlockID, int]
+
+
+_q_get_blocks_by_ids = Q(
+    """
+SELECT
+    block._id,
+    organization.organization_id,
+    block.block_id,
+    block.size
+FROM block
+INNER JOIN organization ON organization._id = block.organization
+WHERE
+    block._id = ANY($ids::INTEGER[])
+ORDER BY block._id
+"""
+)
+
+
+_q_get_last_block_id = Q(
+    """
+SELECT COALESCE(MAX(_id), 0) FROM block
+"""
+)
+
+
+def _block_row(row: Any) -> _BlockRow:
+    return (
+        row["_id"],
+        OrganizationID(row["organization_id"]),
+        BlockID.from_hex(row["block_id"]),
+        row["size"],
+    )
+
+
+class BlockStoreMigration:
+    """
+    Copy the blocks referenced by the `block` table from a blockstore to another.
+
+    Blocks are processed in `_id` order, fetched by batches (so the migration
+    doesn't depend on the number of blocks) and copied by `concurrency` workers.
+    `last_id` is the checkpoint of the migration: all the blocks up to it have
+    been processed, hence a migration can be resumed by providing the `last_id`
+    of the previous one.
+
+    The size of each block read from the source is checked against the one in
+    the `block` table. Blocks that cannot be copied (size mismatch, or still
+    failing after `retries` attempts) are reported with `on_block_error`, kept
+    in `unmigrated_blocks` and skipped. Those blocks are retried first when
+    provided to the next migration along with `last_id`.
+    """
+
+    def __init__(
+        self,
+        dbh: PGHandler,
+        source: BaseBlockStoreComponent,
+        destination: BaseBlockStoreComponent,
+        last_id: int = 0,
+        concurrency: int = 16,
+        batch_size: int = 1000,
+        retries: int = 3,
+        retry_delay: float = 1.0,
+        on_block_error: BlockMigrationErrorCallback | None = None,
+        unmigrated_blocks: Dict[int, Tuple[OrganizationID, BlockID]] | None = None,
+    ):
+        self.dbh = dbh
+        self.source = source
+        self.destination = destination
+        self.last_id = last_id
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.on_block_error = on_block_error
+        self.copied_blocks = 0
+        self.copied_bytes = 0
+        self.failed_blocks = 0
+        # Blocks (by `_id`) that failed to be copied, up to `last_id`
+        self.unmigrated_blocks = dict(unmigrated_blocks or {})
+        # Blocks from a previous migration being retried, not part of the checkpoint
+        self._retried: Set[int] = set()
+        # Blocks being processed in `_id` order, and those among them that are done.
+        # Blocks are completed out of order, so the checkpoint only moves forward
+        # once all the blocks before it are done.
+        self._in_progress: Deque[int] = deque()
+        self._done: Set[int] = set()
+        self._checkpoint_moved = trio.Event()
+
+    async def get_last_block_id(self) -> int:
+        async with self.dbh.pool.acquire() as conn:
+            return await conn.fetchval(*_q_get_last_block_id())
+
+    def _block_done(self, row_id: int) -> None:
+        self._done.add(row_id)
+        while self._in_progress and self._in_progress[0] in self._done:
+            self.last_id = self._in_progress.popleft()
+            self._done.discard(self.last_id)
+            self._checkpoint_moved.set()
+
+    def _block_failed(
+        self, row_id: int, organization_id: OrganizationID, block_id: BlockID, reason: str
+    ) -> None:
+        self.failed_blocks += 1
+        self.unmigrated_blocks[row_id] = (organization_id, block_id)
+        if self.on_block_error:
+            self.on_block_error(row_id, organization_id, block_id, reason)
+
+    async def _migrate_block(
+        self, row_id: int, organization_id: OrganizationID, block_id: BlockID, size: int
+    ) -> None:
+        attempt = 0
+        while True:
+            try:
+                block = await self.source.read(organization_id, block_id)
+                if len(block) != size:
+                    # Retrying won't help, the data is not the one we expect
+                    self._block_failed(
+                        row_id,
+                        organization_id,
+                        block_id,
+                        f"size mismatch: expected {size} bytes, got {len(block)}",
+                    )
+                    return
+                await self.destination.create(organization_id, block_id, block)
+                break
+
+            except BlockStoreError as exc:
+                attempt += 1
+                if attempt > self.retries:
+                    self._block_failed(row_id, organization_id, block_id, str(exc))
+                    return
+                await trio.sleep(self.retry_delay)
+
+        self.copied_blocks += 1
+        self.copied_bytes += size
+        self.unmigrated_blocks.pop(row_id, None)
+
+    async def _worker(self, receive_channel: trio.MemoryReceiveChannel[_BlockRow]) -> None:
+        async with receive_channel:
+            async for row_id, organization_id, block_id, size in receive_channel:
+                await self._migrate_block(row_id, organization_id, block_id, size)
+                if row_id in self._retried:
+                    self._retried.discard(row_id)
+                else:
+                    self._block_done(row_id)
+
+    async def run(self) -> None:
+        # No buffer: the producer only fetches the next batch once the workers
+        # have picked the blocks of the current one
+        send_channel, receive_channel = trio.open_memory_channel[_BlockRow](0)
+        async with trio.open_nursery() as nursery:
+            for _ in range(self.concurrency):
+                nursery.start_soon(self._worker, receive_channel.clone())
+            receive_channel.close()
+
+            async with send_channel:
+                if self.unmigrated_blocks:
+                    async with self.dbh.pool.acquire() as conn:
+                        rows = await conn.fetch(
+                            *_q_get_blocks_by_ids(ids=list(self.unmigrated_blocks))
+                        )
+                    # Blocks no longer in the database don't have to be migrated
+                    found = {row["_id"] for row in rows}
+                    for row_id in self.unmigrated_blocks.keys() - found:
+                        del self.unmigrated_blocks[row_id]
+                    for row in rows:
+                        self._retried.add(row["_id"])
+                        await send_channel.send(_block_row(row))
+
+                fetch_from = self.last_id
+                while True:
+                    async with self.dbh.pool.acquire() as conn:
+                        rows = await get_blocks_batch(conn, fetch_from, self.batch_size)
+                    for row in rows:
+                        while len(self._in_progress) >= MAX_IN_PROGRESS_BLOCKS:
+                            self._checkpoint_moved = trio.Event()
+                            await self._checkpoint_moved.wait()
+                        self._in_progress.append(row["_id"])
+                        await send_channel.send(_block_row(row))
+                    if len(rows) < self.batch_size:
+                        break
+                    fetch_from = rows[-1]["_id"]
@@ -7,31 +7,39 @@ from typing import Any, AsyncGenerator
 
 import triopg
 
-from parsec._parsec import BackendEvent
+from parsec._parsec import BackendEvent, OrganizationID
+from parsec.backend.auth_cache import AuthenticationCache
 from parsec.backend.blockstore import blockstore_factory
 from parsec.backend.config import BackendConfig
 from parsec.backend.events import EventsComponent
 from parsec.backend.postgresql.block import PGBlockComponent
-from parsec.backend.postgresql.handler import PGHandler, send_signal
+from parsec.backend.postgresql.handler import PGHandler, get_logged_events, send_signal
 from parsec.backend.postgresql.invite import PGInviteComponent
 from parsec.backend.postgresql.message import PGMessageComponent
 from parsec.backend.postgresql.organization import PGOrganizationComponent
 from parsec.backend.postgresql.ping import PGPingComponent
 from parsec.backend.postgresql.pki import PGPkiEnrollmentComponent
+from parsec.backend.postgresql.raid_scrubber import PGRAIDScrubber, get_raid_blockstore
 from parsec.backend.postgresql.realm import PGRealmComponent
 from parsec.backend.postgresql.sequester import PGPSequesterComponent
 from parsec.backend.postgresql.user import PGUserComponent
 from parsec.backend.postgresql.vlob import PGVlobComponent
 from parsec.backend.webhooks import WebhooksComponent
 from parsec.event_bus import EventBus
-from parsec.utils import open_service_nursery
+from parsec.utils import open_service_nursery, start_task
 
 
 @asynccontextmanager
 async def components_factory(  # type: ignore[misc]
     config: BackendConfig, event_bus: EventBus
 ) -> AsyncGenerator[dict[str, Any], None]:
-    dbh = PGHandler(config.db_url, config.db_min_connections, config.db_max_connections, event_bus)
+    dbh = PGHandler(
+        config.db_url,
+        config.db_min_connections,
+        config.db_max_connections,
+        event_bus,
+        event_log_retention=config.event_log_retention,
+    )
 
     async def _send_event(
         event: BackendEvent,
@@ -43,6 +51,12 @@ async def components_factory(  # type: ignore[misc]
         else:
             await send_signal(conn, event)
 
+    async def _replay_events(
+        organization_id: OrganizationID, last_event_id: str
+    ) -> list[tuple[str, BackendEvent]] | None:
+        async with dbh.pool.acquire() as conn:
+            return await get_logged_events(conn, organization_id, last_event_id)
+
     webhooks = WebhooksComponent(config)
     organization = PGOrganizationComponent(dbh=dbh, webhooks=webhooks, config=config)
     user = PGUserComponent(dbh=dbh, event_bus=event_bus)
@@ -55,10 +69,29 @@ async def components_factory(  # type: ignore[misc]
     block = PGBlockComponent(dbh=dbh, blockstore_component=blockstore)
     pki = PGPkiEnrollmentComponent(dbh)
     sequester = PGPSequesterComponent(dbh)
-    events = EventsComponent(realm_component=realm, send_event=_send_event)
+    events = EventsComponent(
+        realm_component=realm,
+        send_event=_send_event,
+        event_bus=event_bus,
+        cache_size=config.events_cache_size,
+        cache_max_age=config.events_cache_max_age,
+        event_log=_replay_events if config.event_log_retention > 0 else None,
+    )
+
+    auth_cache = AuthenticationCache(event_bus, ttl=config.auth_cache_ttl)
+
+    raid_scrubber = None
+    if config.blockstore_raid_scrub_io_budget > 0:
+        raid_blockstore = get_raid_blockstore(blockstore)
+        if raid_blockstore is None:
+            raise ValueError("RAID scrubbing requires a RAID1, RAID5 or RAIDEC block store")
+        raid_scrubber = PGRAIDScrubber(
+            dbh, raid_blockstore, io_budget=config.blockstore_raid_scrub_io_budget
+        )
 
     components = {
         "events": events,
+        "auth_cache": auth_cache,
         "webhooks": webhooks,
         "organization": organization,
         "user": user,
@@ -71,6 +104,7 @@ async def components_factory(  # type: ignore[misc]
         "blockstore": blockstore,
         "pki": pki,
         "sequester": sequester,
+        "raid_scrubber": raid_scrubber,
     }
     for component in components.values():
         method = getattr(component, "register_components", None)
@@ -79,8 +113,13 @@ async def components_factory(  # type: ignore[misc]
 
     async with open_service_nursery() as nursery:
         await dbh.init(nursery=nursery, events_component=events)
+        stats_roll_up_task = await start_task(nursery, organization.run_stats_roll_up)
+        raid_scrubber_task = await start_task(nursery, raid_scrubber.run) if raid_scrubber else None
         try:
             yield components
 
         finally:
+            if raid_scrubber_task:
+                await raid_scrubber_task.cancel_and_join()
+            await stats_roll_up_task.cancel_and_join()
             await dbh.teardown()
@@ -3,23 +3,27 @@ from __future__ import annotations
 
 import importlib.resources
 import re
+import time
 from base64 import b64decode, b64encode
 from datetime import datetime
 from functools import wraps
-from typing import Awaitable, Callable, Coroutine, Iterable, List, Tuple
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Iterable, List, Tuple
 from uuid import uuid4
 
+import asyncpg
 import attr
 import trio
 import trio_typing
 import triopg
+from asyncpg.prepared_stmt import PreparedStatement
 from structlog import get_logger
 from triopg import PostgresError, UndefinedTableError, UniqueViolationError
 from typing_extensions import ParamSpec
 
-from parsec._parsec import ActiveUsersLimit, BackendEvent, DateTime
+from parsec._parsec import ActiveUsersLimit, BackendEvent, DateTime, OrganizationID
 from parsec.backend.events import EventsComponent
 from parsec.backend.postgresql import migrations as migrations_module
+from parsec.backend.postgresql.utils import Q, get_organization_internal_id, get_query
 from parsec.event_bus import EventBus
 from parsec.utils import TaskStatus, start_task
 
@@ -200,13 +204,106 @@ async def handle_integer(conn: triopg._triopg.TrioConnectionProxy) -> None:
     )
 
 
+class PGConnection(asyncpg.Connection):
+    """
+    Connection of the pool, statements generated by `Q` are explicitly prepared
+    the first time they are run on the connection and kept for its whole lifetime
+    (unlike asyncpg's statement cache which is smaller than the number of `Q`s, hence
+    the statements get evicted and parsed again).
+
+    Each execution of those statements is accounted in the stats of its `Q`.
+
+    The connection also caches the organizations internal IDs (see
+    `get_organization_internal_id`).
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._q_statements: Dict[str, PreparedStatement] = {}
+        self.organization_internal_ids: Dict[OrganizationID, int] = {}
+
+    async def _run_q(
+        self, q: Q, sql: str, method: str, args: Tuple[Any, ...], **kwargs: Any
+    ) -> Any:
+        started_on = time.perf_counter()
+        while True:
+            statement = self._q_statements.get(sql)
+            if statement is None:
+                statement = await self.prepare(sql)
+                self._q_statements[sql] = statement
+            try:
+                if method == "execute":
+                    await statement.fetch(*args, **kwargs)
+                    result = statement.get_statusmsg()
+                else:
+                    result = await getattr(statement, method)(*args, **kwargs)
+                break
+            except (asyncpg.InvalidCachedStatementError, asyncpg.OutdatedSchemaCacheError):
+                # The schema has changed since the statement was prepared, just like
+                # asyncpg does with its own statement cache we prepare it again unless
+                # the current transaction is already aborted
+                del self._q_statements[sql]
+                if self.is_in_transaction():
+                    raise
+
+        if method == "execute":
+            # Status is the command tag (e.g. `INSERT 0 1`, `UPDATE 2`)
+            status = result.rsplit(" ", 1)[-1]
+            rows = int(status) if status.isdigit() else 0
+        elif method == "fetch":
+            rows = len(result)
+        else:
+            rows = int(result is not None)
+        q.stats.record(time.perf_counter() - started_on, rows)
+        return result
+
+    async def execute(self, query: str, *args: Any, timeout: float | None = None) -> str:
+        q = get_query(query)
+        if q is None:
+            return await super().execute(query, *args, timeout=timeout)
+        return await self._run_q(q, query, "execute", args, timeout=timeout)
+
+    async def fetch(
+        self, query: str, *args: Any, timeout: float | None = None, record_class: Any = None
+    ) -> List[Any]:
+        q = get_query(query)
+        if q is None or record_class is not None:
+            return await super().fetch(query, *args, timeout=timeout, record_class=record_class)
+        return await self._run_q(q, query, "fetch", args, timeout=timeout)
+
+    async def fetchval(
+        self, query: str, *args: Any, column: int = 0, timeout: float | None = None
+    ) -> Any:
+        q = get_query(query)
+        if q is None:
+            return await super().fetchval(query, *args, column=column, timeout=timeout)
+        return await self._run_q(q, query, "fetchval", args, column=column, timeout=timeout)
+
+    async def fetchrow(
+        self, query: str, *args: Any, timeout: float | None = None, record_class: Any = None
+    ) -> Any:
+        q = get_query(query)
+        if q is None or record_class is not None:
+            return await super().fetchrow(query, *args, timeout=timeout, record_class=record_class)
+        return await self._run_q(q, query, "fetchrow", args, timeout=timeout)
+
+
 # TODO: replace by a function
 class PGHandler:
-    def __init__(self, url: str, min_connections: int, max_connections: int, event_bus: EventBus):
+    def __init__(
+        self,
+        url: str,
+        min_connections: int,
+        max_connections: int,
+        event_bus: EventBus,
+        event_log_retention: float = 0,
+    ):
         self.url = url
         self.min_connections = min_connections
         self.max_connections = max_connections
         self.event_bus = event_bus
+        # Number of seconds events are kept in the event log (disabled if <= 0)
+        self.event_log_retention = event_log_retention
         self.pool: triopg._triopg.TrioPoolProxy
         self.notification_conn: triopg._triopg.TrioConnectionProxy
         self._task_status: TaskStatus[None] | None = None
@@ -229,11 +326,17 @@ class PGHandler:
             await handle_uuid(conn)
             await handle_integer(conn)
 
+        # Event log is enabled per connection (see `send_signal`), using a setting
+        # given at connection time given the pool resets the session ones
+        server_settings = {EVENT_LOG_SETTING: "on"} if self.event_log_retention > 0 else {}
+
         async with triopg.create_pool(
             self.url,
             min_size=self.min_connections,
             max_size=self.max_connections,
             init=_init_connection,
+            connection_class=PGConnection,
+            server_settings=server_settings,
         ) as self.pool:
             # This connection is dedicated to the notifications listening, so it
             # would only complicate stuff to include it into the connection pool
@@ -244,11 +347,24 @@ class PGHandler:
                 await self.notification_conn.add_listener("app_notification", self._on_notification)
                 task_status.started()
                 try:
-                    await trio.sleep_forever()
+                    if self.event_log_retention > 0:
+                        await self._prune_event_log_forever()
+                    else:
+                        await trio.sleep_forever()
                 finally:
                     if self._connection_lost:
                         raise ConnectionError("PostgreSQL notification query has been lost")
 
+    async def _prune_event_log_forever(self) -> None:
+        while True:
+            before = DateTime.now().subtract(microseconds=int(self.event_log_retention * 1_000_000))
+            try:
+                async with self.pool.acquire() as conn:
+                    await prune_event_log(conn, before)
+            except PostgresError as exc:
+                logger.warning("Cannot prune the event log", exc_info=exc)
+            await trio.sleep(min(self.event_log_retention, EVENT_LOG_PRUNING_INTERVAL))
+
     # Notification listening is achieve by a never-ending LISTEN
     # query to PostgreSQL.
     # If this query is terminated (most likely because the database has
@@ -282,10 +398,123 @@ class PGHandler:
             await self._task_status.cancel_and_join()
 
 
+# Custom setting (so any name prefixed by `parsec.`) enabling the event log
+EVENT_LOG_SETTING = "parsec.event_log"
+EVENT_LOG_PRUNING_INTERVAL = 60
+EVENT_LOG_PRUNING_BATCH_SIZE = 10000
+EVENT_LOG_REPLAY_MAX_EVENTS = 10000
+
+
+_q_send_signal = Q(
+    f"""
+WITH cte_event_log AS (
+    INSERT INTO event_log (organization, event_id, event, created_on, xact_id, xact_xmin)
+    SELECT
+        _id,
+        $event_id,
+        $event,
+        NOW(),
+        txid_current(),
+        txid_snapshot_xmin(txid_current_snapshot())
+    FROM organization
+    WHERE
+        organization_id = $organization_id
+        AND current_setting('{EVENT_LOG_SETTING}', TRUE) = 'on'
+)
+SELECT pg_notify($channel, $payload)
+"""
+)
+
+
+# `_id` follows the insertion order, not the commit order: an event logged before
+# the client's last event by a transaction still running at that time may have
+# been committed (hence notified) after it. Any transaction not finished when the
+# last event was logged has a `xact_id` greater or equal than its `xact_xmin`, so
+# those events are also returned (the ones committed before the last event are
+# sent twice to the client, which is harmless unlike missing them).
+# The last event is included in the result, so that an empty result means the
+# event is not in the log (or not in this organization).
+_q_get_logged_events = Q(
+    """
+WITH cte_last_event AS (
+    SELECT _id, xact_id, xact_xmin
+    FROM event_log
+    WHERE organization = $organization AND event_id = $last_event_id
+)
+SELECT event_id, event
+FROM event_log, cte_last_event
+WHERE
+    event_log.organization = $organization
+    AND (
+        event_log._id >= cte_last_event._id
+        OR (
+            event_log.xact_id >= cte_last_event.xact_xmin
+            -- Events of the last event's transaction have been notified along with it
+            AND event_log.xact_id != cte_last_event.xact_id
+        )
+    )
+ORDER BY event_log._id
+LIMIT $limit
+"""
+)
+
+
+_q_prune_event_log = Q(
+    """
+DELETE FROM event_log
+WHERE _id IN (SELECT _id FROM event_log WHERE created_on < $before LIMIT $limit)
+"""
+)
+
+
 async def send_signal(conn: triopg._triopg.TrioConnectionProxy, event: BackendEvent) -> None:
+    raw_event = event.dump()
     # PostgreSQL's NOTIFY only accept string as payload, hence we must
     # use base64 on our payload...
-    raw_event = b64encode(event.dump()).decode("ascii")
     event_id = uuid4().hex
-    payload = f"{event_id}:{raw_event}"
-    await conn.execute("SELECT pg_notify($1, $2)", "app_notification", payload)
+    payload = f"{event_id}:{b64encode(raw_event).decode('ascii')}"
+    await conn.execute(
+        *_q_send_signal(
+            organization_id=event.organization_id.str,
+            event_id=event_id,
+            event=raw_event,
+            channel="app_notification",
+            payload=payload,
+        )
+    )
+
+
+async def get_logged_events(
+    conn: triopg._triopg.TrioConnectionProxy,
+    organization_id: OrganizationID,
+    last_event_id: str,
+    max_events: int = EVENT_LOG_REPLAY_MAX_EVENTS,
+) -> List[Tuple[str, BackendEvent]] | None:
+    """
+    Returns: the organization's events that may have been committed after `last_event_id`
+    (in logging order), or `None` if this event is not in the log or too many events
+    have been logged since
+    """
+    rows = await conn.fetch(
+        *_q_get_logged_events(
+            organization=await get_organization_internal_id(conn, organization_id),
+            last_event_id=last_event_id,
+            limit=max_events + 2,
+        )
+    )
+    if not rows or len(rows) > max_events + 1:
+        return None
+    return [
+        (row["event_id"], BackendEvent.load(row["event"]))
+        for row in rows
+        if row["event_id"] != last_event_id
+    ]
+
+
+async def prune_event_log(conn: triopg._triopg.TrioConnectionProxy, before: DateTime) -> None:
+    while True:
+        status = await conn.execute(
+            *_q_prune_event_log(before=before, limit=EVENT_LOG_PRUNING_BATCH_SIZE)
+        )
+        if int(status.split()[-1]) < EVENT_LOG_PRUNING_BATCH_SIZE:
+            break
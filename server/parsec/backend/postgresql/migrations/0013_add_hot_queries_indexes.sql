@@ -0,0 +1,25 @@
+-- Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+
+-------------------------------------------------------
+--  Migration
+-------------------------------------------------------
+
+-- The UNIQUE constraints don't lead with the columns used by the hot queries,
+-- hence those indexes designed for their access paths.
+
+
+-- Vlob lookup by id, regardless of its encryption revision (realm retrieval,
+-- list versions, organization stats)
+CREATE INDEX vlob_atom_organization_vlob_id_version_idx ON vlob_atom (organization, vlob_id, version DESC);
+
+
+-- Current role of a user in a realm, i.e. its last role certificate
+-- (`DISTINCT ON (user_) ... ORDER BY user_, certified_on DESC` or
+-- `ORDER BY certified_on DESC LIMIT 1`)
+CREATE INDEX realm_user_role_realm_user_certified_on_idx ON realm_user_role (realm, user_, certified_on DESC) INCLUDE (role);
+-- Current roles of a user across all its realms
+CREATE INDEX realm_user_role_user_realm_certified_on_idx ON realm_user_role (user_, realm, certified_on DESC) INCLUDE (role);
+
+
+-- Realm stats
+CREATE INDEX block_realm_idx ON block (realm) INCLUDE (size);
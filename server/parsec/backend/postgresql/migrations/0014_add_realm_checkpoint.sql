@@ -0,0 +1,15 @@
+-- Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+
+-------------------------------------------------------
+--  Migration
+-------------------------------------------------------
+
+-- Last checkpoint allocated in the realm's `realm_vlob_update`, bumped along with
+-- each vlob create/update (this row lock is what orders the concurrent writers)
+ALTER TABLE realm ADD checkpoint INTEGER NOT NULL DEFAULT 0;
+
+UPDATE realm SET checkpoint = (
+    SELECT COALESCE(MAX(index), 0)
+    FROM realm_vlob_update
+    WHERE realm_vlob_update.realm = realm._id
+);
@@ -0,0 +1,28 @@
+-- Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+
+-------------------------------------------------------
+--  Migration
+-------------------------------------------------------
+
+-- Reencryption progress toward this revision: number of vlob atoms in the
+-- previous revision (set when the reencryption maintenance starts), and number
+-- of them already reencrypted (bumped by each saved batch)
+ALTER TABLE vlob_encryption_revision ADD reencryption_total INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE vlob_encryption_revision ADD reencryption_done INTEGER NOT NULL DEFAULT 0;
+
+UPDATE vlob_encryption_revision SET
+    reencryption_total = (
+        SELECT COUNT(*)
+        FROM vlob_atom
+        INNER JOIN vlob_encryption_revision AS previous
+        ON vlob_atom.vlob_encryption_revision = previous._id
+        WHERE
+            previous.realm = vlob_encryption_revision.realm
+            AND previous.encryption_revision = vlob_encryption_revision.encryption_revision - 1
+    ),
+    reencryption_done = (
+        SELECT COUNT(*)
+        FROM vlob_atom
+        WHERE vlob_atom.vlob_encryption_revision = vlob_encryption_revision._id
+    )
+WHERE encryption_revision > 1;
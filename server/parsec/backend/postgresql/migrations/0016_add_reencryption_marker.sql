@@ -0,0 +1,13 @@
+-- Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+
+-------------------------------------------------------
+--  Migration
+-------------------------------------------------------
+
+-- All the vlob atoms of the previous revision with an `_id` lower or equal to
+-- this marker have already been reencrypted, so reencryption batches are
+-- fetched from there
+ALTER TABLE vlob_encryption_revision ADD reencryption_marker INTEGER NOT NULL DEFAULT 0;
+
+-- Keyset pagination on the atoms of a given revision
+CREATE INDEX vlob_atom_vlob_encryption_revision_id_idx ON vlob_atom (vlob_encryption_revision, _id);
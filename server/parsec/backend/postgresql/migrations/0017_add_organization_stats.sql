@@ -0,0 +1,176 @@
+-- Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+
+-------------------------------------------------------
+--  Migration
+-------------------------------------------------------
+
+-- Organization stats are maintained by the queries modifying the counted items
+-- (see `q_increment_organization_stats`) instead of being computed from the
+-- whole `vlob_atom`/`block`/`user_`/`realm_user_role` tables on each request.
+-- Those queries only append their changes to `organization_stats_delta`, which
+-- are periodically rolled up into `organization_stats` and `organization_daily_stats`
+-- (see `PGOrganizationComponent.roll_up_stats`), so concurrent writes don't conflict.
+CREATE TABLE organization_stats (
+    _id SERIAL PRIMARY KEY,
+    organization INTEGER REFERENCES organization (_id) NOT NULL,
+    data_size BIGINT NOT NULL DEFAULT 0,
+    metadata_size BIGINT NOT NULL DEFAULT 0,
+    realms INTEGER NOT NULL DEFAULT 0,
+    admin_users_active INTEGER NOT NULL DEFAULT 0,
+    admin_users_revoked INTEGER NOT NULL DEFAULT 0,
+    standard_users_active INTEGER NOT NULL DEFAULT 0,
+    standard_users_revoked INTEGER NOT NULL DEFAULT 0,
+    outsider_users_active INTEGER NOT NULL DEFAULT 0,
+    outsider_users_revoked INTEGER NOT NULL DEFAULT 0,
+
+    UNIQUE(organization)
+);
+
+-- Same counters, but only the changes accounted for a given day (in UTC), so
+-- stats at a given point in time only have to compute the changes from the
+-- beginning of that day
+CREATE TABLE organization_daily_stats (
+    _id SERIAL PRIMARY KEY,
+    organization INTEGER REFERENCES organization (_id) NOT NULL,
+    day DATE NOT NULL,
+    data_size BIGINT NOT NULL DEFAULT 0,
+    metadata_size BIGINT NOT NULL DEFAULT 0,
+    realms INTEGER NOT NULL DEFAULT 0,
+    admin_users_active INTEGER NOT NULL DEFAULT 0,
+    admin_users_revoked INTEGER NOT NULL DEFAULT 0,
+    standard_users_active INTEGER NOT NULL DEFAULT 0,
+    standard_users_revoked INTEGER NOT NULL DEFAULT 0,
+    outsider_users_active INTEGER NOT NULL DEFAULT 0,
+    outsider_users_revoked INTEGER NOT NULL DEFAULT 0,
+
+    UNIQUE(organization, day)
+);
+
+-- Changes not rolled up yet, along with the day they are accounted for
+CREATE TABLE organization_stats_delta (
+    _id BIGSERIAL PRIMARY KEY,
+    organization INTEGER REFERENCES organization (_id) NOT NULL,
+    day DATE NOT NULL,
+    data_size BIGINT NOT NULL DEFAULT 0,
+    metadata_size BIGINT NOT NULL DEFAULT 0,
+    realms INTEGER NOT NULL DEFAULT 0,
+    admin_users_active INTEGER NOT NULL DEFAULT 0,
+    admin_users_revoked INTEGER NOT NULL DEFAULT 0,
+    standard_users_active INTEGER NOT NULL DEFAULT 0,
+    standard_users_revoked INTEGER NOT NULL DEFAULT 0,
+    outsider_users_active INTEGER NOT NULL DEFAULT 0,
+    outsider_users_revoked INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX organization_stats_delta_organization_idx ON organization_stats_delta (organization, day);
+
+-- Changes from the beginning of the day
+CREATE INDEX vlob_atom_organization_created_on_idx ON vlob_atom (organization, created_on) INCLUDE (size);
+CREATE INDEX block_organization_created_on_idx ON block (organization, created_on) INCLUDE (size);
+
+-- Compute the stats of the existing organizations
+
+INSERT INTO organization_daily_stats (organization, day, metadata_size)
+SELECT organization, (created_on AT TIME ZONE 'UTC')::DATE, SUM(size)
+FROM vlob_atom
+GROUP BY 1, 2;
+
+INSERT INTO organization_daily_stats (organization, day, data_size)
+SELECT organization, (created_on AT TIME ZONE 'UTC')::DATE, SUM(size)
+FROM block
+GROUP BY 1, 2
+ON CONFLICT (organization, day) DO UPDATE
+SET data_size = EXCLUDED.data_size;
+
+-- There's no `created_on` field for realm, the oldest role certification is used instead
+INSERT INTO organization_daily_stats (organization, day, realms)
+SELECT organization, (created_on AT TIME ZONE 'UTC')::DATE, COUNT(*)
+FROM (
+    SELECT realm.organization, MIN(realm_user_role.certified_on) AS created_on
+    FROM realm
+    INNER JOIN realm_user_role ON realm_user_role.realm = realm._id
+    GROUP BY realm._id
+) AS realm_creation
+GROUP BY 1, 2
+ON CONFLICT (organization, day) DO UPDATE
+SET realms = EXCLUDED.realms;
+
+-- Users are accounted as active the day they are created, then as revoked the
+-- day they are revoked
+INSERT INTO organization_daily_stats (
+    organization,
+    day,
+    admin_users_active,
+    standard_users_active,
+    outsider_users_active
+)
+SELECT
+    organization,
+    (created_on AT TIME ZONE 'UTC')::DATE,
+    COUNT(*) FILTER (WHERE profile = 'ADMIN'),
+    COUNT(*) FILTER (WHERE profile = 'STANDARD'),
+    COUNT(*) FILTER (WHERE profile = 'OUTSIDER')
+FROM user_
+GROUP BY 1, 2
+ON CONFLICT (organization, day) DO UPDATE
+SET
+    admin_users_active = EXCLUDED.admin_users_active,
+    standard_users_active = EXCLUDED.standard_users_active,
+    outsider_users_active = EXCLUDED.outsider_users_active;
+
+INSERT INTO organization_daily_stats (
+    organization,
+    day,
+    admin_users_active,
+    admin_users_revoked,
+    standard_users_active,
+    standard_users_revoked,
+    outsider_users_active,
+    outsider_users_revoked
+)
+SELECT
+    organization,
+    (revoked_on AT TIME ZONE 'UTC')::DATE,
+    -COUNT(*) FILTER (WHERE profile = 'ADMIN'),
+    COUNT(*) FILTER (WHERE profile = 'ADMIN'),
+    -COUNT(*) FILTER (WHERE profile = 'STANDARD'),
+    COUNT(*) FILTER (WHERE profile = 'STANDARD'),
+    -COUNT(*) FILTER (WHERE profile = 'OUTSIDER'),
+    COUNT(*) FILTER (WHERE profile = 'OUTSIDER')
+FROM user_
+WHERE revoked_on IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT (organization, day) DO UPDATE
+SET
+    admin_users_active = organization_daily_stats.admin_users_active + EXCLUDED.admin_users_active,
+    admin_users_revoked = EXCLUDED.admin_users_revoked,
+    standard_users_active = organization_daily_stats.standard_users_active + EXCLUDED.standard_users_active,
+    standard_users_revoked = EXCLUDED.standard_users_revoked,
+    outsider_users_active = organization_daily_stats.outsider_users_active + EXCLUDED.outsider_users_active,
+    outsider_users_revoked = EXCLUDED.outsider_users_revoked;
+
+INSERT INTO organization_stats (
+    organization,
+    data_size,
+    metadata_size,
+    realms,
+    admin_users_active,
+    admin_users_revoked,
+    standard_users_active,
+    standard_users_revoked,
+    outsider_users_active,
+    outsider_users_revoked
+)
+SELECT
+    organization,
+    SUM(data_size),
+    SUM(metadata_size),
+    SUM(realms),
+    SUM(admin_users_active),
+    SUM(admin_users_revoked),
+    SUM(standard_users_active),
+    SUM(standard_users_revoked),
+    SUM(outsider_users_active),
+    SUM(outsider_users_revoked)
+FROM organization_daily_stats
+GROUP BY organization;
@@ -0,0 +1,29 @@
+-- Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+
+-------------------------------------------------------
+--  Migration
+-------------------------------------------------------
+
+-- Events sent by `send_signal` are also persisted (if the event log is enabled),
+-- so that SSE clients can get the events they missed while reconnecting to
+-- another server or after a restart
+CREATE TABLE event_log (
+    _id BIGSERIAL PRIMARY KEY,
+    organization INTEGER REFERENCES organization (_id) NOT NULL,
+    event_id VARCHAR(32) NOT NULL,
+    event BYTEA NOT NULL,
+    created_on TIMESTAMPTZ NOT NULL,
+    -- Transaction that logged the event, and oldest transaction still running at
+    -- that time (see `get_logged_events`)
+    xact_id BIGINT NOT NULL,
+    xact_xmin BIGINT NOT NULL,
+
+    UNIQUE(event_id)
+);
+
+-- Replay the events of an organization
+CREATE INDEX event_log_organization_idx ON event_log (organization, _id);
+-- Replay the events logged before the last one but committed after it
+CREATE INDEX event_log_organization_xact_idx ON event_log (organization, xact_id);
+-- Retention
+CREATE INDEX event_log_created_on_idx ON event_log (created_on);
@@ -229,6 +229,8 @@ CREATE TABLE realm (
     maintenance_started_by INTEGER REFERENCES device (_id),
     maintenance_started_on TIMESTAMPTZ,
     maintenance_type maintenance_type,
+    -- Last checkpoint allocated in `realm_vlob_update`
+    checkpoint INTEGER NOT NULL DEFAULT 0,
 
     UNIQUE(organization, realm_id)
 );
@@ -248,6 +250,11 @@ CREATE TABLE realm_user_role (
     certified_on TIMESTAMPTZ NOT NULL
 );
 
+-- Current role of a user in a realm, i.e. its last role certificate
+CREATE INDEX realm_user_role_realm_user_certified_on_idx ON realm_user_role (realm, user_, certified_on DESC) INCLUDE (role);
+-- Current roles of a user across all its realms
+CREATE INDEX realm_user_role_user_realm_certified_on_idx ON realm_user_role (user_, realm, certified_on DESC) INCLUDE (role);
+
 
 CREATE TABLE realm_user_change (
     _id SERIAL PRIMARY KEY,
@@ -271,6 +278,13 @@ CREATE TABLE vlob_encryption_revision (
     _id SERIAL PRIMARY KEY,
     realm INTEGER REFERENCES realm (_id),
     encryption_revision INTEGER NOT NULL,
+    -- Reencryption progress toward this revision: number of vlob atoms in the
+    -- previous revision, and number of them already reencrypted
+    reencryption_total INTEGER NOT NULL DEFAULT 0,
+    reencryption_done INTEGER NOT NULL DEFAULT 0,
+    -- All the vlob atoms of the previous revision with an `_id` lower or equal
+    -- to this marker have already been reencrypted
+    reencryption_marker INTEGER NOT NULL DEFAULT 0,
 
     UNIQUE(realm, encryption_revision)
 );
@@ -292,6 +306,13 @@ CREATE TABLE vlob_atom (
     UNIQUE(vlob_encryption_revision, vlob_id, version)
 );
 
+-- Vlob lookup by id, regardless of its encryption revision
+CREATE INDEX vlob_atom_organization_vlob_id_version_idx ON vlob_atom (organization, vlob_id, version DESC);
+-- Keyset pagination on the atoms of a given revision
+CREATE INDEX vlob_atom_vlob_encryption_revision_id_idx ON vlob_atom (vlob_encryption_revision, _id);
+-- Organization stats at a given point in time
+CREATE INDEX vlob_atom_organization_created_on_idx ON vlob_atom (organization, created_on) INCLUDE (size);
+
 
 CREATE TABLE realm_vlob_update (
     _id SERIAL PRIMARY KEY,
@@ -329,6 +350,10 @@ CREATE TABLE block (
     UNIQUE(organization, block_id)
 );
 
+CREATE INDEX block_realm_idx ON block (realm) INCLUDE (size);
+-- Organization stats at a given point in time
+CREATE INDEX block_organization_created_on_idx ON block (organization, created_on) INCLUDE (size);
+
 
 -- Only used if we store blocks' data in database
 CREATE TABLE block_data (
@@ -343,6 +368,92 @@ CREATE TABLE block_data (
 );
 
 
+-------------------------------------------------------
+--  Statistics
+-------------------------------------------------------
+
+
+-- Rolled up from `organization_stats_delta`
+CREATE TABLE organization_stats (
+    _id SERIAL PRIMARY KEY,
+    organization INTEGER REFERENCES organization (_id) NOT NULL,
+    data_size BIGINT NOT NULL DEFAULT 0,
+    metadata_size BIGINT NOT NULL DEFAULT 0,
+    realms INTEGER NOT NULL DEFAULT 0,
+    admin_users_active INTEGER NOT NULL DEFAULT 0,
+    admin_users_revoked INTEGER NOT NULL DEFAULT 0,
+    standard_users_active INTEGER NOT NULL DEFAULT 0,
+    standard_users_revoked INTEGER NOT NULL DEFAULT 0,
+    outsider_users_active INTEGER NOT NULL DEFAULT 0,
+    outsider_users_revoked INTEGER NOT NULL DEFAULT 0,
+
+    UNIQUE(organization)
+);
+
+
+-- Changes of the organization stats accounted for a given day (in UTC)
+CREATE TABLE organization_daily_stats (
+    _id SERIAL PRIMARY KEY,
+    organization INTEGER REFERENCES organization (_id) NOT NULL,
+    day DATE NOT NULL,
+    data_size BIGINT NOT NULL DEFAULT 0,
+    metadata_size BIGINT NOT NULL DEFAULT 0,
+    realms INTEGER NOT NULL DEFAULT 0,
+    admin_users_active INTEGER NOT NULL DEFAULT 0,
+    admin_users_revoked INTEGER NOT NULL DEFAULT 0,
+    standard_users_active INTEGER NOT NULL DEFAULT 0,
+    standard_users_revoked INTEGER NOT NULL DEFAULT 0,
+    outsider_users_active INTEGER NOT NULL DEFAULT 0,
+    outsider_users_revoked INTEGER NOT NULL DEFAULT 0,
+
+    UNIQUE(organization, day)
+);
+
+
+-- Changes appended by the queries modifying the counted items, not rolled up yet
+CREATE TABLE organization_stats_delta (
+    _id BIGSERIAL PRIMARY KEY,
+    organization INTEGER REFERENCES organization (_id) NOT NULL,
+    day DATE NOT NULL,
+    data_size BIGINT NOT NULL DEFAULT 0,
+    metadata_size BIGINT NOT NULL DEFAULT 0,
+    realms INTEGER NOT NULL DEFAULT 0,
+    admin_users_active INTEGER NOT NULL DEFAULT 0,
+    admin_users_revoked INTEGER NOT NULL DEFAULT 0,
+    standard_users_active INTEGER NOT NULL DEFAULT 0,
+    standard_users_revoked INTEGER NOT NULL DEFAULT 0,
+    outsider_users_active INTEGER NOT NULL DEFAULT 0,
+    outsider_users_revoked INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX organization_stats_delta_organization_idx ON organization_stats_delta (organization, day);
+
+
+-------------------------------------------------------
+--  Events
+-------------------------------------------------------
+
+
+-- Events sent by `send_signal`, only populated if the event log is enabled
+CREATE TABLE event_log (
+    _id BIGSERIAL PRIMARY KEY,
+    organization INTEGER REFERENCES organization (_id) NOT NULL,
+    event_id VARCHAR(32) NOT NULL,
+    event BYTEA NOT NULL,
+    created_on TIMESTAMPTZ NOT NULL,
+    -- Transaction that logged the event, and oldest transaction still running at
+    -- that time (see `get_logged_events`)
+    xact_id BIGINT NOT NULL,
+    xact_xmin BIGINT NOT NULL,
+
+    UNIQUE(event_id)
+);
+
+CREATE INDEX event_log_organization_idx ON event_log (organization, _id);
+CREATE INDEX event_log_organization_xact_idx ON event_log (organization, xact_id);
+CREATE INDEX event_log_created_on_idx ON event_log (created_on);
+
+
 -------------------------------------------------------
 --  Migration
 -------------------------------------------------------
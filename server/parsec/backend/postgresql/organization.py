@@ -2,10 +2,13 @@
 from __future__ import annotations
 
 from functools import lru_cache
-from typing import Any, Union
+from typing import TYPE_CHECKING, Any, AsyncIterator, Tuple, Union
 
+import trio
+import trio_typing
 import triopg
-from triopg import UniqueViolationError
+from structlog import get_logger
+from triopg import PostgresError, UniqueViolationError
 
 from parsec._parsec import (
     ActiveUsersLimit,
@@ -31,10 +34,31 @@ from parsec.backend.organization import (
 )
 from parsec.backend.postgresql.handler import PGHandler, send_signal
 from parsec.backend.postgresql.user_queries.create import q_create_user
-from parsec.backend.postgresql.utils import Q, q_organization_internal_id
+from parsec.backend.postgresql.utils import (
+    ORGANIZATION_STATS_COUNTERS,
+    Q,
+    organization_stats_users_counter,
+    q_day,
+    q_day_start,
+    q_organization_internal_id,
+)
 from parsec.backend.user import Device, User, UserError
 from parsec.backend.utils import Unset, UnsetType
 
+if TYPE_CHECKING:
+    from parsec.backend.auth_cache import AuthenticationCache
+
+
+logger = get_logger()
+
+
+# Number of organizations fetched at once by `server_stats`
+SERVER_STATS_BATCH_SIZE = 100
+# Organization stats deltas are rolled up by batches, every few seconds
+ORGANIZATION_STATS_ROLL_UP_BATCH_SIZE = 1000
+ORGANIZATION_STATS_ROLL_UP_INTERVAL = 10
+
+
 _q_insert_organization = Q(
     """
 INSERT INTO organization (
@@ -132,52 +156,200 @@ WHERE
 """
 )
 
-# Note the `profile::text` casting here, this is a limitation of asyncpg which doesn't support
-# enum within an anonymous record (see https://github.com/MagicStack/asyncpg/issues/360)
+# Current stats are the rolled up counters, plus the deltas not rolled up yet
+# (both being seen from the same snapshot, a delta is never counted twice)
+_Q_CURRENT_STATS_COUNTERS = ", ".join(
+    f"COALESCE(organization_stats.{counter}, 0) + deltas.{counter} AS {counter}"
+    for counter in ORGANIZATION_STATS_COUNTERS
+)
+_Q_CURRENT_STATS_FROM = f"""
+FROM organization
+LEFT JOIN organization_stats ON organization_stats.organization = organization._id
+CROSS JOIN LATERAL (
+    SELECT
+        {
+            ", ".join(
+                f"COALESCE(SUM({counter}), 0)::BIGINT AS {counter}"
+                for counter in ORGANIZATION_STATS_COUNTERS
+            )
+        }
+    FROM organization_stats_delta
+    WHERE organization_stats_delta.organization = organization._id
+) AS deltas
+"""
+
+
 _q_get_stats = Q(
     f"""
+SELECT { _Q_CURRENT_STATS_COUNTERS }
+{ _Q_CURRENT_STATS_FROM }
+WHERE organization.organization_id = $organization_id
+"""
+)
+
+
+_q_get_server_stats = Q(
+    f"""
 SELECT
-    (
-        SELECT COALESCE(_created_on <= $at, false)
-        FROM organization
-        WHERE organization_id = $organization_id
-    ) exist,
-    (
-        SELECT ARRAY(
-            SELECT (revoked_on, profile::text)
-            FROM user_
-            WHERE organization = { q_organization_internal_id("$organization_id") }
-            AND created_on <= $at
-        )
-    ) users,
-    (
-        SELECT COUNT(DISTINCT(realm._id))
-        FROM realm
-        LEFT JOIN realm_user_role
-        ON realm_user_role.realm = realm._id
-        WHERE realm.organization = { q_organization_internal_id("$organization_id") }
-        AND realm_user_role.certified_on <= $at
-    ) realms,
-    (
+    organization.organization_id,
+    { _Q_CURRENT_STATS_COUNTERS }
+{ _Q_CURRENT_STATS_FROM }
+WHERE organization.organization_id > $after
+ORDER BY organization.organization_id
+LIMIT $limit
+"""
+)
+
+
+def _q_roll_up_stats_increments(table: str) -> str:
+    return ", ".join(
+        f"{counter} = {table}.{counter} + EXCLUDED.{counter}"
+        for counter in ORGANIZATION_STATS_COUNTERS
+    )
+
+
+# Deltas are consumed in a single statement, so readers either see them as deltas
+# or as part of the counters. Counter rows are updated in a consistent order to
+# avoid deadlocks between concurrent roll ups (e.g. from several servers).
+_q_roll_up_stats = Q(
+    f"""
+WITH cte_deltas AS (
+    DELETE FROM organization_stats_delta
+    WHERE _id IN (
+        SELECT _id
+        FROM organization_stats_delta
+        ORDER BY _id
+        LIMIT $limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING organization, day, { ", ".join(ORGANIZATION_STATS_COUNTERS) }
+),
+cte_roll_up_organization_stats AS (
+    INSERT INTO organization_stats (organization, { ", ".join(ORGANIZATION_STATS_COUNTERS) })
+    SELECT
+        organization,
+        { ", ".join(f"SUM({counter})" for counter in ORGANIZATION_STATS_COUNTERS) }
+    FROM cte_deltas
+    GROUP BY organization
+    ORDER BY organization
+    ON CONFLICT (organization) DO UPDATE SET
+        { _q_roll_up_stats_increments("organization_stats") }
+),
+cte_roll_up_organization_daily_stats AS (
+    INSERT INTO organization_daily_stats (
+        organization, day, { ", ".join(ORGANIZATION_STATS_COUNTERS) }
+    )
+    SELECT
+        organization,
+        day,
+        { ", ".join(f"SUM({counter})" for counter in ORGANIZATION_STATS_COUNTERS) }
+    FROM cte_deltas
+    GROUP BY organization, day
+    ORDER BY organization, day
+    ON CONFLICT (organization, day) DO UPDATE SET
+        { _q_roll_up_stats_increments("organization_daily_stats") }
+)
+SELECT COUNT(*) FROM cte_deltas
+"""
+)
+
+
+def _q_between_day_start_and_at(column: str) -> str:
+    return f"({column} >= { q_day_start('$at') } AND {column} <= $at)"
+
+
+def _q_users_counters(profile: UserProfile) -> str:
+    created = f"profile = '{profile.str}' AND { _q_between_day_start_and_at('created_on') }"
+    revoked = f"profile = '{profile.str}' AND { _q_between_day_start_and_at('revoked_on') }"
+    return f"""
+        COUNT(*) FILTER (WHERE {created}) - COUNT(*) FILTER (WHERE {revoked})
+            AS {organization_stats_users_counter(profile, revoked=False)},
+        COUNT(*) FILTER (WHERE {revoked})
+            AS {organization_stats_users_counter(profile, revoked=True)}
+    """
+
+
+# Stats at a given point in time are the sum of the daily stats (and of the deltas
+# not rolled up yet) before that day, plus the changes from the beginning of the
+# day (computed from the counted items).
+_q_get_stats_at = Q(
+    f"""
+WITH cte_organization AS (
+    SELECT _id
+    FROM organization
+    WHERE organization_id = $organization_id AND _created_on <= $at
+),
+cte_daily_stats AS (
+    SELECT
+        {
+            ", ".join(
+                f"COALESCE(SUM({counter}), 0)::BIGINT AS {counter}"
+                for counter in ORGANIZATION_STATS_COUNTERS
+            )
+        }
+    FROM (
+        SELECT organization, day, { ", ".join(ORGANIZATION_STATS_COUNTERS) }
+        FROM organization_daily_stats
+        UNION ALL
+        SELECT organization, day, { ", ".join(ORGANIZATION_STATS_COUNTERS) }
+        FROM organization_stats_delta
+    ) AS daily_stats
+    WHERE
+        organization = (SELECT _id FROM cte_organization)
+        AND day < { q_day("$at") }
+),
+cte_users_changes AS (
+    SELECT { ", ".join(_q_users_counters(profile) for profile in UserProfile.VALUES) }
+    FROM user_
+    WHERE organization = (SELECT _id FROM cte_organization)
+)
+SELECT
+    cte_daily_stats.data_size + (
         SELECT COALESCE(SUM(size), 0)
-        FROM vlob_atom
+        FROM block
         WHERE
-            organization = { q_organization_internal_id("$organization_id") }
-            AND created_on <= $at
-            AND (deleted_on IS NULL OR deleted_on > $at)
-    ) metadata_size,
-    (
+            organization = (SELECT _id FROM cte_organization)
+            AND { _q_between_day_start_and_at("created_on") }
+    ) AS data_size,
+    cte_daily_stats.metadata_size + (
         SELECT COALESCE(SUM(size), 0)
-        FROM block
+        FROM vlob_atom
+        WHERE
+            organization = (SELECT _id FROM cte_organization)
+            AND { _q_between_day_start_and_at("created_on") }
+    ) AS metadata_size,
+    -- There's no `created_on` field for realm, the oldest role certification is used instead
+    cte_daily_stats.realms + (
+        SELECT COUNT(*)
+        FROM realm
         WHERE
-            organization = { q_organization_internal_id("$organization_id") }
-            AND created_on <= $at
-            AND (deleted_on IS NULL OR deleted_on > $at)
-    ) data_size
+            organization = (SELECT _id FROM cte_organization)
+            AND {
+                _q_between_day_start_and_at(
+                    "(SELECT MIN(certified_on) FROM realm_user_role WHERE realm = realm._id)"
+                )
+            }
+    ) AS realms,
+    {
+        ", ".join(
+            f"cte_daily_stats.{counter} + cte_users_changes.{counter} AS {counter}"
+            for counter in ORGANIZATION_STATS_COUNTERS
+            if counter.endswith(("_users_active", "_users_revoked"))
+        )
+    }
+FROM cte_organization, cte_daily_stats, cte_users_changes
 """
 )
 
-_q_get_organizations = Q("SELECT organization_id AS id from organization ORDER BY id")
+_q_get_organizations = Q(
+    """
+SELECT organization_id AS id
+FROM organization
+WHERE organization_id > $after
+ORDER BY id
+LIMIT $limit
+"""
+)
 
 # There's no `created_on` or similar field for realm. So we get an estimation by
 # taking the oldest certification in the `realm_user_role`
@@ -219,35 +391,33 @@ def _q_update_factory(
 async def _organization_stats(
     conn: triopg._triopg.TrioConnectionProxy,
     id: OrganizationID,
-    at: DateTime,
+    at: DateTime | None,
 ) -> OrganizationStats | None:
-    result = await conn.fetchrow(*_q_get_stats(organization_id=id.str, at=at))
-    if not result["exist"]:
+    if at is None:
+        row = await conn.fetchrow(*_q_get_stats(organization_id=id.str))
+    else:
+        row = await conn.fetchrow(*_q_get_stats_at(organization_id=id.str, at=at))
+    if not row:
         return None
+    return _organization_stats_from_row(row)
 
-    users = 0
-    active_users = 0
-    users_per_profile_detail = {p: {"active": 0, "revoked": 0} for p in UserProfile.VALUES}
-    for u in result["users"]:
-        is_revoked, profile = u
-        users += 1
-        if is_revoked:
-            users_per_profile_detail[UserProfile.from_str(profile)]["revoked"] += 1
-        else:
-            active_users += 1
-            users_per_profile_detail[UserProfile.from_str(profile)]["active"] += 1
 
+def _organization_stats_from_row(row: Any) -> OrganizationStats:
     users_per_profile_detail = tuple(
-        UsersPerProfileDetailItem(profile=profile, **data)
-        for profile, data in users_per_profile_detail.items()
+        UsersPerProfileDetailItem(
+            profile=profile,
+            active=row[organization_stats_users_counter(profile, revoked=False)],
+            revoked=row[organization_stats_users_counter(profile, revoked=True)],
+        )
+        for profile in UserProfile.VALUES
     )
 
     return OrganizationStats(
-        data_size=result["data_size"],
-        metadata_size=result["metadata_size"],
-        realms=result["realms"],
-        users=users,
-        active_users=active_users,
+        data_size=row["data_size"],
+        metadata_size=row["metadata_size"],
+        realms=row["realms"],
+        users=sum(item.active + item.revoked for item in users_per_profile_detail),
+        active_users=sum(item.active for item in users_per_profile_detail),
         users_per_profile_detail=users_per_profile_detail,
     )
 
@@ -256,6 +426,10 @@ class PGOrganizationComponent(BaseOrganizationComponent):
     def __init__(self, dbh: PGHandler, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
         self.dbh = dbh
+        self._auth_cache: AuthenticationCache | None = None
+
+    def register_components(self, auth_cache: AuthenticationCache, **other_components: Any) -> None:
+        self._auth_cache = auth_cache
 
     async def create(
         self,
@@ -389,7 +563,6 @@ class PGOrganizationComponent(BaseOrganizationComponent):
         id: OrganizationID,
         at: DateTime | None = None,
     ) -> OrganizationStats:
-        at = at or DateTime.now()
         async with self.dbh.pool.acquire() as conn:
             stats = await _organization_stats(conn, id, at)
             if not stats:
@@ -398,18 +571,61 @@ class PGOrganizationComponent(BaseOrganizationComponent):
 
     async def server_stats(
         self, at: DateTime | None = None
-    ) -> dict[OrganizationID, OrganizationStats]:
-        at = at or DateTime.now()
-        results = {}
+    ) -> AsyncIterator[Tuple[OrganizationID, OrganizationStats]]:
+        # Organizations are fetched by batches (keyset pagination on their ID),
+        # the connection being released while the caller consumes each batch
+        after = ""
+        while True:
+            batch = []
+            async with self.dbh.pool.acquire() as conn:
+                if at is None:
+                    rows = await conn.fetch(
+                        *_q_get_server_stats(after=after, limit=SERVER_STATS_BATCH_SIZE)
+                    )
+                    for row in rows:
+                        after = row["organization_id"]
+                        batch.append((OrganizationID(after), _organization_stats_from_row(row)))
 
-        async with self.dbh.pool.acquire() as conn, conn.transaction():
-            for org in await conn.fetch(*_q_get_organizations()):
-                org_id = OrganizationID(org["id"])
-                org_stats = await _organization_stats(conn, org_id, at)
-                if org_stats:
-                    results[org_id] = org_stats
+                else:
+                    rows = await conn.fetch(
+                        *_q_get_organizations(after=after, limit=SERVER_STATS_BATCH_SIZE)
+                    )
+                    for row in rows:
+                        after = row["id"]
+                        org_id = OrganizationID(after)
+                        org_stats = await _organization_stats(conn, org_id, at)
+                        if org_stats:
+                            batch.append((org_id, org_stats))
+
+            for item in batch:
+                yield item
+            if len(rows) < SERVER_STATS_BATCH_SIZE:
+                break
+
+    async def run_stats_roll_up(
+        self, task_status: trio_typing.TaskStatus[None] = trio.TASK_STATUS_IGNORED
+    ) -> None:
+        task_status.started()
+        while True:
+            try:
+                await self.roll_up_stats()
+            except PostgresError as exc:
+                logger.warning("Cannot roll up the organization stats", exc_info=exc)
+            await trio.sleep(ORGANIZATION_STATS_ROLL_UP_INTERVAL)
 
-        return results
+    async def roll_up_stats(self) -> None:
+        """
+        Roll the organization stats deltas up into the current and daily stats,
+        this is only needed to keep the deltas (which are summed on each stats
+        request) small, and is safe to run concurrently.
+        """
+        while True:
+            async with self.dbh.pool.acquire() as conn:
+                count = await conn.fetchval(
+                    *_q_roll_up_stats(limit=ORGANIZATION_STATS_ROLL_UP_BATCH_SIZE)
+                )
+            if count < ORGANIZATION_STATS_ROLL_UP_BATCH_SIZE:
+                break
 
     async def update(
         self,
@@ -464,3 +680,8 @@ class PGOrganizationComponent(BaseOrganizationComponent):
 
             if with_is_expired and is_expired:
                 await send_signal(conn, BackendEventOrganizationExpired(organization_id=id))
+
+        # Invalidate once the transaction is committed, otherwise a concurrent
+        # lookup could put back the outdated organization in cache
+        assert self._auth_cache is not None
+        self._auth_cache.invalidate_organization(id)
@@ -0,0 +1,179 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+from typing import Dict, Union
+
+import trio
+import trio_typing
+from structlog import get_logger
+
+from parsec._parsec import BlockID, OrganizationID
+from parsec.backend.block import BlockStoreError
+from parsec.backend.blockstore import BaseBlockStoreComponent
+from parsec.backend.cached_blockstore import CachedBlockStoreComponent
+from parsec.backend.postgresql.block import get_blocks_batch
+from parsec.backend.postgresql.handler import PGHandler
+from parsec.backend.raid1_blockstore import RAID1BlockStoreComponent
+from parsec.backend.raid5_blockstore import RAID5BlockStoreComponent
+from parsec.backend.raidec_blockstore import RAIDECBlockStoreComponent
+
+logger = get_logger()
+
+
+RAID_SCRUB_BATCH_SIZE = 100
+# Minimal I/O (in bytes) accounted for each scrubbed block, so that tiny blocks
+# don't end up flooding the nodes with requests
+RAID_SCRUB_MIN_IO_PER_BLOCK = 64 * 1024
+# Delay (in seconds) between the end of a scrub pass and the start of the next one
+RAID_SCRUB_PASS_INTERVAL = 24 * 3600
+# Delay (in seconds) before retrying when the blocks cannot be retrieved
+# (e.g. the database is not available)
+RAID_SCRUB_DB_RETRY_DELAY = 60
+
+
+RAIDBlockStoreComponent = Union[
+    RAID1BlockStoreComponent, RAID5BlockStoreComponent, RAIDECBlockStoreComponent
+]
+
+
+def get_raid_blockstore(blockstore: BaseBlockStoreComponent) -> RAIDBlockStoreComponent | None:
+    if isinstance(blockstore, CachedBlockStoreComponent):
+        blockstore = blockstore.blockstore
+    if isinstance(
+        blockstore,
+        (RAID1BlockStoreComponent, RAID5BlockStoreComponent, RAIDECBlockStoreComponent),
+    ):
+        return blockstore
+    return None
+
+
+class PGRAIDScrubber:
+    """
+    Go through all the blocks (in `_id` order) to repair the ones missing from some
+    nodes of the RAID blockstore, typically created while a node was failing with
+    `partial_create_ok`.
+
+    Blocks are scrubbed one at a time, and the scrubber sleeps after each of them
+    so that the data read from and written to the nodes stays under `io_budget`
+    bytes per second.
+
+    The scrubber runs along with the server, so errors are only logged: a block
+    that cannot be scrubbed is skipped, and a batch of blocks that cannot be
+    retrieved is retried later.
+    """
+
+    def __init__(
+        self,
+        dbh: PGHandler,
+        blockstore: RAIDBlockStoreComponent,
+        io_budget: int,
+        pass_interval: float = RAID_SCRUB_PASS_INTERVAL,
+    ):
+        assert io_budget > 0
+        self.dbh = dbh
+        self.blockstore = blockstore
+        self.io_budget = io_budget
+        self.pass_interval = pass_interval
+        self._logger = logger.bind(io_budget=io_budget)
+        # `_id` of the last block scrubbed by the current pass
+        self.last_id = 0
+        self.passes = 0
+        self.scrubbed_blocks = 0
+        self.read_bytes = 0
+        self.written_bytes = 0
+        self.repaired_nodes = 0
+        self.repair_failures = 0
+        self.inconsistent_nodes = 0
+        self.size_mismatches = 0
+        self.unrecoverable_blocks = 0
+        self.scrub_errors = 0
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "last_id": self.last_id,
+            "passes": self.passes,
+            "scrubbed_blocks": self.scrubbed_blocks,
+            "read_bytes": self.read_bytes,
+            "written_bytes": self.written_bytes,
+            "repaired_nodes": self.repaired_nodes,
+            "repair_failures": self.repair_failures,
+            "inconsistent_nodes": self.inconsistent_nodes,
+            "size_mismatches": self.size_mismatches,
+            "unrecoverable_blocks": self.unrecoverable_blocks,
+            "scrub_errors": self.scrub_errors,
+        }
+
+    async def run(
+        self, task_status: trio_typing.TaskStatus[None] = trio.TASK_STATUS_IGNORED
+    ) -> None:
+        task_status.started()
+        while True:
+            await self.scrub_pass()
+            await trio.sleep(self.pass_interval)
+
+    async def scrub_pass(self) -> None:
+        self.last_id = 0
+        while True:
+            try:
+                async with self.dbh.pool.acquire() as conn:
+                    rows = await get_blocks_batch(conn, self.last_id, RAID_SCRUB_BATCH_SIZE)
+            except Exception as exc:
+                self._logger.warning("Cannot retrieve the blocks to scrub", exc_info=exc)
+                await trio.sleep(RAID_SCRUB_DB_RETRY_DELAY)
+                continue
+
+            for row in rows:
+                await self.scrub_block(
+                    OrganizationID(row["organization_id"]),
+                    BlockID.from_hex(row["block_id"]),
+                    row["size"],
+                )
+                self.last_id = row["_id"]
+            if len(rows) < RAID_SCRUB_BATCH_SIZE:
+                break
+
+        self.passes += 1
+        self._logger.info("RAID scrub pass done", **self.stats())
+
+    async def scrub_block(
+        self, organization_id: OrganizationID, block_id: BlockID, size: int
+    ) -> None:
+        log = self._logger.bind(organization_id=organization_id.str, block_id=block_id.hex)
+        try:
+            result = await self.blockstore.scrub(organization_id, block_id)
+        except BlockStoreError as exc:
+            self.unrecoverable_blocks += 1
+            log.warning("RAID scrub: block cannot be rebuilt", exc_info=exc)
+            io = size
+        except Exception as exc:
+            self.scrub_errors += 1
+            log.exception("RAID scrub: unexpected error", exc_info=exc)
+            io = size
+        else:
+            self.scrubbed_blocks += 1
+            self.read_bytes += result.read_bytes
+            self.written_bytes += result.written_bytes
+            self.repaired_nodes += len(result.missing_nodes) - len(result.repair_failed_nodes)
+            self.repair_failures += len(result.repair_failed_nodes)
+            self.inconsistent_nodes += len(result.inconsistent_nodes)
+            if result.missing_nodes:
+                log.warning(
+                    "RAID scrub: block missing from nodes",
+                    missing_nodes=result.missing_nodes,
+                    repair_failed_nodes=result.repair_failed_nodes,
+                )
+            if result.inconsistent_nodes:
+                log.warning(
+                    "RAID scrub: nodes data doesn't match the rebuilt block",
+                    inconsistent_nodes=result.inconsistent_nodes,
+                )
+            if result.block_size != size:
+                self.size_mismatches += 1
+                log.warning(
+                    "RAID scrub: block size mismatch",
+                    expected_size=size,
+                    block_size=result.block_size,
+                )
+            io = result.read_bytes + result.written_bytes
+
+        await trio.sleep(max(io, RAID_SCRUB_MIN_IO_PER_BLOCK) / self.io_budget)
@@ -8,6 +8,7 @@ from parsec.backend.postgresql.handler import send_signal
 from parsec.backend.postgresql.utils import (
     Q,
     q_device_internal_id,
+    q_increment_organization_stats,
     q_organization_internal_id,
     q_user_internal_id,
     query,
@@ -93,6 +94,11 @@ async def query_create(
 
     await conn.execute(*_q_insert_realm_encryption_revision(_id=realm_internal_id))
 
+    # The realm creation date is the date of its first role certification
+    await q_increment_organization_stats(
+        conn, organization_id, self_granted_role.granted_on, realms=1
+    )
+
     await send_signal(
         conn,
         BackendEventRealmRolesUpdated(
@@ -25,6 +25,7 @@ from parsec.backend.postgresql.utils import (
     q_realm,
     q_realm_internal_id,
     q_user,
+    q_vlob_encryption_revision_internal_id,
     query,
 )
 from parsec.backend.realm import (
@@ -157,14 +158,28 @@ WHERE
 )
 
 
+# The number of atoms to reencrypt is fixed from now on given the realm is in
+# maintenance, so it is counted once here (see `query_maintenance_save_reencryption_batch`)
 _q_query_start_reencryption_maintenance_update_vlob_encryption_revision = Q(
     f"""
 INSERT INTO vlob_encryption_revision(
     realm,
-    encryption_revision
+    encryption_revision,
+    reencryption_total
 ) SELECT
     { q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id") },
-    $encryption_revision
+    $encryption_revision,
+    (
+        SELECT COUNT(*)
+        FROM vlob_atom
+        WHERE vlob_encryption_revision = {
+            q_vlob_encryption_revision_internal_id(
+                organization_id="$organization_id",
+                realm_id="$realm_id",
+                encryption_revision="$encryption_revision - 1",
+            )
+        }
+    )
 """
 )
 
@@ -229,21 +244,15 @@ async def query_start_reencryption_maintenance(
 
 _query_finish_reencryption_maintenance_get_info = Q(
     f"""
-WITH cte_encryption_revisions AS (
-    SELECT
-        _id,
-        encryption_revision
-    FROM vlob_encryption_revision
-    WHERE
-        realm = { q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id") }
-        AND (encryption_revision = $encryption_revision OR encryption_revision = $encryption_revision - 1)
-)
-SELECT encryption_revision, COUNT(*) as count
-FROM vlob_atom
-INNER JOIN cte_encryption_revisions
-ON cte_encryption_revisions._id = vlob_atom.vlob_encryption_revision
-GROUP BY encryption_revision
-ORDER BY encryption_revision
+SELECT reencryption_total, reencryption_done
+FROM vlob_encryption_revision
+WHERE _id = {
+    q_vlob_encryption_revision_internal_id(
+        organization_id="$organization_id",
+        realm_id="$realm_id",
+        encryption_revision="$encryption_revision",
+    )
+}
 """
 )
 
@@ -280,22 +289,15 @@ async def query_finish_reencryption_maintenance(
         raise RealmEncryptionRevisionError("Invalid encryption revision")
 
     # Test reencryption operations are over
-    rep = await conn.fetch(
+    rep = await conn.fetchrow(
         *_query_finish_reencryption_maintenance_get_info(
             organization_id=organization_id.str,
             realm_id=realm_id,
             encryption_revision=encryption_revision,
         )
     )
-
-    try:
-        previous, current = rep
-    except ValueError:
-        raise RealmMaintenanceError("Reencryption operations are not over")
-    assert previous["encryption_revision"] == encryption_revision - 1
-    assert current["encryption_revision"] == encryption_revision
-    assert previous["count"] >= current["count"]
-    if previous["count"] != current["count"]:
+    assert rep["reencryption_total"] >= rep["reencryption_done"]
+    if rep["reencryption_total"] != rep["reencryption_done"]:
         raise RealmMaintenanceError("Reencryption operations are not over")
 
     await conn.execute(
@@ -1,7 +1,7 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
-from typing import Any, List, Tuple
+from typing import TYPE_CHECKING, Any, List, Tuple
 
 from parsec._parsec import DateTime, DeviceID, OrganizationID, UserID
 from parsec.backend.postgresql.handler import PGHandler
@@ -26,11 +26,18 @@ from parsec.backend.user import (
     User,
 )
 
+if TYPE_CHECKING:
+    from parsec.backend.auth_cache import AuthenticationCache
+
 
 class PGUserComponent(BaseUserComponent):
     def __init__(self, dbh: PGHandler, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
         self.dbh = dbh
+        self._auth_cache: AuthenticationCache | None = None
+
+    def register_components(self, auth_cache: AuthenticationCache, **other_components: Any) -> None:
+        self._auth_cache = auth_cache
 
     async def create_user(
         self, organization_id: OrganizationID, user: User, first_device: Device
@@ -103,7 +110,7 @@ class PGUserComponent(BaseUserComponent):
         revoked_on: DateTime | None = None,
     ) -> None:
         async with self.dbh.pool.acquire() as conn:
-            return await query_revoke_user(
+            await query_revoke_user(
                 conn,
                 organization_id,
                 user_id,
@@ -111,6 +118,10 @@ class PGUserComponent(BaseUserComponent):
                 revoked_user_certifier,
                 revoked_on,
             )
+        # Invalidate once the transaction is committed, otherwise a concurrent
+        # lookup could put back the outdated user in cache
+        assert self._auth_cache is not None
+        self._auth_cache.invalidate_user(organization_id, user_id)
 
     async def dump_users(self, organization_id: OrganizationID) -> Tuple[List[User], List[Device]]:
         async with self.dbh.pool.acquire() as conn:
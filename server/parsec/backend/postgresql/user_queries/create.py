@@ -12,8 +12,10 @@ from parsec._parsec import (
 )
 from parsec.backend.postgresql.utils import (
     Q,
+    organization_stats_users_counter,
     q_device_internal_id,
     q_human_internal_id,
+    q_increment_organization_stats,
     q_organization_internal_id,
     q_user_internal_id,
     query,
@@ -291,6 +293,13 @@ async def q_create_user(
 
     await _create_device(conn, organization_id, first_device, first_device=True)
 
+    await q_increment_organization_stats(
+        conn,
+        organization_id,
+        user.created_on,
+        **{organization_stats_users_counter(user.profile, revoked=False): 1},
+    )
+
 
 @query(in_transaction=True)
 async def query_create_user(
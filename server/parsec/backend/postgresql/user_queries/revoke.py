@@ -9,12 +9,15 @@ from parsec._parsec import (
     DeviceID,
     OrganizationID,
     UserID,
+    UserProfile,
 )
 from parsec.backend.postgresql.handler import send_signal
 from parsec.backend.postgresql.user_queries.create import q_take_user_device_write_lock
 from parsec.backend.postgresql.utils import (
     Q,
+    organization_stats_users_counter,
     q_device_internal_id,
+    q_increment_organization_stats,
     q_organization_internal_id,
     q_user,
     query,
@@ -31,6 +34,7 @@ WHERE
     organization = { q_organization_internal_id("$organization_id") }
     AND user_id = $user_id
     AND revoked_on IS NULL
+RETURNING profile
 """
 )
 
@@ -49,18 +53,19 @@ async def query_revoke_user(
     revoked_user_certifier: DeviceID,
     revoked_on: DateTime | None = None,
 ) -> None:
+    revoked_on = revoked_on or DateTime.now()
     await q_take_user_device_write_lock(conn, organization_id)
-    result = await conn.execute(
+    revoked = await conn.fetchrow(
         *_q_revoke_user(
             organization_id=organization_id.str,
             user_id=user_id.str,
             revoked_user_certificate=revoked_user_certificate,
             revoked_user_certifier=revoked_user_certifier.str,
-            revoked_on=revoked_on or DateTime.now(),
+            revoked_on=revoked_on,
         )
     )
 
-    if result != "UPDATE 1":
+    if not revoked:
         # TODO: avoid having to do another query to find the error
         err_result = await conn.fetchrow(
             *_q_revoke_user_error(organization_id=organization_id.str, user_id=user_id.str)
@@ -72,8 +77,18 @@ async def query_revoke_user(
             raise UserAlreadyRevokedError()
 
         else:
-            raise UserError(f"Update error: {result}")
+            raise UserError("Update error")
     else:
+        profile = UserProfile.from_str(revoked["profile"])
+        await q_increment_organization_stats(
+            conn,
+            organization_id,
+            revoked_on,
+            **{
+                organization_stats_users_counter(profile, revoked=False): -1,
+                organization_stats_users_counter(profile, revoked=True): 1,
+            },
+        )
         await send_signal(
             conn,
             BackendEventUserUpdatedOrRevoked(
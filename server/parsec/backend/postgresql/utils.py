@@ -2,22 +2,60 @@
 from __future__ import annotations
 
 import re
-from functools import wraps
-from typing import Any, Awaitable, Callable, Dict, List, Tuple, TypeVar
+import sys
+from functools import lru_cache, wraps
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple, TypeVar
 
+import attr
 import triopg
 from typing_extensions import Concatenate, ParamSpec
 
+from parsec._parsec import DateTime, OrganizationID, UserProfile
+
 T = TypeVar("T")
 P = ParamSpec("P")
 
 
+@attr.s(slots=True, auto_attribs=True)
+class QueryStats:
+    calls: int = 0
+    rows: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+    def record(self, elapsed: float, rows: int) -> None:
+        self.calls += 1
+        self.rows += rows
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+
+# Queries by stripped SQL, this is how a connection retrieves the `Q` a statement
+# has been generated from (see `PGConnection`)
+_QUERIES: Dict[str, Q] = {}
+
+
+def get_query(sql: str) -> Q | None:
+    return _QUERIES.get(sql)
+
+
+def queries_stats() -> List[Dict[str, Any]]:
+    """
+    Stats of the queries executed so far, most time consuming first
+    """
+    stats = [{"name": q.name, **attr.asdict(q.stats)} for q in _QUERIES.values() if q.stats.calls]
+    return sorted(stats, key=lambda item: item["total_time"], reverse=True)
+
+
 class Q:
     """
     Dead simple SQL query composition framework (◠﹏◠)
+
+    The generated statements are prepared once per pooled connection, and their
+    executions are accounted in `stats` (see `PGConnection`).
     """
 
-    def __init__(self, src: str, **kwargs: Any):
+    def __init__(self, src: str, name: str | None = None, **kwargs: Any):
         # retrieve variables
         variables: Dict[str, str] = {}
         for candidate in re.findall(r"\$([a-zA-Z0-9_]+)", src):
@@ -37,10 +75,34 @@ class Q:
         self._sql = src
         self._stripped_sql = " ".join([x.strip() for x in src.split()])
 
+        # Name is resolved lazily given the module is still being imported
+        self._name = name
+        caller = sys._getframe(1)
+        self._module: str = caller.f_globals.get("__name__", "")
+        self._factory = caller.f_code.co_name
+        self.stats = QueryStats()
+        _QUERIES.setdefault(self._stripped_sql, self)
+
     @property
     def sql(self) -> str:
         return self._sql
 
+    @property
+    def name(self) -> str:
+        """
+        Explicit name if any, otherwise the module variable the query is stored in
+        (or the factory function that generated it)
+        """
+        if self._name is None:
+            name = self._factory
+            module = sys.modules.get(self._module)
+            for key, value in vars(module).items() if module else ():
+                if value is self:
+                    name = key
+                    break
+            self._name = f"{self._module}.{name}"
+        return self._name
+
     def __call__(self, **kwargs: Any) -> List[Any]:
         if kwargs.keys() != self._variables.keys():
             missing = self._variables.keys() - kwargs.keys()
@@ -70,6 +132,37 @@ def q_organization_internal_id(organization_id: str, **kwargs: Any) -> str:
     return q_organization(organization_id=organization_id, select="_id", **kwargs)
 
 
+_q_get_organization_internal_id = Q(
+    "SELECT _id FROM organization WHERE organization_id = $organization_id"
+)
+
+
+async def get_organization_internal_id(
+    conn: triopg._triopg.TrioConnectionProxy, organization_id: OrganizationID
+) -> int | None:
+    """
+    Organization internal ID never changes once the organization is created (creating
+    again a not bootstrapped organization updates the existing row), hence it is
+    cached by the pooled connections (see `PGConnection`) instead of being looked up
+    by a subquery in each statement.
+
+    Returns: the internal ID, or `None` if the organization doesn't exist
+    """
+    cache: Dict[OrganizationID, int] | None = getattr(conn, "organization_internal_ids", None)
+    if cache is not None:
+        try:
+            return cache[organization_id]
+        except KeyError:
+            pass
+
+    internal_id = await conn.fetchval(
+        *_q_get_organization_internal_id(organization_id=organization_id.str)
+    )
+    if cache is not None and internal_id is not None:
+        cache[organization_id] = internal_id
+    return internal_id
+
+
 def _table_q_factory(
     table: str, public_id_field: str
 ) -> Tuple[Callable[..., str], Callable[..., str]]:
@@ -229,6 +322,93 @@ COALESCE(
 """
 
 
+def q_day(timestamp: str) -> str:
+    """
+    Day (in UTC) of a timestamp, as used by `organization_daily_stats`
+    """
+    return f"((({timestamp})::TIMESTAMPTZ AT TIME ZONE 'UTC')::DATE)"
+
+
+def q_day_start(timestamp: str) -> str:
+    return f"(DATE_TRUNC('day', ({timestamp})::TIMESTAMPTZ AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')"
+
+
+def organization_stats_users_counter(profile: UserProfile, revoked: bool) -> str:
+    return f"{profile.str.lower()}_users_{'revoked' if revoked else 'active'}"
+
+
+ORGANIZATION_STATS_COUNTERS = (
+    "data_size",
+    "metadata_size",
+    "realms",
+    *(
+        organization_stats_users_counter(profile, revoked)
+        for profile in UserProfile.VALUES
+        for revoked in (False, True)
+    ),
+)
+
+
+def q_increment_organization_stats_ctes(increments: str, counters: Iterable[str]) -> str:
+    """
+    CTE appending the `counters` provided by the `increments` CTE (along with the
+    `organization` internal ID and the `day` of the change) to the organization
+    stats deltas, later rolled up into the current and daily stats.
+
+    Note data-modifying CTEs are always executed, even if not referenced by the
+    main statement.
+    """
+    counters = tuple(counters)
+    assert counters and set(counters) <= set(ORGANIZATION_STATS_COUNTERS)
+    columns = ", ".join(counters)
+    sums = ", ".join(f"SUM({counter})" for counter in counters)
+
+    return f"""
+cte_increment_organization_stats AS (
+    INSERT INTO organization_stats_delta (organization, day, {columns})
+    SELECT organization, day, {sums}
+    FROM {increments}
+    GROUP BY organization, day
+)
+"""
+
+
+@lru_cache()
+def _q_increment_organization_stats_factory(counters: Tuple[str, ...]) -> Q:
+    return Q(
+        f"""
+WITH cte_increments AS (
+    SELECT
+        $organization::INTEGER AS organization,
+        { q_day("$on") } AS day,
+        { ", ".join(f"${counter}::BIGINT AS {counter}" for counter in counters) }
+),
+{ q_increment_organization_stats_ctes("cte_increments", counters) }
+SELECT TRUE
+"""
+    )
+
+
+async def q_increment_organization_stats(
+    conn: triopg._triopg.TrioConnectionProxy,
+    organization_id: OrganizationID,
+    on: DateTime,
+    **counters: int,
+) -> None:
+    """
+    Organization stats are maintained by the queries modifying the counted items,
+    `on` being the date the change has to be accounted for (e.g. the creation
+    date of the item).
+
+    The change is only appended to `organization_stats_delta` (hence concurrent
+    transactions never wait for each other here), the deltas being rolled up
+    into the organization stats by `PGOrganizationComponent.roll_up_stats`.
+    """
+    organization = await get_organization_internal_id(conn, organization_id)
+    q = _q_increment_organization_stats_factory(tuple(sorted(counters)))
+    await conn.execute(*q(organization=organization, on=on, **counters))
+
+
 def query(
     in_transaction: bool = False,
 ) -> Callable[
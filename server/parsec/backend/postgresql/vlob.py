@@ -7,7 +7,7 @@ import triopg
 
 from parsec._parsec import DateTime, DeviceID, OrganizationID, SequesterServiceID, VlobID
 from parsec.backend.organization import SequesterAuthority
-from parsec.backend.postgresql.handler import PGHandler, retry_on_unique_violation
+from parsec.backend.postgresql.handler import PGHandler
 from parsec.backend.postgresql.sequester import get_sequester_authority, get_sequester_services
 from parsec.backend.postgresql.vlob_queries import (
     query_create,
@@ -20,6 +20,7 @@ from parsec.backend.postgresql.vlob_queries import (
 from parsec.backend.sequester import BaseSequesterService, SequesterDisabledError
 from parsec.backend.vlob import (
     BaseVlobComponent,
+    VlobNotAvailableError,
     VlobSequesterDisabledError,
     VlobSequesterServiceInconsistencyError,
     extract_sequestered_data_and_proceed_webhook,
@@ -116,7 +117,6 @@ class PGVlobComponent(BaseVlobComponent):
 
         return sequestered_data
 
-    @retry_on_unique_violation
     async def create(
         self,
         organization_id: OrganizationID,
@@ -167,7 +167,19 @@ class PGVlobComponent(BaseVlobComponent):
         #     conn, organization_id, author, encryption_revision, vlob_id, version, timestamp
         # )
 
-    @retry_on_unique_violation
+    async def read_batch(
+        self,
+        organization_id: OrganizationID,
+        author: DeviceID,
+        encryption_revision: int,
+        items: List[Tuple[VlobID, int | None, DateTime | None]],
+    ) -> Tuple[List[Tuple[VlobID, int, bytes, DeviceID, DateTime, int]], List[VlobID]]:
+        # TODO: `query_read_batch` cannot be used until the certificate index is
+        # stored (just like for `read`), reject the command meanwhile
+        raise VlobNotAvailableError("Batch read is not available with PostgreSQL")
+        # async with self.dbh.pool.acquire() as conn:
+        # return await query_read_batch(conn, organization_id, author, encryption_revision, items)
+
     async def update(
         self,
         organization_id: OrganizationID,
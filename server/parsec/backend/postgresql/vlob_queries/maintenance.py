@@ -8,132 +8,137 @@ import triopg
 from parsec._parsec import DeviceID, OrganizationID, VlobID
 from parsec.backend.postgresql.utils import (
     Q,
-    q_organization_internal_id,
+    q_day,
+    q_increment_organization_stats_ctes,
     q_vlob_encryption_revision_internal_id,
     query,
 )
-from parsec.backend.postgresql.vlob_queries.utils import _check_realm, _check_realm_access
-from parsec.backend.realm import RealmRole
-from parsec.backend.utils import OperationKind
+from parsec.backend.postgresql.vlob_queries.utils import _check_realm_and_maintenance_access
+
+_sql_previous_revision = q_vlob_encryption_revision_internal_id(
+    organization_id="$organization_id",
+    realm_id="$realm_id",
+    encryption_revision="$encryption_revision - 1",
+)
+_sql_current_revision = q_vlob_encryption_revision_internal_id(
+    organization_id="$organization_id",
+    realm_id="$realm_id",
+    encryption_revision="$encryption_revision",
+)
+
+# Atoms of the previous revision not reencrypted yet, in `_id` order. The scan
+# starts from the revision's reencryption marker (i.e. the atoms known to be
+# already reencrypted are skipped) so it costs O(batch size) instead of O(realm size).
+_sql_atoms_to_reencrypt = f"""
+FROM vlob_atom AS previous
+WHERE
+    previous.vlob_encryption_revision = { _sql_previous_revision }
+    AND previous._id > (
+        SELECT reencryption_marker
+        FROM vlob_encryption_revision
+        WHERE _id = { _sql_current_revision }
+    )
+    AND NOT EXISTS(
+        SELECT TRUE
+        FROM vlob_atom AS reencrypted
+        WHERE
+            reencrypted.vlob_encryption_revision = { _sql_current_revision }
+            AND reencrypted.vlob_id = previous.vlob_id
+            AND reencrypted.version = previous.version
+    )
+ORDER BY previous._id
+"""
+
 
 _q_maintenance_get_reencryption_batch = Q(
     f"""
-WITH cte_to_encrypt AS (
-    SELECT vlob_id, version, blob
-    FROM vlob_atom
-    WHERE vlob_encryption_revision = {
-        q_vlob_encryption_revision_internal_id(
-            organization_id="$organization_id",
-            realm_id="$realm_id",
-            encryption_revision="$encryption_revision - 1"
-        )
-    }
-),
-cte_encrypted AS (
-    SELECT vlob_id, version
-    FROM vlob_atom
-    WHERE vlob_encryption_revision = {
-        q_vlob_encryption_revision_internal_id(
-            organization_id="$organization_id",
-            realm_id="$realm_id",
-            encryption_revision="$encryption_revision"
-        )
-    }
-)
 SELECT
-    cte_to_encrypt.vlob_id,
-    cte_to_encrypt.version,
-    blob
-FROM cte_to_encrypt
-LEFT JOIN cte_encrypted
-ON cte_to_encrypt.vlob_id = cte_encrypted.vlob_id AND cte_to_encrypt.version = cte_encrypted.version
-WHERE cte_encrypted.vlob_id IS NULL
+    previous.vlob_id,
+    previous.version,
+    previous.blob
+{ _sql_atoms_to_reencrypt }
 LIMIT $size
 """
 )
 
 
-_q_maintenance_save_reencryption_batch = Q(
+# Move the marker up to the first atom not reencrypted yet (or the last atom if
+# the reencryption is done). Given the marker only goes forward, the atoms are
+# scanned only once during the whole reencryption.
+_q_maintenance_advance_reencryption_marker = Q(
     f"""
-INSERT INTO vlob_atom(
-    organization,
-    vlob_encryption_revision,
-    vlob_id,
-    version,
-    blob,
-    size,
-    author,
-    created_on,
-    deleted_on
+UPDATE vlob_encryption_revision
+SET reencryption_marker = COALESCE(
+    (
+        SELECT previous._id - 1
+        { _sql_atoms_to_reencrypt }
+        LIMIT 1
+    ),
+    (
+        SELECT MAX(_id)
+        FROM vlob_atom
+        WHERE vlob_encryption_revision = { _sql_previous_revision }
+    ),
+    0
 )
-SELECT
-    organization,
-    {
-        q_vlob_encryption_revision_internal_id(
-            organization_id="$organization_id",
-            realm_id="$realm_id",
-            encryption_revision="$encryption_revision",
-        )
-    },
-    $vlob_id,
-    $version,
-    $blob,
-    $blob_len,
-    author,
-    created_on,
-    deleted_on
-FROM vlob_atom
-WHERE
-    organization = { q_organization_internal_id("$organization_id") }
-    AND vlob_id = $vlob_id
-    AND version = $version
-ON CONFLICT DO NOTHING
+WHERE _id = { _sql_current_revision }
 """
 )
 
 
-_q_maintenance_save_reencryption_batch_get_stat = Q(
+# The whole batch is inserted in a single statement (items are provided as three
+# arrays of the same size). Items already saved or not part of the previous
+# revision are ignored, so only the inserted atoms are added to the progress (and
+# to the organization stats, reencrypted atoms keeping their creation date).
+_q_maintenance_save_reencryption_batch = Q(
     f"""
-SELECT (
-    SELECT COUNT(*)
-    FROM vlob_atom
-    WHERE vlob_encryption_revision = {
-        q_vlob_encryption_revision_internal_id(
-            organization_id="$organization_id",
-            realm_id="$realm_id",
-            encryption_revision="$encryption_revision - 1",
-        )
-    }
+WITH cte_inserted AS (
+    INSERT INTO vlob_atom(
+        organization,
+        vlob_encryption_revision,
+        vlob_id,
+        version,
+        blob,
+        size,
+        author,
+        created_on,
+        deleted_on
+    )
+    SELECT
+        previous.organization,
+        { _sql_current_revision },
+        item.vlob_id,
+        item.version,
+        item.blob,
+        OCTET_LENGTH(item.blob),
+        previous.author,
+        previous.created_on,
+        previous.deleted_on
+    FROM UNNEST($vlob_ids::UUID[], $versions::INTEGER[], $blobs::BYTEA[])
+        WITH ORDINALITY AS item(vlob_id, version, blob, position)
+    INNER JOIN vlob_atom AS previous
+    ON
+        previous.vlob_encryption_revision = { _sql_previous_revision }
+        AND previous.vlob_id = item.vlob_id
+        AND previous.version = item.version
+    -- In case of duplicated items, the first one wins
+    ORDER BY item.position
+    ON CONFLICT DO NOTHING
+    RETURNING organization, size, created_on
 ),
-(
-    SELECT COUNT(*)
-    FROM vlob_atom
-    WHERE vlob_encryption_revision = {
-        q_vlob_encryption_revision_internal_id(
-            organization_id="$organization_id",
-            realm_id="$realm_id",
-            encryption_revision="$encryption_revision",
-        )
-    }
-)
+cte_increments AS (
+    SELECT organization, { q_day("created_on") } AS day, size AS metadata_size
+    FROM cte_inserted
+),
+{ q_increment_organization_stats_ctes("cte_increments", ["metadata_size"]) }
+UPDATE vlob_encryption_revision
+SET reencryption_done = reencryption_done + (SELECT COUNT(*) FROM cte_inserted)
+WHERE _id = { _sql_current_revision }
+RETURNING reencryption_total, reencryption_done
 """
 )
 
 
-async def _check_realm_and_maintenance_access(
-    conn: triopg._triopg.TrioConnectionProxy,
-    organization_id: OrganizationID,
-    author: DeviceID,
-    realm_id: VlobID,
-    encryption_revision: int,
-) -> None:
-    await _check_realm(
-        conn, organization_id, realm_id, encryption_revision, OperationKind.MAINTENANCE
-    )
-    can_write_roles = (RealmRole.OWNER,)
-    await _check_realm_access(conn, organization_id, realm_id, author, can_write_roles)
-
-
 @query(in_transaction=True)
 async def query_maintenance_get_reencryption_batch(
     conn: triopg._triopg.TrioConnectionProxy,
@@ -169,25 +174,23 @@ async def query_maintenance_save_reencryption_batch(
     await _check_realm_and_maintenance_access(
         conn, organization_id, author, realm_id, encryption_revision
     )
-    for vlob_id, version, blob in batch:
-        await conn.execute(
-            *_q_maintenance_save_reencryption_batch(
-                organization_id=organization_id.str,
-                realm_id=realm_id,
-                vlob_id=vlob_id,
-                version=version,
-                encryption_revision=encryption_revision,
-                blob=blob,
-                blob_len=len(blob),
-            )
-        )
-
     rep = await conn.fetchrow(
-        *_q_maintenance_save_reencryption_batch_get_stat(
+        *_q_maintenance_save_reencryption_batch(
+            organization_id=organization_id.str,
+            realm_id=realm_id,
+            encryption_revision=encryption_revision,
+            vlob_ids=[vlob_id for vlob_id, _, _ in batch],
+            versions=[version for _, version, _ in batch],
+            blobs=[blob for _, _, blob in batch],
+        )
+    )
+    # Done in a separate statement to see the atoms inserted by the previous one
+    await conn.execute(
+        *_q_maintenance_advance_reencryption_marker(
             organization_id=organization_id.str,
             realm_id=realm_id,
             encryption_revision=encryption_revision,
         )
     )
 
-    return rep[0], rep[1]
+    return rep["reencryption_total"], rep["reencryption_done"]
@@ -1,7 +1,7 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 
 import triopg
 
@@ -14,20 +14,33 @@ from parsec.backend.postgresql.utils import (
     q_vlob_encryption_revision_internal_id,
     query,
 )
-from parsec.backend.postgresql.vlob_queries.utils import (
-    _check_realm_and_read_access,
-    _get_last_role_granted_on,
-    _get_realm_id_from_vlob_id,
-)
+from parsec.backend.postgresql.vlob_queries.utils import _check_realm_and_read_access
 from parsec.backend.vlob import VlobNotFoundError, VlobVersionError
 
+# Last time a role (possibly a revocation) has been granted to the vlob atom's author
+# on the vlob's realm, retrieved along with the atom to save a round-trip
+_sql_author_last_role_granted_on = """(
+    SELECT realm_user_role.certified_on
+    FROM realm_user_role
+    WHERE
+        realm_user_role.realm = (
+            SELECT realm
+            FROM vlob_encryption_revision
+            WHERE _id = vlob_atom.vlob_encryption_revision
+        )
+        AND realm_user_role.user_ = (SELECT user_ FROM device WHERE _id = vlob_atom.author)
+    ORDER BY realm_user_role.certified_on DESC
+    LIMIT 1
+)"""
+
 _q_read_data_without_timestamp = Q(
     f"""
 SELECT
     version,
     blob,
     { q_device(_id="author", select="device_id") } as author,
-    created_on
+    created_on,
+    { _sql_author_last_role_granted_on } as author_last_role_granted_on
 FROM vlob_atom
 WHERE
     vlob_encryption_revision = {
@@ -49,7 +62,8 @@ SELECT
     version,
     blob,
     { q_device(_id="author", select="device_id") } as author,
-    created_on
+    created_on,
+    { _sql_author_last_role_granted_on } as author_last_role_granted_on
 FROM vlob_atom
 WHERE
     vlob_encryption_revision = {
@@ -73,7 +87,8 @@ SELECT
     version,
     blob,
     { q_device(_id="author", select="device_id") } as author,
-    created_on
+    created_on,
+    { _sql_author_last_role_granted_on } as author_last_role_granted_on
 FROM vlob_atom
 WHERE
     vlob_encryption_revision = {
@@ -99,8 +114,9 @@ async def query_read(
     version: int | None = None,
     timestamp: DateTime | None = None,
 ) -> Tuple[int, bytes, DeviceID, DateTime, DateTime]:
-    realm_id = await _get_realm_id_from_vlob_id(conn, organization_id, vlob_id)
-    await _check_realm_and_read_access(conn, organization_id, author, realm_id, encryption_revision)
+    realm_id = await _check_realm_and_read_access(
+        conn, organization_id, author, encryption_revision, vlob_id=vlob_id
+    )
 
     if version is None:
         if timestamp is None:
@@ -112,7 +128,7 @@ async def query_read(
                     vlob_id=vlob_id,
                 )
             )
-            assert data  # _get_realm_id_from_vlob_id checks vlob presence
+            assert data  # _check_realm_and_read_access checks vlob presence
 
         else:
             data = await conn.fetchrow(
@@ -140,18 +156,127 @@ async def query_read(
         if not data:
             raise VlobVersionError()
 
-    version, blob, vlob_author, created_on = data
+    version, blob, vlob_author, created_on, author_last_role_granted_on = data
     assert isinstance(version, int)
     assert isinstance(blob, bytes)
+    assert isinstance(author_last_role_granted_on, DateTime)
     vlob_author = DeviceID(vlob_author)
 
-    author_last_role_granted_on = await _get_last_role_granted_on(
-        conn, organization_id, realm_id, vlob_author
-    )
-    assert isinstance(author_last_role_granted_on, DateTime)
     return version, blob, vlob_author, created_on, author_last_role_granted_on
 
 
+_q_get_realms_from_vlob_ids = Q(
+    f"""
+SELECT DISTINCT
+    vlob_atom.vlob_id,
+    realm.realm_id
+FROM vlob_atom
+INNER JOIN vlob_encryption_revision
+ON  vlob_atom.vlob_encryption_revision = vlob_encryption_revision._id
+INNER JOIN realm
+ON vlob_encryption_revision.realm = realm._id
+WHERE
+    vlob_atom.organization = { q_organization_internal_id("$organization_id") }
+    AND vlob_atom.vlob_id = ANY($vlob_ids::UUID[])
+"""
+)
+
+
+# Items are provided as three arrays of the same size (`NULL` meaning no
+# version/timestamp constraint), each item resolves to at most one atom
+_q_read_batch_data = Q(
+    f"""
+SELECT
+    item.position,
+    item.vlob_id,
+    atom.version,
+    atom.blob,
+    { q_device(_id="atom.author", select="device_id") } as author,
+    atom.created_on
+FROM UNNEST($vlob_ids::UUID[], $versions::INTEGER[], $timestamps::TIMESTAMPTZ[])
+    WITH ORDINALITY AS item(vlob_id, version, timestamp, position)
+INNER JOIN LATERAL (
+    SELECT
+        version,
+        blob,
+        author,
+        created_on
+    FROM vlob_atom
+    WHERE
+        vlob_encryption_revision = ANY(
+            SELECT vlob_encryption_revision._id
+            FROM vlob_encryption_revision
+            INNER JOIN realm ON vlob_encryption_revision.realm = realm._id
+            WHERE
+                realm.organization = { q_organization_internal_id("$organization_id") }
+                AND realm.realm_id = ANY($realm_ids::UUID[])
+                AND vlob_encryption_revision.encryption_revision = $encryption_revision
+        )
+        AND vlob_id = item.vlob_id
+        AND (item.version IS NULL OR version = item.version)
+        AND (item.timestamp IS NULL OR created_on <= item.timestamp)
+    ORDER BY version DESC
+    LIMIT 1
+) AS atom ON TRUE
+ORDER BY item.position
+"""
+)
+
+
+@query(in_transaction=True)
+async def query_read_batch(
+    conn: triopg._triopg.TrioConnectionProxy,
+    organization_id: OrganizationID,
+    author: DeviceID,
+    encryption_revision: int,
+    items: List[Tuple[VlobID, int | None, DateTime | None]],
+) -> Tuple[List[Tuple[VlobID, int, bytes, DeviceID, DateTime]], List[VlobID]]:
+    vlob_ids = [vlob_id for vlob_id, _, _ in items]
+    rows = await conn.fetch(
+        *_q_get_realms_from_vlob_ids(organization_id=organization_id.str, vlob_ids=vlob_ids)
+    )
+    realm_ids = {VlobID.from_hex(row["realm_id"]) for row in rows}
+
+    # Check each realm only once
+    for realm_id in realm_ids:
+        await _check_realm_and_read_access(
+            conn, organization_id, author, encryption_revision, realm_id=realm_id
+        )
+
+    rows = await conn.fetch(
+        *_q_read_batch_data(
+            organization_id=organization_id.str,
+            realm_ids=list(realm_ids),
+            encryption_revision=encryption_revision,
+            vlob_ids=vlob_ids,
+            versions=[version for _, version, _ in items],
+            timestamps=[timestamp for _, _, timestamp in items],
+        )
+    )
+
+    found = []
+    found_positions = set()
+    for row in rows:
+        found_positions.add(row["position"])
+        found.append(
+            (
+                VlobID.from_hex(row["vlob_id"]),
+                row["version"],
+                row["blob"],
+                DeviceID(row["author"]),
+                row["created_on"],
+            )
+        )
+    # Note `WITH ORDINALITY` positions start at 1
+    not_found = [
+        vlob_id
+        for position, (vlob_id, _, _) in enumerate(items, 1)
+        if position not in found_positions
+    ]
+
+    return found, not_found
+
+
 _q_poll_changes = Q(
     f"""
 SELECT
@@ -191,7 +316,7 @@ async def query_poll_changes(
     realm_id: VlobID,
     checkpoint: int,
 ) -> Tuple[int, Dict[VlobID, int]]:
-    await _check_realm_and_read_access(conn, organization_id, author, realm_id, None)
+    await _check_realm_and_read_access(conn, organization_id, author, None, realm_id=realm_id)
 
     ret = await conn.fetch(
         *_q_poll_changes(
@@ -213,8 +338,7 @@ async def query_list_versions(
     author: DeviceID,
     vlob_id: VlobID,
 ) -> Dict[int, Tuple[DateTime, DeviceID]]:
-    realm_id = await _get_realm_id_from_vlob_id(conn, organization_id, vlob_id)
-    await _check_realm_and_read_access(conn, organization_id, author, realm_id, None)
+    await _check_realm_and_read_access(conn, organization_id, author, None, vlob_id=vlob_id)
 
     rows = await conn.fetch(*_q_list_versions(organization_id=organization_id.str, vlob_id=vlob_id))
     assert rows
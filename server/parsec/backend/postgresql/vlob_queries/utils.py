@@ -1,19 +1,17 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
-from typing import Tuple
-
+import attr
 import triopg
 
 from parsec._parsec import DateTime, DeviceID, OrganizationID, VlobID
-from parsec.backend.postgresql.realm_queries.maintenance import RealmNotFoundError, get_realm_status
 from parsec.backend.postgresql.utils import (
     Q,
-    q_organization_internal_id,
+    get_organization_internal_id,
     q_realm_internal_id,
     q_user_internal_id,
 )
-from parsec.backend.realm import RealmRole
+from parsec.backend.realm import MaintenanceType, RealmRole
 from parsec.backend.utils import OperationKind
 from parsec.backend.vlob import (
     VlobAccessError,
@@ -25,22 +23,30 @@ from parsec.backend.vlob import (
     VlobRequireGreaterTimestampError,
 )
 
+_ALLOWED_ROLES = {
+    OperationKind.DATA_READ: (
+        RealmRole.OWNER,
+        RealmRole.MANAGER,
+        RealmRole.CONTRIBUTOR,
+        RealmRole.READER,
+    ),
+    OperationKind.DATA_WRITE: (RealmRole.OWNER, RealmRole.MANAGER, RealmRole.CONTRIBUTOR),
+    OperationKind.MAINTENANCE: (RealmRole.OWNER,),
+}
 
-async def _check_realm(
-    conn: triopg._triopg.TrioConnectionProxy,
-    organization_id: OrganizationID,
+
+def _check_realm_status(
     realm_id: VlobID,
     encryption_revision: int | None,
     operation_kind: OperationKind,
+    maintenance_type: MaintenanceType | None,
+    current_encryption_revision: int,
 ) -> None:
-    # Get the current realm status
-    try:
-        status = await get_realm_status(conn, organization_id, realm_id)
-    except RealmNotFoundError as exc:
-        raise VlobRealmNotFoundError(*exc.args) from exc
+    in_maintenance = maintenance_type is not None
+    in_reencryption = maintenance_type == MaintenanceType.REENCRYPTION
 
     # Special case of reading while in reencryption
-    if operation_kind == OperationKind.DATA_READ and status.in_reencryption:
+    if operation_kind == OperationKind.DATA_READ and in_reencryption:
         # Starting a reencryption maintenance bumps the encryption revision.
         # Hence if we are currently in reencryption maintenance, last encryption revision is not ready
         # to be used (it will be once the reencryption is over !).
@@ -50,148 +56,220 @@ async def _check_realm(
         # requests, which should also be allowed during a reencryption
 
         # The vlob is not available yet for the current revision
-        if encryption_revision is not None and encryption_revision == status.encryption_revision:
+        if encryption_revision is not None and encryption_revision == current_encryption_revision:
             raise VlobInMaintenanceError(f"Realm `{realm_id.hex}` is currently under maintenance")
 
         # The vlob is only available at the previous revision
         if (
             encryption_revision is not None
-            and encryption_revision != status.encryption_revision - 1
+            and encryption_revision != current_encryption_revision - 1
         ):
             raise VlobEncryptionRevisionError()
 
     # In all other cases
     else:
         # Access during maintenance is forbidden
-        if operation_kind != OperationKind.MAINTENANCE and status.in_maintenance:
+        if operation_kind != OperationKind.MAINTENANCE and in_maintenance:
             raise VlobInMaintenanceError("Data realm is currently under maintenance")
 
         # A maintenance state was expected
-        if operation_kind == OperationKind.MAINTENANCE and not status.in_maintenance:
+        if operation_kind == OperationKind.MAINTENANCE and not in_maintenance:
             raise VlobNotInMaintenanceError(f"Realm `{realm_id.hex}` not under maintenance")
 
         # Otherwise simply check that the revisions match
-        if encryption_revision is not None and status.encryption_revision != encryption_revision:
+        if encryption_revision is not None and current_encryption_revision != encryption_revision:
             raise VlobEncryptionRevisionError()
 
 
-_q_check_realm_access = Q(
-    f"""
-WITH cte_current_realm_roles AS (
-    SELECT DISTINCT ON(user_) user_, role, certified_on
-    FROM  realm_user_role
-    WHERE realm = { q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id") }
-    ORDER BY user_, certified_on DESC
-)
-SELECT role, certified_on
-FROM user_
-LEFT JOIN cte_current_realm_roles
-ON user_._id = cte_current_realm_roles.user_
-WHERE user_._id = { q_user_internal_id(organization_id="$organization_id", user_id="$user_id") }
+# Realm status and caller's current role are fetched together in a single
+# round-trip, the realm being identified either by its id or by one of its vlobs
+def _q_authorize_vlob_operation_factory(realm_internal_id: str) -> Q:
+    return Q(
+        f"""
+SELECT
+    realm._id,
+    realm.realm_id,
+    realm.encryption_revision,
+    realm.maintenance_type,
+    caller_role.user_,
+    caller_role.role,
+    caller_role.certified_on
+FROM realm
+LEFT JOIN LATERAL (
+    SELECT user_, role, certified_on
+    FROM realm_user_role
+    WHERE
+        realm_user_role.realm = realm._id
+        AND realm_user_role.user_ = {
+            q_user_internal_id(organization="$organization", user_id="$user_id")
+        }
+    ORDER BY certified_on DESC
+    LIMIT 1
+) AS caller_role ON TRUE
+WHERE realm._id = { realm_internal_id }
 """
+    )
+
+
+_q_authorize_vlob_operation_from_realm_id = _q_authorize_vlob_operation_factory(
+    q_realm_internal_id(organization="$organization", realm_id="$realm_id")
+)
+
+
+_q_authorize_vlob_operation_from_vlob_id = _q_authorize_vlob_operation_factory(
+    """(
+    SELECT vlob_encryption_revision.realm
+    FROM vlob_atom
+    INNER JOIN vlob_encryption_revision
+    ON vlob_atom.vlob_encryption_revision = vlob_encryption_revision._id
+    WHERE
+        vlob_atom.organization = $organization
+        AND vlob_atom.vlob_id = $vlob_id
+    LIMIT 1
+)"""
 )
 
 
-async def _check_realm_access(
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class VlobOperationAuthorization:
+    realm_id: VlobID
+    # Internal IDs resolved by the authorization, so that the following queries
+    # of the operation don't have to look them up again
+    organization_internal_id: int
+    realm_internal_id: int
+    # `None` if the author has no role in the realm
+    user_internal_id: int | None
+    role_granted_on: DateTime | None
+
+
+async def _authorize_vlob_operation(
     conn: triopg._triopg.TrioConnectionProxy,
     organization_id: OrganizationID,
-    realm_id: VlobID,
     author: DeviceID,
-    allowed_roles: Tuple[RealmRole, ...],
-) -> DateTime:
-    rep = await conn.fetchrow(
-        *_q_check_realm_access(
-            organization_id=organization_id.str, realm_id=realm_id, user_id=author.user_id.str
+    operation_kind: OperationKind,
+    encryption_revision: int | None,
+    realm_id: VlobID | None = None,
+    vlob_id: VlobID | None = None,
+) -> VlobOperationAuthorization:
+    """
+    Check the realm status and the author's role for the given operation.
+    The realm is identified either by `realm_id` or by `vlob_id`.
+
+    Raises:
+        VlobNotFoundError
+        VlobRealmNotFoundError
+        VlobAccessError
+        VlobInMaintenanceError
+        VlobNotInMaintenanceError
+        VlobEncryptionRevisionError
+    """
+    # Unknown organization (i.e. `NULL` internal ID) matches no realm
+    organization_internal_id = await get_organization_internal_id(conn, organization_id)
+    if vlob_id is not None:
+        rep = await conn.fetchrow(
+            *_q_authorize_vlob_operation_from_vlob_id(
+                organization=organization_internal_id,
+                user_id=author.user_id.str,
+                vlob_id=vlob_id,
+            )
         )
-    )
+        if not rep:
+            raise VlobNotFoundError(f"Vlob `{vlob_id.hex}` doesn't exist")
+    else:
+        assert realm_id is not None
+        rep = await conn.fetchrow(
+            *_q_authorize_vlob_operation_from_realm_id(
+                organization=organization_internal_id,
+                user_id=author.user_id.str,
+                realm_id=realm_id,
+            )
+        )
+        if not rep:
+            raise VlobRealmNotFoundError(f"Realm `{realm_id.hex}` doesn't exist")
+    assert organization_internal_id is not None
 
-    if not rep:
-        raise VlobNotFoundError(f"User `{author.user_id.str}` doesn't exist")
+    realm_id = VlobID.from_hex(rep["realm_id"])
+    _check_realm_status(
+        realm_id=realm_id,
+        encryption_revision=encryption_revision,
+        operation_kind=operation_kind,
+        maintenance_type=MaintenanceType.from_str(rep["maintenance_type"])
+        if rep["maintenance_type"]
+        else None,
+        current_encryption_revision=rep["encryption_revision"],
+    )
 
-    role = RealmRole.from_str(rep[0]) if rep[0] is not None else None
-    if role not in allowed_roles:
+    role = RealmRole.from_str(rep["role"]) if rep["role"] is not None else None
+    if role not in _ALLOWED_ROLES[operation_kind]:
         raise VlobAccessError()
 
-    role_granted_on = rep[1]
-    return role_granted_on
+    return VlobOperationAuthorization(
+        realm_id=realm_id,
+        organization_internal_id=organization_internal_id,
+        realm_internal_id=rep["_id"],
+        user_internal_id=rep["user_"],
+        role_granted_on=rep["certified_on"],
+    )
 
 
 async def _check_realm_and_read_access(
     conn: triopg._triopg.TrioConnectionProxy,
     organization_id: OrganizationID,
     author: DeviceID,
-    realm_id: VlobID,
     encryption_revision: int | None,
-) -> None:
-    await _check_realm(
-        conn, organization_id, realm_id, encryption_revision, OperationKind.DATA_READ
+    realm_id: VlobID | None = None,
+    vlob_id: VlobID | None = None,
+) -> VlobID:
+    authorization = await _authorize_vlob_operation(
+        conn,
+        organization_id,
+        author,
+        OperationKind.DATA_READ,
+        encryption_revision,
+        realm_id=realm_id,
+        vlob_id=vlob_id,
     )
-    can_read_roles = (RealmRole.OWNER, RealmRole.MANAGER, RealmRole.CONTRIBUTOR, RealmRole.READER)
-    await _check_realm_access(conn, organization_id, realm_id, author, can_read_roles)
+    return authorization.realm_id
 
 
 async def _check_realm_and_write_access(
     conn: triopg._triopg.TrioConnectionProxy,
     organization_id: OrganizationID,
     author: DeviceID,
-    realm_id: VlobID,
     encryption_revision: int | None,
     timestamp: DateTime,
-) -> None:
-    await _check_realm(
-        conn, organization_id, realm_id, encryption_revision, OperationKind.DATA_WRITE
-    )
-    can_write_roles = (RealmRole.OWNER, RealmRole.MANAGER, RealmRole.CONTRIBUTOR)
-    last_role_granted_on = await _check_realm_access(
-        conn, organization_id, realm_id, author, can_write_roles
+    realm_id: VlobID | None = None,
+    vlob_id: VlobID | None = None,
+) -> VlobOperationAuthorization:
+    authorization = await _authorize_vlob_operation(
+        conn,
+        organization_id,
+        author,
+        OperationKind.DATA_WRITE,
+        encryption_revision,
+        realm_id=realm_id,
+        vlob_id=vlob_id,
     )
     # Write operations should always occurs strictly after the last change of role for this user
+    last_role_granted_on = authorization.role_granted_on
+    assert last_role_granted_on is not None  # Role has been checked
     if last_role_granted_on >= timestamp:
         raise VlobRequireGreaterTimestampError(last_role_granted_on)
+    return authorization
 
 
-_q_get_realm_id_from_vlob_id = Q(
-    f"""
-SELECT
-    realm.realm_id
-FROM vlob_atom
-INNER JOIN vlob_encryption_revision
-ON  vlob_atom.vlob_encryption_revision = vlob_encryption_revision._id
-INNER JOIN realm
-ON vlob_encryption_revision.realm = realm._id
-WHERE vlob_atom._id = (
-    SELECT _id
-    FROM vlob_atom
-    WHERE
-        organization = { q_organization_internal_id("$organization_id") }
-        AND vlob_id = $vlob_id
-    LIMIT 1
-)
-LIMIT 1
-"""
-)
-
-
-async def _get_realm_id_from_vlob_id(
-    conn: triopg._triopg.TrioConnectionProxy, organization_id: OrganizationID, vlob_id: VlobID
-) -> VlobID:
-    realm_id_uuid = await conn.fetchval(
-        *_q_get_realm_id_from_vlob_id(organization_id=organization_id.str, vlob_id=vlob_id)
-    )
-    if not realm_id_uuid:
-        raise VlobNotFoundError(f"Vlob `{vlob_id.hex}` doesn't exist")
-    return VlobID.from_hex(realm_id_uuid)
-
-
-async def _get_last_role_granted_on(
+async def _check_realm_and_maintenance_access(
     conn: triopg._triopg.TrioConnectionProxy,
     organization_id: OrganizationID,
-    realm_id: VlobID,
     author: DeviceID,
-) -> DateTime | None:
-    rep = await conn.fetchrow(
-        *_q_check_realm_access(
-            organization_id=organization_id.str, realm_id=realm_id, user_id=author.user_id.str
-        )
+    realm_id: VlobID,
+    encryption_revision: int,
+) -> None:
+    await _authorize_vlob_operation(
+        conn,
+        organization_id,
+        author,
+        OperationKind.MAINTENANCE,
+        encryption_revision,
+        realm_id=realm_id,
     )
-    return None if rep is None else rep[1]
@@ -18,15 +18,13 @@ from parsec.backend.postgresql.handler import send_signal
 from parsec.backend.postgresql.utils import (
     Q,
     q_device_internal_id,
-    q_organization_internal_id,
-    q_realm_internal_id,
-    q_user_internal_id,
+    q_increment_organization_stats,
     q_vlob_encryption_revision_internal_id,
     query,
 )
 from parsec.backend.postgresql.vlob_queries.utils import (
+    VlobOperationAuthorization,
     _check_realm_and_write_access,
-    _get_realm_id_from_vlob_id,
 )
 from parsec.backend.vlob import (
     VlobAlreadyExistsError,
@@ -35,68 +33,57 @@ from parsec.backend.vlob import (
     VlobVersionError,
 )
 
+# Checkpoints are allocated from the realm row: concurrent writers on the same
+# realm wait for each other on the row lock (instead of computing the same
+# `MAX(index) + 1` and failing on the `UNIQUE(realm, index)` constraint)
 _q_vlob_updated = Q(
-    f"""
+    """
+WITH realm_checkpoint AS (
+    UPDATE realm
+    SET checkpoint = checkpoint + 1
+    WHERE _id = $realm
+    RETURNING _id, checkpoint
+)
 INSERT INTO realm_vlob_update (
 realm, index, vlob_atom
 )
-SELECT
-{ q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id") },
-(
-    SELECT COALESCE(MAX(index) + 1, 1)
-    FROM realm_vlob_update
-    WHERE realm = { q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id") }
-),
-$vlob_atom_internal_id
+SELECT _id, checkpoint, $vlob_atom_internal_id
+FROM realm_checkpoint
 RETURNING index
 """
 )
 
 
 _q_set_last_vlob_update = Q(
-    f"""
+    """
 INSERT INTO realm_user_change(realm, user_, last_role_change, last_vlob_update)
-VALUES (
-    { q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id") },
-    { q_user_internal_id(organization_id="$organization_id", user_id="$user_id") },
-    NULL,
-    $timestamp
-)
+VALUES ($realm, $user, NULL, $timestamp)
 ON CONFLICT (realm, user_)
-DO UPDATE SET last_vlob_update = (
-    SELECT GREATEST($timestamp, last_vlob_update)
-    FROM realm_user_change
-    WHERE realm={ q_realm_internal_id(organization_id="$organization_id", realm_id="$realm_id") }
-    AND user_={ q_user_internal_id(organization_id="$organization_id", user_id="$user_id") }
-    LIMIT 1
-)
+DO UPDATE SET last_vlob_update = GREATEST($timestamp, realm_user_change.last_vlob_update)
 """
 )
 
 
 async def _set_vlob_updated(
     conn: triopg._triopg.TrioConnectionProxy,
+    authorization: VlobOperationAuthorization,
     vlob_atom_internal_id: int,
     organization_id: OrganizationID,
     author: DeviceID,
-    realm_id: VlobID,
     src_id: VlobID,
     timestamp: DateTime,
     src_version: int = 1,
 ) -> None:
     index = await conn.fetchval(
         *_q_vlob_updated(
-            organization_id=organization_id.str,
-            realm_id=realm_id,
-            vlob_atom_internal_id=vlob_atom_internal_id,
+            realm=authorization.realm_internal_id, vlob_atom_internal_id=vlob_atom_internal_id
         )
     )
 
     await conn.execute(
         *_q_set_last_vlob_update(
-            organization_id=organization_id.str,
-            realm_id=realm_id,
-            user_id=author.user_id.str,
+            realm=authorization.realm_internal_id,
+            user=authorization.user_internal_id,
             timestamp=timestamp,
         )
     )
@@ -106,7 +93,7 @@ async def _set_vlob_updated(
         BackendEventRealmVlobsUpdated(
             organization_id=organization_id,
             author=author,
-            realm_id=realm_id,
+            realm_id=authorization.realm_id,
             checkpoint=index,
             src_id=src_id,
             src_version=src_version,
@@ -115,13 +102,13 @@ async def _set_vlob_updated(
 
 
 _q_get_vlob_version = Q(
-    f"""
+    """
 SELECT
     version,
     created_on
 FROM vlob_atom
 WHERE
-    organization = { q_organization_internal_id("$organization_id") }
+    organization = $organization
     AND vlob_id = $vlob_id
 ORDER BY version DESC LIMIT 1
 """
@@ -141,19 +128,17 @@ INSERT INTO vlob_atom (
     created_on
 )
 SELECT
-    { q_organization_internal_id(organization_id="$organization_id") },
+    $organization,
     {
         q_vlob_encryption_revision_internal_id(
-            organization_id="$organization_id",
-            realm_id="$realm_id",
-            encryption_revision="$encryption_revision"
+            realm="$realm", encryption_revision="$encryption_revision"
         )
     },
     $vlob_id,
     $version,
     $blob,
     $blob_len,
-    { q_device_internal_id(organization_id="$organization_id", device_id="$author") },
+    { q_device_internal_id(organization="$organization", device_id="$author") },
     $timestamp
 RETURNING _id
 """
@@ -172,13 +157,12 @@ async def query_update(
     blob: bytes,
     sequester_blob: Dict[SequesterServiceID, bytes] | None = None,
 ) -> None:
-    realm_id = await _get_realm_id_from_vlob_id(conn, organization_id, vlob_id)
-    await _check_realm_and_write_access(
-        conn, organization_id, author, realm_id, encryption_revision, timestamp
+    authorization = await _check_realm_and_write_access(
+        conn, organization_id, author, encryption_revision, timestamp, vlob_id=vlob_id
     )
 
     previous = await conn.fetchrow(
-        *_q_get_vlob_version(organization_id=organization_id.str, vlob_id=vlob_id)
+        *_q_get_vlob_version(organization=authorization.organization_internal_id, vlob_id=vlob_id)
     )
     if not previous:
         raise VlobNotFoundError(f"Vlob `{vlob_id.hex}` doesn't exist")
@@ -192,9 +176,9 @@ async def query_update(
     try:
         vlob_atom_internal_id = await conn.fetchval(
             *_q_insert_vlob_atom(
-                organization_id=organization_id.str,
+                organization=authorization.organization_internal_id,
                 author=author.str,
-                realm_id=realm_id,
+                realm=authorization.realm_internal_id,
                 encryption_revision=encryption_revision,
                 vlob_id=vlob_id,
                 blob=blob,
@@ -209,18 +193,26 @@ async def query_update(
         raise VlobVersionError()
 
     if sequester_blob:
-        for service_id, blob in sequester_blob.items():
+        for service_id, service_blob in sequester_blob.items():
             await conn.fetchval(
                 *_q_create_sequester_blob(
-                    organization_id=organization_id.str,
+                    organization=authorization.organization_internal_id,
                     service_id=service_id,
                     vlob_atom_internal_id=vlob_atom_internal_id,
-                    blob=blob,
+                    blob=service_blob,
                 )
             )
     await _set_vlob_updated(
-        conn, vlob_atom_internal_id, organization_id, author, realm_id, vlob_id, timestamp, version
+        conn,
+        authorization,
+        vlob_atom_internal_id,
+        organization_id,
+        author,
+        vlob_id,
+        timestamp,
+        version,
     )
+    await q_increment_organization_stats(conn, organization_id, timestamp, metadata_size=len(blob))
 
 
 _q_create = Q(
@@ -236,19 +228,17 @@ INSERT INTO vlob_atom (
     created_on
 )
 SELECT
-    { q_organization_internal_id("$organization_id") },
+    $organization,
     {
         q_vlob_encryption_revision_internal_id(
-            organization_id="$organization_id",
-            realm_id="$realm_id",
-            encryption_revision="$encryption_revision"
+            realm="$realm", encryption_revision="$encryption_revision"
         )
     },
     $vlob_id,
     1,
     $blob,
     $blob_len,
-    { q_device_internal_id(organization_id="$organization_id", device_id="$author") },
+    { q_device_internal_id(organization="$organization", device_id="$author") },
     $timestamp
 RETURNING _id
 """
@@ -256,14 +246,14 @@ RETURNING _id
 
 
 _q_create_sequester_blob = Q(
-    f"""
+    """
     INSERT INTO sequester_service_vlob_atom(service, vlob_atom, blob)
     SELECT
         (SELECT _id
             FROM sequester_service
             WHERE
                 sequester_service.service_id=$service_id
-                AND sequester_service.organization={ q_organization_internal_id("$organization_id") }),
+                AND sequester_service.organization=$organization),
         $vlob_atom_internal_id,
         $blob
     RETURNING _id
@@ -283,17 +273,17 @@ async def query_create(
     blob: bytes,
     sequester_blob: Dict[SequesterServiceID, bytes] | None = None,
 ) -> None:
-    await _check_realm_and_write_access(
-        conn, organization_id, author, realm_id, encryption_revision, timestamp
+    authorization = await _check_realm_and_write_access(
+        conn, organization_id, author, encryption_revision, timestamp, realm_id=realm_id
     )
 
     # Actually create the vlob
     try:
         vlob_atom_internal_id = await conn.fetchval(
             *_q_create(
-                organization_id=organization_id.str,
+                organization=authorization.organization_internal_id,
                 author=author.str,
-                realm_id=realm_id,
+                realm=authorization.realm_internal_id,
                 encryption_revision=encryption_revision,
                 vlob_id=vlob_id,
                 blob=blob,
@@ -306,15 +296,16 @@ async def query_create(
         raise VlobAlreadyExistsError()
 
     if sequester_blob:
-        for service_id, blob in sequester_blob.items():
+        for service_id, service_blob in sequester_blob.items():
             await conn.fetchval(
                 *_q_create_sequester_blob(
-                    organization_id=organization_id.str,
+                    organization=authorization.organization_internal_id,
                     service_id=service_id,
                     vlob_atom_internal_id=vlob_atom_internal_id,
-                    blob=blob,
+                    blob=service_blob,
                 )
             )
     await _set_vlob_updated(
-        conn, vlob_atom_internal_id, organization_id, author, realm_id, vlob_id, timestamp
+        conn, authorization, vlob_atom_internal_id, organization_id, author, vlob_id, timestamp
     )
+    await q_increment_organization_stats(conn, organization_id, timestamp, metadata_size=len(blob))
@@ -1,45 +1,191 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
-from typing import List
+from collections import deque
+from typing import Deque, Dict, List, Tuple, Union
 
+import trio
 from structlog import get_logger
 from trio import CancelScope, Nursery
 
 from parsec._parsec import BlockID, OrganizationID
 from parsec.backend.block import BlockStoreError
-from parsec.backend.blockstore import BaseBlockStoreComponent
+from parsec.backend.blockstore import BaseBlockStoreComponent, BlockScrubResult, scrub_nodes
 from parsec.utils import open_service_nursery
 
 logger = get_logger()
 
 
+# Hedged reads: the read is first sent to the mirror expected to be the fastest,
+# a second mirror is only queried if no answer came back after the (estimated)
+# 95th percentile of the first mirror's latency. This way most reads cost a
+# single request, while the slow ones (the tail latency) get a second chance.
+# The price is paid when the mirrors are mostly idle: a slow read then takes
+# that delay plus the second mirror's latency, while querying all the mirrors
+# at once (`hedged_reads=False`) only waits for the fastest answer (see
+# `benchmarks/bench_raid1_hedged_reads.py` with a single client).
+
+RAID1_LATENCY_EWMA_ALPHA = 0.2
+RAID1_LATENCY_WINDOW = 128
+# Below this number of samples, the p95 estimation is not relevant
+RAID1_HEDGE_MIN_SAMPLES = 16
+RAID1_HEDGE_DEFAULT_DELAY = 0.05
+RAID1_HEDGE_MIN_DELAY = 0.002
+RAID1_HEDGE_MAX_DELAY = 1.0
+# A failed mirror is queried last until this delay (in seconds) is elapsed
+RAID1_FAILURE_COOLDOWN = 30.0
+
+
+class _MirrorStats:
+    __slots__ = (
+        "latency_ewma",
+        "latencies",
+        "requests",
+        "failures",
+        "consecutive_failures",
+        "last_failure_on",
+    )
+
+    def __init__(self) -> None:
+        self.latency_ewma: float | None = None
+        self.latencies: Deque[float] = deque(maxlen=RAID1_LATENCY_WINDOW)
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure_on = 0.0
+
+    def _update_ewma(self, latency: float) -> None:
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += RAID1_LATENCY_EWMA_ALPHA * (latency - self.latency_ewma)
+
+    def record_success(self, latency: float) -> None:
+        self.consecutive_failures = 0
+        self.latencies.append(latency)
+        self._update_ewma(latency)
+
+    def record_failure(self, now: float) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_failure_on = now
+
+    def record_cancelled(self, elapsed: float) -> None:
+        # The request has been cancelled given another mirror answered first, so
+        # we only know the actual latency is greater than the elapsed time.
+        # Still this must be taken into account, otherwise a mirror that became
+        # slow would never lose its "fastest mirror" status.
+        if self.latency_ewma is None or elapsed > self.latency_ewma:
+            self._update_ewma(elapsed)
+
+    def is_healthy(self, now: float) -> bool:
+        return (
+            self.consecutive_failures == 0 or now - self.last_failure_on >= RAID1_FAILURE_COOLDOWN
+        )
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < RAID1_HEDGE_MIN_SAMPLES:
+            return RAID1_HEDGE_DEFAULT_DELAY
+        latencies = sorted(self.latencies)
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        return min(max(p95, RAID1_HEDGE_MIN_DELAY), RAID1_HEDGE_MAX_DELAY)
+
+
+def _rebuild_raid1_block(mirrors_data: List[bytes | None]) -> Tuple[bytes, List[bytes]]:
+    block = next((data for data in mirrors_data if data is not None), None)
+    if block is None:
+        raise BlockStoreError("All RAID1 nodes have failed")
+    return block, [block] * len(mirrors_data)
+
+
 class RAID1BlockStoreComponent(BaseBlockStoreComponent):
     def __init__(
         self,
         blockstores: List[BaseBlockStoreComponent],
         partial_create_ok: bool = False,
+        hedged_reads: bool = True,
     ):
         self.blockstores = blockstores
         self._partial_create_ok = partial_create_ok
-        self._logger = logger.bind(blockstore_type="RAID1", partial_create_ok=partial_create_ok)
+        self._hedged_reads = hedged_reads
+        self._mirrors_stats = [_MirrorStats() for _ in blockstores]
+        self.reads = 0
+        self.hedged_reads = 0
+        self._logger = logger.bind(
+            blockstore_type="RAID1", partial_create_ok=partial_create_ok, hedged_reads=hedged_reads
+        )
+
+    def stats(self) -> Dict[str, object]:
+        now = trio.current_time()
+        return {
+            "reads": self.reads,
+            "hedged_reads": self.hedged_reads,
+            "mirrors": [
+                {
+                    "requests": stats.requests,
+                    "failures": stats.failures,
+                    "healthy": stats.is_healthy(now),
+                    "latency_ewma": stats.latency_ewma,
+                    "hedge_delay": stats.hedge_delay(),
+                }
+                for stats in self._mirrors_stats
+            ],
+        }
+
+    def _mirrors_by_preference(self) -> List[int]:
+        now = trio.current_time()
+        # Healthy mirrors first, then the fastest ones (mirrors without
+        # latency information come first so that they get evaluated)
+        return sorted(
+            range(len(self.blockstores)),
+            key=lambda index: (
+                not self._mirrors_stats[index].is_healthy(now),
+                self._mirrors_stats[index].latency_ewma or 0.0,
+            ),
+        )
 
     async def read(self, organization_id: OrganizationID, block_id: BlockID) -> bytes:
-        value = None
+        value: Union[bytes, None] = None
+        # Set each time a mirror fails, so the next one is queried without delay
+        mirror_failed = trio.Event()
+        self.reads += 1
 
-        async def _single_blockstore_read(
-            nursery: Nursery, blockstore: BaseBlockStoreComponent
-        ) -> None:
+        async def _single_blockstore_read(nursery: Nursery, blockstore_index: int) -> None:
             nonlocal value
+            stats = self._mirrors_stats[blockstore_index]
+            stats.requests += 1
+            started_on = trio.current_time()
             try:
-                value = await blockstore.read(organization_id, block_id)
-                nursery.cancel_scope.cancel()
+                block = await self.blockstores[blockstore_index].read(organization_id, block_id)
             except BlockStoreError:
-                pass
+                stats.record_failure(trio.current_time())
+                mirror_failed.set()
+                return
+            except trio.Cancelled:
+                stats.record_cancelled(trio.current_time() - started_on)
+                raise
+            stats.record_success(trio.current_time() - started_on)
+            value = block
+            nursery.cancel_scope.cancel()
 
         async with open_service_nursery() as nursery:
-            for blockstore in self.blockstores:
-                nursery.start_soon(_single_blockstore_read, nursery, blockstore)
+            if not self._hedged_reads:
+                for blockstore_index in range(len(self.blockstores)):
+                    nursery.start_soon(_single_blockstore_read, nursery, blockstore_index)
+
+            else:
+                mirrors = self._mirrors_by_preference()
+                for position, blockstore_index in enumerate(mirrors):
+                    if position == 1:
+                        self.hedged_reads += 1
+                    nursery.start_soon(_single_blockstore_read, nursery, blockstore_index)
+                    if position == len(mirrors) - 1:
+                        break
+                    # Wait for the mirror to answer (the nursery then gets cancelled)
+                    # before sending the read to the next mirror
+                    with trio.move_on_after(self._mirrors_stats[blockstore_index].hedge_delay()):
+                        await mirror_failed.wait()
+                    mirror_failed = trio.Event()
 
         if not value:
             self._logger.warning(
@@ -92,3 +238,12 @@ class RAID1BlockStoreComponent(BaseBlockStoreComponent):
                     block_id=block_id.hex,
                 )
                 raise BlockStoreError("A RAID1 node have failed")
+
+    async def scrub(self, organization_id: OrganizationID, block_id: BlockID) -> BlockScrubResult:
+        """
+        Copy the block again on the mirrors it is missing from
+
+        Raises:
+            BlockStoreError
+        """
+        return await scrub_nodes(self.blockstores, organization_id, block_id, _rebuild_raid1_block)
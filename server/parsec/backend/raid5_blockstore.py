@@ -3,20 +3,35 @@ from __future__ import annotations
 
 import struct
 from sys import byteorder
-from typing import List, Union
+from typing import List, Tuple, Union
 
+import trio
 from structlog import get_logger
 from trio import Nursery
 
 from parsec._parsec import BlockID, OrganizationID
 from parsec.backend.block import BlockStoreError
-from parsec.backend.blockstore import BaseBlockStoreComponent
+from parsec.backend.blockstore import BaseBlockStoreComponent, BlockScrubResult, scrub_nodes
 from parsec.utils import open_service_nursery
 
+try:
+    import numpy
+except ImportError:
+    # NumPy is an optional dependency (`numpy` extra) only used to speed up
+    # the parity computation
+    numpy = None  # type: ignore[assignment]
+
 logger = get_logger()
 
 
-def _xor_buffers(*buffers: bytes) -> bytes:
+# Chunks bigger than this have their parity computed in a worker thread
+# to avoid stalling the event loop (NumPy releases the GIL while XORing)
+RAID5_THREAD_THRESHOLD = 64 * 1024
+# NumPy calls overhead makes it slower than big integers on small chunks
+RAID5_NUMPY_THRESHOLD = 4 * 1024
+
+
+def _xor_buffers_int(*buffers: bytes) -> bytes:
     buff_len = len(buffers[0])
     xored = int.from_bytes(buffers[0], byteorder)
     for buff in buffers[1:]:
@@ -25,16 +40,53 @@ def _xor_buffers(*buffers: bytes) -> bytes:
     return xored.to_bytes(buff_len, byteorder)
 
 
+def _xor_buffers_numpy(*buffers: bytes) -> bytes:
+    buff_len = len(buffers[0])
+    # Work on 64bits words, the remaining bytes (if any) are XORed one by one
+    words_count = buff_len // 8
+    tail_offset = words_count * 8
+    xored = bytearray(buffers[0])
+    xored_words = numpy.frombuffer(xored, dtype=numpy.uint64, count=words_count)
+    xored_tail = numpy.frombuffer(xored, dtype=numpy.uint8, offset=tail_offset)
+    for buff in buffers[1:]:
+        assert len(buff) == buff_len
+        numpy.bitwise_xor(
+            xored_words,
+            numpy.frombuffer(buff, dtype=numpy.uint64, count=words_count),
+            out=xored_words,
+        )
+        numpy.bitwise_xor(
+            xored_tail,
+            numpy.frombuffer(buff, dtype=numpy.uint8, offset=tail_offset),
+            out=xored_tail,
+        )
+    return bytes(xored)
+
+
+def _xor_buffers(*buffers: bytes) -> bytes:
+    if numpy is not None and len(buffers[0]) >= RAID5_NUMPY_THRESHOLD:
+        return _xor_buffers_numpy(*buffers)
+    else:
+        return _xor_buffers_int(*buffers)
+
+
 def split_block_in_chunks(block: bytes, nb_chunks: int) -> List[bytes]:
     payload_size = len(block) + 4  # encode block len as a uint32
     chunk_len = payload_size // nb_chunks
     if nb_chunks * chunk_len < payload_size:
         chunk_len += 1
-    padding_len = chunk_len * nb_chunks - payload_size
 
-    payload = struct.pack("!I", len(block)) + block + b"\x00" * padding_len
+    # Payload is `<block len><block><zero padding>`, each chunk is built
+    # straight from the block so the data is only copied once
+    header = struct.pack("!I", len(block))
+    block_view = memoryview(block)
+    chunks = []
+    for start in range(0, chunk_len * nb_chunks, chunk_len):
+        end = start + chunk_len
+        chunk = b"".join((header[start:end], block_view[max(start - 4, 0) : max(end - 4, 0)]))
+        chunks.append(chunk.ljust(chunk_len, b"\x00"))
 
-    return [payload[chunk_len * i : chunk_len * (i + 1)] for i in range(nb_chunks)]
+    return chunks
 
 
 def generate_checksum_chunk(chunks: List[bytes]) -> bytes:
@@ -52,9 +104,42 @@ def rebuild_block_from_chunks(chunks: List[bytes | None], checksum_chunk: bytes
         pass
     # By now, all chunks are valid
     chunks: List[bytes]
-    payload = b"".join(chunks)
-    (block_len,) = struct.unpack("!I", payload[:4])
-    return payload[4 : 4 + block_len]
+
+    # The block length header may span multiple chunks if they are tiny
+    header = chunks[0] if len(chunks[0]) >= 4 else b"".join(chunks)
+    (block_len,) = struct.unpack_from("!I", header)
+
+    # Only keep the block part of each chunk (i.e. skip header and padding)
+    # so the data is only copied once
+    parts = []
+    to_skip = 4
+    remaining = block_len
+    for chunk in chunks:
+        if not remaining:
+            break
+        if to_skip >= len(chunk):
+            to_skip -= len(chunk)
+            continue
+        part = memoryview(chunk)[to_skip : to_skip + remaining]
+        to_skip = 0
+        remaining -= len(part)
+        parts.append(part)
+    return b"".join(parts)
+
+
+def _split_block_with_checksum(block: bytes, nb_chunks: int) -> Tuple[List[bytes], bytes]:
+    chunks = split_block_in_chunks(block, nb_chunks)
+    return chunks, generate_checksum_chunk(chunks)
+
+
+def _rebuild_raid5_block(nodes_data: List[bytes | None]) -> Tuple[bytes, List[bytes]]:
+    if nodes_data.count(None) > 1:
+        raise BlockStoreError("More than 1 RAID5 nodes have failed")
+    if len({len(data) for data in nodes_data if data is not None}) != 1:
+        raise BlockStoreError("RAID5 nodes have returned inconsistent chunks")
+    block = rebuild_block_from_chunks(nodes_data[:-1], nodes_data[-1])
+    chunks, checksum_chunk = _split_block_with_checksum(block, len(nodes_data) - 1)
+    return block, [*chunks, checksum_chunk]
 
 
 class RAID5BlockStoreComponent(BaseBlockStoreComponent):
@@ -107,13 +192,13 @@ class RAID5BlockStoreComponent(BaseBlockStoreComponent):
             assert isinstance(checksum, (bytes, bytearray))
             assert len([res for res in fetch_results if isinstance(res, Exception)]) == 1
 
-            return rebuild_block_from_chunks(
-                [
-                    res if isinstance(res, (bytes, bytearray)) else None
-                    for res in fetch_results[:-1]
-                ],
-                checksum,
-            )
+            chunks = [
+                res if isinstance(res, (bytes, bytearray)) else None for res in fetch_results[:-1]
+            ]
+            if len(checksum) >= RAID5_THREAD_THRESHOLD:
+                return await trio.to_thread.run_sync(rebuild_block_from_chunks, chunks, checksum)
+            else:
+                return rebuild_block_from_chunks(chunks, checksum)
 
         else:
             # No need to log the detail of the nodes errors, they should have
@@ -129,9 +214,13 @@ class RAID5BlockStoreComponent(BaseBlockStoreComponent):
         self, organization_id: OrganizationID, block_id: BlockID, block: bytes
     ) -> None:
         nb_chunks = len(self.blockstores) - 1
-        chunks = split_block_in_chunks(block, nb_chunks)
+        if len(block) // nb_chunks >= RAID5_THREAD_THRESHOLD:
+            chunks, checksum_chunk = await trio.to_thread.run_sync(
+                _split_block_with_checksum, block, nb_chunks
+            )
+        else:
+            chunks, checksum_chunk = _split_block_with_checksum(block, nb_chunks)
         assert len(chunks) == nb_chunks
-        checksum_chunk = generate_checksum_chunk(chunks)
 
         # Actually do the upload
         error_count = 0
@@ -178,3 +267,18 @@ class RAID5BlockStoreComponent(BaseBlockStoreComponent):
                     block_id=block_id.hex,
                 )
                 raise BlockStoreError("A RAID5 node have failed")
+
+    async def scrub(self, organization_id: OrganizationID, block_id: BlockID) -> BlockScrubResult:
+        """
+        Rebuild the chunk (or checksum chunk) missing from a node and create it again
+
+        Raises:
+            BlockStoreError
+        """
+        return await scrub_nodes(
+            self.blockstores,
+            organization_id,
+            block_id,
+            _rebuild_raid5_block,
+            rebuild_in_thread=True,
+        )
@@ -0,0 +1,296 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+from functools import lru_cache, partial
+from typing import List, Sequence, Tuple
+
+import trio
+from structlog import get_logger
+from trio import Nursery
+
+from parsec._parsec import BlockID, OrganizationID
+from parsec.backend.block import BlockStoreError
+from parsec.backend.blockstore import BaseBlockStoreComponent, BlockScrubResult, scrub_nodes
+from parsec.backend.raid5_blockstore import (
+    RAID5_THREAD_THRESHOLD,
+    _xor_buffers,
+    rebuild_block_from_chunks,
+    split_block_in_chunks,
+)
+from parsec.utils import open_service_nursery
+
+logger = get_logger()
+
+
+# Reed-Solomon erasure coding over GF(2^8)
+#
+# The block is split into `k` data shards (using the RAID5 chunk format), then
+# `m` parity shards are computed by multiplying the data shards with a Cauchy
+# matrix. The resulting `[identity; cauchy]` encoding matrix has the property
+# that any `k` of its rows form an invertible matrix, hence the block can be
+# rebuilt from any `k` shards.
+#
+# Multiplying a shard by a constant is done with a 256 bytes translation table
+# (so it runs at `bytes.translate` speed), and additions are XORs.
+
+RAIDEC_MAX_SHARDS = 256
+
+
+def _build_gf_tables() -> Tuple[List[int], List[int]]:
+    # Generator 2 with the 0x11d primitive polynomial (same as most RS implementations)
+    exp = [0] * 512
+    log = [0] * 256
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= 0x11D
+    # Duplicate the table to avoid the modulo when adding logarithms
+    for i in range(255, 512):
+        exp[i] = exp[i - 255]
+    return exp, log
+
+
+_GF_EXP, _GF_LOG = _build_gf_tables()
+
+
+def _gf_mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return _GF_EXP[_GF_LOG[a] + _GF_LOG[b]]
+
+
+def _gf_inv(a: int) -> int:
+    assert a != 0
+    return _GF_EXP[255 - _GF_LOG[a]]
+
+
+@lru_cache(maxsize=256)
+def _gf_mul_table(coef: int) -> bytes:
+    return bytes(_gf_mul(coef, x) for x in range(256))
+
+
+def _gf_invert_matrix(matrix: Sequence[Sequence[int]]) -> List[List[int]]:
+    # Gauss-Jordan elimination on `[matrix | identity]`
+    size = len(matrix)
+    rows = [[*row, *(1 if i == j else 0 for j in range(size))] for i, row in enumerate(matrix)]
+    for col in range(size):
+        pivot = next(i for i in range(col, size) if rows[i][col] != 0)
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        pivot_inv = _gf_inv(rows[col][col])
+        rows[col] = [_gf_mul(pivot_inv, x) for x in rows[col]]
+        for i in range(size):
+            factor = rows[i][col]
+            if i != col and factor != 0:
+                rows[i] = [x ^ _gf_mul(factor, y) for x, y in zip(rows[i], rows[col])]
+    return [row[size:] for row in rows]
+
+
+@lru_cache(maxsize=32)
+def _encoding_matrix(data_shards: int, parity_shards: int) -> Tuple[Tuple[int, ...], ...]:
+    assert data_shards + parity_shards <= RAIDEC_MAX_SHARDS
+    identity = [tuple(1 if i == j else 0 for j in range(data_shards)) for i in range(data_shards)]
+    # `(data_shards + i) ^ j` is never null given `j < data_shards <= data_shards + i`
+    cauchy = [
+        tuple(_gf_inv((data_shards + i) ^ j) for j in range(data_shards))
+        for i in range(parity_shards)
+    ]
+    return (*identity, *cauchy)
+
+
+def _combine_shards(coefs: Sequence[int], shards: Sequence[bytes]) -> bytes:
+    return _xor_buffers(
+        *(
+            shard if coef == 1 else shard.translate(_gf_mul_table(coef))
+            for coef, shard in zip(coefs, shards)
+            if coef != 0
+        )
+    )
+
+
+def encode_shards(block: bytes, data_shards: int, parity_shards: int) -> List[bytes]:
+    """
+    Returns the `data_shards` data shards followed by the `parity_shards` parity shards
+    """
+    chunks = split_block_in_chunks(block, data_shards)
+    matrix = _encoding_matrix(data_shards, parity_shards)
+    parities = [_combine_shards(row, chunks) for row in matrix[data_shards:]]
+    return [*chunks, *parities]
+
+
+def decode_shards(shards: List[bytes | None], data_shards: int, parity_shards: int) -> bytes:
+    """
+    `shards` must contain at least `data_shards` non-None items
+    """
+    assert len(shards) == data_shards + parity_shards
+    data = shards[:data_shards]
+    if None not in data:
+        return rebuild_block_from_chunks(data, None)
+
+    # Data shards come first, so they are used in priority
+    available = [index for index, shard in enumerate(shards) if shard is not None][:data_shards]
+    assert len(available) == data_shards  # Cannot correct more than `parity_shards` shards
+    matrix = _encoding_matrix(data_shards, parity_shards)
+    decoding_matrix = _gf_invert_matrix([matrix[index] for index in available])
+    available_shards: List[bytes] = [shards[index] for index in available]  # type: ignore[misc]
+    rebuilt_data = [
+        shard if shard is not None else _combine_shards(decoding_matrix[i], available_shards)
+        for i, shard in enumerate(data)
+    ]
+    return rebuild_block_from_chunks(rebuilt_data, None)  # type: ignore[arg-type]
+
+
+def _rebuild_raidec_block(
+    shards: List[bytes | None], data_shards: int, parity_shards: int
+) -> Tuple[bytes, List[bytes]]:
+    if shards.count(None) > parity_shards:
+        raise BlockStoreError(f"More than {parity_shards} RAIDEC nodes have failed")
+    if len({len(shard) for shard in shards if shard is not None}) != 1:
+        raise BlockStoreError("RAIDEC nodes have returned inconsistent shards")
+    block = decode_shards(shards, data_shards, parity_shards)
+    return block, encode_shards(block, data_shards, parity_shards)
+
+
+class RAIDECBlockStoreComponent(BaseBlockStoreComponent):
+    def __init__(
+        self,
+        blockstores: List[BaseBlockStoreComponent],
+        parity_shards: int,
+        partial_create_ok: bool = False,
+    ):
+        assert 0 < parity_shards < len(blockstores) <= RAIDEC_MAX_SHARDS
+        self.blockstores = blockstores
+        self._data_shards = len(blockstores) - parity_shards
+        self._parity_shards = parity_shards
+        self._partial_create_ok = partial_create_ok
+        self._logger = logger.bind(
+            blockstore_type="RAIDEC",
+            data_shards=self._data_shards,
+            parity_shards=parity_shards,
+            partial_create_ok=partial_create_ok,
+        )
+
+    async def read(self, organization_id: OrganizationID, block_id: BlockID) -> bytes:
+        shards: List[bytes | None] = [None] * len(self.blockstores)
+        fetched_count = 0
+        error_count = 0
+
+        async def _shard_read(nursery: Nursery, blockstore_index: int) -> None:
+            nonlocal fetched_count
+            nonlocal error_count
+            try:
+                shards[blockstore_index] = await self.blockstores[blockstore_index].read(
+                    organization_id, block_id
+                )
+            except BlockStoreError:
+                error_count += 1
+                if error_count > self._parity_shards:
+                    # Early exit given the block cannot be rebuilt
+                    nursery.cancel_scope.cancel()
+            else:
+                fetched_count += 1
+                if fetched_count == self._data_shards:
+                    # Enough shards to rebuild the block, don't wait for the slowest nodes
+                    nursery.cancel_scope.cancel()
+
+        async with open_service_nursery() as nursery:
+            for blockstore_index in range(len(self.blockstores)):
+                nursery.start_soon(_shard_read, nursery, blockstore_index)
+
+        if fetched_count < self._data_shards:
+            # No need to log the detail of the nodes errors, they should have
+            # already been logged before raising their exceptions
+            self._logger.warning(
+                f"Block read error: More than {self._parity_shards} nodes have failed",
+                organization_id=organization_id.str,
+                block_id=block_id.hex,
+            )
+            raise BlockStoreError(f"More than {self._parity_shards} RAIDEC nodes have failed")
+
+        shard_sizes = {len(shard) for shard in shards if shard is not None}
+        if len(shard_sizes) != 1:
+            self._logger.warning(
+                "Block read error: Nodes have returned shards of different sizes",
+                organization_id=organization_id.str,
+                block_id=block_id.hex,
+            )
+            raise BlockStoreError("RAIDEC nodes have returned inconsistent shards")
+
+        (shard_size,) = shard_sizes
+        if None in shards[: self._data_shards] and shard_size >= RAID5_THREAD_THRESHOLD:
+            return await trio.to_thread.run_sync(
+                decode_shards, shards, self._data_shards, self._parity_shards
+            )
+        else:
+            return decode_shards(shards, self._data_shards, self._parity_shards)
+
+    async def create(
+        self, organization_id: OrganizationID, block_id: BlockID, block: bytes
+    ) -> None:
+        if len(block) // self._data_shards >= RAID5_THREAD_THRESHOLD:
+            shards = await trio.to_thread.run_sync(
+                encode_shards, block, self._data_shards, self._parity_shards
+            )
+        else:
+            shards = encode_shards(block, self._data_shards, self._parity_shards)
+        assert len(shards) == len(self.blockstores)
+
+        # Actually do the upload
+        error_count = 0
+
+        async def _shard_create(nursery: Nursery, blockstore_index: int, shard: bytes) -> None:
+            nonlocal error_count
+            try:
+                await self.blockstores[blockstore_index].create(organization_id, block_id, shard)
+            except BlockStoreError:
+                error_count += 1
+                if error_count > self._parity_shards or not self._partial_create_ok:
+                    # Early exit
+                    nursery.cancel_scope.cancel()
+
+        async with open_service_nursery() as nursery:
+            for blockstore_index, shard in enumerate(shards):
+                nursery.start_soon(_shard_create, nursery, blockstore_index, shard)
+
+        if self._partial_create_ok:
+            # Up to `parity_shards` blockstores are allowed to fail (see RAID5
+            # regarding the nodes that may have written their shard anyway)
+            if error_count > self._parity_shards:
+                # No need to log the detail of the nodes errors, they should have
+                # already been logged before raising their exceptions
+                self._logger.warning(
+                    f"Block create error: More than {self._parity_shards} nodes have failed",
+                    organization_id=organization_id.str,
+                    block_id=block_id.hex,
+                )
+                raise BlockStoreError(f"More than {self._parity_shards} RAIDEC nodes have failed")
+
+        else:
+            if error_count:
+                self._logger.warning(
+                    "Block create error: A node have failed",
+                    organization_id=organization_id.str,
+                    block_id=block_id.hex,
+                )
+                raise BlockStoreError("A RAIDEC node have failed")
+
+    async def scrub(self, organization_id: OrganizationID, block_id: BlockID) -> BlockScrubResult:
+        """
+        Rebuild the shards missing from some nodes and create them again
+
+        Raises:
+            BlockStoreError
+        """
+        return await scrub_nodes(
+            self.blockstores,
+            organization_id,
+            block_id,
+            partial(
+                _rebuild_raidec_block,
+                data_shards=self._data_shards,
+                parity_shards=self._parity_shards,
+            ),
+            rebuild_in_thread=True,
+        )
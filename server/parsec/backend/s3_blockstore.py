@@ -2,9 +2,11 @@
 from __future__ import annotations
 
 from functools import partial
+from typing import Callable, TypeVar
 
 import boto3
 import trio
+from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError
 from structlog import get_logger
 
@@ -14,6 +16,12 @@ from parsec.backend.blockstore import BaseBlockStoreComponent
 
 logger = get_logger()
 
+T = TypeVar("T")
+
+# Blocks are at most 512KB, reading them by smaller chunks avoid having the
+# HTTP response fully buffered twice (once in urllib3, once in our result)
+S3_READ_CHUNK_SIZE = 64 * 1024
+
 
 def build_s3_slug(organization_id: OrganizationID, block_id: BlockID) -> str:
     # The slug uses the UUID canonical textual representation (eg.
@@ -29,26 +37,67 @@ class S3BlockStoreComponent(BaseBlockStoreComponent):
         s3_key: str,
         s3_secret: str,
         s3_endpoint_url: str | None = None,
+        max_connections: int = 10,
+        timeout: float = 30.0,
     ):
         self._s3 = None
         self._s3_bucket = None
+        # Boto3 clients are thread-safe, so a single client (and its pool of
+        # HTTP connections) is shared by all the worker threads. The pool is
+        # sized to match the worker limiter, so a thread never waits for a
+        # connection to be released.
         self._s3 = boto3.client(
             "s3",
             region_name=s3_region,
             aws_access_key_id=s3_key,
             aws_secret_access_key=s3_secret,
             endpoint_url=s3_endpoint_url,
+            config=Config(
+                max_pool_connections=max_connections,
+                connect_timeout=timeout,
+                read_timeout=timeout,
+            ),
         )
         self._s3_bucket = s3_bucket
         self._s3.head_bucket(Bucket=s3_bucket)
+        self._limiter = trio.CapacityLimiter(max_connections)
+        self._timeout = timeout
         self._logger = logger.bind(blockstore_type="S3", s3_region=s3_region, s3_bucket=s3_bucket)
 
+    async def _run_in_thread(self, fn: Callable[[], T]) -> T:
+        """
+        Run a blocking boto3 operation off the event loop.
+
+        Raises:
+            trio.TooSlowError
+        """
+        with trio.fail_after(self._timeout):
+            # `cancellable` allows us to give up on a stuck request, note the
+            # limiter token is only released once the thread has actually
+            # returned (which is guaranteed by the botocore timeouts)
+            return await trio.to_thread.run_sync(fn, cancellable=True, limiter=self._limiter)
+
+    def _sync_read(self, slug: str) -> bytes:
+        assert self._s3 is not None
+        obj = self._s3.get_object(Bucket=self._s3_bucket, Key=slug)
+        body = obj["Body"]
+        try:
+            data = bytearray()
+            while True:
+                chunk = body.read(S3_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            # Release the HTTP connection back to the pool
+            body.close()
+        return bytes(data)
+
     async def read(self, organization_id: OrganizationID, block_id: BlockID) -> bytes:
         slug = build_s3_slug(organization_id=organization_id, block_id=block_id)
         try:
-            assert self._s3 is not None
-            obj = self._s3.get_object(Bucket=self._s3_bucket, Key=slug)
-        except (BotoCoreError, ClientError) as exc:
+            return await self._run_in_thread(partial(self._sync_read, slug))
+        except (BotoCoreError, ClientError, trio.TooSlowError) as exc:
             self._logger.warning(
                 "Block read error",
                 organization_id=organization_id.str,
@@ -57,18 +106,16 @@ class S3BlockStoreComponent(BaseBlockStoreComponent):
             )
             raise BlockStoreError(exc) from exc
 
-        return obj["Body"].read()
-
     async def create(
         self, organization_id: OrganizationID, block_id: BlockID, block: bytes
     ) -> None:
         slug = build_s3_slug(organization_id=organization_id, block_id=block_id)
         try:
             assert self._s3 is not None
-            await trio.to_thread.run_sync(
+            await self._run_in_thread(
                 partial(self._s3.put_object, Bucket=self._s3_bucket, Key=slug, Body=block)
             )
-        except (BotoCoreError, ClientError) as exc:
+        except (BotoCoreError, ClientError, trio.TooSlowError) as exc:
             self._logger.warning(
                 "Block create error",
                 organization_id=organization_id.str,
@@ -1,7 +1,8 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
-from functools import partial
+import threading
+from typing import Any, Callable, List, TypeVar
 from unittest.mock import Mock
 
 import pbr.version
@@ -30,6 +31,10 @@ from parsec.backend.blockstore import BaseBlockStoreComponent
 
 logger = get_logger()
 
+T = TypeVar("T")
+# `swiftclient` is not typed
+_SwiftConnection = Any
+
 
 def build_swift_slug(organization_id: OrganizationID, id: BlockID) -> str:
     # The slug uses the UUID canonical textual representation (eg.
@@ -37,22 +42,91 @@ def build_swift_slug(organization_id: OrganizationID, id: BlockID) -> str:
     return f"{organization_id.str}/{id.hyphenated}"
 
 
+class _SwiftConnectionPool:
+    """
+    `swiftclient.Connection` is not thread-safe, so each worker thread checks out
+    its own connection for the duration of a request.
+
+    Connections are created lazily (at most one per worker thread, so at most
+    `max_connections`) and reuse the authentication token of the others: only
+    the first connection authenticates, then a connection only re-authenticates
+    if the token has expired (which `swiftclient.Connection` does by itself on
+    a 401 error) and shares the new token with the other connections.
+    """
+
+    def __init__(self, connection_factory: Callable[..., _SwiftConnection], max_connections: int):
+        self._connection_factory = connection_factory
+        self._idle_connections: List[_SwiftConnection] = []
+        self._lock = threading.Lock()
+        self._limiter = trio.CapacityLimiter(max_connections)
+        self._storage_url: str | None = None
+        self._token: str | None = None
+        self.connections_count = 0
+
+    def _checkout(self) -> _SwiftConnection:
+        with self._lock:
+            storage_url, token = self._storage_url, self._token
+            if self._idle_connections:
+                connection = self._idle_connections.pop()
+                if token and connection.token != token:
+                    # Token has been renewed by another connection
+                    connection.url, connection.token = storage_url, token
+                return connection
+            self.connections_count += 1
+        return self._connection_factory(preauthurl=storage_url, preauthtoken=token)
+
+    def _checkin(self, connection: _SwiftConnection) -> None:
+        with self._lock:
+            # Token may have been obtained (or renewed) during the request
+            if connection.token:
+                self._storage_url, self._token = connection.url, connection.token
+            self._idle_connections.append(connection)
+
+    def run_sync(self, fn: Callable[[_SwiftConnection], T]) -> T:
+        connection = self._checkout()
+        try:
+            return fn(connection)
+        finally:
+            self._checkin(connection)
+
+    async def run(self, fn: Callable[[_SwiftConnection], T]) -> T:
+        """
+        Run a blocking swiftclient operation off the event loop.
+        """
+        return await trio.to_thread.run_sync(self.run_sync, fn, limiter=self._limiter)
+
+
 class SwiftBlockStoreComponent(BaseBlockStoreComponent):
     def __init__(
-        self, auth_url: str, tenant: str, container: str, user: str, password: str
+        self,
+        auth_url: str,
+        tenant: str,
+        container: str,
+        user: str,
+        password: str,
+        max_connections: int = 10,
     ) -> None:
-        self.swift_client = swiftclient.Connection(
-            authurl=auth_url, user=":".join([user, tenant]), key=password
-        )
+        def _connection_factory(
+            preauthurl: str | None, preauthtoken: str | None
+        ) -> _SwiftConnection:
+            return swiftclient.Connection(
+                authurl=auth_url,
+                user=":".join([user, tenant]),
+                key=password,
+                preauthurl=preauthurl,
+                preauthtoken=preauthtoken,
+            )
+
+        self._pool = _SwiftConnectionPool(_connection_factory, max_connections=max_connections)
         self._container = container
-        self.swift_client.head_container(container)
+        self._pool.run_sync(lambda connection: connection.head_container(container))
         self._logger = logger.bind(blockstore_type="Swift", authurl=auth_url)
 
     async def read(self, organization_id: OrganizationID, block_id: BlockID) -> bytes:
         slug = build_swift_slug(organization_id=organization_id, id=block_id)
         try:
-            _, obj = await trio.to_thread.run_sync(
-                self.swift_client.get_object, self._container, slug
+            _, obj = await self._pool.run(
+                lambda connection: connection.get_object(self._container, slug)
             )
 
         except ClientException as exc:
@@ -71,8 +145,8 @@ class SwiftBlockStoreComponent(BaseBlockStoreComponent):
     ) -> None:
         slug = build_swift_slug(organization_id=organization_id, id=block_id)
         try:
-            await trio.to_thread.run_sync(
-                partial(self.swift_client.put_object, self._container, slug, block)
+            await self._pool.run(
+                lambda connection: connection.put_object(self._container, slug, block)
             )
 
         except ClientException as exc:
@@ -71,6 +71,10 @@ class VlobMaintenanceError(VlobError):
     pass
 
 
+class VlobNotAvailableError(VlobError):
+    pass
+
+
 class VlobRequireGreaterTimestampError(VlobError):
     @property
     def strictly_greater_than(self) -> DateTime:
@@ -346,6 +350,47 @@ class BaseVlobComponent:
             certificate_index,
         )
 
+    @api
+    async def api_vlob_read_batch(
+        self,
+        client_ctx: AuthenticatedClientContext,
+        req: authenticated_cmds.latest.vlob_read_batch.Req,
+    ) -> authenticated_cmds.latest.vlob_read_batch.Rep:
+        try:
+            items, not_found = await self.read_batch(
+                client_ctx.organization_id,
+                client_ctx.device_id,
+                encryption_revision=req.encryption_revision,
+                items=[(item.vlob_id, item.version, item.timestamp) for item in req.items],
+            )
+
+        except VlobAccessError:
+            return authenticated_cmds.latest.vlob_read_batch.RepNotAllowed()
+
+        except VlobEncryptionRevisionError:
+            return authenticated_cmds.latest.vlob_read_batch.RepBadEncryptionRevision()
+
+        except VlobInMaintenanceError:
+            return authenticated_cmds.latest.vlob_read_batch.RepInMaintenance()
+
+        except VlobNotAvailableError:
+            return authenticated_cmds.latest.vlob_read_batch.RepNotAvailable()
+
+        return authenticated_cmds.latest.vlob_read_batch.RepOk(
+            items=[
+                authenticated_cmds.latest.vlob_read_batch.ReadBatchResultItem(
+                    vlob_id=vlob_id,
+                    version=version,
+                    blob=blob,
+                    author=author,
+                    timestamp=created_on,
+                    certificate_index=certificate_index,
+                )
+                for vlob_id, version, blob, author, created_on, certificate_index in items
+            ],
+            not_found=not_found,
+        )
+
     @api
     async def apiv3_vlob_update(
         self, client_ctx: AuthenticatedClientContext, req: authenticated_cmds.v3.vlob_update.Req
@@ -613,6 +658,28 @@ class BaseVlobComponent:
         """
         raise NotImplementedError()
 
+    async def read_batch(
+        self,
+        organization_id: OrganizationID,
+        author: DeviceID,
+        encryption_revision: int,
+        items: List[Tuple[VlobID, int | None, DateTime | None]],
+    ) -> Tuple[List[Tuple[VlobID, int, bytes, DeviceID, DateTime, int]], List[VlobID]]:
+        """
+        Read multiple vlobs at once, `items` being a list of `(vlob_id, version, timestamp)`.
+
+        Realm status and access are checked only once per realm involved in the batch.
+        Returns the found vlobs (in the order of `items`) and the ids of the ones
+        that don't exist or don't have the requested version/timestamp.
+
+        Raises:
+            VlobAccessError
+            VlobEncryptionRevisionError: if encryption_revision mismatch
+            VlobInMaintenanceError
+            VlobNotAvailableError: if the backend doesn't support batch reads
+        """
+        raise NotImplementedError()
+
     async def update(
         self,
         organization_id: OrganizationID,
@@ -672,6 +739,10 @@ class BaseVlobComponent:
         size: int,
     ) -> List[Tuple[VlobID, int, bytes]]:
         """
+        Batches are returned in a stable order and resume after the items already
+        saved (see `maintenance_save_reencryption_batch`), hence fetching a batch
+        costs its size, not the size of the realm.
+
         Raises:
             VlobNotFoundError
             VlobAccessError
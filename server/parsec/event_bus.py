@@ -1,7 +1,17 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
-from typing import ContextManager, DefaultDict, Dict, Iterator, List, Tuple, Type, Union
+from typing import (
+    Callable,
+    ContextManager,
+    DefaultDict,
+    Dict,
+    Iterator,
+    List,
+    Tuple,
+    Type,
+    Union,
+)
 
 try:
     # Introduced in Python 3.8
@@ -141,6 +151,7 @@ class EventBusConnectionContext:
     def __init__(self, event_bus: EventBus):
         self.event_bus = event_bus
         self.to_disconnect: List[Tuple[EventTypes, EventCallback]] = []
+        self.to_cleanup: List[Callable[[], None]] = []
 
     def __enter__(self) -> "EventBusConnectionContext":
         return self
@@ -152,6 +163,9 @@ class EventBusConnectionContext:
         for event, cb in self.to_disconnect:
             self.event_bus.disconnect(event, cb)
         self.to_disconnect.clear()
+        for cleanup in self.to_cleanup:
+            cleanup()
+        self.to_cleanup.clear()
 
     def send(self, event: EventTypes, **kwargs: object) -> None:
         self.event_bus.send(event, **kwargs)
@@ -169,6 +183,13 @@ class EventBusConnectionContext:
     def connect_in_context(self, *events: Tuple[EventTypes, EventCallback]) -> ContextManager[None]:
         return self.event_bus.connect_in_context(*events)
 
+    def on_clear(self, cb: Callable[[], None]) -> None:
+        """
+        Register a callback to be called when the context is cleared (typically
+        used to unregister from a dispatcher not directly connected to the bus).
+        """
+        self.to_cleanup.append(cb)
+
     def disconnect(self, event: EventTypes, cb: EventCallback) -> None:
         self.event_bus.disconnect(event, cb)
         self.to_disconnect.remove((event, cb))
@@ -0,0 +1,8 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+
+from __future__ import annotations
+
+from asyncpg.connection import Connection
+from asyncpg.exceptions import InvalidCachedStatementError, OutdatedSchemaCacheError
+
+__all__ = ("Connection", "InvalidCachedStatementError", "OutdatedSchemaCacheError")
@@ -0,0 +1,9 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+
+from __future__ import annotations
+
+class PostgresError(Exception): ...
+class FeatureNotSupportedError(PostgresError): ...
+class InvalidCachedStatementError(FeatureNotSupportedError): ...
+class InternalClientError(Exception): ...
+class OutdatedSchemaCacheError(InternalClientError): ...
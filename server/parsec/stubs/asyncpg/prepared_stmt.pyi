@@ -0,0 +1,11 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+
+from __future__ import annotations
+
+from typing import Any, List
+
+class PreparedStatement:
+    def get_statusmsg(self) -> str: ...
+    async def fetch(self, *args: Any, timeout: float | None = None) -> List[Any]: ...
+    async def fetchval(self, *args: Any, column: int = 0, timeout: float | None = None) -> Any: ...
+    async def fetchrow(self, *args: Any, timeout: float | None = None) -> Any: ...
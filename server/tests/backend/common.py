@@ -266,6 +266,18 @@ vlob_read = CmdSock(
         "encryption_revision": encryption_revision,
     },
 )
+vlob_read_batch = CmdSock(
+    authenticated_cmds.latest.vlob_read_batch,
+    parse_args=lambda items, encryption_revision=1: {
+        "items": [
+            authenticated_cmds.latest.vlob_read_batch.ReadBatchItem(
+                vlob_id=vlob_id, version=version, timestamp=timestamp
+            )
+            for vlob_id, version, timestamp in items
+        ],
+        "encryption_revision": encryption_revision,
+    },
+)
 apiv2v3_vlob_read = CmdSock(
     authenticated_cmds.v3.vlob_read,
     parse_args=lambda vlob_id, version=None, timestamp=None, encryption_revision=1: {
@@ -0,0 +1,27 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import pytest
+
+from parsec._parsec import OrganizationID
+from parsec.backend.postgresql.utils import get_organization_internal_id
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_organization_internal_id_cache(backend, alice):
+    async with backend.vlob.dbh.pool.acquire() as conn:
+        internal_id = await conn.fetchval(
+            "SELECT _id FROM organization WHERE organization_id = $1", alice.organization_id.str
+        )
+        assert await get_organization_internal_id(conn, alice.organization_id) == internal_id
+        assert conn.organization_internal_ids[alice.organization_id] == internal_id
+        # Cached value is used from now on
+        conn.organization_internal_ids[alice.organization_id] = -1
+        assert await get_organization_internal_id(conn, alice.organization_id) == -1
+        conn.organization_internal_ids[alice.organization_id] = internal_id
+
+        # Unknown organization is not cached given it can be created later on
+        unknown = OrganizationID("Unknown")
+        assert await get_organization_internal_id(conn, unknown) is None
+        assert unknown not in conn.organization_internal_ids
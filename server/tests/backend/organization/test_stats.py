@@ -185,3 +185,114 @@ async def test_organization_stats_users(
         metadata_size=0,
         realms=0,
     )
+
+
+@pytest.mark.trio
+async def test_organization_stats_at(backend, alice, bob, realm):
+    day1 = DateTime(2100, 1, 1, 10)
+    day2 = DateTime(2100, 1, 2, 10)
+
+    async def _stats(at):
+        return await backend.organization.stats(alice.organization_id, at=at)
+
+    initial = await _stats(DateTime(2100, 1, 1))
+
+    await backend.vlob.create(
+        organization_id=alice.organization_id,
+        author=alice.device_id,
+        realm_id=realm,
+        encryption_revision=1,
+        vlob_id=VlobID.new(),
+        timestamp=day1,
+        blob=b"1234",
+    )
+    await backend.user.revoke_user(
+        organization_id=alice.organization_id,
+        user_id=bob.user_id,
+        revoked_user_certificate=b"<dummy>",
+        revoked_user_certifier=alice.device_id,
+        revoked_on=day1,
+    )
+    await backend.block.create(
+        organization_id=alice.organization_id,
+        author=alice.device_id,
+        block_id=BlockID.new(),
+        realm_id=realm,
+        created_on=day2,
+        block=b"123456",
+    )
+
+    # Changes are accounted for the day they occurred on, the bound being included
+    assert await _stats(day1.subtract(microseconds=1)) == initial
+    day1_stats = await _stats(day1)
+    assert day1_stats.metadata_size == initial.metadata_size + 4
+    assert day1_stats.data_size == initial.data_size
+    assert day1_stats.users == initial.users
+    assert day1_stats.active_users == initial.active_users - 1
+    assert day1_stats.users_per_profile_detail != initial.users_per_profile_detail
+
+    # Previous days are accounted as a whole
+    assert await _stats(day2.subtract(microseconds=1)) == day1_stats
+    day2_stats = await _stats(day2)
+    assert day2_stats.metadata_size == initial.metadata_size + 4
+    assert day2_stats.data_size == initial.data_size + 6
+    assert day2_stats.users_per_profile_detail == day1_stats.users_per_profile_detail
+    assert await _stats(DateTime(2100, 2, 1)) == day2_stats
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_organization_stats_roll_up(backend, alice, realm):
+    day1 = DateTime(2100, 1, 1, 10)
+    day2 = DateTime(2100, 1, 2, 10)
+
+    await backend.vlob.create(
+        organization_id=alice.organization_id,
+        author=alice.device_id,
+        realm_id=realm,
+        encryption_revision=1,
+        vlob_id=VlobID.new(),
+        timestamp=day1,
+        blob=b"1234",
+    )
+    await backend.block.create(
+        organization_id=alice.organization_id,
+        author=alice.device_id,
+        block_id=BlockID.new(),
+        realm_id=realm,
+        created_on=day1,
+        block=b"123456",
+    )
+
+    async def _all_stats():
+        return [
+            await backend.organization.stats(alice.organization_id),
+            await backend.organization.stats(alice.organization_id, at=day1),
+            await backend.organization.stats(alice.organization_id, at=day2),
+        ]
+
+    # Rolling the deltas up into the counters doesn't change the stats
+    expected = await _all_stats()
+    assert expected[0].metadata_size >= 4
+    assert expected[0].data_size >= 6
+    await backend.organization.roll_up_stats()
+    assert await _all_stats() == expected
+    async with backend.organization.dbh.pool.acquire() as conn:
+        assert await conn.fetchval("SELECT COUNT(*) FROM organization_stats_delta") == 0
+
+    # Nor does it for the changes made once rolled up
+    await backend.vlob.create(
+        organization_id=alice.organization_id,
+        author=alice.device_id,
+        realm_id=realm,
+        encryption_revision=1,
+        vlob_id=VlobID.new(),
+        timestamp=day1,
+        blob=b"12",
+    )
+    stats = await backend.organization.stats(alice.organization_id)
+    assert stats.metadata_size == expected[0].metadata_size + 2
+    await backend.organization.roll_up_stats()
+    assert await backend.organization.stats(alice.organization_id) == stats
+    day2_stats = await backend.organization.stats(alice.organization_id, at=day2)
+    assert day2_stats.metadata_size == expected[2].metadata_size + 2
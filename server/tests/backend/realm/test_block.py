@@ -1,6 +1,10 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
+import struct
+from functools import reduce
+from operator import xor
+
 import msgpack
 import pytest
 import trio
@@ -31,6 +35,7 @@ from parsec.backend.raid5_blockstore import (
     rebuild_block_from_chunks,
     split_block_in_chunks,
 )
+from parsec.backend.raidec_blockstore import decode_shards, encode_shards
 from parsec.backend.realm import RealmGrantedRole
 from tests.backend.common import block_create, block_read
 from tests.common import customize_fixtures
@@ -218,6 +223,18 @@ async def test_raid1_block_read_partial_failure(alice_ws, backend, block):
     assert rep == BlockReadRepOk(BLOCK_DATA)
 
 
+@pytest.mark.trio
+@customize_fixtures(blockstore_mode="RAID1_READ_ALL")
+async def test_raid1_read_all_block_create_and_read(alice_ws, realm):
+    await test_block_create_and_read(alice_ws, realm)
+
+
+@pytest.mark.trio
+@customize_fixtures(blockstore_mode="RAID1_READ_ALL")
+async def test_raid1_read_all_block_read_partial_failure(alice_ws, backend, block):
+    await test_raid1_block_read_partial_failure(alice_ws, backend, block)
+
+
 @pytest.mark.trio
 @customize_fixtures(blockstore_mode="RAID0")
 async def test_raid0_block_create_and_read(alice_ws, realm):
@@ -353,6 +370,141 @@ async def test_raid5_block_read_multiple_failure(
     assert f"block_id={block.hex}" in log
 
 
+@pytest.mark.trio
+@customize_fixtures(blockstore_mode="CACHED")
+async def test_cached_block_create_and_read(alice_ws, backend, realm):
+    await test_block_create_and_read(alice_ws, realm)
+    rep = await block_read(alice_ws, BLOCK_ID)
+    assert rep == BlockReadRepOk(BLOCK_DATA)
+    stats = backend.blockstore.stats()
+    assert stats["misses"] == 1
+    assert stats["memory_hits"] == 1
+
+
+@pytest.mark.trio
+@customize_fixtures(blockstore_mode="RAIDEC")
+async def test_raidec_block_create_and_read(alice_ws, realm):
+    await test_block_create_and_read(alice_ws, realm)
+
+
+@pytest.mark.trio
+@customize_fixtures(blockstore_mode="RAIDEC")
+async def test_raidec_block_create_single_failure(caplog, alice_ws, backend, realm):
+    async def mock_create(organization_id, id, block):
+        await trio.sleep(0)
+        raise BlockStoreError()
+
+    backend.blockstore.blockstores[2].create = mock_create
+
+    rep = await block_create(alice_ws, BLOCK_ID, realm, BLOCK_DATA, check_rep=False)
+    assert isinstance(rep, BlockCreateRepTimeout)
+
+    log = caplog.assert_occurred_once("[warning  ] Block create error: A node have failed")
+    assert f"organization_id=CoolOrg" in log
+    assert f"block_id={BLOCK_ID.hex}" in log
+
+
+@pytest.mark.trio
+@customize_fixtures(blockstore_mode="RAIDEC_PARTIAL_CREATE_OK")
+@pytest.mark.parametrize("failing_blockstores", [(0,), (0, 1), (1, 3), (2, 3)])
+async def test_raidec_partial_create_ok_block_create_failures(
+    alice_ws, backend, realm, failing_blockstores
+):
+    async def mock_create(organization_id, id, block):
+        await trio.sleep(0)
+        raise BlockStoreError()
+
+    async def mock_read(organization_id, id):
+        await trio.sleep(0)
+        raise BlockStoreError()
+
+    for index in failing_blockstores:
+        backend.blockstore.blockstores[index].create = mock_create
+        backend.blockstore.blockstores[index].read = mock_read
+
+    await block_create(alice_ws, BLOCK_ID, realm, BLOCK_DATA)
+
+    rep = await block_read(alice_ws, BLOCK_ID)
+    assert rep == BlockReadRepOk(BLOCK_DATA)
+
+
+@pytest.mark.trio
+@customize_fixtures(blockstore_mode="RAIDEC_PARTIAL_CREATE_OK")
+async def test_raidec_partial_create_ok_block_create_too_many_failures(
+    caplog, alice_ws, backend, realm
+):
+    async def mock_create(organization_id, id, block):
+        await trio.sleep(0)
+        raise BlockStoreError()
+
+    for index in (0, 2, 3):
+        backend.blockstore.blockstores[index].create = mock_create
+
+    rep = await block_create(alice_ws, BLOCK_ID, realm, BLOCK_DATA, check_rep=False)
+    assert isinstance(rep, BlockCreateRepTimeout)
+
+    log = caplog.assert_occurred_once(
+        "[warning  ] Block create error: More than 2 nodes have failed"
+    )
+    assert f"organization_id=CoolOrg" in log
+    assert f"block_id={BLOCK_ID.hex}" in log
+
+
+@pytest.mark.trio
+@customize_fixtures(blockstore_mode="RAIDEC")
+@pytest.mark.parametrize("failing_blockstores", [(0,), (1,), (0, 1), (0, 2), (1, 3), (2, 3)])
+async def test_raidec_block_read_failures(alice_ws, backend, block, failing_blockstores):
+    async def mock_read(organization_id, id):
+        await trio.sleep(0)
+        raise BlockStoreError()
+
+    for index in failing_blockstores:
+        backend.blockstore.blockstores[index].read = mock_read
+
+    rep = await block_read(alice_ws, block)
+    assert rep == BlockReadRepOk(BLOCK_DATA)
+
+
+@pytest.mark.trio
+@customize_fixtures(blockstore_mode="RAIDEC")
+async def test_raidec_block_read_does_not_wait_slowest_nodes(alice_ws, backend, block):
+    slow_reads_cancelled = 0
+
+    async def mock_read(organization_id, id):
+        nonlocal slow_reads_cancelled
+        try:
+            await trio.sleep_forever()
+        finally:
+            slow_reads_cancelled += 1
+
+    # Only 2 shards are needed to rebuild the block
+    backend.blockstore.blockstores[0].read = mock_read
+    backend.blockstore.blockstores[3].read = mock_read
+
+    with trio.fail_after(1):
+        rep = await block_read(alice_ws, block)
+    assert rep == BlockReadRepOk(BLOCK_DATA)
+    assert slow_reads_cancelled == 2
+
+
+@pytest.mark.trio
+@customize_fixtures(blockstore_mode="RAIDEC")
+async def test_raidec_block_read_too_many_failures(caplog, alice_ws, backend, block):
+    async def mock_read(organization_id, id):
+        await trio.sleep(0)
+        raise BlockStoreError()
+
+    for index in (0, 1, 3):
+        backend.blockstore.blockstores[index].read = mock_read
+
+    rep = await block_read(alice_ws, block)
+    assert isinstance(rep, BlockReadRepTimeout)
+
+    log = caplog.assert_occurred_once("[warning  ] Block read error: More than 2 nodes have failed")
+    assert f"organization_id=CoolOrg" in log
+    assert f"block_id={block.hex}" in log
+
+
 @pytest.mark.parametrize(
     "bad_msg",
     [
@@ -478,3 +630,40 @@ def test_split_block(block, nb_blockstores):
         partial_chunks[missing] = None
         rebuilt = rebuild_block_from_chunks(partial_chunks, checksum_chunk)
         assert rebuilt == block
+
+
+@given(block=st.binary(max_size=2**10), nb_blockstores=st.integers(min_value=3, max_value=16))
+def test_split_block_chunk_format(block, nb_blockstores):
+    # Chunks are the slices of `<block len as uint32><block><zero padding>`
+    nb_chunks = nb_blockstores - 1
+    chunks = split_block_in_chunks(block, nb_chunks)
+    chunk_len = len(chunks[0])
+    payload = struct.pack("!I", len(block)) + block
+    payload += b"\x00" * (chunk_len * nb_chunks - len(payload))
+    assert chunks == [payload[chunk_len * i : chunk_len * (i + 1)] for i in range(nb_chunks)]
+
+    checksum_chunk = generate_checksum_chunk(chunks)
+    assert checksum_chunk == bytes(reduce(xor, column) for column in zip(*chunks))
+
+
+@given(
+    block=st.binary(max_size=2**10),
+    data_shards=st.integers(min_value=1, max_value=8),
+    parity_shards=st.integers(min_value=1, max_value=4),
+    data=st.data(),
+)
+def test_raidec_encode_decode_shards(block, data_shards, parity_shards, data):
+    shards = encode_shards(block, data_shards, parity_shards)
+    assert len(shards) == data_shards + parity_shards
+    assert len({len(shard) for shard in shards}) == 1
+    # Data shards use the RAID5 chunk format
+    assert shards[:data_shards] == split_block_in_chunks(block, data_shards)
+
+    missing = data.draw(
+        st.sets(
+            st.integers(min_value=0, max_value=data_shards + parity_shards - 1),
+            max_size=parity_shards,
+        )
+    )
+    partial_shards = [None if i in missing else shard for i, shard in enumerate(shards)]
+    assert decode_shards(partial_shards, data_shards, parity_shards) == block
@@ -567,6 +567,38 @@ async def test_reencryption_provide_unknown_vlob_atom_and_duplications(
     assert content == duplicated_expected_blob
 
 
+@pytest.mark.trio
+async def test_reencryption_batch_resumes_after_saved_atoms(alice, alice_ws, realm, vlob_atoms):
+    await realm_start_reencryption_maintenance(
+        alice_ws, realm, 2, DateTime.now(), {alice.user_id: b"foo"}
+    )
+    rep = await vlob_maintenance_get_reencryption_batch(alice_ws, realm, 2)
+    assert isinstance(rep, VlobMaintenanceGetReencryptionBatchRepOk)
+    first, second, third = rep.batch
+
+    # Batches are returned in a stable order
+    rep = await vlob_maintenance_get_reencryption_batch(alice_ws, realm, 2, size=2)
+    assert rep.batch == [first, second]
+
+    # Save the atoms out of order, the batches skip them but not the ones before
+    rep = await vlob_maintenance_save_reencryption_batch(alice_ws, realm, 2, [second])
+    assert rep == VlobMaintenanceSaveReencryptionBatchRepOk(total=3, done=1)
+    rep = await vlob_maintenance_get_reencryption_batch(alice_ws, realm, 2, size=2)
+    assert rep.batch == [first, third]
+
+    rep = await vlob_maintenance_save_reencryption_batch(alice_ws, realm, 2, [first])
+    assert rep == VlobMaintenanceSaveReencryptionBatchRepOk(total=3, done=2)
+    rep = await vlob_maintenance_get_reencryption_batch(alice_ws, realm, 2, size=2)
+    assert rep.batch == [third]
+
+    rep = await vlob_maintenance_save_reencryption_batch(alice_ws, realm, 2, [third])
+    assert rep == VlobMaintenanceSaveReencryptionBatchRepOk(total=3, done=3)
+    rep = await vlob_maintenance_get_reencryption_batch(alice_ws, realm, 2, size=2)
+    assert rep.batch == []
+
+    await realm_finish_reencryption_maintenance(alice_ws, realm, 2)
+
+
 @pytest.mark.trio
 async def test_access_during_reencryption(backend, alice_ws, alice, realm_factory, next_timestamp):
     # First initialize a nice realm with block and vlob
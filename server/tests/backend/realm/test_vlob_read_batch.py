@@ -0,0 +1,169 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import pytest
+
+from parsec._parsec import DateTime, VlobID, authenticated_cmds
+from parsec.backend.postgresql.vlob_queries import query_read_batch
+from parsec.backend.vlob import VlobAccessError, VlobEncryptionRevisionError
+from tests.backend.common import vlob_read_batch
+
+ReadBatchResultItem = authenticated_cmds.latest.vlob_read_batch.ReadBatchResultItem
+VlobReadBatchRepOk = authenticated_cmds.latest.vlob_read_batch.RepOk
+VlobReadBatchRepNotAllowed = authenticated_cmds.latest.vlob_read_batch.RepNotAllowed
+VlobReadBatchRepBadEncryptionRevision = (
+    authenticated_cmds.latest.vlob_read_batch.RepBadEncryptionRevision
+)
+VlobReadBatchRepInMaintenance = authenticated_cmds.latest.vlob_read_batch.RepInMaintenance
+VlobReadBatchRepNotAvailable = authenticated_cmds.latest.vlob_read_batch.RepNotAvailable
+
+UNKNOWN_VLOB_ID = VlobID.from_hex("F0000000000000000000000000000000")
+BOB_VLOB_ID = VlobID.from_hex("C1000000000000000000000000000000")
+
+
+async def _expected_item(backend, device, vlob_id, version=None, timestamp=None):
+    version, blob, author, created_on, _, certificate_index = await backend.vlob.read(
+        device.organization_id,
+        device.device_id,
+        encryption_revision=1,
+        vlob_id=vlob_id,
+        version=version,
+        timestamp=timestamp,
+    )
+    return ReadBatchResultItem(
+        vlob_id=vlob_id,
+        version=version,
+        blob=blob,
+        author=author,
+        timestamp=created_on,
+        certificate_index=certificate_index,
+    )
+
+
+@pytest.mark.trio
+async def test_read_batch(backend, alice, alice_rpc, vlobs):
+    rep = await vlob_read_batch(
+        alice_rpc,
+        [
+            (vlobs[0], None, None),
+            (vlobs[0], 1, None),
+            (UNKNOWN_VLOB_ID, None, None),
+            (vlobs[1], None, DateTime(2000, 1, 4)),
+            # Bad version and too old timestamp are reported as not found
+            (vlobs[1], 42, None),
+            (vlobs[0], None, DateTime(2000, 1, 1)),
+        ],
+    )
+    assert rep == VlobReadBatchRepOk(
+        items=[
+            await _expected_item(backend, alice, vlobs[0]),
+            await _expected_item(backend, alice, vlobs[0], version=1),
+            await _expected_item(backend, alice, vlobs[1], timestamp=DateTime(2000, 1, 4)),
+        ],
+        not_found=[UNKNOWN_VLOB_ID, vlobs[1], vlobs[0]],
+    )
+    assert [item.blob for item in rep.items] == [b"r:A b:1 v:2", b"r:A b:1 v:1", b"r:A b:2 v:1"]
+
+
+@pytest.mark.trio
+async def test_read_batch_empty(alice_rpc):
+    rep = await vlob_read_batch(alice_rpc, [])
+    assert rep == VlobReadBatchRepOk(items=[], not_found=[])
+
+
+@pytest.mark.trio
+async def test_read_batch_not_allowed(backend, bob, bob_rpc, vlobs, bob_realm):
+    await backend.vlob.create(
+        organization_id=bob.organization_id,
+        author=bob.device_id,
+        realm_id=bob_realm,
+        encryption_revision=1,
+        vlob_id=BOB_VLOB_ID,
+        timestamp=DateTime(2000, 1, 3),
+        blob=b"bob's",
+    )
+
+    # A single realm without access fails the whole batch
+    rep = await vlob_read_batch(bob_rpc, [(BOB_VLOB_ID, None, None), (vlobs[0], None, None)])
+    assert rep == VlobReadBatchRepNotAllowed()
+
+    # Bob can still read his own realm
+    rep = await vlob_read_batch(bob_rpc, [(BOB_VLOB_ID, None, None)])
+    assert rep == VlobReadBatchRepOk(
+        items=[await _expected_item(backend, bob, BOB_VLOB_ID)], not_found=[]
+    )
+
+
+@pytest.mark.trio
+async def test_read_batch_bad_encryption_revision(alice_rpc, vlobs):
+    rep = await vlob_read_batch(alice_rpc, [(vlobs[0], None, None)], encryption_revision=42)
+    assert rep == VlobReadBatchRepBadEncryptionRevision()
+
+
+@pytest.mark.trio
+async def test_read_batch_in_maintenance(backend, alice, alice_rpc, realm, vlobs):
+    await backend.realm.start_reencryption_maintenance(
+        alice.organization_id,
+        alice.device_id,
+        realm,
+        2,
+        {alice.user_id: b"whatever"},
+        DateTime.now(),
+    )
+
+    # Reading the new encryption revision is not possible until the end of the maintenance
+    rep = await vlob_read_batch(alice_rpc, [(vlobs[0], None, None)], encryption_revision=2)
+    assert rep == VlobReadBatchRepInMaintenance()
+
+    # ...but the previous one is still readable
+    rep = await vlob_read_batch(alice_rpc, [(vlobs[0], None, None)], encryption_revision=1)
+    assert isinstance(rep, VlobReadBatchRepOk)
+    assert [item.blob for item in rep.items] == [b"r:A b:1 v:2"]
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_read_batch_not_available_with_postgresql(alice_rpc, vlobs):
+    rep = await vlob_read_batch(alice_rpc, [(vlobs[0], None, None)])
+    assert rep == VlobReadBatchRepNotAvailable()
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_query_read_batch(backend, alice, bob, vlobs):
+    async with backend.vlob.dbh.pool.acquire() as conn:
+        found, not_found = await query_read_batch(
+            conn,
+            alice.organization_id,
+            alice.device_id,
+            1,
+            [
+                (vlobs[0], None, None),
+                (vlobs[0], 1, None),
+                (UNKNOWN_VLOB_ID, None, None),
+                (vlobs[1], None, DateTime(2000, 1, 4)),
+                (vlobs[1], 42, None),
+                (vlobs[0], None, DateTime(2000, 1, 1)),
+            ],
+        )
+        assert found == [
+            (vlobs[0], 2, b"r:A b:1 v:2", alice.device_id, DateTime(2000, 1, 3)),
+            (vlobs[0], 1, b"r:A b:1 v:1", alice.device_id, DateTime(2000, 1, 2, 1)),
+            (vlobs[1], 1, b"r:A b:2 v:1", alice.device_id, DateTime(2000, 1, 4)),
+        ]
+        assert not_found == [UNKNOWN_VLOB_ID, vlobs[1], vlobs[0]]
+
+        # Only unknown vlobs, hence no realm to check
+        assert await query_read_batch(
+            conn, alice.organization_id, alice.device_id, 1, [(UNKNOWN_VLOB_ID, None, None)]
+        ) == ([], [UNKNOWN_VLOB_ID])
+
+        with pytest.raises(VlobEncryptionRevisionError):
+            await query_read_batch(
+                conn, alice.organization_id, alice.device_id, 42, [(vlobs[0], None, None)]
+            )
+
+        with pytest.raises(VlobAccessError):
+            await query_read_batch(
+                conn, bob.organization_id, bob.device_id, 1, [(vlobs[0], None, None)]
+            )
@@ -15,6 +15,12 @@ from parsec.api.protocol import (
     VlobID,
 )
 from parsec.api.rest import organization_stats_rep_serializer
+from parsec.backend.asgi import app_factory
+from parsec.backend.config import (
+    CachedBlockStoreConfig,
+    MockedBlockStoreConfig,
+    RAID1BlockStoreConfig,
+)
 from parsec.backend.organization import Organization
 from tests.common import customize_fixtures, local_device_to_backend_user
 
@@ -748,3 +754,69 @@ async def test_handles_escaped_path(backend_asgi_app):
             },
         )
         assert response.status_code == 404, route
+
+
+@pytest.mark.trio
+async def test_metrics(backend_asgi_app, alice_rpc):
+    client = backend_asgi_app.test_client()
+    headers = {"Authorization": f"Bearer {backend_asgi_app.backend.config.administration_token}"}
+
+    response = await client.get("/administration/metrics", headers={})
+    assert response.status_code == 403
+
+    # Populate the authentication cache
+    await alice_rpc.send({"cmd": "ping", "ping": "foo"}, check_rep=False)
+    await alice_rpc.send({"cmd": "ping", "ping": "foo"}, check_rep=False)
+
+    response = await client.get("/administration/metrics", headers=headers)
+    assert response.status_code == 200
+    metrics = await response.get_json()
+    auth_cache_stats = metrics["auth_cache"]
+    assert auth_cache_stats["device_hits"] >= 1
+    assert auth_cache_stats["cached_devices"] >= 1
+    # Blockstore cache is not enabled by default
+    assert "blockstore_cache" not in metrics
+
+
+@pytest.mark.trio
+async def test_metrics_cached_raid1_blockstore(backend_factory):
+    blockstore_config = CachedBlockStoreConfig(
+        blockstore=RAID1BlockStoreConfig(
+            blockstores=[MockedBlockStoreConfig(), MockedBlockStoreConfig()]
+        ),
+        memory_cache_size=1024**2,
+    )
+    async with backend_factory(config={"blockstore_config": blockstore_config}) as backend:
+        client = app_factory(backend).test_client()
+        headers = {"Authorization": f"Bearer {backend.config.administration_token}"}
+        response = await client.get("/administration/metrics", headers=headers)
+        assert response.status_code == 200
+        metrics = await response.get_json()
+
+    # RAID1 stats are still available behind the cache
+    assert "blockstore_cache" in metrics
+    assert metrics["blockstore_raid1"]["reads"] == 0
+    assert len(metrics["blockstore_raid1"]["mirrors"]) == 2
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_metrics_postgresql_queries(backend_asgi_app, alice_rpc):
+    client = backend_asgi_app.test_client()
+    headers = {"Authorization": f"Bearer {backend_asgi_app.backend.config.administration_token}"}
+
+    # Authentication fetches the organization, user and device from the database
+    await alice_rpc.send({"cmd": "ping", "ping": "foo"}, check_rep=False)
+
+    response = await client.get("/administration/metrics", headers=headers)
+    assert response.status_code == 200
+    metrics = await response.get_json()
+    queries = {item["name"]: item for item in metrics["postgresql_queries"]}
+    assert queries
+    for name, item in queries.items():
+        assert name.startswith("parsec.backend.postgresql.")
+        assert item["calls"] >= 1
+        assert item["max_time"] <= item["total_time"]
+    # Most time consuming queries first
+    total_times = [item["total_time"] for item in metrics["postgresql_queries"]]
+    assert total_times == sorted(total_times, reverse=True)
@@ -0,0 +1,125 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import pytest
+
+from parsec.api.protocol import BlockID, OrganizationID
+from parsec.backend.cli.blockstore import (
+    BlockStoreMigrationCliError,
+    load_checkpoint,
+    save_checkpoint,
+)
+from parsec.backend.fs_blockstore import FileSystemBlockStoreComponent
+from parsec.backend.memory import MemoryBlockStoreComponent
+from parsec.backend.postgresql.blockstore_migration import BlockStoreMigration
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_blockstore_migration(tmp_path, backend, alice, realm):
+    blocks = {BlockID.new(): f"block {i}".encode() for i in range(10)}
+    for block_id, block in blocks.items():
+        await backend.block.create(alice.organization_id, alice.device_id, block_id, realm, block)
+    destination = FileSystemBlockStoreComponent(tmp_path)
+
+    # More blocks than workers and than a batch
+    migration = BlockStoreMigration(
+        backend.block.dbh, backend.blockstore, destination, concurrency=3, batch_size=4
+    )
+    last_block_id = await migration.get_last_block_id()
+    await migration.run()
+
+    assert migration.copied_blocks == 10
+    assert migration.copied_bytes == sum(len(block) for block in blocks.values())
+    assert migration.failed_blocks == 0
+    assert migration.last_id == last_block_id
+    for block_id, block in blocks.items():
+        assert await destination.read(alice.organization_id, block_id) == block
+
+    # Resuming from the checkpoint only copies the blocks created in the meantime
+    new_block_id = BlockID.new()
+    await backend.block.create(
+        alice.organization_id, alice.device_id, new_block_id, realm, b"new block"
+    )
+    migration = BlockStoreMigration(
+        backend.block.dbh, backend.blockstore, destination, last_id=migration.last_id
+    )
+    await migration.run()
+
+    assert migration.copied_blocks == 1
+    assert migration.last_id > last_block_id
+    assert await destination.read(alice.organization_id, new_block_id) == b"new block"
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_blockstore_migration_errors(tmp_path, backend, alice, realm):
+    block_ids = [BlockID.new() for _ in range(3)]
+    for block_id in block_ids:
+        await backend.block.create(alice.organization_id, alice.device_id, block_id, realm, b"foo")
+
+    # Source blockstore with a corrupted block and a missing one
+    source = MemoryBlockStoreComponent()
+    await source.create(alice.organization_id, block_ids[0], b"foo")
+    await source.create(alice.organization_id, block_ids[1], b"corrupted")
+    destination = FileSystemBlockStoreComponent(tmp_path)
+
+    errors = []
+    migration = BlockStoreMigration(
+        backend.block.dbh,
+        source,
+        destination,
+        retries=1,
+        retry_delay=0,
+        on_block_error=lambda *args: errors.append(args),
+    )
+    await migration.run()
+
+    assert migration.copied_blocks == 1
+    assert migration.failed_blocks == 2
+    assert sorted(block_id for _, _, block_id, _ in errors) == sorted(block_ids[1:])
+    reasons = {block_id: reason for _, _, block_id, reason in errors}
+    assert reasons[block_ids[1]] == "size mismatch: expected 3 bytes, got 9"
+    # Failed blocks are reported, but don't prevent the migration from moving forward
+    assert migration.last_id == await migration.get_last_block_id()
+    assert await destination.read(alice.organization_id, block_ids[0]) == b"foo"
+    assert sorted(block_id for _, block_id in migration.unmigrated_blocks.values()) == sorted(
+        block_ids[1:]
+    )
+
+    # Failed blocks are retried when resuming the migration
+    await source.create(alice.organization_id, block_ids[2], b"foo")
+    migration = BlockStoreMigration(
+        backend.block.dbh,
+        source,
+        destination,
+        last_id=migration.last_id,
+        retries=0,
+        unmigrated_blocks=migration.unmigrated_blocks,
+    )
+    await migration.run()
+
+    assert migration.copied_blocks == 1
+    assert migration.failed_blocks == 1
+    assert [block_id for _, block_id in migration.unmigrated_blocks.values()] == [block_ids[1]]
+    assert migration.last_id == await migration.get_last_block_id()
+    assert await destination.read(alice.organization_id, block_ids[2]) == b"foo"
+
+
+def test_blockstore_migration_checkpoint(tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    assert load_checkpoint(checkpoint) == (0, {})
+
+    save_checkpoint(checkpoint, 42, {})
+    assert load_checkpoint(checkpoint) == (42, {})
+    unmigrated_blocks = {
+        12: (OrganizationID("Org1"), BlockID.new()),
+        7: (OrganizationID("Org2"), BlockID.new()),
+    }
+    save_checkpoint(checkpoint, 1337, unmigrated_blocks)
+    assert load_checkpoint(checkpoint) == (1337, unmigrated_blocks)
+    assert list(tmp_path.iterdir()) == [checkpoint]
+
+    checkpoint.write_text("dummy")
+    with pytest.raises(BlockStoreMigrationCliError):
+        load_checkpoint(checkpoint)
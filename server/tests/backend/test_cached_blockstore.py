@@ -0,0 +1,270 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import pytest
+import trio
+from trio.testing import wait_all_tasks_blocked
+
+from parsec.api.protocol import BlockID, OrganizationID
+from parsec.backend.block import BlockStoreError
+from parsec.backend.blockstore import blockstore_factory
+from parsec.backend.cached_blockstore import CachedBlockStoreComponent, _DiskBlockCache
+from parsec.backend.config import CachedBlockStoreConfig, MockedBlockStoreConfig
+from parsec.backend.memory import MemoryBlockStoreComponent
+
+ORG_ID = OrganizationID("org42")
+BLOCK_ID_1 = BlockID.from_hex("00000000000000000000000000000001")
+BLOCK_ID_2 = BlockID.from_hex("00000000000000000000000000000002")
+BLOCK_ID_3 = BlockID.from_hex("00000000000000000000000000000003")
+
+
+class CountingBlockStore(MemoryBlockStoreComponent):
+    def __init__(self) -> None:
+        super().__init__()
+        self.reads = 0
+        self.read_allowed = trio.Event()
+        self.read_allowed.set()
+
+    async def read(self, organization_id, block_id):
+        self.reads += 1
+        await self.read_allowed.wait()
+        return await super().read(organization_id, block_id)
+
+
+def test_cached_blockstore_factory(tmp_path):
+    blockstore = blockstore_factory(
+        CachedBlockStoreConfig(
+            blockstore=MockedBlockStoreConfig(),
+            memory_cache_size=1024,
+            disk_cache_dir=tmp_path,
+            disk_cache_size=2048,
+        )
+    )
+    assert isinstance(blockstore, CachedBlockStoreComponent)
+    assert isinstance(blockstore.blockstore, MemoryBlockStoreComponent)
+
+
+@pytest.mark.trio
+async def test_memory_cache_lru_eviction():
+    sub_blockstore = CountingBlockStore()
+    blockstore = CachedBlockStoreComponent(sub_blockstore, memory_cache_size=20)
+    await blockstore.create(ORG_ID, BLOCK_ID_1, b"a" * 10)
+    await blockstore.create(ORG_ID, BLOCK_ID_2, b"b" * 10)
+    await blockstore.create(ORG_ID, BLOCK_ID_3, b"c" * 10)
+
+    assert await blockstore.read(ORG_ID, BLOCK_ID_1) == b"a" * 10
+    assert await blockstore.read(ORG_ID, BLOCK_ID_2) == b"b" * 10
+    assert sub_blockstore.reads == 2
+    # Both blocks fit in the cache
+    assert await blockstore.read(ORG_ID, BLOCK_ID_1) == b"a" * 10
+    assert await blockstore.read(ORG_ID, BLOCK_ID_2) == b"b" * 10
+    assert sub_blockstore.reads == 2
+
+    # Block 2 is now the least recently used, so it gets evicted
+    await blockstore.read(ORG_ID, BLOCK_ID_1)
+    await blockstore.read(ORG_ID, BLOCK_ID_3)
+    assert sub_blockstore.reads == 3
+    await blockstore.read(ORG_ID, BLOCK_ID_1)
+    assert sub_blockstore.reads == 3
+    await blockstore.read(ORG_ID, BLOCK_ID_2)
+    assert sub_blockstore.reads == 4
+
+    stats = blockstore.stats()
+    assert stats["memory_hits"] == 4
+    assert stats["misses"] == 4
+    assert stats["hit_ratio"] == 0.5
+    assert stats["bytes_served"] == 80
+    assert stats["bytes_fetched"] == 40
+    assert stats["memory_cached_blocks"] == 2
+    assert stats["memory_cached_bytes"] == 20
+
+
+@pytest.mark.trio
+async def test_block_bigger_than_cache_is_not_cached():
+    sub_blockstore = CountingBlockStore()
+    blockstore = CachedBlockStoreComponent(sub_blockstore, memory_cache_size=5)
+    await blockstore.create(ORG_ID, BLOCK_ID_1, b"a" * 10)
+
+    assert await blockstore.read(ORG_ID, BLOCK_ID_1) == b"a" * 10
+    assert await blockstore.read(ORG_ID, BLOCK_ID_1) == b"a" * 10
+    assert sub_blockstore.reads == 2
+    assert blockstore.stats()["memory_cached_bytes"] == 0
+
+
+@pytest.mark.trio
+async def test_concurrent_misses_are_coalesced():
+    sub_blockstore = CountingBlockStore()
+    blockstore = CachedBlockStoreComponent(sub_blockstore, memory_cache_size=1024)
+    await blockstore.create(ORG_ID, BLOCK_ID_1, b"data")
+    sub_blockstore.read_allowed = trio.Event()
+
+    results = []
+
+    async def _read():
+        results.append(await blockstore.read(ORG_ID, BLOCK_ID_1))
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(10):
+            nursery.start_soon(_read)
+        await wait_all_tasks_blocked()
+        sub_blockstore.read_allowed.set()
+
+    assert results == [b"data"] * 10
+    assert sub_blockstore.reads == 1
+    stats = blockstore.stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced_reads"] == 9
+
+
+@pytest.mark.trio
+async def test_coalesced_reads_errors():
+    sub_blockstore = CountingBlockStore()
+    blockstore = CachedBlockStoreComponent(sub_blockstore, memory_cache_size=1024)
+    sub_blockstore.read_allowed = trio.Event()
+    errors = []
+
+    async def _read():
+        try:
+            await blockstore.read(ORG_ID, BLOCK_ID_1)
+        except BlockStoreError as exc:
+            errors.append(exc)
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(3):
+            nursery.start_soon(_read)
+        await wait_all_tasks_blocked()
+        sub_blockstore.read_allowed.set()
+
+    # Block doesn't exist in the sub blockstore, all the reads fail...
+    assert len(errors) == 3
+    assert sub_blockstore.reads == 1
+
+    # ...and errors are not cached
+    await blockstore.create(ORG_ID, BLOCK_ID_1, b"data")
+    assert await blockstore.read(ORG_ID, BLOCK_ID_1) == b"data"
+
+
+@pytest.mark.trio
+async def test_coalesced_read_retried_on_cancellation():
+    sub_blockstore = CountingBlockStore()
+    blockstore = CachedBlockStoreComponent(sub_blockstore, memory_cache_size=1024)
+    await blockstore.create(ORG_ID, BLOCK_ID_1, b"data")
+    sub_blockstore.read_allowed = trio.Event()
+    leader_scope = trio.CancelScope()
+    results = []
+
+    async def _leader_read():
+        with leader_scope:
+            await blockstore.read(ORG_ID, BLOCK_ID_1)
+
+    async def _read():
+        results.append(await blockstore.read(ORG_ID, BLOCK_ID_1))
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(_leader_read)
+        await wait_all_tasks_blocked()
+        nursery.start_soon(_read)
+        await wait_all_tasks_blocked()
+        # Leader read gets cancelled, the coalesced read must take over
+        leader_scope.cancel()
+        await wait_all_tasks_blocked()
+        sub_blockstore.read_allowed.set()
+
+    assert results == [b"data"]
+    assert sub_blockstore.reads == 2
+
+
+@pytest.mark.trio
+async def test_disk_cache(tmp_path):
+    sub_blockstore = CountingBlockStore()
+    blockstore = CachedBlockStoreComponent(
+        sub_blockstore, memory_cache_size=10, disk_cache_dir=tmp_path, disk_cache_size=20
+    )
+    await blockstore.create(ORG_ID, BLOCK_ID_1, b"a" * 10)
+    await blockstore.create(ORG_ID, BLOCK_ID_2, b"b" * 10)
+    await blockstore.create(ORG_ID, BLOCK_ID_3, b"c" * 10)
+
+    await blockstore.read(ORG_ID, BLOCK_ID_1)
+    await blockstore.read(ORG_ID, BLOCK_ID_2)
+    assert sub_blockstore.reads == 2
+
+    # Block 1 is no longer in memory, but still on disk
+    assert await blockstore.read(ORG_ID, BLOCK_ID_1) == b"a" * 10
+    assert sub_blockstore.reads == 2
+    assert blockstore.stats()["disk_hits"] == 1
+
+    # Disk tier is also bounded, block 2 is the least recently used one
+    await blockstore.read(ORG_ID, BLOCK_ID_3)
+    assert sub_blockstore.reads == 3
+    assert blockstore.stats()["disk_cached_bytes"] == 20
+    assert len(list((tmp_path / "parsec-block-cache").glob("*/*/*"))) == 2
+    await blockstore.read(ORG_ID, BLOCK_ID_2)
+    assert sub_blockstore.reads == 4
+
+    # Disk cache is cleared on startup
+    CachedBlockStoreComponent(
+        sub_blockstore, memory_cache_size=10, disk_cache_dir=tmp_path, disk_cache_size=20
+    )
+    assert not list((tmp_path / "parsec-block-cache").glob("*/*/*"))
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("read_before_eviction", (True, False))
+async def test_disk_cache_eviction_while_reading(tmp_path, monkeypatch, read_before_eviction):
+    disk_cache = _DiskBlockCache(tmp_path, max_size=20)
+    await disk_cache.put((ORG_ID, BLOCK_ID_1), b"a" * 10)
+    await disk_cache.put((ORG_ID, BLOCK_ID_2), b"b" * 10)
+
+    reads_allowed = trio.Event()
+    run_sync = trio.to_thread.run_sync
+
+    async def _run_sync(fn, *args):
+        if getattr(fn, "__name__", None) != "read_bytes":
+            return await run_sync(fn, *args)
+        if read_before_eviction:
+            block = fn()
+            await reads_allowed.wait()
+            return block
+        await reads_allowed.wait()
+        return fn()
+
+    monkeypatch.setattr(trio.to_thread, "run_sync", _run_sync)
+
+    async def _get():
+        block = await disk_cache.get((ORG_ID, BLOCK_ID_1))
+        assert block == (b"a" * 10 if read_before_eviction else None)
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(_get)
+        await wait_all_tasks_blocked()
+        # Block 1 is evicted while being read
+        await disk_cache.put((ORG_ID, BLOCK_ID_3), b"c" * 10)
+        reads_allowed.set()
+
+    assert len(disk_cache) == 2
+    assert disk_cache.size == 20
+    assert await disk_cache.get((ORG_ID, BLOCK_ID_2)) == b"b" * 10
+    assert await disk_cache.get((ORG_ID, BLOCK_ID_3)) == b"c" * 10
+
+
+@pytest.mark.trio
+async def test_disk_cache_concurrent_puts(tmp_path, monkeypatch):
+    disk_cache = _DiskBlockCache(tmp_path, max_size=20)
+
+    writes_allowed = trio.Event()
+    run_sync = trio.to_thread.run_sync
+
+    async def _run_sync(fn, *args):
+        await writes_allowed.wait()
+        return await run_sync(fn, *args)
+
+    monkeypatch.setattr(trio.to_thread, "run_sync", _run_sync)
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(2):
+            nursery.start_soon(disk_cache.put, (ORG_ID, BLOCK_ID_1), b"a" * 10)
+        await wait_all_tasks_blocked()
+        writes_allowed.set()
+
+    assert len(disk_cache) == 1
+    assert disk_cache.size == 10
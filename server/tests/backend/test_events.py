@@ -4,12 +4,25 @@ from __future__ import annotations
 import pytest
 import trio
 
-from parsec._parsec import BackendEventPinged
+from parsec._parsec import (
+    ApiVersion,
+    BackendEventMessageReceived,
+    BackendEventPinged,
+    BackendEventRealmRolesUpdated,
+    BackendEventRealmVlobsUpdated,
+    DateTime,
+    RealmRole,
+    VlobID,
+)
 from parsec.api.protocol import (
     APIEventPinged,
     EventsListenRepOk,
 )
 from parsec.backend.asgi import app_factory
+from parsec.backend.client_context import AuthenticatedClientContext
+from parsec.backend.events import EventsCache, EventsDispatcher
+from parsec.backend.postgresql.handler import get_logged_events, prune_event_log, send_signal
+from parsec.event_bus import EventBus
 from tests.backend.common import (
     authenticated_ping,
     real_clock_timeout,
@@ -19,6 +32,191 @@ from tests.common import AuthenticatedRpcApiClient
 # TODO: also test connection is cancelled when the organization gets expired
 
 
+def test_events_dispatcher_routing(alice, alice2, bob, other_alice):
+    def _client_ctx(device):
+        return AuthenticatedClientContext(
+            api_version=ApiVersion.API_LATEST_VERSION,
+            client_api_version=ApiVersion.API_LATEST_VERSION,
+            organization_id=device.organization_id,
+            device_id=device.device_id,
+            human_handle=device.human_handle,
+            device_label=device.device_label,
+            profile=device.profile,
+            public_key=device.public_key,
+            verify_key=device.verify_key,
+        )
+
+    def _received(client_ctx):
+        events = []
+        while True:
+            try:
+                events.append(client_ctx.receive_events_channel.receive_nowait()[1])
+            except trio.WouldBlock:
+                return events
+
+    realm_id = VlobID.new()
+    dispatcher = EventsDispatcher()
+    event_bus = EventBus()
+    clients = {}
+    with event_bus.connection_context() as event_bus_ctx:
+        for device in (alice, alice2, bob, other_alice):
+            client_ctx = _client_ctx(device)
+            dispatcher.subscribe(client_ctx)
+            event_bus_ctx.on_clear(lambda c=client_ctx: dispatcher.unsubscribe(c))
+            clients[device] = client_ctx
+        dispatcher.set_client_realms(clients[alice], [realm_id])
+        dispatcher.set_client_realms(clients[alice2], [realm_id])
+        assert dispatcher.stats() == {"organizations": 2, "clients": 4}
+
+        # Organization-wide event, the author is filtered out
+        pinged = BackendEventPinged(alice.organization_id, alice.device_id, "foo")
+        dispatcher.dispatch("e1", pinged)
+        assert _received(clients[alice]) == []
+        assert _received(clients[alice2]) == [pinged]
+        assert _received(clients[bob]) == [pinged]
+        assert _received(clients[other_alice]) == []
+
+        # Realm event only reaches the realm's members
+        vlobs_updated = BackendEventRealmVlobsUpdated(
+            alice.organization_id, alice.device_id, realm_id, 1, VlobID.new(), 1
+        )
+        dispatcher.dispatch("e2", vlobs_updated)
+        assert _received(clients[alice]) == []
+        assert _received(clients[alice2]) == [vlobs_updated]
+        assert _received(clients[bob]) == []
+
+        # User event, also keeps the realm index up to date
+        roles_updated = BackendEventRealmRolesUpdated(
+            alice.organization_id, alice.device_id, realm_id, bob.user_id, RealmRole.READER
+        )
+        dispatcher.dispatch("e3", roles_updated)
+        assert _received(clients[bob]) == [roles_updated]
+        assert _received(clients[alice2]) == []
+        assert clients[bob].realms == {realm_id}
+        dispatcher.dispatch("e4", vlobs_updated)
+        assert _received(clients[bob]) == [vlobs_updated]
+
+        message_received = BackendEventMessageReceived(
+            bob.organization_id, bob.device_id, alice.user_id, 1, b"hello"
+        )
+        dispatcher.dispatch("e5", message_received)
+        assert _received(clients[alice]) == [message_received]
+        assert _received(clients[alice2]) == [message_received]
+        assert _received(clients[bob]) == []
+
+    # Clients are removed from the index once their connection context is closed
+    assert dispatcher.stats() == {"organizations": 0, "clients": 0}
+    dispatcher.dispatch("e6", pinged)
+    assert _received(clients[alice2]) == []
+
+
+def test_events_cache(alice, bob, other_alice):
+    now = 0.0
+    cache = EventsCache(max_size=4, max_age=10, clock=lambda: now)
+
+    def _pinged(device, ping):
+        return BackendEventPinged(device.organization_id, device.device_id, ping)
+
+    e1 = _pinged(alice, "e1")
+    e2 = _pinged(other_alice, "e2")
+    e3 = _pinged(bob, "e3")
+    e4 = _pinged(alice, "e4")
+    for event in (e1, e2, e3, e4):
+        cache.add(event.ping, event)
+
+    # Only the events of the organization are returned
+    assert cache.get_events_since(alice.organization_id, "e1") == [("e3", e3), ("e4", e4)]
+    assert cache.get_events_since(alice.organization_id, "e4") == []
+    assert cache.get_events_since(other_alice.organization_id, "e2") == []
+    # Event from another organization is considered unknown
+    assert cache.get_events_since(alice.organization_id, "e2") is None
+    assert cache.get_events_since(alice.organization_id, "dummy") is None
+
+    # Cache is bounded in size...
+    e5 = _pinged(alice, "e5")
+    cache.add("e5", e5)
+    assert len(cache) == 4
+    assert cache.get_events_since(alice.organization_id, "e1") is None
+    assert cache.get_events_since(alice.organization_id, "e3") == [("e4", e4), ("e5", e5)]
+
+    # ...and in age
+    now = 5.0
+    e6 = _pinged(alice, "e6")
+    cache.add("e6", e6)
+    now = 12.0
+    assert cache.get_events_since(alice.organization_id, "e3") is None
+    assert cache.get_events_since(alice.organization_id, "e6") == []
+    assert len(cache) == 1
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_event_log(backend_factory, alice, bob, other_alice):
+    def _pinged(device, ping):
+        return BackendEventPinged(device.organization_id, device.device_id, ping)
+
+    async with backend_factory(config={"event_log_retention": 3600}) as backend:
+        async with backend.ping.dbh.pool.acquire() as conn:
+            await conn.execute("DELETE FROM event_log")
+            events = [_pinged(alice, "e1"), _pinged(other_alice, "e2"), _pinged(bob, "e3")]
+            for event in events:
+                await send_signal(conn, event)
+            event_ids = [
+                row["event_id"]
+                for row in await conn.fetch("SELECT event_id FROM event_log ORDER BY _id")
+            ]
+            assert len(event_ids) == 3
+            e1_id, e2_id, e3_id = event_ids
+
+            # Only the events of the organization are returned
+            assert await get_logged_events(conn, alice.organization_id, e1_id) == [
+                (e3_id, events[2])
+            ]
+            assert await get_logged_events(conn, alice.organization_id, e3_id) == []
+            assert await get_logged_events(conn, other_alice.organization_id, e2_id) == []
+            # Event from another organization is considered unknown
+            assert await get_logged_events(conn, alice.organization_id, e2_id) is None
+            assert await get_logged_events(conn, alice.organization_id, "dummy") is None
+            # Replay is bounded
+            assert await get_logged_events(conn, alice.organization_id, e1_id, max_events=0) is None
+
+            await prune_event_log(conn, DateTime.now().add(seconds=1))
+            assert await conn.fetchval("SELECT COUNT(*) FROM event_log") == 0
+            assert await get_logged_events(conn, alice.organization_id, e1_id) is None
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_event_log_replay_follows_commit_order(backend_factory, alice):
+    def _pinged(ping):
+        return BackendEventPinged(alice.organization_id, alice.device_id, ping)
+
+    async with backend_factory(config={"event_log_retention": 3600}) as backend:
+        pool = backend.ping.dbh.pool
+        async with pool.acquire() as conn1, pool.acquire() as conn2:
+            await conn1.execute("DELETE FROM event_log")
+            await send_signal(conn1, _pinged("e0"))
+
+            # First event is logged by a transaction committed after the second one
+            async with conn1.transaction():
+                await send_signal(conn1, _pinged("e1"))
+                await send_signal(conn2, _pinged("e2"))
+            rows = await conn1.fetch("SELECT event_id FROM event_log ORDER BY _id")
+            e0_id, e1_id, e2_id = [row["event_id"] for row in rows]
+
+            # Client received e2 before e1 got committed, so e1 must be replayed
+            # (other events may also be replayed depending on the concurrent transactions)
+            replayed = await get_logged_events(conn1, alice.organization_id, e2_id)
+            assert (e1_id, _pinged("e1")) in replayed
+            assert e2_id not in [event_id for event_id, _ in replayed]
+            replayed = await get_logged_events(conn1, alice.organization_id, e1_id)
+            assert replayed[-1] == (e2_id, _pinged("e2"))
+            assert await get_logged_events(conn1, alice.organization_id, e0_id) == [
+                (e1_id, _pinged("e1")),
+                (e2_id, _pinged("e2")),
+            ]
+
+
 @pytest.mark.trio
 async def test_sse_events_connection_closed_on_user_revoke(
     backend_asgi_app, bob_rpc: AuthenticatedRpcApiClient, bob, alice
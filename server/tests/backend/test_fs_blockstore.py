@@ -0,0 +1,143 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import pytest
+import trio
+
+from parsec.api.protocol import BlockID, OrganizationID
+from parsec.backend.block import BlockStoreError
+from parsec.backend.blockstore import blockstore_factory
+from parsec.backend.config import (
+    FileSystemBlockStoreConfig,
+    RAID1BlockStoreConfig,
+    RAID5BlockStoreConfig,
+)
+from parsec.backend.fs_blockstore import FileSystemBlockStoreComponent, build_fs_block_path
+from parsec.backend.raid1_blockstore import RAID1BlockStoreComponent
+from parsec.backend.raid5_blockstore import RAID5BlockStoreComponent
+
+ORG_ID = OrganizationID("org42")
+BLOCK_ID = BlockID.from_hex("00000000000000000000000000000001")
+BLOCK_DATA = b"Hodi ho !"
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("mode", ["fsync", "nofsync", "fsync_batch"])
+async def test_fs_blockstore_create_and_read(tmp_path, mode):
+    blockstore = FileSystemBlockStoreComponent(
+        tmp_path, fsync=mode != "nofsync", fsync_batch_delay=0.01 if mode == "fsync_batch" else 0
+    )
+    await blockstore.create(ORG_ID, BLOCK_ID, BLOCK_DATA)
+    assert await blockstore.read(ORG_ID, BLOCK_ID) == BLOCK_DATA
+
+    # Blocks are sharded in sub-directories
+    block_path = build_fs_block_path(tmp_path, ORG_ID, BLOCK_ID)
+    assert block_path.read_bytes() == BLOCK_DATA
+    assert block_path.relative_to(tmp_path).parts[0] == ORG_ID.str
+    assert len(block_path.relative_to(tmp_path).parts) == 4
+    # No temporary file left behind
+    assert list(block_path.parent.iterdir()) == [block_path]
+
+    # Create is idempotent
+    await blockstore.create(ORG_ID, BLOCK_ID, BLOCK_DATA)
+    assert await blockstore.read(ORG_ID, BLOCK_ID) == BLOCK_DATA
+
+    with pytest.raises(BlockStoreError):
+        await blockstore.read(ORG_ID, BlockID.from_hex("00000000000000000000000000000002"))
+
+
+@pytest.mark.trio
+async def test_fs_blockstore_fsync_batch(tmp_path, monkeypatch):
+    from parsec.backend import fs_blockstore
+
+    committed_batches = []
+    vanilla_commit_blocks = fs_blockstore._commit_blocks
+
+    def _commit_blocks(blocks):
+        committed_batches.append(len(blocks))
+        vanilla_commit_blocks(blocks)
+
+    monkeypatch.setattr(fs_blockstore, "_commit_blocks", _commit_blocks)
+    blockstore = FileSystemBlockStoreComponent(tmp_path, fsync_batch_delay=0.1)
+
+    # Block data is written before joining the batch, do it beforehand so that
+    # the concurrent creates reach the batch at the same time
+    def _write_tmp_blocks(count):
+        blocks = []
+        for _ in range(count):
+            block_id = BlockID.new()
+            block_path = build_fs_block_path(tmp_path, ORG_ID, block_id)
+            tmp_path_ = fs_blockstore._write_tmp_block(block_path, block_id.hex.encode(), False)
+            blocks.append((block_id, tmp_path_, block_path))
+        return blocks
+
+    blocks = _write_tmp_blocks(10)
+    async with trio.open_nursery() as nursery:
+        for _, tmp_path_, block_path in blocks:
+            nursery.start_soon(blockstore._commit_in_batch, tmp_path_, block_path)
+
+    assert committed_batches == [10]
+    for block_id, tmp_path_, _ in blocks:
+        assert await blockstore.read(ORG_ID, block_id) == block_id.hex.encode()
+        assert not tmp_path_.exists()
+
+    # All the creates of a failed batch fail
+    def _failing_commit_blocks(blocks):
+        committed_batches.append(len(blocks))
+        raise OSError("Disk is on fire !")
+
+    monkeypatch.setattr(fs_blockstore, "_commit_blocks", _failing_commit_blocks)
+    results = []
+
+    async def _commit(tmp_path_, block_path):
+        try:
+            await blockstore._commit_in_batch(tmp_path_, block_path)
+            results.append(None)
+        except OSError as exc:
+            results.append(exc)
+
+    async with trio.open_nursery() as nursery:
+        for _, tmp_path_, block_path in _write_tmp_blocks(3):
+            nursery.start_soon(_commit, tmp_path_, block_path)
+
+    assert committed_batches == [10, 3]
+    assert len(results) == 3
+    assert all(isinstance(result, OSError) for result in results)
+
+    # Next batch is not impacted
+    monkeypatch.setattr(fs_blockstore, "_commit_blocks", _commit_blocks)
+    await blockstore.create(ORG_ID, BLOCK_ID, BLOCK_DATA)
+    assert committed_batches == [10, 3, 1]
+    assert await blockstore.read(ORG_ID, BLOCK_ID) == BLOCK_DATA
+
+
+@pytest.mark.trio
+async def test_fs_blockstore_as_raid_node(tmp_path):
+    raid1 = blockstore_factory(
+        RAID1BlockStoreConfig(
+            blockstores=[
+                FileSystemBlockStoreConfig(path=tmp_path / "raid1_node0"),
+                FileSystemBlockStoreConfig(path=tmp_path / "raid1_node1"),
+            ]
+        )
+    )
+    assert isinstance(raid1, RAID1BlockStoreComponent)
+    await raid1.create(ORG_ID, BLOCK_ID, BLOCK_DATA)
+    assert await raid1.read(ORG_ID, BLOCK_ID) == BLOCK_DATA
+    assert build_fs_block_path(tmp_path / "raid1_node1", ORG_ID, BLOCK_ID).exists()
+
+    raid5 = blockstore_factory(
+        RAID5BlockStoreConfig(
+            blockstores=[
+                FileSystemBlockStoreConfig(path=tmp_path / f"raid5_node{i}", fsync_batch_delay=0.01)
+                for i in range(3)
+            ]
+        )
+    )
+    assert isinstance(raid5, RAID5BlockStoreComponent)
+    await raid5.create(ORG_ID, BLOCK_ID, BLOCK_DATA)
+    assert await raid5.read(ORG_ID, BLOCK_ID) == BLOCK_DATA
+
+    # Block can still be rebuilt if a node has lost its chunk
+    build_fs_block_path(tmp_path / "raid5_node0", ORG_ID, BLOCK_ID).unlink()
+    assert await raid5.read(ORG_ID, BLOCK_ID) == BLOCK_DATA
@@ -8,10 +8,12 @@ import pytest
 import trio
 import triopg
 
-from parsec._parsec import ActiveUsersLimit, DateTime, EnrollmentID
+from parsec._parsec import ActiveUsersLimit, BlockID, DateTime, EnrollmentID, VlobID
+from parsec.backend.block import BlockAlreadyExistsError
 from parsec.backend.organization import OrganizationAlreadyBootstrappedError
 from parsec.backend.pki import PkiEnrollmentNoLongerAvailableError
 from parsec.backend.user import UserActiveUsersLimitReached, UserAlreadyExistsError
+from tests.backend.common import real_clock_timeout
 from tests.common import local_device_to_backend_user
 
 # Testing concurrency interactions is hard given it involve precise timing
@@ -276,3 +278,121 @@ async def test_concurrency_pki_enrollment_accept(
         assert res["count"] == 1
         res = await conn.fetchrow("SELECT enrollment_state FROM pki_enrollment")
         res["enrollment_state"] == "ACCEPTED"
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_concurrency_vlob_create_same_realm(
+    postgresql_url, backend_factory, backend_data_binder_factory, realm_factory, coolorg, alice
+):
+    results = []
+
+    async def _concurrent_create(backend):
+        try:
+            await backend.vlob.create(
+                organization_id=alice.organization_id,
+                author=alice.device_id,
+                realm_id=realm_id,
+                encryption_revision=1,
+                vlob_id=VlobID.new(),
+                timestamp=DateTime.now(),
+                blob=b"foo",
+            )
+            results.append(None)
+
+        except Exception as exc:
+            results.append(exc)
+
+    async with backend_factory(
+        config={"db_url": postgresql_url, "db_max_connections": 10}, populated=False
+    ) as backend:
+        # Create&bootstrap the organization
+        binder = backend_data_binder_factory(backend)
+        await binder.bind_organization(coolorg, alice)
+        realm_id = await realm_factory(backend, alice)
+
+        # Concurrent vlob creation, each one needs a checkpoint in the same realm
+        with ensure_pg_transaction_concurrency_barrier(concurrency=10):
+            async with trio.open_nursery() as nursery:
+                for _ in range(10):
+                    nursery.start_soon(_concurrent_create, backend)
+
+    assert results == [None] * 10
+
+    async with triopg.connect(postgresql_url) as conn:
+        rows = await conn.fetch("SELECT index FROM realm_vlob_update ORDER BY index")
+        assert [row["index"] for row in rows] == list(range(1, 11))
+        res = await conn.fetchrow("SELECT checkpoint FROM realm")
+        assert res["checkpoint"] == 10
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_concurrency_block_create_does_not_hold_connection_during_upload(
+    postgresql_url, backend_factory, backend_data_binder_factory, realm_factory, coolorg, alice
+):
+    uploads_started = 0
+    all_uploads_started = trio.Event()
+    release_uploads = trio.Event()
+
+    async with backend_factory(
+        config={"db_url": postgresql_url, "db_max_connections": 2}, populated=False
+    ) as backend:
+        binder = backend_data_binder_factory(backend)
+        await binder.bind_organization(coolorg, alice)
+        realm_id = await realm_factory(backend, alice)
+
+        vanilla_blockstore_create = backend.blockstore.create
+
+        async def _slow_blockstore_create(organization_id, block_id, block):
+            nonlocal uploads_started
+            uploads_started += 1
+            if uploads_started == 10:
+                all_uploads_started.set()
+            await release_uploads.wait()
+            await vanilla_blockstore_create(organization_id, block_id, block)
+
+        backend.blockstore.create = _slow_blockstore_create
+
+        async with trio.open_nursery() as nursery:
+            for _ in range(10):
+                nursery.start_soon(
+                    backend.block.create,
+                    alice.organization_id,
+                    alice.device_id,
+                    BlockID.new(),
+                    realm_id,
+                    b"foo",
+                )
+
+            # More uploads than database connections, yet the database is still
+            # available while they are in progress
+            async with real_clock_timeout():
+                await all_uploads_started.wait()
+                await backend.realm.get_stats(alice.organization_id, alice.device_id, realm_id)
+            release_uploads.set()
+
+        # Concurrent creation of the same block
+        results = []
+        block_id = BlockID.new()
+
+        async def _concurrent_create():
+            try:
+                await backend.block.create(
+                    alice.organization_id, alice.device_id, block_id, realm_id, b"bar"
+                )
+                results.append(None)
+
+            except Exception as exc:
+                results.append(exc)
+
+        async with trio.open_nursery() as nursery:
+            for _ in range(10):
+                nursery.start_soon(_concurrent_create)
+
+    assert len(results) == 10
+    assert len([r for r in results if isinstance(r, BlockAlreadyExistsError)]) == 9
+
+    async with triopg.connect(postgresql_url) as conn:
+        res = await conn.fetchrow("SELECT count(*) FROM block")
+        assert res["count"] == 11
@@ -0,0 +1,203 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterator, List
+
+import pytest
+import triopg
+
+from parsec.backend.postgresql.block import _q_get_block_meta, _q_get_realm_id_from_block_id
+from parsec.backend.postgresql.realm_queries.get import (
+    _q_get_blocks_size_from_realm,
+    _q_get_current_roles,
+    _q_get_realm_status,
+    _q_get_realms_for_user,
+    _q_get_vlob_size_from_realm,
+)
+from parsec.backend.postgresql.vlob_queries.read import (
+    _q_list_versions,
+    _q_poll_changes,
+    _q_read_data_with_version,
+    _q_read_data_without_timestamp,
+)
+from parsec.backend.postgresql.vlob_queries.utils import (
+    _q_authorize_vlob_operation_from_realm_id,
+    _q_authorize_vlob_operation_from_vlob_id,
+)
+
+# Tables big enough for a sequential scan to be a performance issue
+HOT_TABLES = {"vlob_atom", "realm_vlob_update", "realm_user_role", "block"}
+
+
+# Each organization gets `{users}` users and `{realms}` realms. Each realm is shared
+# with a fifth of the users (with a couple of role changes each), contains
+# `{vlobs}` vlobs with `{versions}` versions each and `{blocks}` blocks.
+SEED_SQL = """
+INSERT INTO organization (
+    organization_id, bootstrap_token, user_profile_outsider_allowed, is_expired, _created_on
+)
+SELECT 'Org' || o, '', TRUE, FALSE, now() FROM generate_series(1, {organizations}) o;
+
+INSERT INTO user_ (
+    organization, user_id, user_certificate, redacted_user_certificate, created_on, profile
+)
+SELECT organization._id, 'user' || u, '', '', now(), 'STANDARD'
+FROM organization, generate_series(1, {users}) u;
+
+INSERT INTO device (
+    organization, user_, device_id, device_certificate, redacted_device_certificate, created_on
+)
+SELECT organization, _id, user_id || '@dev1', '', '', now() FROM user_;
+
+INSERT INTO realm (organization, realm_id, encryption_revision)
+SELECT organization._id, md5(random()::text)::uuid, 1
+FROM organization, generate_series(1, {realms});
+
+INSERT INTO vlob_encryption_revision (realm, encryption_revision)
+SELECT _id, 1 FROM realm;
+
+INSERT INTO realm_user_role (realm, user_, role, certificate, certified_by, certified_on)
+SELECT realm._id, user_._id, 'CONTRIBUTOR', '', device._id, now() - make_interval(days => c)
+FROM realm
+INNER JOIN user_ ON user_.organization = realm.organization AND (user_._id + realm._id) % 5 = 0
+INNER JOIN device ON device.user_ = user_._id
+CROSS JOIN generate_series(1, 3) c;
+
+WITH vlob AS (
+    SELECT realm._id AS realm, realm.organization, md5(random()::text)::uuid AS vlob_id
+    FROM realm, generate_series(1, {vlobs})
+)
+INSERT INTO vlob_atom (
+    organization, vlob_encryption_revision, vlob_id, version, blob, size, author, created_on
+)
+SELECT
+    vlob.organization,
+    vlob_encryption_revision._id,
+    vlob.vlob_id,
+    version,
+    '',
+    0,
+    (SELECT MIN(_id) FROM device WHERE device.organization = vlob.organization),
+    now()
+FROM vlob
+INNER JOIN vlob_encryption_revision ON vlob_encryption_revision.realm = vlob.realm
+CROSS JOIN generate_series(1, {versions}) version;
+
+INSERT INTO realm_vlob_update (realm, index, vlob_atom)
+SELECT
+    vlob_encryption_revision.realm,
+    ROW_NUMBER() OVER (PARTITION BY vlob_encryption_revision.realm ORDER BY vlob_atom._id),
+    vlob_atom._id
+FROM vlob_atom
+INNER JOIN vlob_encryption_revision
+ON vlob_atom.vlob_encryption_revision = vlob_encryption_revision._id;
+
+INSERT INTO block (organization, block_id, realm, author, size, created_on)
+SELECT
+    realm.organization,
+    md5(random()::text)::uuid,
+    realm._id,
+    (SELECT MIN(_id) FROM device WHERE device.organization = realm.organization),
+    512,
+    now()
+FROM realm, generate_series(1, {blocks});
+
+ANALYZE;
+"""
+
+
+def _iter_seq_scans(plan: Dict[str, Any]) -> Iterator[str]:
+    if plan["Node Type"] == "Seq Scan":
+        yield plan["Relation Name"]
+    for sub_plan in plan.get("Plans", ()):
+        yield from _iter_seq_scans(sub_plan)
+
+
+async def _get_seq_scans(conn, query: List[Any]) -> set[str]:
+    sql, *args = query
+    raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+    (explain,) = json.loads(raw)
+    return set(_iter_seq_scans(explain["Plan"]))
+
+
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_hot_queries_use_indexes(postgresql_url, asyncio_loop):
+    async with triopg.connect(postgresql_url) as conn:
+        await conn.execute(
+            SEED_SQL.format(organizations=10, users=50, realms=50, vlobs=20, versions=2, blocks=40)
+        )
+
+        organization_id = "Org1"
+        row = await conn.fetchrow(
+            """
+            SELECT realm.realm_id, user_.user_id
+            FROM realm_user_role
+            INNER JOIN realm ON realm._id = realm_user_role.realm
+            INNER JOIN user_ ON user_._id = realm_user_role.user_
+            INNER JOIN organization ON organization._id = realm.organization
+            WHERE organization.organization_id = $1
+            LIMIT 1
+            """,
+            organization_id,
+        )
+        realm_id, user_id = row["realm_id"], row["user_id"]
+        organization = await conn.fetchval(
+            "SELECT _id FROM organization WHERE organization_id = $1", organization_id
+        )
+        vlob_id = await conn.fetchval(
+            """
+            SELECT vlob_id FROM vlob_atom
+            INNER JOIN vlob_encryption_revision
+            ON vlob_encryption_revision._id = vlob_atom.vlob_encryption_revision
+            INNER JOIN realm ON realm._id = vlob_encryption_revision.realm
+            WHERE realm.realm_id = $1
+            LIMIT 1
+            """,
+            realm_id,
+        )
+        block_id = await conn.fetchval(
+            "SELECT block_id FROM block INNER JOIN realm ON realm._id = block.realm "
+            "WHERE realm.realm_id = $1 LIMIT 1",
+            realm_id,
+        )
+
+        realm_kwargs = {"organization_id": organization_id, "realm_id": realm_id}
+        queries = {
+            "authorize_vlob_operation_from_realm_id": _q_authorize_vlob_operation_from_realm_id(
+                organization=organization, realm_id=realm_id, user_id=user_id
+            ),
+            "authorize_vlob_operation_from_vlob_id": _q_authorize_vlob_operation_from_vlob_id(
+                organization=organization, vlob_id=vlob_id, user_id=user_id
+            ),
+            "read_data_without_timestamp": _q_read_data_without_timestamp(
+                **realm_kwargs, encryption_revision=1, vlob_id=vlob_id
+            ),
+            "read_data_with_version": _q_read_data_with_version(
+                **realm_kwargs, encryption_revision=1, vlob_id=vlob_id, version=1
+            ),
+            "list_versions": _q_list_versions(organization_id=organization_id, vlob_id=vlob_id),
+            "poll_changes": _q_poll_changes(**realm_kwargs, checkpoint=10),
+            "get_realm_status": _q_get_realm_status(**realm_kwargs, user_id=user_id),
+            "get_current_roles": _q_get_current_roles(**realm_kwargs),
+            "get_realms_for_user": _q_get_realms_for_user(
+                organization_id=organization_id, user_id=user_id
+            ),
+            "get_blocks_size_from_realm": _q_get_blocks_size_from_realm(**realm_kwargs),
+            "get_vlob_size_from_realm": _q_get_vlob_size_from_realm(**realm_kwargs),
+            "get_realm_id_from_block_id": _q_get_realm_id_from_block_id(
+                organization_id=organization_id, block_id=block_id
+            ),
+            "get_block_meta": _q_get_block_meta(
+                organization_id=organization_id, user_id=user_id, block_id=block_id
+            ),
+        }
+
+        seq_scans = {}
+        for name, query in queries.items():
+            hot_seq_scans = await _get_seq_scans(conn, query) & HOT_TABLES
+            if hot_seq_scans:
+                seq_scans[name] = hot_seq_scans
+
+        assert not seq_scans
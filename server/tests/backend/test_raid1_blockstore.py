@@ -0,0 +1,170 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import math
+
+import pytest
+import trio
+
+from parsec.api.protocol import BlockID, OrganizationID
+from parsec.backend.block import BlockStoreError
+from parsec.backend.blockstore import blockstore_factory
+from parsec.backend.config import MockedBlockStoreConfig, RAID1BlockStoreConfig
+from parsec.backend.memory import MemoryBlockStoreComponent
+from parsec.backend.raid1_blockstore import (
+    RAID1_FAILURE_COOLDOWN,
+    RAID1_HEDGE_DEFAULT_DELAY,
+    RAID1_HEDGE_MIN_SAMPLES,
+    RAID1BlockStoreComponent,
+)
+
+ORG_ID = OrganizationID("org42")
+BLOCK_ID = BlockID.from_hex("00000000000000000000000000000001")
+BLOCK_DATA = b"Hodi ho !"
+
+
+class MirrorBlockStore(MemoryBlockStoreComponent):
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__()
+        self.latency = latency
+        self.failing = False
+        self.reads = 0
+
+    async def read(self, organization_id, block_id):
+        self.reads += 1
+        await trio.sleep(self.latency)
+        if self.failing:
+            raise BlockStoreError()
+        return await super().read(organization_id, block_id)
+
+
+async def _timed_read(clock, blockstore):
+    # Let the clock jump to the next deadline each time the read is waiting
+    clock.autojump_threshold = 0
+    try:
+        started_on = trio.current_time()
+        block = await blockstore.read(ORG_ID, BLOCK_ID)
+        return block, trio.current_time() - started_on
+    finally:
+        clock.autojump_threshold = math.inf
+
+
+async def _create_mirrors(*latencies, hedged_reads=True):
+    mirrors = [MirrorBlockStore(latency) for latency in latencies]
+    blockstore = RAID1BlockStoreComponent(mirrors, hedged_reads=hedged_reads)
+    await blockstore.create(ORG_ID, BLOCK_ID, BLOCK_DATA)
+    return blockstore, mirrors
+
+
+def test_raid1_blockstore_factory():
+    config = RAID1BlockStoreConfig(blockstores=[MockedBlockStoreConfig(), MockedBlockStoreConfig()])
+    assert blockstore_factory(config)._hedged_reads
+    config = RAID1BlockStoreConfig(
+        blockstores=[MockedBlockStoreConfig(), MockedBlockStoreConfig()], hedged_reads=False
+    )
+    assert not blockstore_factory(config)._hedged_reads
+
+
+@pytest.mark.trio
+async def test_hedged_read_queries_a_single_mirror(frozen_clock):
+    blockstore, mirrors = await _create_mirrors(0.01, 0.01, 0.01)
+
+    for _ in range(10):
+        block, _ = await _timed_read(frozen_clock, blockstore)
+        assert block == BLOCK_DATA
+
+    assert sum(mirror.reads for mirror in mirrors) == 10
+    stats = blockstore.stats()
+    assert stats["reads"] == 10
+    assert stats["hedged_reads"] == 0
+
+
+@pytest.mark.trio
+async def test_read_all_mode_queries_all_mirrors(frozen_clock):
+    blockstore, mirrors = await _create_mirrors(0.01, 0.02, hedged_reads=False)
+
+    block, duration = await _timed_read(frozen_clock, blockstore)
+    assert block == BLOCK_DATA
+    assert duration == pytest.approx(0.01)
+    assert [mirror.reads for mirror in mirrors] == [1, 1]
+
+
+@pytest.mark.trio
+async def test_hedged_read_slow_mirror(frozen_clock):
+    blockstore, mirrors = await _create_mirrors(10, 0.01)
+
+    # No latency information yet, so the slow mirror may be queried first...
+    block, duration = await _timed_read(frozen_clock, blockstore)
+    assert block == BLOCK_DATA
+    # ...but the read is hedged with the other mirror
+    assert duration == pytest.approx(RAID1_HEDGE_DEFAULT_DELAY + 0.01)
+    assert [mirror.reads for mirror in mirrors] == [1, 1]
+    assert blockstore.stats()["hedged_reads"] == 1
+
+    # Now the fast mirror is known and queried first
+    for _ in range(10):
+        block, duration = await _timed_read(frozen_clock, blockstore)
+        assert block == BLOCK_DATA
+        assert duration == pytest.approx(0.01)
+    assert [mirror.reads for mirror in mirrors] == [1, 11]
+
+
+@pytest.mark.trio
+async def test_hedged_read_mirror_becoming_slow(frozen_clock):
+    blockstore, mirrors = await _create_mirrors(0.01, 0.02)
+    for _ in range(RAID1_HEDGE_MIN_SAMPLES + 2):
+        await _timed_read(frozen_clock, blockstore)
+    assert mirrors[0].reads == RAID1_HEDGE_MIN_SAMPLES + 1
+    # The hedge delay is now based on the latency observed on the mirror
+    assert blockstore.stats()["mirrors"][0]["hedge_delay"] == pytest.approx(0.01)
+
+    mirrors[0].latency = 10
+    block, duration = await _timed_read(frozen_clock, blockstore)
+    assert block == BLOCK_DATA
+    assert duration == pytest.approx(0.01 + 0.02)
+
+    # The cancelled requests are taken into account, so the other mirror ends up
+    # being the preferred one
+    reads_before = mirrors[0].reads
+    for _ in range(20):
+        await _timed_read(frozen_clock, blockstore)
+    assert mirrors[0].reads - reads_before < 20
+    block, duration = await _timed_read(frozen_clock, blockstore)
+    assert duration == pytest.approx(0.02)
+
+
+@pytest.mark.trio
+async def test_hedged_read_failing_mirror(frozen_clock):
+    blockstore, mirrors = await _create_mirrors(0.01, 0.01)
+    mirrors[0].failing = True
+
+    # No need to wait for the hedge delay when a mirror fails
+    block, duration = await _timed_read(frozen_clock, blockstore)
+    assert block == BLOCK_DATA
+    assert duration == pytest.approx(0.02)
+    assert [mirror.reads for mirror in mirrors] == [1, 1]
+
+    # The failed mirror is no longer preferred...
+    await _timed_read(frozen_clock, blockstore)
+    assert [mirror.reads for mirror in mirrors] == [1, 2]
+    stats = blockstore.stats()
+    assert not stats["mirrors"][0]["healthy"]
+    assert stats["mirrors"][0]["failures"] == 1
+
+    # ...until it had time to recover
+    mirrors[0].failing = False
+    frozen_clock.jump(RAID1_FAILURE_COOLDOWN)
+    assert blockstore.stats()["mirrors"][0]["healthy"]
+    await _timed_read(frozen_clock, blockstore)
+    assert [mirror.reads for mirror in mirrors] == [2, 2]
+
+
+@pytest.mark.trio
+async def test_hedged_read_all_mirrors_failing(frozen_clock):
+    blockstore, mirrors = await _create_mirrors(0.01, 0.01, 0.01)
+    for mirror in mirrors:
+        mirror.failing = True
+
+    with pytest.raises(BlockStoreError):
+        await _timed_read(frozen_clock, blockstore)
+    assert [mirror.reads for mirror in mirrors] == [1, 1, 1]
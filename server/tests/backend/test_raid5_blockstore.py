@@ -0,0 +1,53 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+from functools import reduce
+from operator import xor
+
+import pytest
+
+from parsec.api.protocol import BlockID, OrganizationID
+from parsec.backend import raid5_blockstore
+from parsec.backend.memory import MemoryBlockStoreComponent
+from parsec.backend.raid5_blockstore import (
+    RAID5_NUMPY_THRESHOLD,
+    RAID5_THREAD_THRESHOLD,
+    RAID5BlockStoreComponent,
+    _xor_buffers,
+)
+
+ORG_ID = OrganizationID("org42")
+BLOCK_ID = BlockID.from_hex("00000000000000000000000000000001")
+
+
+@pytest.fixture(params=["numpy", "python"])
+def xor_implementation(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        # Big integers XOR fallback, used when NumPy is not installed
+        monkeypatch.setattr(raid5_blockstore, "numpy", None)
+    return request.param
+
+
+@pytest.mark.parametrize("buff_len", [0, 7, RAID5_NUMPY_THRESHOLD, RAID5_NUMPY_THRESHOLD + 3])
+def test_xor_buffers(xor_implementation, buff_len):
+    # Chunks length is not always a multiple of the 64bits words NumPy works on
+    buffers = [bytes((i * 7 + j) % 256 for j in range(buff_len)) for i in range(4)]
+    assert _xor_buffers(*buffers) == bytes(reduce(xor, column) for column in zip(*buffers))
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("nb_blockstores", [3, 5])
+async def test_raid5_big_block(xor_implementation, nb_blockstores):
+    blockstore = RAID5BlockStoreComponent(
+        [MemoryBlockStoreComponent() for _ in range(nb_blockstores)]
+    )
+    # Chunks are big enough to be split and rebuilt in a worker thread
+    block = bytes(range(256)) * ((nb_blockstores - 1) * RAID5_THREAD_THRESHOLD // 256 + 1)
+    await blockstore.create(ORG_ID, BLOCK_ID, block)
+    assert await blockstore.read(ORG_ID, BLOCK_ID) == block
+
+    # Missing chunk is rebuilt from the parity
+    del blockstore.blockstores[0]._blocks[(ORG_ID, BLOCK_ID)]
+    assert await blockstore.read(ORG_ID, BLOCK_ID) == block
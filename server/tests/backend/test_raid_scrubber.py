@@ -0,0 +1,230 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+
+import pytest
+import trio
+
+from parsec.api.protocol import BlockID, OrganizationID
+from parsec.backend.block import BlockStoreError
+from parsec.backend.blockstore import blockstore_factory
+from parsec.backend.config import (
+    MockedBlockStoreConfig,
+    RAID1BlockStoreConfig,
+    RAID5BlockStoreConfig,
+    RAIDECBlockStoreConfig,
+)
+from parsec.backend.postgresql.raid_scrubber import PGRAIDScrubber, get_raid_blockstore
+from tests.backend.common import real_clock_timeout
+from tests.common import customize_fixtures
+
+ORG_ID = OrganizationID("org42")
+BLOCK_ID = BlockID.from_hex("00000000000000000000000000000001")
+BLOCK_DATA = b"Hodi ho !"
+
+RAID_CONFIGS = {
+    "RAID1": RAID1BlockStoreConfig(
+        blockstores=[MockedBlockStoreConfig() for _ in range(3)], partial_create_ok=True
+    ),
+    "RAID5": RAID5BlockStoreConfig(
+        blockstores=[MockedBlockStoreConfig() for _ in range(3)], partial_create_ok=True
+    ),
+    "RAIDEC": RAIDECBlockStoreConfig(
+        blockstores=[MockedBlockStoreConfig() for _ in range(4)],
+        parity_shards=2,
+        partial_create_ok=True,
+    ),
+}
+# Number of nodes that can be lost without losing the block
+RAID_REDUNDANCY = {"RAID1": 2, "RAID5": 1, "RAIDEC": 2}
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("raid", RAID_CONFIGS.keys())
+async def test_raid_scrub(raid):
+    blockstore = blockstore_factory(RAID_CONFIGS[raid])
+    await blockstore.create(ORG_ID, BLOCK_ID, BLOCK_DATA)
+    nodes = blockstore.blockstores
+    nodes_data = [node._blocks[(ORG_ID, BLOCK_ID)] for node in nodes]
+
+    # Nothing to repair
+    result = await blockstore.scrub(ORG_ID, BLOCK_ID)
+    assert result.block_size == len(BLOCK_DATA)
+    assert result.read_bytes == sum(len(data) for data in nodes_data)
+    assert result.written_bytes == 0
+    assert result.missing_nodes == []
+    assert result.inconsistent_nodes == []
+
+    # Any node (including checksum/parity ones) can be repaired
+    for index, node in enumerate(nodes):
+        del node._blocks[(ORG_ID, BLOCK_ID)]
+        result = await blockstore.scrub(ORG_ID, BLOCK_ID)
+        assert result.block_size == len(BLOCK_DATA)
+        assert result.written_bytes == len(nodes_data[index])
+        assert result.missing_nodes == [index]
+        assert result.repair_failed_nodes == []
+        assert node._blocks[(ORG_ID, BLOCK_ID)] == nodes_data[index]
+
+    # As many nodes as the redundancy allows
+    lost_nodes = list(range(RAID_REDUNDANCY[raid]))
+    for index in lost_nodes:
+        del nodes[index]._blocks[(ORG_ID, BLOCK_ID)]
+    result = await blockstore.scrub(ORG_ID, BLOCK_ID)
+    assert result.missing_nodes == lost_nodes
+    assert await blockstore.read(ORG_ID, BLOCK_ID) == BLOCK_DATA
+    for index in lost_nodes:
+        assert nodes[index]._blocks[(ORG_ID, BLOCK_ID)] == nodes_data[index]
+
+    # Repair fails if the node is still not available
+    async def _failing_create(organization_id, block_id, block):
+        raise BlockStoreError()
+
+    del nodes[0]._blocks[(ORG_ID, BLOCK_ID)]
+    nodes[0].create = _failing_create
+    result = await blockstore.scrub(ORG_ID, BLOCK_ID)
+    assert result.missing_nodes == [0]
+    assert result.repair_failed_nodes == [0]
+
+    # Too many nodes lost
+    for index in range(1, RAID_REDUNDANCY[raid] + 1):
+        del nodes[index]._blocks[(ORG_ID, BLOCK_ID)]
+    with pytest.raises(BlockStoreError):
+        await blockstore.scrub(ORG_ID, BLOCK_ID)
+
+
+@pytest.mark.trio
+async def test_raid_scrub_inconsistent_nodes():
+    blockstore = blockstore_factory(RAID_CONFIGS["RAID5"])
+    await blockstore.create(ORG_ID, BLOCK_ID, BLOCK_DATA)
+    nodes = blockstore.blockstores
+
+    # Checksum chunk no longer matches the data chunks
+    checksum_chunk = nodes[2]._blocks[(ORG_ID, BLOCK_ID)]
+    nodes[2]._blocks[(ORG_ID, BLOCK_ID)] = bytes(len(checksum_chunk))
+    result = await blockstore.scrub(ORG_ID, BLOCK_ID)
+    assert result.block_size == len(BLOCK_DATA)
+    assert result.missing_nodes == []
+    assert result.inconsistent_nodes == [2]
+
+    # Chunks of different sizes cannot be used to rebuild the block
+    nodes[2]._blocks[(ORG_ID, BLOCK_ID)] = b"dummy"
+    with pytest.raises(BlockStoreError):
+        await blockstore.scrub(ORG_ID, BLOCK_ID)
+
+
+@pytest.mark.trio
+async def test_raid_scrubber_io_budget():
+    blockstore = blockstore_factory(RAID_CONFIGS["RAID1"])
+    block = bytes(100_000)
+    await blockstore.create(ORG_ID, BLOCK_ID, block)
+    del blockstore.blockstores[0]._blocks[(ORG_ID, BLOCK_ID)]
+
+    scrubber = PGRAIDScrubber(dbh=None, blockstore=blockstore, io_budget=3_000_000)
+    started_on = trio.current_time()
+    await scrubber.scrub_block(ORG_ID, BLOCK_ID, len(block))
+    # 2 mirrors read and 1 repaired, at 3MB/s
+    assert trio.current_time() - started_on >= 0.1
+    assert scrubber.stats()["read_bytes"] == 200_000
+    assert scrubber.stats()["written_bytes"] == 100_000
+
+
+@pytest.mark.trio
+async def test_raid_scrubber_errors(monkeypatch, caplog):
+    blockstore = blockstore_factory(RAID_CONFIGS["RAID1"])
+    block_ids = [BlockID.new() for _ in range(3)]
+    for block_id in block_ids:
+        await blockstore.create(ORG_ID, block_id, BLOCK_DATA)
+    rows = [
+        {"_id": i, "organization_id": ORG_ID.str, "block_id": block_id.hex, "size": 9}
+        for i, block_id in enumerate(block_ids, start=1)
+    ]
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield None
+
+    class _DBH:
+        pool = _Pool()
+
+    # Blocks cannot be retrieved at first (e.g. no connection available)
+    fetch_failures = [OSError("Connection refused")]
+
+    async def _get_blocks_batch(conn, last_id, batch_size):
+        if fetch_failures:
+            raise fetch_failures.pop()
+        return [row for row in rows if row["_id"] > last_id][:batch_size]
+
+    monkeypatch.setattr(
+        "parsec.backend.postgresql.raid_scrubber.get_blocks_batch", _get_blocks_batch
+    )
+    monkeypatch.setattr("parsec.backend.postgresql.raid_scrubber.RAID_SCRUB_DB_RETRY_DELAY", 0)
+
+    # Unexpected error while scrubbing a block
+    vanilla_scrub = blockstore.scrub
+
+    async def _scrub(organization_id, block_id):
+        if block_id == block_ids[1]:
+            raise RuntimeError("D'oh !")
+        return await vanilla_scrub(organization_id, block_id)
+
+    blockstore.scrub = _scrub
+
+    scrubber = PGRAIDScrubber(dbh=_DBH(), blockstore=blockstore, io_budget=1024**3)
+    await scrubber.scrub_pass()
+    caplog.assert_occurred_once("[error    ] RAID scrub: unexpected error")
+
+    stats = scrubber.stats()
+    assert not fetch_failures
+    assert stats["passes"] == 1
+    assert stats["last_id"] == 3
+    assert stats["scrubbed_blocks"] == 2
+    assert stats["scrub_errors"] == 1
+
+
+@customize_fixtures(blockstore_mode="RAID5_PARTIAL_CREATE_OK")
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_raid_scrubber(backend, alice, realm):
+    block_ids = [BlockID.new() for _ in range(5)]
+    for block_id in block_ids:
+        await backend.block.create(
+            alice.organization_id, alice.device_id, block_id, realm, block_id.bytes
+        )
+    raid_blockstore = get_raid_blockstore(backend.blockstore)
+    # First node is the PostgreSQL blockstore, the others are in memory
+    _, node1, node2 = raid_blockstore.blockstores
+    del node1._blocks[(alice.organization_id, block_ids[0])]
+    del node2._blocks[(alice.organization_id, block_ids[1])]
+    # Cannot be rebuilt
+    del node1._blocks[(alice.organization_id, block_ids[2])]
+    del node2._blocks[(alice.organization_id, block_ids[2])]
+
+    scrubber = PGRAIDScrubber(backend.block.dbh, raid_blockstore, io_budget=1024**3)
+    await scrubber.scrub_pass()
+
+    stats = scrubber.stats()
+    assert stats["passes"] == 1
+    assert stats["scrubbed_blocks"] == 4
+    assert stats["repaired_nodes"] == 2
+    assert stats["repair_failures"] == 0
+    assert stats["inconsistent_nodes"] == 0
+    assert stats["size_mismatches"] == 0
+    assert stats["unrecoverable_blocks"] == 1
+    assert stats["scrub_errors"] == 0
+    assert (alice.organization_id, block_ids[0]) in node1._blocks
+    assert (alice.organization_id, block_ids[1]) in node2._blocks
+    for block_id in (block_ids[0], block_ids[1], *block_ids[3:]):
+        assert await raid_blockstore.read(alice.organization_id, block_id) == block_id.bytes
+
+
+@customize_fixtures(blockstore_mode="RAID1_PARTIAL_CREATE_OK")
+@pytest.mark.trio
+@pytest.mark.postgresql
+async def test_raid_scrubber_background_task(backend_factory):
+    async with backend_factory(config={"blockstore_raid_scrub_io_budget": 1024**3}) as backend:
+        assert backend.raid_scrubber is not None
+        async with real_clock_timeout():
+            while not backend.raid_scrubber.passes:
+                await trio.sleep(0.01)
@@ -7,7 +7,14 @@ from unittest.mock import patch
 
 import pytest
 
-from parsec._parsec import ApiVersion, DateTime, DeviceID, anonymous_cmds
+from parsec._parsec import (
+    ApiVersion,
+    BackendEventOrganizationExpired,
+    BackendEventUserUpdatedOrRevoked,
+    DateTime,
+    DeviceID,
+    anonymous_cmds,
+)
 from parsec.backend import BackendApp
 from parsec.serde import packb
 from tests.common import AnonymousRpcApiClient, AuthenticatedRpcApiClient, LocalDevice
@@ -335,6 +342,52 @@ async def test_handshake(
     await _test_invited_handshake_invitation_invalid_token(invited_rpc)
 
 
+@pytest.mark.trio
+async def test_authenticated_handshake_cache(
+    alice_rpc: AuthenticatedRpcApiClient,
+    alice: LocalDevice,
+    bob: LocalDevice,
+    backend: BackendApp,
+):
+    await _test_good_handshake(alice_rpc)
+    stats = backend.auth_cache.stats()
+
+    # Subsequent requests are served from the cache
+    await _test_good_handshake(alice_rpc)
+    await _test_good_handshake(alice_rpc)
+    new_stats = backend.auth_cache.stats()
+    assert new_stats["organization_hits"] == stats["organization_hits"] + 2
+    assert new_stats["organization_misses"] == stats["organization_misses"]
+    assert new_stats["device_hits"] == stats["device_hits"] + 2
+    assert new_stats["device_misses"] == stats["device_misses"]
+
+    # Events (typically sent by another server node) invalidate the cache
+    backend.event_bus.send(
+        BackendEventUserUpdatedOrRevoked,
+        event_id="dummy",
+        payload=BackendEventUserUpdatedOrRevoked(
+            organization_id=alice.organization_id, user_id=alice.user_id, profile=None
+        ),
+    )
+    assert backend.auth_cache.stats()["cached_devices"] == 0
+    backend.event_bus.send(
+        BackendEventOrganizationExpired,
+        event_id="dummy",
+        payload=BackendEventOrganizationExpired(organization_id=alice.organization_id),
+    )
+    assert backend.auth_cache.stats()["cached_organizations"] == 0
+
+    # Revoked user is rejected on the very next request
+    await _test_good_handshake(alice_rpc)
+    await backend.user.revoke_user(
+        organization_id=alice.organization_id,
+        user_id=alice.user_id,
+        revoked_user_certificate=b"dummy",
+        revoked_user_certifier=bob.device_id,
+    )
+    await _test_authenticated_handshake_user_revoked(alice_rpc)
+
+
 @pytest.mark.trio
 async def test_client_version_in_logs(
     alice_rpc: AuthenticatedRpcApiClient,
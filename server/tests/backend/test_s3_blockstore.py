@@ -1,10 +1,14 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
+import threading
+import time
+from io import BytesIO
 from unittest import mock
 from unittest.mock import Mock
 
 import pytest
+import trio
 from botocore.exceptions import ClientError as S3ClientError
 from botocore.exceptions import EndpointConnectionError as S3EndpointConnectionError
 
@@ -31,10 +35,8 @@ async def test_s3_read(caplog):
         blockstore = S3BlockStoreComponent("europe", "parsec", "john", "secret")
 
         # Ok
-        response_mock = Mock()
-        response_mock.read.return_value = "content"
-        client_mock().get_object.return_value = {"Body": response_mock}
-        assert await blockstore.read(org_id, block_id) == "content"
+        client_mock().get_object.return_value = {"Body": BytesIO(b"content")}
+        assert await blockstore.read(org_id, block_id) == b"content"
         client_mock().get_object.assert_called_once_with(
             Bucket="parsec", Key="org42/0694a211-7635-4e82-95e2-8a543e5887f9"
         )
@@ -111,3 +113,92 @@ async def test_s3_create(caplog):
         with pytest.raises(BlockStoreError):
             await blockstore.create(org_id, block_id, "content")
         _assert_log()
+
+
+class LocalS3Server:
+    """
+    Minimal stand-in for a boto3 S3 client: objects are kept in memory and
+    each request blocks the calling thread for `latency` seconds, just like
+    a real HTTP round trip would.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.objects = {}
+        self.concurrent_requests = 0
+        self.max_concurrent_requests = 0
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            self.concurrent_requests += 1
+            self.max_concurrent_requests = max(
+                self.max_concurrent_requests, self.concurrent_requests
+            )
+        time.sleep(self.latency)
+        with self._lock:
+            self.concurrent_requests -= 1
+
+    def head_bucket(self, Bucket):
+        return True
+
+    def put_object(self, Bucket, Key, Body):
+        self._request()
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        self._request()
+        try:
+            return {"Body": BytesIO(self.objects[(Bucket, Key)])}
+        except KeyError:
+            raise S3ClientError(error_response={"Error": {"Code": "404"}}, operation_name="GET")
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("max_connections", (1, 4))
+async def test_s3_concurrent_reads_overlap(max_connections):
+    org_id = OrganizationID("org42")
+    block_ids = [BlockID.new() for _ in range(8)]
+    server = LocalS3Server(latency=0.05)
+
+    with mock.patch("boto3.client", return_value=server):
+        blockstore = S3BlockStoreComponent(
+            "europe", "parsec", "john", "secret", max_connections=max_connections
+        )
+        for block_id in block_ids:
+            await blockstore.create(org_id, block_id, block_id.bytes * 1000)
+
+        results = {}
+
+        async def _read(block_id):
+            results[block_id] = await blockstore.read(org_id, block_id)
+
+        # The event loop must stay responsive while the reads are in progress
+        loop_ticks = 0
+        async with trio.open_nursery() as nursery:
+            for block_id in block_ids:
+                nursery.start_soon(_read, block_id)
+            while len(results) < len(block_ids):
+                loop_ticks += 1
+                await trio.sleep(0.001)
+
+    assert results == {block_id: block_id.bytes * 1000 for block_id in block_ids}
+    assert loop_ticks > 1
+    # Reads overlap, but never exceed the configured pool size
+    assert server.max_concurrent_requests == max_connections
+
+
+@pytest.mark.trio
+async def test_s3_read_timeout(caplog):
+    org_id = OrganizationID("org42")
+    block_id = BlockID.new()
+    server = LocalS3Server(latency=1)
+    server.objects[("parsec", f"org42/{block_id.hyphenated}")] = b"content"
+
+    with mock.patch("boto3.client", return_value=server):
+        blockstore = S3BlockStoreComponent("europe", "parsec", "john", "secret", timeout=0.1)
+        with pytest.raises(BlockStoreError):
+            await blockstore.read(org_id, block_id)
+
+    log = caplog.assert_occurred_once("[warning  ] Block read error")
+    assert f"block_id={block_id.hex}" in log
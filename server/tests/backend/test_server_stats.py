@@ -1,12 +1,17 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 
+import tracemalloc
 from typing import Optional
 
 import pytest
 
-from parsec._parsec import BlockID, DateTime, RealmRole, VlobID
+from parsec._parsec import BlockID, DateTime, OrganizationID, RealmRole, VlobID
 from parsec.api.protocol.types import UserProfile
 from parsec.backend.app import BackendApp
+from parsec.backend.asgi.administration import (
+    _stream_server_stats_as_csv,
+    _stream_server_stats_as_json,
+)
 from parsec.backend.realm import RealmGrantedRole
 from tests.common import customize_fixtures
 
@@ -333,3 +338,40 @@ Org1,200,20,2,3,1,0,1,0,1,0\r
 Org2,300,30,3,1,1,0,0,1,0,1\r
 """
     )
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("format", ["csv", "json"])
+@customize_fixtures(backend_not_populated=True)
+async def test_stats_streaming_memory_is_flat(backend: BackendApp, format: str):
+    stream = _stream_server_stats_as_csv if format == "csv" else _stream_server_stats_as_json
+    organizations_count = 0
+
+    async def _create_organizations(count: int) -> None:
+        nonlocal organizations_count
+        for _ in range(count):
+            organizations_count += 1
+            await backend.organization.create(
+                OrganizationID(f"Org{organizations_count}"), bootstrap_token="123"
+            )
+
+    async def _stream_peak_memory() -> int:
+        chunks = 0
+        tracemalloc.start()
+        try:
+            async for _ in stream(backend.organization.server_stats()):
+                chunks += 1
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert chunks == organizations_count + (2 if format == "json" else 1)
+        return peak
+
+    await _create_organizations(200)
+    small_peak = await _stream_peak_memory()
+
+    await _create_organizations(800)
+    big_peak = await _stream_peak_memory()
+
+    # Five times more organizations, but the stats are never all in memory at once
+    assert big_peak < small_peak * 2
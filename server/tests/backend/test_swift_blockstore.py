@@ -1,10 +1,13 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
+import threading
+import time
 from unittest import mock
 from unittest.mock import Mock
 
 import pytest
+import trio
 from swiftclient.exceptions import ClientException
 
 from parsec.api.protocol import BlockID, OrganizationID
@@ -89,3 +92,123 @@ async def test_swift_create(caplog):
         with pytest.raises(BlockStoreError):
             await blockstore.create(org_id, block_id, "content")
         _assert_log()
+
+
+class LocalSwiftServer:
+    """
+    Minimal stand-in for a Swift service and its `swiftclient.Connection`: objects
+    are kept in memory, each request blocks the calling thread for `latency`
+    seconds and connections re-authenticate when their token has expired (just
+    like `swiftclient.Connection` does).
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.objects = {}
+        self.valid_tokens = set()
+        self.auth_count = 0
+        self.concurrent_requests = 0
+        self.max_concurrent_requests = 0
+        self._lock = threading.Lock()
+
+    def connection_factory(self, authurl, user, key, preauthurl=None, preauthtoken=None):
+        return LocalSwiftConnection(self, preauthurl, preauthtoken)
+
+    def authenticate(self):
+        with self._lock:
+            self.auth_count += 1
+            token = f"token{self.auth_count}"
+            self.valid_tokens.add(token)
+        return "http://storage.local", token
+
+    def expire_tokens(self):
+        with self._lock:
+            self.valid_tokens.clear()
+
+    def request(self):
+        with self._lock:
+            self.concurrent_requests += 1
+            self.max_concurrent_requests = max(
+                self.max_concurrent_requests, self.concurrent_requests
+            )
+        time.sleep(self.latency)
+        with self._lock:
+            self.concurrent_requests -= 1
+
+
+class LocalSwiftConnection:
+    def __init__(self, server: LocalSwiftServer, url, token):
+        self.server = server
+        self.url = url
+        self.token = token
+        self._in_use = False
+
+    def _request(self):
+        # A connection must never be used by multiple threads at the same time
+        assert not self._in_use
+        self._in_use = True
+        try:
+            if self.token not in self.server.valid_tokens:
+                self.url, self.token = self.server.authenticate()
+            self.server.request()
+        finally:
+            self._in_use = False
+
+    def head_container(self, container):
+        self._request()
+        return {}
+
+    def put_object(self, container, obj, contents):
+        self._request()
+        self.server.objects[(container, obj)] = contents
+
+    def get_object(self, container, obj):
+        self._request()
+        try:
+            return {}, self.server.objects[(container, obj)]
+        except KeyError:
+            raise ClientException(http_status=404, msg="")
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("max_connections", (1, 4))
+async def test_swift_concurrent_reads_scale(max_connections):
+    org_id = OrganizationID("org42")
+    block_ids = [BlockID.new() for _ in range(8)]
+    server = LocalSwiftServer(latency=0.05)
+
+    with mock.patch("swiftclient.Connection", side_effect=server.connection_factory):
+        blockstore = SwiftBlockStoreComponent(
+            "http://url", "scille", "parsec", "john", "secret", max_connections=max_connections
+        )
+        for block_id in block_ids:
+            await blockstore.create(org_id, block_id, block_id.bytes * 1000)
+
+        async def _read_all():
+            results = {}
+
+            async def _read(block_id):
+                results[block_id] = await blockstore.read(org_id, block_id)
+
+            async with trio.open_nursery() as nursery:
+                for block_id in block_ids:
+                    nursery.start_soon(_read, block_id)
+            assert results == {block_id: block_id.bytes * 1000 for block_id in block_ids}
+
+        await _read_all()
+        # Reads overlap, but never exceed the configured pool size
+        assert server.max_concurrent_requests == max_connections
+        assert blockstore._pool.connections_count == max_connections
+        # The connections reuse the token obtained by the first one
+        assert server.auth_count == 1
+
+        # Connections re-authenticate once the token has expired...
+        server.expire_tokens()
+        await _read_all()
+        assert 1 < server.auth_count <= 1 + max_connections
+
+        # ...then share the new token
+        auth_count = server.auth_count
+        await _read_all()
+        assert server.auth_count == auth_count
+        assert blockstore._pool.connections_count == max_connections
@@ -84,7 +84,13 @@ TRUNCATE TABLE
     realm_vlob_update,
 
     block,
-    block_data
+    block_data,
+
+    organization_stats,
+    organization_daily_stats,
+    organization_stats_delta,
+
+    event_log
 RESTART IDENTITY CASCADE
 """,
     )
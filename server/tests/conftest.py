@@ -12,11 +12,13 @@ import trio
 import trio_asyncio
 
 from parsec.backend.config import (
+    CachedBlockStoreConfig,
     MockedBlockStoreConfig,
     PostgreSQLBlockStoreConfig,
     RAID0BlockStoreConfig,
     RAID1BlockStoreConfig,
     RAID5BlockStoreConfig,
+    RAIDECBlockStoreConfig,
 )
 from parsec.monitoring import TaskMonitoringInstrument
 
@@ -345,6 +347,10 @@ def blockstore(backend_store, fixtures_customization):
         config = RAID0BlockStoreConfig(blockstores=[config, MockedBlockStoreConfig()])
     elif raid == "RAID1":
         config = RAID1BlockStoreConfig(blockstores=[config, MockedBlockStoreConfig()])
+    elif raid == "RAID1_READ_ALL":
+        config = RAID1BlockStoreConfig(
+            blockstores=[config, MockedBlockStoreConfig()], hedged_reads=False
+        )
     elif raid == "RAID1_PARTIAL_CREATE_OK":
         config = RAID1BlockStoreConfig(
             blockstores=[config, MockedBlockStoreConfig()], partial_create_ok=True
@@ -358,6 +364,20 @@ def blockstore(backend_store, fixtures_customization):
             blockstores=[config, MockedBlockStoreConfig(), MockedBlockStoreConfig()],
             partial_create_ok=True,
         )
+    elif raid == "RAIDEC":
+        # 2 data shards + 2 parity shards
+        config = RAIDECBlockStoreConfig(
+            blockstores=[config, *(MockedBlockStoreConfig() for _ in range(3))],
+            parity_shards=2,
+        )
+    elif raid == "RAIDEC_PARTIAL_CREATE_OK":
+        config = RAIDECBlockStoreConfig(
+            blockstores=[config, *(MockedBlockStoreConfig() for _ in range(3))],
+            parity_shards=2,
+            partial_create_ok=True,
+        )
+    elif raid == "CACHED":
+        config = CachedBlockStoreConfig(blockstore=config, memory_cache_size=1024**2)
     else:
         assert raid == "NO_RAID"
 
@@ -0,0 +1,60 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
+from __future__ import annotations
+
+import json
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+BENCHMARKS_DIR = pathlib.Path(__file__).parent.parent / "benchmarks"
+
+
+@pytest.mark.slow
+def test_rpc_commands_benchmark(tmp_path):
+    # Smoke test to make sure the benchmark doesn't rot
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            str(BENCHMARKS_DIR / "bench_rpc_commands.py"),
+            "--db=MOCKED",
+            "--iterations=5",
+            "--block-size=1024",
+            "--sse-clients=3",
+            "--fanout-iterations=3",
+            "--json",
+        ],
+        cwd=BENCHMARKS_DIR.parent,
+    )
+    results = json.loads(output)
+    assert results["environment"]["db"] == "MOCKED"
+    assert results["results"].keys() == {
+        "handshake_ping",
+        "handshake_ping_without_auth_cache",
+        "block_create",
+        "block_read",
+        "vlob_create",
+        "vlob_update",
+        "vlob_read",
+        "vlob_poll_changes_full",
+        "vlob_poll_changes_up_to_date",
+        "events_fanout",
+    }
+    for name, stats in results["results"].items():
+        assert "error" not in stats, name
+        assert stats["ops_per_s"] > 0
+
+    # Results can be compared with each others
+    (tmp_path / "results.json").write_bytes(output)
+    comparison = subprocess.check_output(
+        [
+            sys.executable,
+            str(BENCHMARKS_DIR / "compare_results.py"),
+            str(tmp_path / "results.json"),
+            str(tmp_path / "results.json"),
+            "--fail-on-regression",
+        ],
+        text=True,
+    )
+    assert "block_read.median_us" in comparison
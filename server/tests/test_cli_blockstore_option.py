@@ -1,14 +1,19 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) BUSL-1.1 2016-present Scille SAS
 from __future__ import annotations
 
+from pathlib import Path
+
 import pytest
 from click import BadParameter
 
-from parsec.backend.cli.utils import _parse_blockstore_params
+from parsec.backend.cli.utils import _parse_blockstore_params, configure_blockstore_connections
 from parsec.backend.config import (
+    FileSystemBlockStoreConfig,
     MockedBlockStoreConfig,
     PostgreSQLBlockStoreConfig,
     RAID0BlockStoreConfig,
+    RAID1BlockStoreConfig,
+    RAIDECBlockStoreConfig,
     S3BlockStoreConfig,
     SWIFTBlockStoreConfig,
 )
@@ -83,6 +88,19 @@ def test_parse_swift_custom_url_scheme():
     )
 
 
+def test_parse_fs():
+    config = _parse_blockstore_params(["fs:/var/lib/parsec/blocks"])
+    assert config == FileSystemBlockStoreConfig(path=Path("/var/lib/parsec/blocks"))
+
+    config = _parse_blockstore_params(["fs:/mnt/parsec\\:blocks:0.005"])
+    assert config == FileSystemBlockStoreConfig(
+        path=Path("/mnt/parsec:blocks"), fsync_batch_delay=0.005
+    )
+
+    config = _parse_blockstore_params(["fs:/tmp/blocks:nofsync"])
+    assert config == FileSystemBlockStoreConfig(path=Path("/tmp/blocks"), fsync=False)
+
+
 def test_parse_simple_raid():
     config = _parse_blockstore_params(
         [
@@ -114,12 +132,70 @@ def test_parse_simple_raid():
     )
 
 
+def test_parse_raidec():
+    config = _parse_blockstore_params(
+        ["raidec2:0:MOCKED", "raidec2:1:MOCKED", "raidec2:2:POSTGRESQL", "raidec2:3:MOCKED"]
+    )
+    assert config == RAIDECBlockStoreConfig(
+        blockstores=[
+            MockedBlockStoreConfig(),
+            MockedBlockStoreConfig(),
+            PostgreSQLBlockStoreConfig(),
+            MockedBlockStoreConfig(),
+        ],
+        parity_shards=2,
+    )
+
+
+def test_configure_blockstore_connections():
+    config = _parse_blockstore_params(
+        [
+            "raid1:0:s3:s3.example.com:region1:bucketA:key123:S3cr3t",
+            "raid1:1:swift:swift.example.com:tenant2:containerB:user123:S3cr3t",
+            "raid1:2:MOCKED",
+        ]
+    )
+    # Default values are kept
+    assert configure_blockstore_connections(config, None, None) == config
+
+    config = configure_blockstore_connections(config, 42, 2.5)
+    assert config == RAID1BlockStoreConfig(
+        blockstores=[
+            S3BlockStoreConfig(
+                s3_endpoint_url="https://s3.example.com",
+                s3_region="region1",
+                s3_bucket="bucketA",
+                s3_key="key123",
+                s3_secret="S3cr3t",
+                s3_max_connections=42,
+                s3_timeout=2.5,
+            ),
+            SWIFTBlockStoreConfig(
+                swift_authurl="https://swift.example.com",
+                swift_tenant="tenant2",
+                swift_container="containerB",
+                swift_user="user123",
+                swift_password="S3cr3t",
+                swift_max_connections=42,
+            ),
+            MockedBlockStoreConfig(),
+        ]
+    )
+
+    config = _parse_blockstore_params(["s3::region1:bucketA:key123:S3cr3t"])
+    config = configure_blockstore_connections(config, 3, None)
+    assert config.s3_max_connections == 3
+    assert config.s3_timeout == 30.0
+
+
 @pytest.mark.parametrize(
     "param",
     [
         "foo",  # Unknown type
         "s3:",  # Too few parts
         "s3:s3.example.com:region1:bucketA:key123:S3cr3t:dummy",  # Too much parts
+        "fs:",  # Missing path
+        "fs:/tmp/blocks:dummy",  # Invalid fsync batch delay
     ],
 )
 def test_bad_single_param(param):
@@ -149,6 +225,9 @@ def test_invalid_mix_raid_params(param):
         ["raid0:1:MOCKED", "raid0:2:MOCKED"],  # Hole in the nodes
         ["raid0:0:MOCKED", "raid0:2:MOCKED"],  # Hole in the nodes
         ["raid0:0:MOCKED", "raid0:0:MOCKED"],  # Same node multiple times
+        ["raidec0:0:MOCKED", "raidec0:1:MOCKED"],  # No parity shard
+        ["raidec2:0:MOCKED", "raidec2:1:MOCKED"],  # No data shard
+        ["raidec:0:MOCKED", "raidec:1:MOCKED"],  # Missing parity shards count
     ],
 )
 def test_bad_raid_params(params):
@@ -123,3 +123,16 @@ def test_connection_context(event_bus):
     events_received.clear()
     event_bus_ctx.send("foo")
     assert events_received == [("global", "foo")]
+
+
+def test_connection_context_on_clear(event_bus):
+    cleared = []
+
+    with event_bus.connection_context() as event_bus_ctx:
+        event_bus_ctx.on_clear(lambda: cleared.append("foo"))
+        assert cleared == []
+
+    assert cleared == ["foo"]
+    # Callbacks are only called once
+    event_bus_ctx.clear()
+    assert cleared == ["foo"]